@@ -20,7 +20,8 @@ import copy
 import nupic.math
 from nupic.support.consoleprinter import ConsolePrinterMixin
 from nupic.bindings.math import Random
-from nupic.bindings.algorithms import isSegmentActive, getSegmentActivityLevel
+
+from htmresearch.algorithms.csr_connections import _raggedRange
 
 # Default verbosity while running unit tests
 VERBOSITY = 0
@@ -207,6 +208,7 @@ class TM(ConsolePrinterMixin):
       'segmentUpdates',
       '_internalStats',
       '_stats',
+      '_segmentPool',
       ]
 
   #############################################################################
@@ -221,6 +223,15 @@ class TM(ConsolePrinterMixin):
     # is a tuple (column index, cell index).
     self.segmentUpdates = {}
 
+    # The synapses of all segments are stored in a SegmentPool. It isn't
+    # pickled; the segments pickle their own synapses and are put back into a
+    # new pool here.
+    self._segmentPool = SegmentPool(self.numberOfCols * self.cellsPerColumn)
+    for c in xrange(self.numberOfCols):
+      for i in xrange(self.cellsPerColumn):
+        for segment in self.cells[c][i]:
+          segment._restore(c * self.cellsPerColumn + i)
+
     self.sequenceSignatures = []
 
     # Allocate and reset all stats
@@ -1051,32 +1062,38 @@ class TM(ConsolePrinterMixin):
     #   for reinforcement,
     # - if pooling is on, try to find the best weakly activated segment to
     #   reinforce it, else create a new pooling segment.
-    for c in xrange(self.numberOfCols):
+    # The activity of every segment is computed at once. Only the cells with
+    # an active segment are visited, the others have no confidence.
+    pool = self._segmentPool
+    activity = pool.computeActivity(self._cellMask(self.activeState['t']),
+                                    self.connectedPerm)
+    # sum(connected synapses) >= activationThreshold?
+    isActive = ((activity >= self.activationThreshold) &
+                (pool.segmentCells[:len(activity)] >= 0))
 
-      buPredicted = False # whether any cell in the column is predicted
-      for i in xrange(self.cellsPerColumn):
-        # Iterate over each of the segments of this cell
-        maxConfidence = 0
-        for s in self.cells[c][i]:
+    self.confidence['t'].fill(0)
+    for cell in numpy.unique(pool.segmentCells[:len(activity)][isActive]):
+      c, i = divmod(int(cell), self.cellsPerColumn)
+      # Iterate over each of the segments of this cell
+      maxConfidence = 0
+      for s in self.cells[c][i]:
 
-          # sum(connected synapses) >= activationThreshold?
-          if self.isSegmentActive(s, self.activeState['t']):
+        if isActive[s._index]:
 
-            self.predictedState['t'][c,i] = 1
-            buPredicted = True
-            maxConfidence = max(maxConfidence, s.dutyCycle(readOnly=True))
+          self.predictedState['t'][c,i] = 1
+          maxConfidence = max(maxConfidence, s.dutyCycle(readOnly=True))
 
-            if doLearn:
-              s.totalActivations += 1    # increment activationFrequency
-              s.lastActiveIteration = self.iterationIdx
-              # mark this segment for learning
-              activeUpdate = self.getSegmentActiveSynapses(c,i,s,'t')
-              activeUpdate.phase1Flag = False
-              self.addToSegmentUpdates(c, i, activeUpdate)
+          if doLearn:
+            s.totalActivations += 1    # increment activationFrequency
+            s.lastActiveIteration = self.iterationIdx
+            # mark this segment for learning
+            activeUpdate = self.getSegmentActiveSynapses(c,i,s,'t')
+            activeUpdate.phase1Flag = False
+            self.addToSegmentUpdates(c, i, activeUpdate)
 
-        # Store the max confidence seen among all the weak and strong segments
-        #  as the cell's confidence.
-        self.confidence['t'][c,i] = maxConfidence
+      # Store the max confidence seen among all the weak and strong segments
+      #  as the cell's confidence.
+      self.confidence['t'][c,i] = maxConfidence
 
 
   def compute(self, bottomUpInput, enableLearn, computeInfOutput=None):
@@ -1329,32 +1346,23 @@ class TM(ConsolePrinterMixin):
     # it can be called in adaptSegments, in the case where we
     # do global decay only episodically.
     if self.globalDecay > 0.0 and ((self.iterationIdx % self.maxAge) == 0):
-      for c, i in product(xrange(self.numberOfCols), xrange(self.cellsPerColumn)):
-
-        segsToDel = [] # collect and remove outside the loop
-        for segment in self.cells[c][i]:
-          age = self.iterationIdx - segment[0][self.kSegLastActiveIteration]
-          if age <= self.maxAge:
-            continue
-
-          #print "Decrementing seg age %d:" % (age), c, i, segment
-          synsToDel = [] # collect and remove outside the loop
-          for synapse in segment.syns: # skip sequenceSegment flag
-
-            synapse[2] = synapse[2] - self.globalDecay # decrease permanence
+      pool = self._segmentPool
+      segments = pool.liveSegments()
+      age = self.iterationIdx - pool.lastActiveIterations[segments]
+      segments = segments[age > self.maxAge]
 
-            if synapse[2] <= 0:
-              synsToDel.append(synapse) # add to list to delete
+      slots = pool.rowSlots(segments)
+      permanences = pool.slotPermanences(slots) - self.globalDecay
+      pool.setSlotPermanences(slots, permanences)
+      numRemaining = pool.compactRows(segments, permanences > 0)
 
-          if len(synsToDel) == len(segment.syns): # 1 for sequenceSegment flag
-            segsToDel.append(segment) # will remove the whole segment
-          elif len(synsToDel) > 0:
-            for syn in synsToDel: # remove some synapses on segment
-              segment.syns.remove(syn)
-
-        for seg in segsToDel: # remove some segments of this cell
-          self.cleanUpdatesList(c,i,seg)
-          self.cells[c][i].remove(seg)
+      # Remove the segments that lost all of their synapses
+      for index in segments[numRemaining == 0]:
+        c, i = divmod(int(pool.segmentCells[index]), self.cellsPerColumn)
+        for seg in self.cells[c][i]:
+          if seg._index == index:
+            self.removeSegment(c, i, seg)
+            break
 
 
     # Update the prediction score stats
@@ -1444,33 +1452,46 @@ class TM(ConsolePrinterMixin):
     if minNumSyns is None:
       minNumSyns = self.activationThreshold
 
-    # Loop through all segments
-    nSegsRemoved, nSynsRemoved = 0, 0
-    segsToDel = [] # collect and remove segments outside the loop
-    for segment in segList:
-
-      # List if synapses to delete
-      synsToDel = [syn for syn in segment.syns if syn[2] < minPermanence]
-
-      if len(synsToDel) == len(segment.syns):
-        segsToDel.append(segment) # will remove the whole segment
-      else:
-        if len(synsToDel) > 0:
-          for syn in synsToDel: # remove some synapses on segment
-            segment.syns.remove(syn)
-            nSynsRemoved += 1
-        if len(segment.syns) < minNumSyns:
-          segsToDel.append(segment)
+    # Segments that were already removed, e.g. because they were queued for
+    # trimming twice, are skipped
+    segList = [segment for segment in segList if segment._index is not None]
+    toDelete, nSynsRemoved = self._trimSynapses(segList, minPermanence,
+                                                minNumSyns)
 
     # Remove segments that don't have enough synapses and also take them
     # out of the segment update list, if they are in there
-    nSegsRemoved += len(segsToDel)
-    for seg in segsToDel: # remove some segments of this cell
-      self.cleanUpdatesList(colIdx, cellIdx, seg)
-      self.cells[colIdx][cellIdx].remove(seg)
-      nSynsRemoved += len(seg.syns)
+    for seg, delete in zip(segList, toDelete):
+      if delete:
+        self.removeSegment(colIdx, cellIdx, seg)
 
-    return nSegsRemoved, nSynsRemoved
+    return int(toDelete.sum()), nSynsRemoved
+
+
+  ################################################################################
+  def _trimSynapses(self, segments, minPermanence, minNumSyns):
+    """ Delete the synapses of a list of segments whose permanence is less than
+    minPermanence, and find the segments that have less than minNumSyns
+    synapses remaining, or none at all.
+
+    Parameters:
+    --------------------------------------------------------------
+    segments:           List of segment references
+    retval:             (boolean array of the segments to delete,
+                        numSynsRemoved). The synapses of the segments to delete
+                        count as removed.
+    """
+    pool = self._segmentPool
+    indices = numpy.array([segment._index for segment in segments],
+                          dtype="int64")
+
+    numSynapses = pool.rowLengths(indices)
+    keep = pool.slotPermanences(pool.rowSlots(indices)) >= minPermanence
+    numRemaining = pool.compactRows(indices, keep)
+
+    delete = (numRemaining == 0) | (numRemaining < minNumSyns)
+    nSynsRemoved = int(numSynapses.sum() - numRemaining[~delete].sum())
+
+    return delete, nSynsRemoved
 
 
   ################################################################################
@@ -1496,18 +1517,20 @@ class TM(ConsolePrinterMixin):
     if minNumSyns is None:
       minNumSyns = self.activationThreshold
 
-    # Loop through all cells
-    totalSegsRemoved, totalSynsRemoved = 0, 0
-    for c,i in product(xrange(self.numberOfCols), xrange(self.cellsPerColumn)):
+    # Trim the segments of all cells at once
+    cells = [(c, i, segment)
+             for c,i in product(xrange(self.numberOfCols),
+                                xrange(self.cellsPerColumn))
+             for segment in self.cells[c][i]]
 
-      (segsRemoved, synsRemoved) = self.trimSegmentsInCell(colIdx=c, cellIdx=i,
-                segList=self.cells[c][i], minPermanence=minPermanence,
-                minNumSyns=minNumSyns)
-      totalSegsRemoved += segsRemoved
-      totalSynsRemoved += synsRemoved
+    toDelete, totalSynsRemoved = self._trimSynapses(
+      [segment for _, _, segment in cells], minPermanence, minNumSyns)
 
+    for (c, i, segment), delete in zip(cells, toDelete):
+      if delete:
+        self.removeSegment(c, i, segment)
 
-    return totalSegsRemoved, totalSynsRemoved
+    return int(toDelete.sum()), totalSynsRemoved
 
   ################################################################################
   def cleanUpdatesList(self, col, cellIdx, seg):
@@ -1524,9 +1547,20 @@ class TM(ConsolePrinterMixin):
       c,i = key[0], key[1]
       if c == col and i == cellIdx:
         for update in updateList:
-          if update[1].segment == seg:
+          if update[1].segment is seg:
             self.removeSegmentUpdate(update)
 
+  ################################################################################
+  def removeSegment(self, col, cellIdx, seg):
+    """
+    Removes a segment from cell (col, cellIdx), along with its synapses and
+    any update that would be for it.
+    """
+    self.cleanUpdatesList(col, cellIdx, seg)
+    self.cells[col][cellIdx].remove(seg)
+    self._segmentPool.destroySegment(seg._index)
+    seg._index = None
+
   ################################################################################
   def finishLearning(self):
     """Called when learning has been completed. This method just calls
@@ -1675,9 +1709,9 @@ class TM(ConsolePrinterMixin):
     all the synapses of the segment, at either t or t-1.
     """
 
-    # todo: Computing in C, use function getSegmentActivityLevel
-    return getSegmentActivityLevel(seg.syns, activeState, connectedSynapsesOnly,
-                                   self.connectedPerm)
+    permanenceThreshold = self.connectedPerm if connectedSynapsesOnly else None
+    return int(self._segmentPool.computeActivity(
+      self._cellMask(activeState), permanenceThreshold, [seg._index])[0])
 
   #############################################################################
   def isSegmentActive(self, seg, activeState):
@@ -1688,9 +1722,19 @@ class TM(ConsolePrinterMixin):
     Notes: studied various cutoffs, none of which seem to be worthwhile
            list comprehension didn't help either
     """
-    # Computing in C - *much* faster
-    return isSegmentActive(seg.syns, activeState,
-                           self.connectedPerm, self.activationThreshold)
+    return (self.getSegmentActivityLevel(seg, activeState,
+                                         connectedSynapsesOnly=True)
+            >= self.activationThreshold)
+
+
+  #############################################################################
+  def _cellMask(self, state):
+    """
+    Return a boolean array of the cells that are on in a state array, indexed
+    by column * cellsPerColumn + cell, with a final False entry for the unused
+    synapse slots of the SegmentPool.
+    """
+    return numpy.append(state.reshape(-1) != 0, False)
 
 
   ##############################################################################
@@ -1711,8 +1755,9 @@ class TM(ConsolePrinterMixin):
     if s is not None: # s can be None, if adding a new segment
 
       # Here we add *integers* to activeSynapses
-      activeSynapses = [idx for idx, syn in enumerate(s.syns) \
-                        if activeState[syn[0], syn[1]]]
+      presynapticCells = self._segmentPool.presynapticCells(s._index)
+      activeSynapses = numpy.flatnonzero(
+        self._cellMask(activeState)[presynapticCells]).tolist()
 
     if newSynapses: # add a few more synapses
 
@@ -1743,23 +1788,15 @@ class TM(ConsolePrinterMixin):
 
     # todo: put back preference for sequence segments.
 
-    nSegments = len(self.cells[c][i])
-
-    bestActivation = self.activationThreshold
-    which = -1
-
-    for j,s in enumerate(self.cells[c][i]):
+    activity = self._segmentPool.computeActivity(
+      self._cellMask(self.activeState[timeStep]), self.connectedPerm,
+      [s._index for s in self.cells[c][i]])
 
-      activity = self.getSegmentActivityLevel(s, self.activeState[timeStep], connectedSynapsesOnly = True)
-
-      if activity >= bestActivation:
-        bestActivation = activity
-        which = j
-
-    if which != -1:
-      return self.cells[c][i][which]
-    else:
+    # Ties go to the last segment
+    if len(activity) == 0 or activity.max() < self.activationThreshold:
       return None
+    which = len(activity) - 1 - activity[::-1].argmax()
+    return self.cells[c][i][which]
 
 
   ##############################################################################
@@ -1775,23 +1812,26 @@ class TM(ConsolePrinterMixin):
     tmpCandidates = [] # tmp because we'll refine just below with activeSynapses
 
     if timeStep == 't-1':
-      tmpCandidates = numpy.where(self.learnState['t-1'] == 1)
+      tmpCandidates = numpy.flatnonzero(self.learnState['t-1'] == 1)
     else:
-      tmpCandidates = numpy.where(self.learnState['t'] == 1)
+      tmpCandidates = numpy.flatnonzero(self.learnState['t'] == 1)
 
     # Candidates can be empty at this point, in which case we return
     # an empty segment list. adaptSegments will do nothing when getting
     # that list.
-    if len(tmpCandidates[0]) == 0:
+    if len(tmpCandidates) == 0:
       return []
 
-    if s is None: # new segment
-      cands = [syn for syn in zip(tmpCandidates[0], tmpCandidates[1])]
-    else:
+    if s is not None:
       # We exclude any synapse that is already in this segment.
-      synapsesAlreadyInSegment = set((syn[0], syn[1]) for syn in s.syns)
-      cands = [syn for syn in zip(tmpCandidates[0], tmpCandidates[1]) \
-               if (syn[0], syn[1]) not in synapsesAlreadyInSegment]
+      tmpCandidates = tmpCandidates[~numpy.in1d(
+        tmpCandidates, self._segmentPool.presynapticCells(s._index))]
+
+    cands = zip(*divmod(tmpCandidates, self.cellsPerColumn))
+
+    # The segment may already connect to every candidate
+    if len(cands) == 0:
+      return []
 
     if n == 1: # so that we don't shuffle if only one is needed
       idx = self._random.getUInt32(len(cands))
@@ -1815,21 +1855,29 @@ class TM(ConsolePrinterMixin):
     bestSegIdxInCol = -1
     bestCellInCol = -1
 
+    # Compute the activity of all the segments in the column at once
+    activity = self._segmentPool.computeActivity(
+      self._cellMask(activeState), None,
+      [s._index for i in xrange(self.cellsPerColumn) for s in self.cells[c][i]])
+    segmentStart = 0
+
     for i in xrange(self.cellsPerColumn):
 
       maxSegActivity = 0
       maxSegIdx = 0
 
-      for j,s in enumerate(self.cells[c][i]):
-
-        activity = self.getSegmentActivityLevel(s, activeState, connectedSynapsesOnly =False)
+      numSegments = len(self.cells[c][i])
+      cellActivity = activity[segmentStart:segmentStart + numSegments]
+      segmentStart += numSegments
 
-        if self.verbosity >= 6:
-          print " Segment Activity for column ", c, " cell ", i, " segment ", " j is ", activity
+      if self.verbosity >= 6:
+        for j in xrange(numSegments):
+          print " Segment Activity for column ", c, " cell ", i, " segment ", " j is ", cellActivity[j]
 
-        if activity > maxSegActivity:
-          maxSegActivity = activity
-          maxSegIdx = j
+      # Ties go to the first segment
+      if numSegments > 0 and cellActivity.max() > maxSegActivity:
+        maxSegIdx = cellActivity.argmax()
+        maxSegActivity = cellActivity[maxSegIdx]
 
       if maxSegActivity >= bestActivityInCol:
         bestActivityInCol = maxSegActivity
@@ -1852,19 +1900,14 @@ class TM(ConsolePrinterMixin):
     above minThreshold. The routine returns the segment index. If no segments are
     found, then an index of -1 is returned.
     """
-    maxActivity, which = self.minThreshold, -1
-
-    for j,s in enumerate(self.cells[c][i]):
-      activity = self.getSegmentActivityLevel(s, activeState,
-                                              connectedSynapsesOnly=False)
+    activity = self._segmentPool.computeActivity(
+      self._cellMask(activeState), None, [s._index for s in self.cells[c][i]])
 
-      if activity >= maxActivity:
-        maxActivity, which = activity, j
-
-    if which == -1:
+    # Ties go to the last segment
+    if len(activity) == 0 or activity.max() < self.minThreshold:
       return None
-    else:
-      return self.cells[c][i][which]
+    which = len(activity) - 1 - activity[::-1].argmax()
+    return self.cells[c][i][which]
 
   ################################################################################
   def getLeastUsedCell(self, c):
@@ -1888,24 +1931,20 @@ class TM(ConsolePrinterMixin):
     retval:   True if synapse reached 0
     """
 
+    permanences = self._segmentPool.permanences(segment._index)
+    synapses = numpy.fromiter(synapses, dtype="int64")
+    newValues = permanences[synapses] + delta
+
     reached0 = False
 
     if delta > 0:
-      for synapse in synapses:
-        segment[synapse][2] = newValue = segment[synapse][2] + delta
-
-        # Cap synapse permanence at permanenceMax
-        if newValue > self.permanenceMax:
-          segment[synapse][2] = self.permanenceMax
+      # Cap synapse permanence at permanenceMax
+      permanences[synapses] = numpy.minimum(newValues, self.permanenceMax)
 
     else:
-      for synapse in synapses:
-        segment[synapse][2] = newValue = segment[synapse][2] + delta
-
-        # Cap min synapse permanence to 0 in case there is no global decay
-        if newValue < 0:
-          segment[synapse][2] = 0
-          reached0 = True
+      # Cap min synapse permanence to 0 in case there is no global decay
+      reached0 = bool((newValues < 0).any())
+      permanences[synapses] = numpy.maximum(newValues, 0)
 
     return reached0
 
@@ -2040,7 +2079,7 @@ class TM(ConsolePrinterMixin):
         # First, decrement synapses that are not active
         # s is a synapse *index*, with index 0 in the segment being the tuple
         # (segId, sequence segment flag). See below, creation of segments.
-        lastSynIndex = len(segment.syns) - 1
+        lastSynIndex = segment.getNumSynapses() - 1
         inactiveSynIndices = [s for s in xrange(0, lastSynIndex+1) \
                               if s not in synToUpdate]
         trimSegment = segment.updateSynapses(inactiveSynIndices,
@@ -2055,8 +2094,7 @@ class TM(ConsolePrinterMixin):
         # syn is now a tuple (src col, src cell)
         synsToAdd = [syn for syn in activeSynapses if type(syn) != int]
 
-        for newSyn in synsToAdd:
-          segment.addSynapse(newSyn[0], newSyn[1], self.initialPerm)
+        self.addSynapses(segment, synsToAdd)
 
         if self.verbosity >= 4:
           print "            after",
@@ -2086,19 +2124,31 @@ class TM(ConsolePrinterMixin):
       newSegment = Segment(tp=self, isSequenceSeg=segUpdate.sequenceSegment)
 
 
-      # numpy.float32 important so that we can match with C++
-      for synapse in activeSynapses:
-        newSegment.addSynapse(synapse[0], synapse[1], self.initialPerm)
+      self.addSynapses(newSegment, activeSynapses)
 
       if self.verbosity >= 3:
         print "New segment for cell[%d,%d]" %(c,i),
         newSegment.printSegment()
 
       self.cells[c][i].append(newSegment)
+      self._segmentPool.segmentCells[newSegment._index] = (
+        c * self.cellsPerColumn + i)
 
 
     return trimSegment
 
+  ################################################################################
+  def addSynapses(self, segment, sources):
+    """Add synapses from a list of source cells (column index, cell index) to
+    a segment, with permanence initialPerm.
+    """
+    presynapticCells = [col * self.cellsPerColumn + cellIdx
+                        for col, cellIdx in sources]
+    # numpy.float32 important so that we can match with C++
+    self._segmentPool.appendSynapses(
+      segment._index, presynapticCells,
+      numpy.full(len(presynapticCells), self.initialPerm, dtype="float32"))
+
   ################################################################################
   def getSegmentInfo(self, collectActiveData = False):
     """Returns information about the distribution of segments, synapses and
@@ -2132,44 +2182,42 @@ class TM(ConsolePrinterMixin):
     for i in range(numAgeBuckets):
       distAges.append(['%d-%d' % (i*ageBucketSize, (i+1)*ageBucketSize-1), 0])
 
-    for c in xrange(self.numberOfCols):
-      for i in xrange(self.cellsPerColumn):
-
-        if len(self.cells[c][i]) > 0:
-          nSegmentsThisCell = len(self.cells[c][i])
-          nSegments += nSegmentsThisCell
-          if distNSegsPerCell.has_key(nSegmentsThisCell):
-            distNSegsPerCell[nSegmentsThisCell] += 1
-          else:
-            distNSegsPerCell[nSegmentsThisCell] = 1
-          for seg in self.cells[c][i]:
-            nSynapsesThisSeg = seg.getNumSynapses()
-            nSynapses += nSynapsesThisSeg
-            if distSegSizes.has_key(nSynapsesThisSeg):
-              distSegSizes[nSynapsesThisSeg] += 1
-            else:
-              distSegSizes[nSynapsesThisSeg] = 1
-
-            # Accumulate permanence value histogram
-            for syn in seg.syns:
-              p = int(syn[2]*10)
-              if distPermValues.has_key(p):
-                distPermValues[p] += 1
-              else:
-                distPermValues[p] = 1
-
-            # Accumulate segment age histogram
-            age = self.lrnIterationIdx - seg.lastActiveIteration
-            ageBucket = int(age/ageBucketSize)
-            distAges[ageBucket][1] += 1
-
-            # Get active synapse statistics if requested
-            if collectActiveData:
-              if self.isSegmentActive(seg, self.infActiveState['t']):
-                nActiveSegs += 1
-              for syn in seg.syns:
-                if self.activeState['t'][syn[0]][syn[1]] == 1:
-                  nActiveSynapses += 1
+    def histogram(values):
+      counts = numpy.bincount(values)
+      return dict(zip(numpy.flatnonzero(counts).tolist(),
+                      counts[counts > 0].tolist()))
+
+    pool = self._segmentPool
+    segments = pool.liveSegments()
+    nSegments = len(segments)
+    if nSegments > 0:
+      nSegsPerCell = numpy.bincount(pool.segmentCells[segments])
+      distNSegsPerCell = histogram(nSegsPerCell[nSegsPerCell > 0])
+
+      nSynapsesPerSeg = pool.rowLengths(segments)
+      nSynapses = int(nSynapsesPerSeg.sum())
+      distSegSizes = histogram(nSynapsesPerSeg)
+
+      # Accumulate permanence value histogram
+      permanences = pool.slotPermanences(pool.rowSlots(segments))
+      distPermValues = histogram((permanences * 10).astype("int64"))
+
+      # Accumulate segment age histogram. Like list indices, negative buckets
+      # count from the end.
+      ages = self.lrnIterationIdx - pool.lastActiveIterations[segments]
+      ageCounts = numpy.bincount((ages // ageBucketSize) % numAgeBuckets,
+                                 minlength=numAgeBuckets)
+      for ageBucket in xrange(numAgeBuckets):
+        distAges[ageBucket][1] += int(ageCounts[ageBucket])
+
+      # Get active synapse statistics if requested
+      if collectActiveData:
+        activity = pool.computeActivity(
+          self._cellMask(self.infActiveState['t']), self.connectedPerm,
+          segments)
+        nActiveSegs = int((activity >= self.activationThreshold).sum())
+        nActiveSynapses = int(pool.computeActivity(
+          self._cellMask(self.activeState['t'] == 1), None, segments).sum())
 
     return (nSegments, nSynapses, nActiveSegs, nActiveSynapses,
             distSegSizes, distNSegsPerCell, distPermValues, distAges)
@@ -2181,7 +2229,8 @@ class TM(ConsolePrinterMixin):
 class Segment(object):
   """
   The Segment class is a container for all of the segment variables and
-  the synapses it owns.
+  the synapses it owns. The synapses are stored in the SegmentPool of the TP,
+  in the row of the segment's index.
   """
 
   ## These are iteration count tiers used when computing segment duty cycle.
@@ -2201,6 +2250,9 @@ class Segment(object):
     self.segID = tp.segID
     tp.segID += 1
 
+    # The row of the segment in tp._segmentPool, None once it's removed
+    self._index = tp._segmentPool.createSegment()
+
     self.isSequenceSeg = isSequenceSeg
     self.lastActiveIteration = tp.lrnIterationIdx
 
@@ -2213,8 +2265,70 @@ class Segment(object):
     self._lastPosDutyCycle = 1.0 / tp.lrnIterationIdx
     self._lastPosDutyCycleIteration = tp.lrnIterationIdx
 
-    # Each synapse is a tuple (srcCellCol, srcCellIdx, permanence)
-    self.syns = []
+
+  @property
+  def syns(self):
+    """
+    The synapses of the segment, as a list of [srcCellCol, srcCellIdx,
+    permanence]. Modifying the list doesn't change the segment.
+    """
+    pool = self.tp._segmentPool
+    cols, cellIdxs = divmod(pool.presynapticCells(self._index),
+                            self.tp.cellsPerColumn)
+    return [[col, cellIdx, perm]
+            for col, cellIdx, perm in zip(cols.tolist(), cellIdxs.tolist(),
+                                          pool.permanences(self._index))]
+
+
+  @property
+  def lastActiveIteration(self):
+    return int(self.tp._segmentPool.lastActiveIterations[self._index])
+
+
+  @lastActiveIteration.setter
+  def lastActiveIteration(self, iteration):
+    self.tp._segmentPool.lastActiveIterations[self._index] = iteration
+
+
+  def __getstate__(self):
+    """
+    Return the state in the format used before the synapses were moved to the
+    SegmentPool, with the synapses in 'syns'.
+    """
+    state = self.__dict__.copy()
+    state.pop('_index')
+    state['syns'] = self.syns
+    state['lastActiveIteration'] = self.lastActiveIteration
+    return state
+
+
+  def __setstate__(self, state):
+    """
+    The synapses are kept aside until the TP is restored and calls _restore.
+    """
+    state = state.copy()
+    self._pendingSyns = state.pop('syns')
+    self._pendingLastActiveIteration = state.pop('lastActiveIteration')
+    self.__dict__.update(state)
+
+
+  def _restore(self, cell):
+    """
+    Put the synapses of a segment restored from a pickle into the SegmentPool
+    of the TP.
+
+    @param cell The flat index of the segment's cell
+    """
+    pool = self.tp._segmentPool
+    self._index = pool.createSegment()
+    pool.segmentCells[self._index] = cell
+
+    syns = self.__dict__.pop('_pendingSyns')
+    pool.appendSynapses(self._index,
+                        [col * self.tp.cellsPerColumn + cellIdx
+                         for col, cellIdx, _ in syns],
+                        [perm for _, _, perm in syns])
+    self.lastActiveIteration = self.__dict__.pop('_pendingLastActiveIteration')
 
 
   def __ne__(self, s):
@@ -2227,11 +2341,12 @@ class Segment(object):
     if set(d1) != set(d2):
       return False
     for k, v in d1.iteritems():
-      if k in ('tp',):
+      if k in ('tp', '_index'):
         continue
       elif v != d2[k]:
         return False
-    return True
+    return (self.lastActiveIteration == s.lastActiveIteration and
+            self.syns == s.syns)
 
 
   def dutyCycle(self, active=False, readOnly=False):
@@ -2357,7 +2472,7 @@ class Segment(object):
 
 
   def getNumSynapses(self):
-    return len(self.syns)
+    return self.tp._segmentPool.numSynapses(self._index)
 
 
   def freeNSynapses(self, numToFree, inactiveSynapseIndices, verbosity= 0):
@@ -2368,34 +2483,33 @@ class Segment(object):
     @param numToFree              number of synapses to free up
     @param inactiveSynapseIndices list of the inactive synapse indices.
     """
+    pool = self.tp._segmentPool
+    permanences = pool.permanences(self._index)
+
     # Make sure numToFree isn't larger than the total number of syns we have
-    assert (numToFree <= len(self.syns))
+    assert (numToFree <= len(permanences))
 
     if (verbosity >= 4):
+      syns = self.syns
       print "\nIn PY freeNSynapses with numToFree =", numToFree,
       print "inactiveSynapseIndices =",
       for i in inactiveSynapseIndices:
-        print self.syns[i][0:2],
+        print syns[i][0:2],
       print
 
     # Remove the lowest perm inactive synapses first
-    if len(inactiveSynapseIndices) > 0:
-      perms = numpy.array([self.syns[i][2] for i in inactiveSynapseIndices])
-      candidates = numpy.array(inactiveSynapseIndices)[
-          perms.argsort()[0:numToFree]]
-      candidates = list(candidates)
-    else:
-      candidates = []
+    inactiveSynIndices = numpy.array(inactiveSynapseIndices, dtype="int64")
+    candidates = inactiveSynIndices[
+        permanences[inactiveSynIndices].argsort()[0:numToFree]]
 
     # Do we need more? if so, remove the lowest perm active synapses too
     if len(candidates) < numToFree:
-      activeSynIndices = [i for i in xrange(len(self.syns))
-                          if i not in inactiveSynapseIndices]
-      perms = numpy.array([self.syns[i][2] for i in activeSynIndices])
+      activeSynIndices = numpy.setdiff1d(numpy.arange(len(permanences)),
+                                         inactiveSynIndices)
       moreToFree = numToFree - len(candidates)
-      moreCandidates = numpy.array(activeSynIndices)[
-          perms.argsort()[0:moreToFree]]
-      candidates += list(moreCandidates)
+      moreCandidates = activeSynIndices[
+          permanences[activeSynIndices].argsort()[0:moreToFree]]
+      candidates = numpy.append(candidates, moreCandidates)
 
     if verbosity >= 4:
       print "Deleting %d synapses from segment to make room for new ones:" % (
@@ -2404,9 +2518,9 @@ class Segment(object):
       self.printSegment()
 
     # Free up all the candidates now
-    synsToDelete = [self.syns[i] for i in candidates]
-    for syn in synsToDelete:
-      self.syns.remove(syn)
+    keep = numpy.ones(len(permanences), dtype="bool")
+    keep[candidates] = False
+    pool.compactRows([self._index], keep)
 
     if verbosity >= 4:
       print "AFTER:",
@@ -2420,7 +2534,9 @@ class Segment(object):
     @param srcCellIdx source cell index within the column
     @param perm       initial permanence
     """
-    self.syns.append([int(srcCellCol), int(srcCellIdx), numpy.float32(perm)])
+    self.tp._segmentPool.appendSynapses(
+      self._index, [int(srcCellCol) * self.tp.cellsPerColumn + int(srcCellIdx)],
+      [perm])
 
 
   def updateSynapses(self, synapses, delta):
@@ -2432,23 +2548,331 @@ class Segment(object):
 
     @returns   True if synapse reached 0
     """
+    permanences = self.tp._segmentPool.permanences(self._index)
+    synapses = numpy.fromiter(synapses, dtype="int64")
+    newValues = permanences[synapses] + delta
+
     reached0 = False
 
     if delta > 0:
-      for synapse in synapses:
-        self.syns[synapse][2] = newValue = self.syns[synapse][2] + delta
+      # Cap synapse permanence at permanenceMax
+      permanences[synapses] = numpy.minimum(newValues, self.tp.permanenceMax)
+
+    else:
+      # Cap min synapse permanence to 0 in case there is no global decay
+      reached0 = bool((newValues <= 0).any())
+      permanences[synapses] = numpy.maximum(newValues, 0)
+
+    return reached0
+
+
+
+################################################################################
+################################################################################
+
+
+class SegmentPool(object):
+  """
+  Flat storage for the synapses of every segment of a TM.
+
+  Each segment owns a row of slots [start, start + capacity) in preallocated
+  typed arrays of presynaptic cells and permanences, and its synapses occupy
+  the first 'length' slots in the order they were added. Presynaptic cells are
+  flat cell indices, column * cellsPerColumn + cell. Unused slots point at a
+  sentinel cell that is never active, so the activity of every segment is one
+  masked bincount over the arrays.
+
+  When a row runs out of capacity it moves to the end of the arrays with twice
+  the capacity it needs. The abandoned slots are reclaimed by a compaction
+  once they make up half of the storage.
+  """
 
-        # Cap synapse permanence at permanenceMax
-        if newValue > self.tp.permanenceMax:
-          self.syns[synapse][2] = self.tp.permanenceMax
+  # The smallest row capacity allocated for a segment that grows synapses.
+  MIN_ROW_CAPACITY = 8
 
+  def __init__(self, numCells):
+    """
+    @param numCells Number of cells in the TM
+    """
+    self.numCells = numCells
+
+    # Segments. The cell of a segment is -1 until it's placed on a cell, and
+    # after it's destroyed.
+    self.segmentCells = numpy.empty(0, dtype="int32")
+    self.lastActiveIterations = numpy.empty(0, dtype="int64")
+    self._rowStarts = numpy.empty(0, dtype="int64")
+    self._rowLengths = numpy.empty(0, dtype="int64")
+    self._rowCapacities = numpy.empty(0, dtype="int64")
+    self._numSegments = 0
+    self._freeSegments = []
+
+    # Synapses. The cell "numCells" is the sentinel for an empty slot.
+    self._presynapticCells = numpy.empty(0, dtype="int32")
+    self._permanences = numpy.empty(0, dtype="float32")
+    self._slotSegments = numpy.empty(0, dtype="int32")
+    self._numSlots = 0
+    self._numGarbageSlots = 0
+
+
+  def createSegment(self):
+    """
+    @returns The index of a new segment without synapses. Destroyed segments
+             are reused first.
+    """
+    if len(self._freeSegments) > 0:
+      index = self._freeSegments.pop()
     else:
-      for synapse in synapses:
-        self.syns[synapse][2] = newValue = self.syns[synapse][2] + delta
+      self._reserveSegments(self._numSegments + 1)
+      index = self._numSegments
+      self._numSegments += 1
 
-        # Cap min synapse permanence to 0 in case there is no global decay
-        if newValue <= 0:
-          self.syns[synapse][2] = 0
-          reached0 = True
+    self.segmentCells[index] = -1
+    self.lastActiveIterations[index] = 0
+    self._rowStarts[index] = 0
+    self._rowLengths[index] = 0
+    self._rowCapacities[index] = 0
+    return index
 
-    return reached0
+
+  def destroySegment(self, index):
+    """
+    Remove a segment and all of its synapses.
+    """
+    self._clearSlots(self._rowStarts[index], self._rowCapacities[index])
+    self._numGarbageSlots += self._rowCapacities[index]
+    self.segmentCells[index] = -1
+    self._rowLengths[index] = 0
+    self._rowCapacities[index] = 0
+    self._freeSegments.append(index)
+
+
+  def numSynapses(self, index):
+    return int(self._rowLengths[index])
+
+
+  def presynapticCells(self, index):
+    """
+    @returns A view of the presynaptic cells of the segment's synapses. It is
+             invalidated by any change to the synapses.
+    """
+    start = self._rowStarts[index]
+    return self._presynapticCells[start:start + self._rowLengths[index]]
+
+
+  def permanences(self, index):
+    """
+    @returns A writable view of the permanences of the segment's synapses. It
+             is invalidated by any change to the synapses.
+    """
+    start = self._rowStarts[index]
+    return self._permanences[start:start + self._rowLengths[index]]
+
+
+  def liveSegments(self):
+    """
+    @returns The indices of the segments that are on a cell.
+    """
+    return numpy.flatnonzero(self.segmentCells[:self._numSegments] >= 0)
+
+
+  def rowSlots(self, segments):
+    """
+    @returns The occupied slots of the specified segments, grouped by segment
+             in the order the segments are given.
+    """
+    segments = numpy.asarray(segments, dtype="int64")
+    return _raggedRange(self._rowStarts[segments], self._rowLengths[segments])
+
+
+  def rowLengths(self, segments):
+    return self._rowLengths[numpy.asarray(segments, dtype="int64")]
+
+
+  def slotPermanences(self, slots):
+    return self._permanences[slots]
+
+
+  def setSlotPermanences(self, slots, permanences):
+    self._permanences[slots] = permanences
+
+
+  def computeActivity(self, cellMask, permanenceThreshold=None,
+                      segments=None):
+    """
+    Count the synapses from active cells on each segment.
+
+    @param cellMask  Boolean array with one entry per cell, plus a final False
+                     entry for the sentinel
+    @param permanenceThreshold If not None, only count synapses with at least
+                     this permanence
+    @param segments  If not None, only compute the activity of these segments
+
+    @returns The activity of every segment, indexed by segment, or of the
+             specified segments, in order
+    """
+    if segments is not None:
+      segments = numpy.asarray(segments, dtype="int64")
+      slots = self.rowSlots(segments)
+      hits = cellMask[self._presynapticCells[slots]]
+      if permanenceThreshold is not None:
+        hits &= self._permanences[slots] >= permanenceThreshold
+      return numpy.bincount(
+        numpy.repeat(numpy.arange(len(segments)),
+                     self._rowLengths[segments])[hits],
+        minlength=len(segments))
+
+    hits = cellMask[self._presynapticCells[:self._numSlots]]
+    if permanenceThreshold is not None:
+      hits &= self._permanences[:self._numSlots] >= permanenceThreshold
+    return numpy.bincount(self._slotSegments[:self._numSlots][hits],
+                          minlength=self._numSegments)
+
+
+  def appendSynapses(self, index, presynapticCells, permanences):
+    """
+    Add synapses to the end of a segment's row.
+    """
+    presynapticCells = numpy.asarray(presynapticCells, dtype="int32")
+    if len(presynapticCells) == 0:
+      return
+
+    length = self._rowLengths[index]
+    required = length + len(presynapticCells)
+    if required > self._rowCapacities[index]:
+      self._relocateRow(index, required)
+
+    start = self._rowStarts[index] + length
+    self._presynapticCells[start:start + len(presynapticCells)] = (
+      presynapticCells)
+    self._permanences[start:start + len(presynapticCells)] = permanences
+    self._rowLengths[index] = required
+
+
+  def compactRows(self, segments, keep):
+    """
+    Remove synapses from the specified segments, keeping the order of the
+    remaining ones.
+
+    @param segments Unique segment indices
+    @param keep     Boolean array with one entry per occupied slot of the
+                    segments, in the order of rowSlots(segments)
+
+    @returns The number of synapses remaining on each of the segments
+    """
+    segments = numpy.asarray(segments, dtype="int64")
+    if keep.all():
+      return self._rowLengths[segments]
+
+    slots = self.rowSlots(segments)
+    lengths = self._rowLengths[segments]
+    keptCounts = numpy.bincount(
+      numpy.repeat(numpy.arange(len(segments)), lengths)[keep],
+      minlength=len(segments)).astype("int64")
+    dest = _raggedRange(self._rowStarts[segments], keptCounts)
+    src = slots[keep]
+    self._presynapticCells[dest] = self._presynapticCells[src]
+    self._permanences[dest] = self._permanences[src]
+
+    self._clearSlots(self._rowStarts[segments] + keptCounts,
+                     lengths - keptCounts)
+    self._rowLengths[segments] = keptCounts
+    return keptCounts
+
+
+  def _relocateRow(self, index, required):
+    """
+    Move a row to the end of the arrays, giving it twice the capacity it
+    requires.
+    """
+    self._compactIfWasteful()
+
+    capacity = max(2*required, self.MIN_ROW_CAPACITY)
+    start = self._numSlots
+    self._reserveSlots(self._numSlots + capacity)
+
+    oldStart = self._rowStarts[index]
+    length = self._rowLengths[index]
+    self._presynapticCells[start:start + length] = (
+      self._presynapticCells[oldStart:oldStart + length])
+    self._permanences[start:start + length] = (
+      self._permanences[oldStart:oldStart + length])
+    self._slotSegments[start:start + capacity] = index
+
+    self._clearSlots(oldStart, self._rowCapacities[index])
+    self._numGarbageSlots += self._rowCapacities[index]
+
+    self._rowStarts[index] = start
+    self._rowCapacities[index] = capacity
+    self._numSlots += capacity
+
+
+  def _compactIfWasteful(self):
+    """
+    Rebuild the arrays without abandoned slots once they make up half of the
+    storage. Every row keeps its capacity.
+    """
+    if self._numGarbageSlots * 2 <= self._numSlots:
+      return
+
+    segments = numpy.arange(self._numSegments)
+    capacities = self._rowCapacities[:self._numSegments]
+    lengths = self._rowLengths[:self._numSegments]
+    starts = numpy.cumsum(capacities) - capacities
+    numSlots = capacities.sum()
+
+    src = _raggedRange(self._rowStarts[:self._numSegments], lengths)
+    dest = _raggedRange(starts, lengths)
+
+    presynapticCells = numpy.full(max(numSlots, 1), self.numCells,
+                                  dtype="int32")
+    permanences = numpy.zeros(max(numSlots, 1), dtype="float32")
+    slotSegments = numpy.zeros(max(numSlots, 1), dtype="int32")
+    presynapticCells[dest] = self._presynapticCells[src]
+    permanences[dest] = self._permanences[src]
+    slotSegments[_raggedRange(starts, capacities)] = numpy.repeat(segments,
+                                                                  capacities)
+
+    self._presynapticCells = presynapticCells
+    self._permanences = permanences
+    self._slotSegments = slotSegments
+    self._rowStarts[:self._numSegments] = starts
+    self._numSlots = numSlots
+    self._numGarbageSlots = 0
+
+
+  def _clearSlots(self, starts, lengths):
+    slots = _raggedRange(numpy.atleast_1d(starts), numpy.atleast_1d(lengths))
+    self._presynapticCells[slots] = self.numCells
+    self._permanences[slots] = 0
+
+
+  def _reserveSegments(self, numSegments):
+    capacity = len(self.segmentCells)
+    if numSegments <= capacity:
+      return
+
+    capacity = max(numSegments, 2*capacity)
+    for name in ("segmentCells", "lastActiveIterations", "_rowStarts",
+                 "_rowLengths", "_rowCapacities"):
+      old = getattr(self, name)
+      new = numpy.zeros(capacity, dtype=old.dtype)
+      new[:len(old)] = old
+      setattr(self, name, new)
+
+
+  def _reserveSlots(self, numSlots):
+    capacity = len(self._presynapticCells)
+    if numSlots <= capacity:
+      return
+
+    capacity = max(numSlots, 2*capacity)
+    presynapticCells = numpy.full(capacity, self.numCells, dtype="int32")
+    presynapticCells[:self._numSlots] = self._presynapticCells[:self._numSlots]
+    permanences = numpy.zeros(capacity, dtype="float32")
+    permanences[:self._numSlots] = self._permanences[:self._numSlots]
+    slotSegments = numpy.zeros(capacity, dtype="int32")
+    slotSegments[:self._numSlots] = self._slotSegments[:self._numSlots]
+
+    self._presynapticCells = presynapticCells
+    self._permanences = permanences
+    self._slotSegments = slotSegments
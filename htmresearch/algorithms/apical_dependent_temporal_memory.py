@@ -63,7 +63,8 @@ class ApicalDependentTemporalMemory(object):
                basalPredictedSegmentDecrement=0.0,
                apicalPredictedSegmentDecrement=0.0,
                maxSynapsesPerSegment=-1,
-               seed=42):
+               seed=42,
+               connectionsClass=SparseMatrixConnections):
     """
     @param columnCount (int)
     The number of minicolumns
@@ -117,6 +118,10 @@ class ApicalDependentTemporalMemory(object):
 
     @param seed (int)
     Seed for the random number generator.
+
+    @param connectionsClass (class)
+    The class that stores the basal and apical connections. Any class with the
+    SparseMatrixConnections interface works, e.g. CSRConnections.
     """
 
     self.columnCount = columnCount
@@ -132,12 +137,12 @@ class ApicalDependentTemporalMemory(object):
     self.activationThreshold = activationThreshold
     self.reducedBasalThreshold = reducedBasalThreshold
     self.maxSynapsesPerSegment = maxSynapsesPerSegment
-    self.basalConnections = SparseMatrixConnections(columnCount*cellsPerColumn,
-                                                    basalInputSize)
+    self.basalConnections = connectionsClass(columnCount*cellsPerColumn,
+                                             basalInputSize)
     self.disableApicalDependence = False
 
-    self.apicalConnections = SparseMatrixConnections(columnCount*cellsPerColumn,
-                                                     apicalInputSize)
+    self.apicalConnections = connectionsClass(columnCount*cellsPerColumn,
+                                              apicalInputSize)
     self.rng = Random(seed)
     self.activeCells = np.empty(0, dtype="uint32")
     self.winnerCells = np.empty(0, dtype="uint32")
@@ -982,7 +987,8 @@ class ApicalDependentSequenceMemory(ApicalDependentTemporalMemory):
                basalPredictedSegmentDecrement=0.0,
                apicalPredictedSegmentDecrement=0.0,
                maxSynapsesPerSegment=-1,
-               seed=42):
+               seed=42,
+               connectionsClass=SparseMatrixConnections):
     params = {
       "columnCount": columnCount,
       "basalInputSize": columnCount * cellsPerColumn,
@@ -1000,6 +1006,7 @@ class ApicalDependentSequenceMemory(ApicalDependentTemporalMemory):
       "apicalPredictedSegmentDecrement": apicalPredictedSegmentDecrement,
       "maxSynapsesPerSegment": maxSynapsesPerSegment,
       "seed": seed,
+      "connectionsClass": connectionsClass,
     }
 
     super(ApicalDependentSequenceMemory, self).__init__(**params)
@@ -68,7 +68,8 @@ class ApicalTiebreakTemporalMemory(object):
                basalPredictedSegmentDecrement=0.0,
                apicalPredictedSegmentDecrement=0.0,
                maxSynapsesPerSegment=-1,
-               seed=42):
+               seed=42,
+               connectionsClass=SparseMatrixConnections):
     """
     @param columnCount (int)
     The number of minicolumns
@@ -122,6 +123,10 @@ class ApicalTiebreakTemporalMemory(object):
 
     @param seed (int)
     Seed for the random number generator.
+
+    @param connectionsClass (class)
+    The class that stores the basal and apical connections. Any class with the
+    SparseMatrixConnections interface works, e.g. CSRConnections.
     """
 
     self.columnCount = columnCount
@@ -138,10 +143,10 @@ class ApicalTiebreakTemporalMemory(object):
     self.activationThreshold = activationThreshold
     self.maxSynapsesPerSegment = maxSynapsesPerSegment
 
-    self.basalConnections = SparseMatrixConnections(columnCount*cellsPerColumn,
-                                                    basalInputSize)
-    self.apicalConnections = SparseMatrixConnections(columnCount*cellsPerColumn,
-                                                     apicalInputSize)
+    self.basalConnections = connectionsClass(columnCount*cellsPerColumn,
+                                             basalInputSize)
+    self.apicalConnections = connectionsClass(columnCount*cellsPerColumn,
+                                              apicalInputSize)
     self.rng = Random(seed)
     self.activeCells = np.empty(0, dtype="uint32")
     self.winnerCells = np.empty(0, dtype="uint32")
@@ -328,6 +333,168 @@ class ApicalTiebreakTemporalMemory(object):
     self.predictedActiveCells = correctPredictedCells
 
 
+  def depolarizeCellsBatch(self, basalInputs, apicalInputs):
+    """
+    Calculate predictions for a batch of independent streams that share this
+    TM's connections. This is inference only: no learning happens and the TM's
+    own cell and segment activity is left untouched.
+
+    The state of every stream is stored in one array of "stream cells", where
+    cell c of stream i is identified by i * numberOfCells() + c. Use
+    splitStreamCells to get one array of cells per stream.
+
+    @param basalInputs (sequence of numpy arrays)
+    The active basal input bits, one array per stream
+
+    @param apicalInputs (sequence of numpy arrays)
+    The active apical input bits, one array per stream
+
+    @return (numpy array)
+    Sorted stream cells that are predicted
+    """
+    cellCount = self.numberOfCells()
+
+    (cellsForApicalSegments,
+     _) = self._calculateActiveSegmentCellsBatch(
+       self.apicalConnections, apicalInputs, self.connectedPermanence,
+       self.activationThreshold, cellCount)
+
+    # Cells with active apical segments have a lower basal threshold. Gather
+    # every segment that could be active, then drop the ones that only reached
+    # the reduced threshold on cells without an active apical segment.
+    if self.useApicalModulationBasalThreshold:
+      basalThreshold = min(self.activationThreshold, self.reducedBasalThreshold)
+    else:
+      basalThreshold = self.activationThreshold
+
+    (cellsForBasalSegments,
+     basalOverlaps) = self._calculateActiveSegmentCellsBatch(
+       self.basalConnections, basalInputs, self.connectedPermanence,
+       basalThreshold, cellCount)
+
+    if basalThreshold < self.activationThreshold:
+      activeMask = ((basalOverlaps >= self.activationThreshold) |
+                    np.in1d(cellsForBasalSegments, cellsForApicalSegments))
+      cellsForBasalSegments = cellsForBasalSegments[activeMask]
+
+    return np.unique(self._calculatePredictedCellsFromSegmentCells(
+      cellsForBasalSegments, cellsForApicalSegments))
+
+
+  def activateCellsBatch(self, activeColumns, predictedCells):
+    """
+    Activate cells for a batch of independent streams, using the result of
+    'depolarizeCellsBatch' as predictions. No learning happens.
+
+    @param activeColumns (sequence of numpy arrays)
+    The active columns, one array per stream
+
+    @param predictedCells (numpy array)
+    Sorted stream cells that are predicted, as returned by
+    'depolarizeCellsBatch'
+
+    @return (tuple)
+    - activeCells (numpy array)
+      Sorted stream cells that are active
+
+    - predictedActiveCells (numpy array)
+      Sorted stream cells that are active and were correctly predicted
+    """
+    streamColumns = self._toStreamIndices(activeColumns, self.columnCount)
+
+    # A stream cell divided by cellsPerColumn is a stream column, so the usual
+    # single-stream calculation works unchanged on the whole batch.
+    (correctPredictedCells,
+     burstingColumns) = np2.setCompare(predictedCells, streamColumns,
+                                       predictedCells / self.cellsPerColumn,
+                                       rightMinusLeft=True)
+    activeCells = np.concatenate((correctPredictedCells,
+                                  np2.getAllCellsInColumns(
+                                    burstingColumns, self.cellsPerColumn)))
+    activeCells.sort()
+
+    return (activeCells,
+            correctPredictedCells)
+
+
+  def splitStreamCells(self, streamCells, numStreams):
+    """
+    Convert sorted stream cells into one array of cells per stream.
+
+    @param streamCells (numpy array)
+    Sorted stream cells, as returned by the batch methods
+
+    @param numStreams (int)
+    The number of streams in the batch
+
+    @return (list of numpy arrays)
+    The cells of each stream
+    """
+    cellCount = self.numberOfCells()
+    boundaries = np.searchsorted(
+      streamCells, np.arange(1, numStreams, dtype="int64") * cellCount)
+
+    return [(cells - i*cellCount).astype("uint32")
+            for i, cells in enumerate(np.split(streamCells, boundaries))]
+
+
+  @staticmethod
+  def _toStreamIndices(arrays, size):
+    """
+    Concatenate one array of indices per stream, offsetting the indices of
+    stream i by i * size.
+
+    @param arrays (sequence of numpy arrays)
+    @param size (int)
+
+    @return (numpy array)
+    """
+    lengths = [len(indices) for indices in arrays]
+    offsets = np.repeat(np.arange(len(arrays), dtype="int64") * size, lengths)
+
+    return offsets + np.concatenate(
+      [np.asarray(indices, dtype="int64") for indices in arrays])
+
+
+  @staticmethod
+  def _calculateActiveSegmentCellsBatch(connections, activeInputs,
+                                        connectedPermanence, threshold,
+                                        cellCount):
+    """
+    Calculate the active segments of a batch of streams.
+
+    Only the overlap calculation touches the connections once per stream. The
+    segment-to-cell mapping is done once for the whole batch.
+
+    @param connections (SparseMatrixConnections)
+    @param activeInputs (sequence of numpy arrays)
+
+    @return (tuple)
+    - segmentCells (numpy array)
+      The stream cell of each active segment
+
+    - overlaps (numpy array)
+      The number of active connected synapses of each active segment
+    """
+    activeSegments = []
+    activeOverlaps = []
+    for activeInput in activeInputs:
+      overlaps = connections.computeActivity(
+        np.asarray(activeInput, dtype="uint32"), connectedPermanence)
+      segments = np.flatnonzero(overlaps >= threshold)
+      activeSegments.append(segments)
+      activeOverlaps.append(overlaps[segments])
+
+    segments = np.concatenate(activeSegments)
+    streams = np.repeat(np.arange(len(activeSegments), dtype="int64"),
+                        [len(s) for s in activeSegments])
+    segmentCells = (streams * cellCount +
+                    connections.mapSegmentsToCells(segments))
+
+    return (segmentCells,
+            np.concatenate(activeOverlaps))
+
+
   def _calculateBasalLearning(self,
                               activeColumns,
                               burstingColumns,
@@ -585,6 +752,27 @@ class ApicalTiebreakTemporalMemory(object):
     cellsForApicalSegments = self.apicalConnections.mapSegmentsToCells(
       activeApicalSegments)
 
+    return self._calculatePredictedCellsFromSegmentCells(cellsForBasalSegments,
+                                                         cellsForApicalSegments)
+
+
+  def _calculatePredictedCellsFromSegmentCells(self, cellsForBasalSegments,
+                                               cellsForApicalSegments):
+    """
+    Calculate the predicted cells, given the cells of the active segments.
+
+    The cells are only compared by their column (cell / cellsPerColumn), so this
+    also works on the "stream cells" used by the batch methods.
+
+    @param cellsForBasalSegments (numpy array)
+    The cell of each active basal segment
+
+    @param cellsForApicalSegments (numpy array)
+    The cell of each active apical segment
+
+    @return (numpy array)
+    """
+
     fullyDepolarizedCells = np.intersect1d(cellsForBasalSegments,
                                            cellsForApicalSegments)
     partlyDepolarizedCells = np.setdiff1d(cellsForBasalSegments,
@@ -1073,6 +1261,42 @@ class ApicalTiebreakPairMemory(ApicalTiebreakTemporalMemory):
                        basalGrowthCandidates, apicalGrowthCandidates, learn)
 
 
+  def computeBatch(self, activeColumns, basalInputs, apicalInputs=None):
+    """
+    Perform one timestep of inference for a batch of independent streams that
+    share this TM's connections. Nothing is learned.
+
+    Results are "stream cells": cell c of stream i is
+    i * numberOfCells() + c. Use splitStreamCells to unpack them.
+
+    @param activeColumns (sequence of numpy arrays)
+    The active columns, one array per stream
+
+    @param basalInputs (sequence of numpy arrays)
+    The active basal input bits, one array per stream
+
+    @param apicalInputs (sequence of numpy arrays or None)
+    The active apical input bits, one array per stream. If None, no stream has
+    apical input.
+
+    @return (tuple)
+    - predictedCells (numpy array)
+      Sorted stream cells that were predicted for this timestep
+
+    - activeCells (numpy array)
+      Sorted stream cells that are active
+    """
+    if apicalInputs is None:
+      apicalInputs = [()] * len(basalInputs)
+
+    predictedCells = self.depolarizeCellsBatch(basalInputs, apicalInputs)
+    (activeCells,
+     _) = self.activateCellsBatch(activeColumns, predictedCells)
+
+    return (predictedCells,
+            activeCells)
+
+
   def getPredictedCells(self):
     """
     @return (numpy array)
@@ -1123,7 +1347,8 @@ class ApicalTiebreakSequenceMemory(ApicalTiebreakTemporalMemory):
                basalPredictedSegmentDecrement=0.0,
                apicalPredictedSegmentDecrement=0.0,
                maxSynapsesPerSegment=-1,
-               seed=42):
+               seed=42,
+               connectionsClass=SparseMatrixConnections):
     params = {
       "columnCount": columnCount,
       "basalInputSize": columnCount * cellsPerColumn,
@@ -1141,6 +1366,7 @@ class ApicalTiebreakSequenceMemory(ApicalTiebreakTemporalMemory):
       "apicalPredictedSegmentDecrement": apicalPredictedSegmentDecrement,
       "maxSynapsesPerSegment": maxSynapsesPerSegment,
       "seed": seed,
+      "connectionsClass": connectionsClass,
     }
 
     super(ApicalTiebreakSequenceMemory, self).__init__(**params)
@@ -1201,6 +1427,46 @@ class ApicalTiebreakSequenceMemory(ApicalTiebreakTemporalMemory):
     self.prevApicalGrowthCandidates = apicalGrowthCandidates.copy()
 
 
+  def computeBatch(self, activeColumns, predictedCells, apicalInputs=None):
+    """
+    Perform one timestep of inference for a batch of independent streams that
+    share this TM's connections. Nothing is learned.
+
+    The caller keeps the state of the streams: the predictedCells returned by
+    one call are passed into the next one. Start every stream with an empty
+    array, which is equivalent to a reset. Cells are "stream cells": cell c of
+    stream i is i * numberOfCells() + c. Use splitStreamCells to unpack them.
+
+    @param activeColumns (sequence of numpy arrays)
+    The active columns, one array per stream
+
+    @param predictedCells (numpy array)
+    Sorted stream cells predicted by the previous timestep
+
+    @param apicalInputs (sequence of numpy arrays or None)
+    The active apical input bits, one array per stream. If None, no stream has
+    apical input.
+
+    @return (tuple)
+    - activeCells (numpy array)
+      Sorted stream cells that are active
+
+    - nextPredictedCells (numpy array)
+      Sorted stream cells that are predicted for the next timestep
+    """
+    numStreams = len(activeColumns)
+    if apicalInputs is None:
+      apicalInputs = [()] * numStreams
+
+    (activeCells,
+     _) = self.activateCellsBatch(activeColumns, predictedCells)
+    nextPredictedCells = self.depolarizeCellsBatch(
+      self.splitStreamCells(activeCells, numStreams), apicalInputs)
+
+    return (activeCells,
+            nextPredictedCells)
+
+
   def getPredictedCells(self):
     """
     @return (numpy array)
@@ -0,0 +1,712 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""A pure numpy Connections class with the SparseMatrixConnections interface"""
+
+import numpy as np
+
+
+
+class CSRConnections(object):
+  """
+  A drop-in replacement for nupic's SparseMatrixConnections, implemented in
+  numpy. Every method works on numpy arrays of segments, inputs and cells, so
+  the whole inner loop is visible to Python profilers and can be vectorized
+  further.
+
+  Synapses are stored in flat arrays in a CSR-like layout. Each segment owns a
+  contiguous row of slots [start, start + capacity), and its synapses occupy the
+  first 'length' slots. Unused slots point at a sentinel input that is never
+  active. When a row runs out of capacity it is moved to the end of the flat
+  arrays with twice the capacity it needs, so growing a segment is amortized
+  O(1) per synapse. The abandoned slots are reclaimed by a compaction once they
+  make up half of the storage.
+
+  computeActivity scans every slot. When the synapses stop changing, e.g. during
+  inference, it builds an index from inputs to slots and then only visits the
+  synapses of the active inputs.
+
+  Unlike SparseMatrixConnections, the order in which this class samples new
+  synapses doesn't match the C++ implementation, so results are statistically
+  equivalent rather than identical.
+  """
+
+  # The smallest row capacity allocated for a segment that grows synapses.
+  MIN_ROW_CAPACITY = 8
+
+  # Like nupic's SparseMatrix, permanences at or below this value are zero.
+  EPSILON = 1e-6
+
+  # Like SparseMatrixConnections, destroyed segments are mapped to this cell.
+  DESTROYED_SEGMENT_CELL = np.iinfo("uint32").max
+
+  # Build the input index after this many computeActivity calls without any
+  # synapse being added, moved or removed. Building it costs roughly as much
+  # as this many scans.
+  INDEX_AFTER_CALLS = 32
+
+  def __init__(self, numCells, numInputs):
+    """
+    @param numCells (int)
+    The number of cells in this layer
+
+    @param numInputs (int)
+    The number of input bits
+    """
+    self.numCells = numCells
+    self.numInputs = numInputs
+
+    # Segments
+    self._segmentCells = np.empty(0, dtype="uint32")
+    self._rowStarts = np.empty(0, dtype="int64")
+    self._rowLengths = np.empty(0, dtype="int64")
+    self._rowCapacities = np.empty(0, dtype="int64")
+    self._numSegments = 0
+    self._freeSegments = np.empty(0, dtype="uint32")
+    self._segmentCounts = np.zeros(numCells, dtype="int32")
+
+    # Synapses. The input "numInputs" is the sentinel for an empty slot.
+    self._presynapticCells = np.empty(0, dtype="uint32")
+    self._permanences = np.empty(0, dtype="float32")
+    self._slotSegments = np.empty(0, dtype="uint32")
+    self._numSlots = 0
+    self._numGarbageSlots = 0
+
+    # Index from inputs to slots, built lazily.
+    self._inputIndexSlots = None
+    self._inputIndexStarts = None
+    self._callsSinceSynapsesMoved = 0
+
+    self.matrix = _CSRMatrixView(self)
+
+
+  def computeActivity(self, activeInputs, permanenceThreshold=None):
+    """
+    Compute the number of active synapses on each segment.
+
+    @param activeInputs (numpy array)
+    The active input bits
+
+    @param permanenceThreshold (float or None)
+    If specified, only count synapses with permanence >= this threshold
+
+    @return (numpy array)
+    The overlap of every segment
+    """
+    self._callsSinceSynapsesMoved += 1
+    if (self._inputIndexSlots is None and
+        self._callsSinceSynapsesMoved >= self.INDEX_AFTER_CALLS):
+      self._buildInputIndex()
+
+    if self._inputIndexSlots is not None:
+      activeInputs = np.asarray(activeInputs, dtype="int64")
+      starts = self._inputIndexStarts[activeInputs]
+      slots = self._inputIndexSlots[
+        _raggedRange(starts, self._inputIndexStarts[activeInputs + 1] - starts)]
+      if permanenceThreshold is not None:
+        slots = slots[self._permanences[slots] >= permanenceThreshold]
+      hitSegments = self._slotSegments[slots]
+    else:
+      hits = self._inputMask(activeInputs)[
+        self._presynapticCells[:self._numSlots]]
+      if permanenceThreshold is not None:
+        hits &= self._permanences[:self._numSlots] >= permanenceThreshold
+      hitSegments = self._slotSegments[:self._numSlots][hits]
+
+    return np.bincount(hitSegments,
+                       minlength=self._numSegments).astype("int32")
+
+
+  def createSegments(self, cells):
+    """
+    Create a segment on each of the specified cells. Destroyed segments are
+    reused before new segment numbers are handed out.
+
+    @param cells (numpy array)
+
+    @return (numpy array)
+    The new segments
+    """
+    cells = np.asarray(cells, dtype="uint32")
+
+    numReused = min(len(cells), len(self._freeSegments))
+    reused = self._freeSegments[:numReused]
+    self._freeSegments = self._freeSegments[numReused:]
+
+    numNew = len(cells) - numReused
+    self._reserveSegments(self._numSegments + numNew)
+    new = np.arange(self._numSegments, self._numSegments + numNew,
+                    dtype="uint32")
+    self._numSegments += numNew
+
+    segments = np.concatenate((reused, new))
+    self._segmentCells[segments] = cells
+    self._rowStarts[segments] = 0
+    self._rowLengths[segments] = 0
+    self._rowCapacities[segments] = 0
+    np.add.at(self._segmentCounts, cells, 1)
+
+    return segments
+
+
+  def destroySegments(self, segments):
+    """
+    Remove the specified segments and all of their synapses.
+
+    @param segments (numpy array)
+    """
+    segments = np.unique(np.asarray(segments, dtype="uint32"))
+
+    self._clearSlots(self._rowStarts[segments], self._rowCapacities[segments])
+    self._numGarbageSlots += self._rowCapacities[segments].sum()
+    self._rowLengths[segments] = 0
+    self._rowCapacities[segments] = 0
+    np.subtract.at(self._segmentCounts, self._segmentCells[segments], 1)
+    self._segmentCells[segments] = self.DESTROYED_SEGMENT_CELL
+
+    self._freeSegments = np.concatenate((self._freeSegments, segments))
+
+
+  def adjustSynapses(self, segments, activeInputs, activeInputDelta,
+                     inactiveInputDelta):
+    """
+    Add the specified deltas to the permanences of the synapses on the
+    specified segments. Synapses whose permanence reaches 0 are removed.
+
+    @param segments (numpy array)
+    @param activeInputs (numpy array)
+    @param activeInputDelta (float)
+    @param inactiveInputDelta (float)
+    """
+    segments = np.asarray(segments, dtype="uint32")
+    slots = self._slotsForSegments(segments)
+    isActive = self._inputMask(activeInputs)[self._presynapticCells[slots]]
+
+    self._permanences[slots] += np.where(isActive,
+                                         np.float32(activeInputDelta),
+                                         np.float32(inactiveInputDelta))
+    self._clipAndRemove(segments, slots)
+
+
+  def adjustActiveSynapses(self, segments, activeInputs, delta):
+    """
+    Add the delta to the permanences of the synapses to active inputs on the
+    specified segments.
+
+    @param segments (numpy array)
+    @param activeInputs (numpy array)
+    @param delta (float)
+    """
+    self.adjustSynapses(segments, activeInputs, delta, 0.0)
+
+
+  def adjustInactiveSynapses(self, segments, activeInputs, delta):
+    """
+    Add the delta to the permanences of the synapses to inactive inputs on the
+    specified segments.
+
+    @param segments (numpy array)
+    @param activeInputs (numpy array)
+    @param delta (float)
+    """
+    self.adjustSynapses(segments, activeInputs, 0.0, delta)
+
+
+  def growSynapses(self, segments, activeInputs, initialPermanence):
+    """
+    Grow a synapse to every active input on each of the specified segments,
+    skipping inputs that the segment is already connected to.
+
+    @param segments (numpy array)
+    @param activeInputs (numpy array)
+    @param initialPermanence (float)
+    """
+    segments = np.asarray(segments, dtype="uint32")
+    (segmentIndices,
+     inputs) = self._newSynapseCandidates(segments, activeInputs)
+
+    self._appendSynapses(segments, segmentIndices, inputs, initialPermanence)
+
+
+  def growSynapsesToSample(self, segments, activeInputs, sampleSize,
+                           initialPermanence, rng):
+    """
+    On each of the specified segments, grow synapses to a random sample of the
+    active inputs that the segment isn't already connected to.
+
+    @param segments (numpy array)
+    @param activeInputs (numpy array)
+
+    @param sampleSize (int or numpy array)
+    The maximum number of synapses to grow on each segment. Either a single
+    number or one number per segment.
+
+    @param initialPermanence (float)
+
+    @param rng (Random)
+    Any random number generator with an 'initializeReal32Array' method
+    """
+    segments = np.asarray(segments, dtype="uint32")
+    (segmentIndices,
+     inputs) = self._newSynapseCandidates(segments, activeInputs)
+
+    # Shuffle the candidates within each segment, then take the first
+    # sampleSize candidates of each segment.
+    randomKeys = np.empty(len(inputs), dtype="float32")
+    rng.initializeReal32Array(randomKeys)
+    order = np.lexsort((randomKeys, segmentIndices))
+    segmentIndices = segmentIndices[order]
+    inputs = inputs[order]
+
+    candidateCounts = np.bincount(segmentIndices, minlength=len(segments))
+    ranks = (np.arange(len(inputs)) -
+             np.repeat(np.cumsum(candidateCounts) - candidateCounts,
+                       candidateCounts))
+    sampleSizes = np.broadcast_to(sampleSize, (len(segments),))
+    chosen = ranks < sampleSizes[segmentIndices]
+
+    self._appendSynapses(segments, segmentIndices[chosen], inputs[chosen],
+                         initialPermanence)
+
+
+  def clipPermanences(self, segments):
+    """
+    Clip the permanences of the specified segments to [0, 1]. Synapses with
+    permanence 0 are removed.
+
+    @param segments (numpy array)
+    """
+    segments = np.asarray(segments, dtype="uint32")
+    self._clipAndRemove(segments, self._slotsForSegments(segments))
+
+
+  def mapSegmentsToCells(self, segments):
+    """
+    @param segments (numpy array)
+
+    @return (numpy array)
+    The cell of each segment
+    """
+    return self._segmentCells[np.asarray(segments, dtype="uint32")]
+
+
+  def mapSegmentsToSynapseCounts(self, segments):
+    """
+    @param segments (numpy array)
+
+    @return (numpy array)
+    The number of synapses on each segment
+    """
+    return self._rowLengths[np.asarray(segments, dtype="uint32")]
+
+
+  def getSegmentCounts(self, cells):
+    """
+    @param cells (numpy array)
+
+    @return (numpy array)
+    The number of segments on each cell
+    """
+    return self._segmentCounts[np.asarray(cells, dtype="uint32")]
+
+
+  def filterSegmentsByCell(self, segments, cells, assumeSorted=False):
+    """
+    @param segments (numpy array)
+    @param cells (numpy array)
+
+    @param assumeSorted (bool)
+    Accepted for compatibility. The result doesn't depend on it.
+
+    @return (numpy array)
+    The segments that are on one of the specified cells
+    """
+    segments = np.asarray(segments, dtype="uint32")
+    return segments[np.in1d(self._segmentCells[segments], cells)]
+
+
+  def sortSegmentsByCell(self, segments):
+    """
+    Sort the segments in-place by cell. Segments on the same cell keep their
+    relative order.
+
+    @param segments (numpy array)
+    """
+    segments[:] = segments[np.argsort(self._segmentCells[segments],
+                                      kind="mergesort")]
+
+
+  def numSegments(self):
+    """
+    @return (int)
+    The number of live segments
+    """
+    return self._numSegments - len(self._freeSegments)
+
+
+  def numSynapses(self):
+    """
+    @return (int)
+    The number of synapses
+    """
+    return int(self._rowLengths[:self._numSegments].sum())
+
+
+  def _inputMask(self, activeInputs):
+    """
+    @return (numpy array)
+    A boolean array with one entry per input plus a final entry for the empty
+    slot sentinel, which is never active.
+    """
+    mask = np.zeros(self.numInputs + 1, dtype="bool")
+    mask[np.asarray(activeInputs, dtype="uint32")] = True
+    return mask
+
+
+  def _buildInputIndex(self):
+    """
+    Sort the slots by presynaptic input. The sentinel input of the empty slots
+    sorts last, so it's never visited.
+    """
+    presynapticCells = self._presynapticCells[:self._numSlots]
+    self._inputIndexSlots = np.argsort(presynapticCells, kind="mergesort")
+    self._inputIndexStarts = np.searchsorted(
+      presynapticCells[self._inputIndexSlots],
+      np.arange(self.numInputs + 1))
+
+
+  def _synapsesMoved(self):
+    self._inputIndexSlots = None
+    self._inputIndexStarts = None
+    self._callsSinceSynapsesMoved = 0
+
+
+  def _slotsForSegments(self, segments):
+    """
+    @return (numpy array)
+    The occupied slots of the specified segments, grouped by segment in the
+    order the segments are given.
+    """
+    return _raggedRange(self._rowStarts[segments], self._rowLengths[segments])
+
+
+  def _newSynapseCandidates(self, segments, activeInputs):
+    """
+    Find the (segment, input) pairs where the segment isn't yet connected to
+    the input.
+
+    @return (tuple)
+    - segmentIndices (numpy array)
+      Sorted indices into 'segments'
+
+    - inputs (numpy array)
+      The input for each pair
+    """
+    activeInputs = np.unique(np.asarray(activeInputs, dtype="uint32"))
+    numInputs = np.int64(self.numInputs)
+
+    slots = self._slotsForSegments(segments)
+    existingKeys = (np.repeat(np.arange(len(segments), dtype="int64"),
+                              self._rowLengths[segments]) * numInputs +
+                    self._presynapticCells[slots])
+
+    segmentIndices = np.repeat(np.arange(len(segments), dtype="int64"),
+                               len(activeInputs))
+    inputs = np.tile(activeInputs, len(segments))
+    isNew = ~np.in1d(segmentIndices * numInputs + inputs, existingKeys)
+
+    return (segmentIndices[isNew],
+            inputs[isNew])
+
+
+  def _appendSynapses(self, segments, segmentIndices, inputs, permanences):
+    """
+    Add synapses to the end of the segments' rows.
+
+    @param segments (numpy array)
+    Unique segments
+
+    @param segmentIndices (numpy array)
+    Sorted indices into 'segments', one for each new synapse
+
+    @param inputs (numpy array)
+    The presynaptic input of each new synapse
+
+    @param permanences (float or numpy array)
+    The permanence of the new synapses
+    """
+    if len(inputs) == 0:
+      return
+
+    counts = np.bincount(segmentIndices,
+                         minlength=len(segments)).astype("int64")
+    required = self._rowLengths[segments] + counts
+    overflowing = required > self._rowCapacities[segments]
+    if overflowing.any():
+      self._relocateRows(segments[overflowing], required[overflowing])
+
+    ranks = (np.arange(len(inputs)) -
+             np.repeat(np.cumsum(counts) - counts, counts))
+    slots = (self._rowStarts[segments][segmentIndices] +
+             self._rowLengths[segments][segmentIndices] + ranks)
+
+    self._presynapticCells[slots] = inputs
+    self._permanences[slots] = permanences
+    self._rowLengths[segments] += counts
+    self._synapsesMoved()
+
+
+  def _relocateRows(self, segments, required):
+    """
+    Move the rows of the specified segments to the end of the flat arrays,
+    giving each row twice the capacity it requires.
+    """
+    self._compactIfWasteful()
+
+    capacities = np.maximum(2*required, self.MIN_ROW_CAPACITY)
+    starts = self._numSlots + np.cumsum(capacities) - capacities
+    self._reserveSlots(self._numSlots + capacities.sum())
+
+    lengths = self._rowLengths[segments]
+    src = _raggedRange(self._rowStarts[segments], lengths)
+    dest = _raggedRange(starts, lengths)
+    self._presynapticCells[dest] = self._presynapticCells[src]
+    self._permanences[dest] = self._permanences[src]
+    self._slotSegments[_raggedRange(starts, capacities)] = np.repeat(
+      segments, capacities)
+
+    self._clearSlots(self._rowStarts[segments], self._rowCapacities[segments])
+    self._numGarbageSlots += self._rowCapacities[segments].sum()
+
+    self._rowStarts[segments] = starts
+    self._rowCapacities[segments] = capacities
+    self._numSlots += capacities.sum()
+
+
+  def _compactIfWasteful(self):
+    """
+    Rebuild the flat arrays without abandoned slots once they make up half of
+    the storage. Every row keeps its capacity.
+    """
+    if self._numGarbageSlots * 2 <= self._numSlots:
+      return
+
+    segments = np.arange(self._numSegments, dtype="uint32")
+    capacities = self._rowCapacities[:self._numSegments]
+    lengths = self._rowLengths[:self._numSegments]
+    starts = np.cumsum(capacities) - capacities
+    numSlots = capacities.sum()
+
+    src = _raggedRange(self._rowStarts[:self._numSegments], lengths)
+    dest = _raggedRange(starts, lengths)
+
+    presynapticCells = np.full(max(numSlots, 1), self.numInputs,
+                               dtype="uint32")
+    permanences = np.zeros(max(numSlots, 1), dtype="float32")
+    slotSegments = np.zeros(max(numSlots, 1), dtype="uint32")
+    presynapticCells[dest] = self._presynapticCells[src]
+    permanences[dest] = self._permanences[src]
+    slotSegments[_raggedRange(starts, capacities)] = np.repeat(segments,
+                                                               capacities)
+
+    self._presynapticCells = presynapticCells
+    self._permanences = permanences
+    self._slotSegments = slotSegments
+    self._rowStarts[:self._numSegments] = starts
+    self._numSlots = numSlots
+    self._numGarbageSlots = 0
+    self._synapsesMoved()
+
+
+  def _clipAndRemove(self, segments, slots):
+    """
+    Clip the permanences in the specified slots to [0, 1] and remove synapses
+    with permanence 0, keeping each row packed.
+
+    @param segments (numpy array)
+    Unique segments
+
+    @param slots (numpy array)
+    The occupied slots of these segments, as returned by _slotsForSegments
+    """
+    permanences = self._permanences[slots]
+    np.clip(permanences, 0.0, 1.0, out=permanences)
+    self._permanences[slots] = permanences
+
+    keep = permanences > self.EPSILON
+    if keep.all():
+      return
+
+    lengths = self._rowLengths[segments]
+    keptCounts = np.bincount(
+      np.repeat(np.arange(len(segments)), lengths)[keep],
+      minlength=len(segments)).astype("int64")
+    dest = _raggedRange(self._rowStarts[segments], keptCounts)
+    src = slots[keep]
+    self._presynapticCells[dest] = self._presynapticCells[src]
+    self._permanences[dest] = self._permanences[src]
+
+    self._clearSlots(self._rowStarts[segments] + keptCounts,
+                     lengths - keptCounts)
+    self._rowLengths[segments] = keptCounts
+
+
+  def _clearSlots(self, starts, lengths):
+    slots = _raggedRange(starts, lengths)
+    if len(slots) > 0:
+      self._presynapticCells[slots] = self.numInputs
+      self._permanences[slots] = 0
+      self._synapsesMoved()
+
+
+  def _reserveSegments(self, numSegments):
+    capacity = len(self._segmentCells)
+    if numSegments <= capacity:
+      return
+
+    capacity = max(numSegments, 2*capacity)
+    for name in ("_segmentCells", "_rowStarts", "_rowLengths",
+                 "_rowCapacities"):
+      old = getattr(self, name)
+      new = np.zeros(capacity, dtype=old.dtype)
+      new[:len(old)] = old
+      setattr(self, name, new)
+
+
+  def _reserveSlots(self, numSlots):
+    capacity = len(self._presynapticCells)
+    if numSlots <= capacity:
+      return
+
+    capacity = max(numSlots, 2*capacity)
+    presynapticCells = np.full(capacity, self.numInputs, dtype="uint32")
+    presynapticCells[:self._numSlots] = self._presynapticCells[:self._numSlots]
+    permanences = np.zeros(capacity, dtype="float32")
+    permanences[:self._numSlots] = self._permanences[:self._numSlots]
+    slotSegments = np.zeros(capacity, dtype="uint32")
+    slotSegments[:self._numSlots] = self._slotSegments[:self._numSlots]
+
+    self._presynapticCells = presynapticCells
+    self._permanences = permanences
+    self._slotSegments = slotSegments
+
+
+
+class _CSRMatrixView(object):
+  """
+  The subset of the SparseMatrix interface that callers use on
+  SparseMatrixConnections.matrix, for debugging and tracing.
+  """
+
+  def __init__(self, connections):
+    self.connections = connections
+
+
+  def nRows(self):
+    return self.connections._numSegments
+
+
+  def nCols(self):
+    return self.connections.numInputs
+
+
+  def nNonZeros(self):
+    return self.connections.numSynapses()
+
+
+  def getRow(self, row):
+    """
+    @return (numpy array)
+    The permanence of every input on this segment, as a dense array
+    """
+    connections = self.connections
+    slots = connections._slotsForSegments(np.array([row], dtype="uint32"))
+
+    dense = np.zeros(connections.numInputs, dtype="float32")
+    dense[connections._presynapticCells[slots]] = connections._permanences[
+      slots]
+    return dense
+
+
+  def rowNonZeros(self, row):
+    """
+    @return (tuple of numpy arrays)
+    The inputs of every synapse on this segment, and their permanences
+    """
+    connections = self.connections
+    slots = connections._slotsForSegments(np.array([row], dtype="uint32"))
+    order = np.argsort(connections._presynapticCells[slots])
+    return (connections._presynapticCells[slots][order],
+            connections._permanences[slots][order])
+
+
+  def setElements(self, rows, cols, values):
+    """
+    Set the permanence of each (segment, input) pair, creating synapses that
+    don't exist yet. A permanence of 0 removes the synapse.
+    """
+    connections = self.connections
+    rows = np.asarray(rows, dtype="uint32")
+    cols = np.asarray(cols, dtype="uint32")
+    values = np.broadcast_to(np.asarray(values, dtype="float32"), rows.shape)
+
+    segments, segmentIndices = np.unique(rows, return_inverse=True)
+    slots = connections._slotsForSegments(segments)
+    numInputs = np.int64(connections.numInputs)
+    existingKeys = (np.repeat(np.arange(len(segments), dtype="int64"),
+                              connections._rowLengths[segments]) * numInputs +
+                    connections._presynapticCells[slots])
+    keys = segmentIndices * numInputs + cols
+
+    # Overwrite existing synapses.
+    if len(existingKeys) > 0:
+      sorter = np.argsort(existingKeys)
+      positions = np.minimum(np.searchsorted(existingKeys, keys, sorter=sorter),
+                             len(existingKeys) - 1)
+      exists = existingKeys[sorter[positions]] == keys
+      connections._permanences[slots[sorter[positions[exists]]]] = values[
+        exists]
+    else:
+      exists = np.zeros(len(keys), dtype="bool")
+
+    # Append the new synapses, grouped by segment.
+    order = np.argsort(segmentIndices[~exists], kind="mergesort")
+    connections._appendSynapses(segments, segmentIndices[~exists][order],
+                                cols[~exists][order], values[~exists][order])
+
+    connections._clipAndRemove(segments,
+                               connections._slotsForSegments(segments))
+
+
+
+def _raggedRange(starts, lengths):
+  """
+  Concatenate the ranges [starts[i], starts[i] + lengths[i]).
+
+  @param starts (numpy array)
+  @param lengths (numpy array)
+
+  @return (numpy array)
+  """
+  lengths = np.asarray(lengths, dtype="int64")
+  return (np.repeat(np.asarray(starts, dtype="int64") -
+                    (np.cumsum(lengths) - lengths), lengths) +
+          np.arange(lengths.sum(), dtype="int64"))
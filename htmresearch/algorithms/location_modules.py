@@ -75,7 +75,9 @@ class ThresholdedGaussian2DLocationModule(object):
                permanenceDecrement=0.0,
                maxSynapsesPerSegment=-1,
                bumpOverlapMethod="probabilistic",
-               seed=42):
+               excitationResolution=None,
+               seed=42,
+               connectionsClass=SparseMatrixConnections):
     """
     Uses hexagonal firing fields.
 
@@ -105,6 +107,16 @@ class ThresholdedGaussian2DLocationModule(object):
 
     @param bumpOverlapMethod ("probabilistic" or "sum")
     Specifies the firing rate of a cell when it's part of two bumps.
+
+    @param excitationResolution (int or None)
+    If specified, the excitation a bump causes in a cell is read from a table
+    that is precomputed for this many phase steps along each axis, rather than
+    computed from the exact phase displacement. Phase displacements are
+    rounded to the nearest step.
+
+    @param connectionsClass (class)
+    The class that stores the anchor connections, e.g. SparseMatrixConnections
+    or CSRConnections.
     """
 
     self.cellsPerAxis = cellsPerAxis
@@ -131,8 +143,8 @@ class ThresholdedGaussian2DLocationModule(object):
 
     self.activeSegments = np.empty(0, dtype="uint32")
 
-    self.connections = SparseMatrixConnections(self.cellsPerAxis * self.cellsPerAxis,
-                                               anchorInputSize)
+    self.connections = connectionsClass(self.cellsPerAxis * self.cellsPerAxis,
+                                        anchorInputSize)
 
     self.initialPermanence = initialPermanence
     self.connectedPermanence = connectedPermanence
@@ -155,6 +167,14 @@ class ThresholdedGaussian2DLocationModule(object):
     # meaningful impact, but it makes visualizations easier to understand.
     self.cellPhases += [[0.5/self.cellsPerAxis], [0.5/self.cellsPerAxis]]
 
+    self.excitationResolution = excitationResolution
+    if excitationResolution is not None:
+      self.excitationTable = (
+        ThresholdedGaussian2DLocationModule.buildExcitationTable(
+          excitationResolution, bumpSigma))
+    else:
+      self.excitationTable = None
+
     self.rng = Random(seed)
 
   def reset(self):
@@ -170,8 +190,15 @@ class ThresholdedGaussian2DLocationModule(object):
 
 
   def _computeActiveCells(self):
-    cellExcitations = ThresholdedGaussian2DLocationModule.getCellExcitations(
-      self.cellPhases, self.bumpPhases, self.bumpSigma, self.bumpOverlapMethod)
+    if self.excitationTable is not None:
+      cellExcitations = (
+        ThresholdedGaussian2DLocationModule.lookupCellExcitations(
+          self.excitationTable, self.cellPhases, self.bumpPhases,
+          self.bumpOverlapMethod))
+    else:
+      cellExcitations = ThresholdedGaussian2DLocationModule.getCellExcitations(
+        self.cellPhases, self.bumpPhases, self.bumpSigma,
+        self.bumpOverlapMethod)
 
     self.activeCells = np.where(cellExcitations >= self.activeFiringRate)[0]
     self.learningCells = np.where(cellExcitations == cellExcitations.max())[0]
@@ -404,7 +431,14 @@ class ThresholdedGaussian2DLocationModule(object):
 
 
   @staticmethod
-  def getCellExcitations(cellPhases, bumpPhases, bumpSigma, bumpOverlapMethod):
+  def getCellBumpDistances(cellPhases, bumpPhases):
+    """
+    Measure the shortest world distance, with scale normalized out, from each
+    cell to each bump.
+
+    @return (numpy array)
+    A 2D array of distances, organized by cell then bump.
+    """
     # For each cell, compute the phase displacement from each bump. Create an
     # array of matrices, one per cell. Each column in a matrix corresponds to
     # the phase displacement from the bump to the cell.
@@ -443,12 +477,70 @@ class ThresholdedGaussian2DLocationModule(object):
 
     # Choose the shortest distance from each cell to each bump. Create a 2D
     # array of distances, organized by cell then bump.
-    cell_bump_distance = np.amin(cell_direction_bump_distance, axis=1)
+    return np.amin(cell_direction_bump_distance, axis=1)
+
+
+  @staticmethod
+  def getCellExcitations(cellPhases, bumpPhases, bumpSigma, bumpOverlapMethod):
+    cell_bump_distance = (
+      ThresholdedGaussian2DLocationModule.getCellBumpDistances(cellPhases,
+                                                               bumpPhases))
 
     # Compute the gaussian of each of these distances.
     cellExcitationsFromBumps = ThresholdedGaussian2DLocationModule.gaussian(
       bumpSigma, cell_bump_distance)
 
+    return ThresholdedGaussian2DLocationModule.combineBumpExcitations(
+      cellExcitationsFromBumps, bumpOverlapMethod)
+
+
+  @staticmethod
+  def buildExcitationTable(resolution, bumpSigma):
+    """
+    Precompute the excitation caused by a bump for every phase displacement on
+    a resolution x resolution grid.
+
+    @return (numpy array)
+    A 2D array, indexed by the two components of the phase displacement from
+    the bump to the cell, in units of 1/resolution.
+    """
+    phasesAxis = np.arange(resolution, dtype="float") / resolution
+    displacements = np.array([np.repeat(phasesAxis, resolution),
+                              np.tile(phasesAxis, resolution)])
+    distances = ThresholdedGaussian2DLocationModule.getCellBumpDistances(
+      displacements, np.zeros((2, 1)))
+
+    return ThresholdedGaussian2DLocationModule.gaussian(
+      bumpSigma, distances[:, 0]).reshape(resolution, resolution)
+
+
+  @staticmethod
+  def lookupCellExcitations(excitationTable, cellPhases, bumpPhases,
+                            bumpOverlapMethod):
+    """
+    Equivalent to getCellExcitations, but reads each cell/bump excitation from a
+    table built by buildExcitationTable.
+    """
+    resolution = excitationTable.shape[0]
+    i, j = np.mod(
+      np.rint((cellPhases[:, :, np.newaxis] -
+               bumpPhases[:, np.newaxis, :]) * resolution).astype("int"),
+      resolution)
+    cellExcitationsFromBumps = excitationTable[i, j]
+
+    return ThresholdedGaussian2DLocationModule.combineBumpExcitations(
+      cellExcitationsFromBumps, bumpOverlapMethod)
+
+
+  @staticmethod
+  def combineBumpExcitations(cellExcitationsFromBumps, bumpOverlapMethod):
+    """
+    @param cellExcitationsFromBumps (numpy array)
+    A 2D array of firing rates, organized by cell then bump.
+
+    @return (numpy array)
+    The firing rate of each cell.
+    """
     # Combine bumps. Create an array of firing rates, organized by cell.
     if bumpOverlapMethod == "probabilistic":
       # Think of a bump as a probability distribution, with each cell's firing
@@ -481,6 +573,358 @@ class ThresholdedGaussian2DLocationModule(object):
 
 
 
+class FusedThresholdedGaussian2DLocationModules(object):
+  """
+  Runs a set of ThresholdedGaussian2DLocationModules as a single population,
+  without looping over the modules in Python.
+
+  The bumps of every module are stored in one array, along with the index of
+  the module that owns each bump, and the modules' phase conversion matrices
+  are stacked. A movement shifts every bump with one matmul and one mod. The
+  modules share one connections object whose cells are the concatenation of
+  the modules' cells, so anchoring computes the sensory support of every module
+  with one sparse product.
+
+  The cells of module i are numbered i*cellsPerModule to
+  (i+1)*cellsPerModule - 1, which matches the representation that is built by
+  concatenating the cells of a list of modules. All modules share cellsPerAxis,
+  bumpOverlapMethod and the learning parameters. Each module can have its own
+  scale, orientation, activeFiringRate and bumpSigma.
+
+  Because the modules share a random number generator, learning chooses
+  different (equally valid) synapse samples than a list of modules would.
+  """
+
+  def __init__(self,
+               cellsPerAxis,
+               scales,
+               orientations,
+               anchorInputSize,
+               activeFiringRate,
+               bumpSigma,
+               activationThreshold=10,
+               initialPermanence=0.21,
+               connectedPermanence=0.50,
+               learningThreshold=10,
+               sampleSize=20,
+               permanenceIncrement=0.1,
+               permanenceDecrement=0.0,
+               maxSynapsesPerSegment=-1,
+               bumpOverlapMethod="probabilistic",
+               excitationResolution=None,
+               seed=42,
+               connectionsClass=SparseMatrixConnections):
+    """
+    @param scales (sequence of floats)
+    The scale of each module.
+
+    @param orientations (sequence of floats)
+    The orientation of each module, measured in radians.
+
+    @param activeFiringRate (float or sequence of floats)
+    @param bumpSigma (float or sequence of floats)
+    Either one value shared by all modules or one value per module.
+
+    See ThresholdedGaussian2DLocationModule for the other parameters, including
+    excitationResolution, which builds one excitation table per module.
+    """
+    if len(scales) != len(orientations):
+      raise ValueError("scales and orientations must have the same length")
+    if bumpOverlapMethod not in ("probabilistic", "sum"):
+      raise ValueError("Unrecognized bump overlap strategy", bumpOverlapMethod)
+
+    self.moduleCount = len(scales)
+    self.cellsPerAxis = cellsPerAxis
+    self.cellsPerModule = cellsPerAxis * cellsPerAxis
+
+    self.scales = np.array(scales, dtype="float")
+    self.orientations = np.array(orientations, dtype="float")
+    # Stacked matrices that convert a world displacement into each module's
+    # phase displacement.
+    self.A = np.linalg.inv(self.scales[:, np.newaxis, np.newaxis] * np.array(
+      [[np.cos(self.orientations), np.cos(self.orientations + np.radians(60.))],
+       [np.sin(self.orientations),
+        np.sin(self.orientations + np.radians(60.))]]).transpose(2, 0, 1))
+
+    self.activeFiringRates = np.broadcast_to(
+      np.asarray(activeFiringRate, dtype="float"), (self.moduleCount,)).copy()
+    self.bumpSigmas = np.broadcast_to(
+      np.asarray(bumpSigma, dtype="float"), (self.moduleCount,)).copy()
+    self.bumpOverlapMethod = bumpOverlapMethod
+
+    self.excitationResolution = excitationResolution
+    if excitationResolution is not None:
+      self.excitationTables = np.array([
+        ThresholdedGaussian2DLocationModule.buildExcitationTable(
+          excitationResolution, sigma)
+        for sigma in self.bumpSigmas])
+    else:
+      self.excitationTables = None
+
+    self.connections = connectionsClass(
+      self.moduleCount * self.cellsPerModule, anchorInputSize)
+
+    self.initialPermanence = initialPermanence
+    self.connectedPermanence = connectedPermanence
+    self.learningThreshold = learningThreshold
+    self.sampleSize = sampleSize
+    self.permanenceIncrement = permanenceIncrement
+    self.permanenceDecrement = permanenceDecrement
+    self.activationThreshold = activationThreshold
+    self.maxSynapsesPerSegment = maxSynapsesPerSegment
+
+    # Every module uses the same cell phases.
+    cellPhasesAxis = np.linspace(0., 1., self.cellsPerAxis, endpoint=False)
+    self.cellPhases = np.array([np.repeat(cellPhasesAxis, self.cellsPerAxis),
+                                np.tile(cellPhasesAxis, self.cellsPerAxis)])
+    self.cellPhases += [[0.5/self.cellsPerAxis], [0.5/self.cellsPerAxis]]
+
+    self.rng = Random(seed)
+
+    self.reset()
+
+
+  @classmethod
+  def fromModules(cls, modules, anchorInputSize, seed=42,
+                  connectionsClass=SparseMatrixConnections):
+    """
+    Create a fused engine with the parameters of a list of
+    ThresholdedGaussian2DLocationModules. Learned connections are not copied.
+    """
+    shared = ("cellsPerAxis", "bumpOverlapMethod", "excitationResolution",
+              "activationThreshold", "initialPermanence",
+              "connectedPermanence", "learningThreshold", "sampleSize",
+              "permanenceIncrement", "permanenceDecrement",
+              "maxSynapsesPerSegment")
+    for name in shared:
+      if len(set(getattr(module, name) for module in modules)) > 1:
+        raise ValueError("Fused modules must share the same " + name)
+
+    params = dict((name, getattr(modules[0], name)) for name in shared)
+    return cls(scales=[module.scale for module in modules],
+               orientations=[module.orientation for module in modules],
+               anchorInputSize=anchorInputSize,
+               activeFiringRate=[module.activeFiringRate
+                                 for module in modules],
+               bumpSigma=[module.bumpSigma for module in modules],
+               seed=seed,
+               connectionsClass=connectionsClass,
+               **params)
+
+
+  def reset(self):
+    """
+    Clear the active cells.
+    """
+    # Bumps are always kept sorted by module.
+    self.bumpPhases = np.empty((2,0), dtype="float")
+    self.bumpModules = np.empty(0, dtype="int")
+    self.phaseDisplacement = np.empty((0,2), dtype="float")
+    self.activeCells = np.empty(0, dtype="int")
+    self.learningCells = np.empty(0, dtype="int")
+    self.sensoryAssociatedCells = np.empty(0, dtype="int")
+    self.activeSegments = np.empty(0, dtype="uint32")
+
+
+  def _computeCellExcitations(self):
+    """
+    @return (numpy array)
+    The firing rate of every cell, organized by module then cell.
+    """
+    cellExcitations = np.zeros((self.moduleCount, self.cellsPerModule),
+                               dtype="float")
+    if self.bumpModules.size == 0:
+      return cellExcitations
+
+    if self.excitationTables is not None:
+      i, j = np.mod(
+        np.rint((self.cellPhases[:, :, np.newaxis] -
+                 self.bumpPhases[:, np.newaxis, :]) *
+                self.excitationResolution).astype("int"),
+        self.excitationResolution)
+      cellExcitationsFromBumps = self.excitationTables[self.bumpModules, i, j]
+    else:
+      cell_bump_distance = (
+        ThresholdedGaussian2DLocationModule.getCellBumpDistances(
+          self.cellPhases, self.bumpPhases))
+      cellExcitationsFromBumps = ThresholdedGaussian2DLocationModule.gaussian(
+        self.bumpSigmas[self.bumpModules], cell_bump_distance)
+
+    # Combine each module's bumps with a reduction over its contiguous run of
+    # bumps. Modules without bumps keep a firing rate of 0, like an empty
+    # product or sum would give.
+    occupiedModules = np.unique(self.bumpModules)
+    runStarts = np.searchsorted(self.bumpModules, occupiedModules)
+    if self.bumpOverlapMethod == "probabilistic":
+      cellExcitations[occupiedModules] = 1. - np.multiply.reduceat(
+        1. - cellExcitationsFromBumps, runStarts, axis=1).T
+    else:
+      cellExcitations[occupiedModules] = np.add.reduceat(
+        cellExcitationsFromBumps, runStarts, axis=1).T
+
+    return cellExcitations
+
+
+  def _computeActiveCells(self):
+    cellExcitations = self._computeCellExcitations()
+
+    self.activeCells = np.flatnonzero(
+      cellExcitations >= self.activeFiringRates[:, np.newaxis])
+    self.learningCells = np.flatnonzero(
+      cellExcitations == cellExcitations.max(axis=1)[:, np.newaxis])
+
+
+  def activateRandomLocation(self):
+    """
+    Set each module's location to a random point.
+    """
+    self.bumpPhases = np.random.random((self.moduleCount, 2)).T.copy()
+    self.bumpModules = np.arange(self.moduleCount)
+    self._computeActiveCells()
+
+
+  def movementCompute(self, displacement, noiseFactor = 0):
+    """
+    Shift every module's active cells by a vector.
+
+    @param displacement (pair of floats, or array with one pair per module)
+    A translation vector [di, dj], or a different translation for each module.
+    """
+    displacement = np.broadcast_to(np.asarray(displacement, dtype="float"),
+                                   (self.moduleCount, 2))
+
+    if noiseFactor != 0:
+      displacement = displacement + np.random.normal(0, noiseFactor,
+                                                     (self.moduleCount, 2))
+
+    # Calculate delta in each module's coordinates.
+    phaseDisplacement = np.einsum("mij,mj->mi", self.A, displacement)
+
+    # Shift the active coordinates.
+    np.add(self.bumpPhases, phaseDisplacement[self.bumpModules].T,
+           out=self.bumpPhases)
+
+    np.round(self.bumpPhases, decimals=9, out=self.bumpPhases)
+    np.mod(self.bumpPhases, 1.0, out=self.bumpPhases)
+
+    self._computeActiveCells()
+    self.phaseDisplacement = phaseDisplacement
+
+
+  def _sensoryComputeInferenceMode(self, anchorInput):
+    """
+    Infer the location from sensory input. Activate any cells with enough active
+    synapses to this sensory input. Deactivate all other cells.
+
+    @param anchorInput (numpy array)
+    A sensory input. This will often come from a feature-location pair layer.
+    """
+    if len(anchorInput) == 0:
+      return
+
+    overlaps = self.connections.computeActivity(anchorInput,
+                                                self.connectedPermanence)
+    activeSegments = np.where(overlaps >= self.activationThreshold)[0]
+
+    sensorySupportedCells = np.unique(
+      self.connections.mapSegmentsToCells(activeSegments))
+
+    self.bumpPhases = self.cellPhases[:, sensorySupportedCells %
+                                      self.cellsPerModule]
+    self.bumpModules = sensorySupportedCells // self.cellsPerModule
+    self._computeActiveCells()
+    self.activeSegments = activeSegments
+    self.sensoryAssociatedCells = sensorySupportedCells
+
+
+  def _sensoryComputeLearningMode(self, anchorInput):
+    """
+    Associate this location with a sensory input. Subsequently, anchorInput will
+    activate the current location during anchor().
+
+    @param anchorInput (numpy array)
+    A sensory input. This will often come from a feature-location pair layer.
+    """
+    overlaps = self.connections.computeActivity(anchorInput,
+                                                self.connectedPermanence)
+    activeSegments = np.where(overlaps >= self.activationThreshold)[0]
+
+    potentialOverlaps = self.connections.computeActivity(anchorInput)
+    matchingSegments = np.where(potentialOverlaps >=
+                                self.learningThreshold)[0]
+
+    # Cells with a active segment: reinforce the segment
+    cellsForActiveSegments = self.connections.mapSegmentsToCells(
+      activeSegments)
+    learningActiveSegments = activeSegments[
+      np.in1d(cellsForActiveSegments, self.learningCells)]
+    remainingCells = np.setdiff1d(self.learningCells, cellsForActiveSegments)
+
+    # Remaining cells with a matching segment: reinforce the best
+    # matching segment.
+    candidateSegments = self.connections.filterSegmentsByCell(
+      matchingSegments, remainingCells)
+    cellsForCandidateSegments = (
+      self.connections.mapSegmentsToCells(candidateSegments))
+    candidateSegments = candidateSegments[
+      np.in1d(cellsForCandidateSegments, remainingCells)]
+    onePerCellFilter = np2.argmaxMulti(potentialOverlaps[candidateSegments],
+                                       cellsForCandidateSegments)
+    learningMatchingSegments = candidateSegments[onePerCellFilter]
+
+    newSegmentCells = np.setdiff1d(remainingCells, cellsForCandidateSegments)
+
+    for learningSegments in (learningActiveSegments,
+                             learningMatchingSegments):
+      ThresholdedGaussian2DLocationModule._learn(
+        self.connections, self.rng, learningSegments,
+        anchorInput, potentialOverlaps,
+        self.initialPermanence, self.sampleSize,
+        self.permanenceIncrement, self.permanenceDecrement,
+        self.maxSynapsesPerSegment)
+
+    # Remaining cells without a matching segment: grow one.
+    numNewSynapses = len(anchorInput)
+
+    if self.sampleSize != -1:
+      numNewSynapses = min(numNewSynapses, self.sampleSize)
+
+    if self.maxSynapsesPerSegment != -1:
+      numNewSynapses = min(numNewSynapses, self.maxSynapsesPerSegment)
+
+    newSegments = self.connections.createSegments(newSegmentCells)
+
+    self.connections.growSynapsesToSample(
+      newSegments, anchorInput, numNewSynapses,
+      self.initialPermanence, self.rng)
+    self.activeSegments = activeSegments
+    self.sensoryAssociatedCells = self.learningCells
+
+
+  def sensoryCompute(self, anchorInput, anchorGrowthCandidates, learn):
+    if learn:
+      self._sensoryComputeLearningMode(anchorGrowthCandidates)
+    else:
+      self._sensoryComputeInferenceMode(anchorInput)
+
+
+  def getActiveCells(self):
+    return self.activeCells
+
+
+  def getLearnableCells(self):
+    return self.learningCells
+
+
+  def getSensoryAssociatedCells(self):
+    return self.sensoryAssociatedCells
+
+
+  def numberOfCells(self):
+    return self.moduleCount * self.cellsPerModule
+
+
+
 class Superficial2DLocationModule(object):
   """
   A model of a location module. It's similar to a grid cell module, but it uses
@@ -550,7 +994,8 @@ class Superficial2DLocationModule(object):
                maxSynapsesPerSegment=-1,
                anchoringMethod="narrowing",
                rotationMatrix = None,
-               seed=42):
+               seed=42,
+               connectionsClass=SparseMatrixConnections):
     """
     @param cellsPerAxis (int)
     Determines the number of cells. Determines how space is divided between the
@@ -574,6 +1019,10 @@ class Superficial2DLocationModule(object):
     are placed. For example, with value [0.2, 0.8], when cell [2, 3] is activated
     it will place 4 phases, corresponding to the following points in cell
     coordinates: [2.2, 3.2], [2.2, 3.8], [2.8, 3.2], [2.8, 3.8]
+
+    @param connectionsClass (class)
+    The class that stores the anchor connections, e.g. SparseMatrixConnections
+    or CSRConnections.
     """
 
     self.cellsPerAxis = cellsPerAxis
@@ -611,8 +1060,8 @@ class Superficial2DLocationModule(object):
 
     self.activeSegments = np.empty(0, dtype="uint32")
 
-    self.connections = SparseMatrixConnections(np.prod(self.cellDimensions),
-                                               anchorInputSize)
+    self.connections = connectionsClass(np.prod(self.cellDimensions),
+                                        anchorInputSize)
 
     self.initialPermanence = initialPermanence
     self.connectedPermanence = connectedPermanence
@@ -874,6 +1323,129 @@ class Superficial2DLocationModule(object):
 
 
 
+class ImplicitMetricConnections(object):
+  """
+  The metric connections that BodyToSpecificObjectModule2D.formReciprocalSynapses
+  grows, computed arithmetically rather than stored.
+
+  Those connections have one segment for every
+  (bodyLocation, sensorOffset, corner) triple, with one synapse from each of
+  its two presynaptic layers. The triple relates three cells on the torus:
+
+    sensorLocation = bodyLocation + offset(sensorOffset) + corner
+
+  so a segment is active exactly when the cells of its two presynaptic layers
+  are both active, and the postsynaptic cell follows from those two. This class
+  enumerates the pairs of active presynaptic cells instead of scanning the
+  4 * cellCount^2 segments.
+
+  Segments are numbered like the explicit ones,
+    (bodyLocation * cellCount + sensorOffset) * 4 + corner
+  so segment-level traces are the same with both.
+  """
+
+  # The four corners of the 1x1 range of offsets covered by a sensor offset.
+  CORNERS = np.array([[0, -1, 0, -1],
+                      [0, 0, -1, -1]])
+
+  def __init__(self, cellDimensions, postsynapticLayer):
+    """
+    @param cellDimensions (sequence of ints)
+
+    @param postsynapticLayer ("bodyToSpecificObject" or "sensorToSpecificObject")
+    The layer whose cells have these segments. The other location layer and
+    "sensorToBody" are the presynaptic sources.
+    """
+    if postsynapticLayer not in ("bodyToSpecificObject",
+                                 "sensorToSpecificObject"):
+      raise ValueError("Unknown postsynaptic layer: {}".format(
+        postsynapticLayer))
+
+    self.cellDimensions = np.asarray(cellDimensions)
+    self.cellCount = np.prod(cellDimensions)
+    self.postsynapticLayer = postsynapticLayer
+
+
+  def _offsets(self, sensorOffsetCells):
+    """
+    @return (numpy array)
+    A 2 x numOffsets x 4 array with the displacement from the body location to
+    the sensor location for each sensor offset cell and corner.
+    """
+    i, j = np.unravel_index(sensorOffsetCells, self.cellDimensions)
+    d = np.array([i - self.cellDimensions[0] // 2,
+                  j - self.cellDimensions[1] // 2])
+    return d[:, :, np.newaxis] + self.CORNERS[:, np.newaxis, :]
+
+
+  def computeActiveSegments(self, activeInputsBySource):
+    """
+    Equivalent to np.where(overlaps >= 2)[0], where overlaps is the
+    computeActivity of the explicit connections.
+
+    @param activeInputsBySource (dict)
+    The active cells of "sensorToBody" and of the presynaptic location layer.
+
+    @return (numpy array)
+    The active segments, sorted
+    """
+    if self.postsynapticLayer == "bodyToSpecificObject":
+      locationSource = "sensorToSpecificObject"
+      sign = -1
+    else:
+      locationSource = "bodyToSpecificObject"
+      sign = 1
+    sensorOffsetCells = np.unique(
+      np.asarray(activeInputsBySource["sensorToBody"], dtype="int64"))
+    locationCells = np.unique(
+      np.asarray(activeInputsBySource[locationSource], dtype="int64"))
+
+    # Every (location, sensorOffset, corner) combination, as a
+    # 2 x numLocations x numOffsets x 4 array of coordinates.
+    locations = np.array(np.unravel_index(locationCells, self.cellDimensions))
+    otherLocations = (locations[:, :, np.newaxis, np.newaxis] +
+                      sign * self._offsets(sensorOffsetCells)[:, np.newaxis])
+    otherLocationCells = np.ravel_multi_index(
+      (otherLocations[0], otherLocations[1]), self.cellDimensions,
+      mode="wrap")
+
+    if self.postsynapticLayer == "bodyToSpecificObject":
+      bodyLocationCells = otherLocationCells
+    else:
+      bodyLocationCells = np.broadcast_to(
+        locationCells[:, np.newaxis, np.newaxis], otherLocationCells.shape)
+
+    segments = ((bodyLocationCells.astype("int64") * self.cellCount +
+                 sensorOffsetCells[np.newaxis, :, np.newaxis]) * 4 +
+                np.arange(4))
+    return np.unique(segments).astype("uint32")
+
+
+  def mapSegmentsToCells(self, segments):
+    """
+    @param segments (numpy array)
+    """
+    segments = np.asarray(segments, dtype="int64")
+    bodyLocationCells = segments // (4 * self.cellCount)
+    if self.postsynapticLayer == "bodyToSpecificObject":
+      return bodyLocationCells.astype("uint32")
+
+    sensorOffsetCells = (segments // 4) % self.cellCount
+    i, j = np.unravel_index(bodyLocationCells, self.cellDimensions)
+    offsets = self._offsets(sensorOffsetCells)
+    corners = segments % 4
+    numSegments = len(segments)
+    return np.ravel_multi_index(
+      (i + offsets[0, np.arange(numSegments), corners],
+       j + offsets[1, np.arange(numSegments), corners]),
+      self.cellDimensions, mode="wrap").astype("uint32")
+
+
+  def numSegments(self):
+    return 4 * self.cellCount * self.cellCount
+
+
+
 class BodyToSpecificObjectModule2D(object):
   """
   Represents the body's location relative to a specific object. Typically
@@ -881,17 +1453,22 @@ class BodyToSpecificObjectModule2D(object):
   SensorToSpecificObjectModules.
   """
 
-  def __init__(self, cellDimensions):
+  def __init__(self, cellDimensions, implicitMetricConnections=False):
     """
     Initialize this instance, and form all reciprocal connections between this
     instance and an array of SensorToSpecificObjectModules.
 
     @param cellDimensions (sequence of ints)
     @param sensorToSpecificObjectByColumn (sequence of SensorToSpecificObjectModules)
+
+    @param implicitMetricConnections (bool)
+    If True, the connections from each column are computed by an
+    ImplicitMetricConnections rather than stored as segments and synapses.
     """
     self.cellCount = np.prod(cellDimensions)
     self.cellDimensions = np.asarray(cellDimensions)
     self.connectedPermanence = 0.5
+    self.implicitMetricConnections = implicitMetricConnections
 
     # This offset logic assumes there are no "middle" rows or columns
     assert cellDimensions[0] % 2 == 0
@@ -903,13 +1480,23 @@ class BodyToSpecificObjectModule2D(object):
 
 
   def formReciprocalSynapses(self, sensorToSpecificObjectByColumn):
-    cellCountBySource = {
-      "sensorToSpecificObject": self.cellCount,
-      "sensorToBody": self.cellCount,
-    }
-    self.connectionsByColumn = [
-      Multiconnections(self.cellCount, cellCountBySource)
-      for _ in xrange(len(sensorToSpecificObjectByColumn))]
+    if self.implicitMetricConnections:
+      # The connections are the same for every column.
+      connections = ImplicitMetricConnections(self.cellDimensions,
+                                              "bodyToSpecificObject")
+      self.connectionsByColumn = [connections
+                                  for _ in sensorToSpecificObjectByColumn]
+      if all(sensorToSpecificObject.implicitMetricConnections
+             for sensorToSpecificObject in sensorToSpecificObjectByColumn):
+        return
+    else:
+      cellCountBySource = {
+        "sensorToSpecificObject": self.cellCount,
+        "sensorToBody": self.cellCount,
+      }
+      self.connectionsByColumn = [
+        Multiconnections(self.cellCount, cellCountBySource)
+        for _ in xrange(len(sensorToSpecificObjectByColumn))]
 
     # Create a list of location-location-offset triples as 3 numpy arrays.
     # In the math that follows, make sure that the results correspond to this
@@ -966,15 +1553,17 @@ class BodyToSpecificObjectModule2D(object):
     for (connections,
          sensorToSpecificObject) in zip(self.connectionsByColumn,
                                         sensorToSpecificObjectByColumn):
-      bodySegments = connections.createSegments(
-        bodyLocationCells)
-      connections.setPermanences(
-        bodySegments, presynapticCellsForBodyToObject, 1.0)
+      if not self.implicitMetricConnections:
+        bodySegments = connections.createSegments(
+          bodyLocationCells)
+        connections.setPermanences(
+          bodySegments, presynapticCellsForBodyToObject, 1.0)
 
-      sensorSegments = sensorToSpecificObject.metricConnections.createSegments(
-        sensorLocationCells)
-      sensorToSpecificObject.metricConnections.setPermanences(
-        sensorSegments, presynapticCellsForSensorToObject, 1.0)
+      if not sensorToSpecificObject.implicitMetricConnections:
+        sensorSegments = sensorToSpecificObject.metricConnections.createSegments(
+          sensorLocationCells)
+        sensorToSpecificObject.metricConnections.setPermanences(
+          sensorSegments, presynapticCellsForSensorToObject, 1.0)
 
 
   def activateRandomLocation(self):
@@ -1032,11 +1621,16 @@ class BodyToSpecificObjectModule2D(object):
          activeSensorToSpecificObjectCells) in zip(self.connectionsByColumn,
                                                    sensorToBodyByColumn,
                                                    sensorToSpecificObjectByColumn):
-      overlaps = connections.computeActivity({
+      activeInputsBySource = {
         "sensorToBody": activeSensorToBodyCells,
         "sensorToSpecificObject": activeSensorToSpecificObjectCells,
-      })
-      activeSegments = np.where(overlaps >= 2)[0]
+      }
+      if self.implicitMetricConnections:
+        activeSegments = connections.computeActiveSegments(
+          activeInputsBySource)
+      else:
+        overlaps = connections.computeActivity(activeInputsBySource)
+        activeSegments = np.where(overlaps >= 2)[0]
       votes = connections.mapSegmentsToCells(activeSegments)
       votes = np.unique(votes)  # Only allow a column to vote for a cell once.
       votesByCell[votes] += 1
@@ -1102,11 +1696,19 @@ class SensorToSpecificObjectModule(object):
                permanenceIncrement=0.1,
                permanenceDecrement=0.0,
                maxSynapsesPerSegment=-1,
-               seed=42):
+               seed=42,
+               connectionsClass=SparseMatrixConnections,
+               implicitMetricConnections=False):
     """
     @param cellDimensions (sequence of ints)
     @param anchorInputSize (int)
     @param activationThreshold (int)
+    @param connectionsClass (class)
+
+    @param implicitMetricConnections (bool)
+    If True, the metric connections are computed by an
+    ImplicitMetricConnections, and BodyToSpecificObjectModule2D doesn't grow
+    them.
     """
     self.activationThreshold = activationThreshold
     self.initialPermanence = initialPermanence
@@ -1121,14 +1723,20 @@ class SensorToSpecificObjectModule(object):
     self.rng = Random(seed)
 
     self.cellCount = np.prod(cellDimensions)
-    cellCountBySource = {
-      "bodyToSpecificObject": self.cellCount,
-      "sensorToBody": self.cellCount,
-    }
-    self.metricConnections = Multiconnections(self.cellCount,
-                                              cellCountBySource)
-    self.anchorConnections = SparseMatrixConnections(self.cellCount,
-                                                     anchorInputSize)
+    self.implicitMetricConnections = implicitMetricConnections
+    if implicitMetricConnections:
+      self.metricConnections = ImplicitMetricConnections(
+        cellDimensions, "sensorToSpecificObject")
+    else:
+      cellCountBySource = {
+        "bodyToSpecificObject": self.cellCount,
+        "sensorToBody": self.cellCount,
+      }
+      self.metricConnections = Multiconnections(self.cellCount,
+                                                cellCountBySource,
+                                                connectionsClass)
+    self.anchorConnections = connectionsClass(self.cellCount,
+                                              anchorInputSize)
 
 
   def reset(self):
@@ -1152,12 +1760,16 @@ class SensorToSpecificObjectModule(object):
     Active cells of a single module that represents the body's location relative
     to a specific object
     """
-    overlaps = self.metricConnections.computeActivity({
+    activeInputsBySource = {
       "bodyToSpecificObject": bodyToSpecificObject,
       "sensorToBody": sensorToBody,
-    })
-
-    self.activeMetricSegments = np.where(overlaps >= 2)[0]
+    }
+    if self.implicitMetricConnections:
+      self.activeMetricSegments = self.metricConnections.computeActiveSegments(
+        activeInputsBySource)
+    else:
+      overlaps = self.metricConnections.computeActivity(activeInputsBySource)
+      self.activeMetricSegments = np.where(overlaps >= 2)[0]
     self.activeCells = np.unique(
       self.metricConnections.mapSegmentsToCells(
         self.activeMetricSegments))
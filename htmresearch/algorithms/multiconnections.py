@@ -34,16 +34,21 @@ class Multiconnections(object):
   We could port this class to C++ and reduce a lot of redundant segment
   bookkeeping.
   """
-  def __init__(self, cellCount, cellCountBySource):
+  def __init__(self, cellCount, cellCountBySource,
+               connectionsClass=SparseMatrixConnections):
     """
     @param cellCountBySource (dict)
     The number of cells in each source. Example:
       {"customInputName1": 16,
        "customInputName2": 42}
+
+    @param connectionsClass (class)
+    The class that stores the connections of each source, e.g.
+    SparseMatrixConnections or CSRConnections.
     """
 
     self.connectionsBySource = dict(
-      (source, SparseMatrixConnections(cellCount, presynapticCellCount))
+      (source, connectionsClass(cellCount, presynapticCellCount))
       for source, presynapticCellCount in cellCountBySource.iteritems())
 
 
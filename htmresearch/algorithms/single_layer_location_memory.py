@@ -68,18 +68,19 @@ class SingleLayerLocationMemory(object):
                permanenceIncrement=0.1,
                permanenceDecrement=0.1,
                maxSynapsesPerSegment=-1,
-               seed=42):
+               seed=42,
+               connectionsClass=SparseMatrixConnections):
 
     # For transition learning, every segment is split into two parts.
     # For the segment to be active, both parts must be active.
-    self.internalConnections = SparseMatrixConnections(
+    self.internalConnections = connectionsClass(
       cellCount, cellCount)
-    self.deltaConnections = SparseMatrixConnections(
+    self.deltaConnections = connectionsClass(
       cellCount, deltaLocationInputSize)
 
     # Distal segments that receive input from the layer that represents
     # feature-locations.
-    self.featureLocationConnections = SparseMatrixConnections(
+    self.featureLocationConnections = connectionsClass(
       cellCount, featureLocationInputSize)
 
     self.activeCells = np.empty(0, dtype="uint32")
@@ -25,6 +25,8 @@ import matplotlib.pyplot as plt
 import copy
 import os
 from compute_hardwired_weights import compute_hardwired_weights
+from weight_formats import (bandedRandomWeights, bandedWeights, clipWeights,
+                            maxAbsWeight, presynapticProduct)
 
 # STDP kernel time constant in seconds.  Used for the default kernel.
 SDTP_TIME_CONSTANT = 0.012
@@ -124,7 +126,9 @@ class CAN1DNetwork(object):
                envelopeFactor=25,
                initialWeightScale=0.003,
                clip=10,
-               plotting=True):
+               plotting=True,
+               weightFormat="dense",
+               connectionRadius=0.1):
     """
 
     :param numExcitatory: Size of each excitatory population.  Note that there
@@ -155,24 +159,54 @@ class CAN1DNetwork(object):
     :param initialWeightScale: The maximum initial weight value.
     :param clip: The maximum possible activation.  Set to np.inf to disable.
     :param plotting: Whether or not to generate plots.  False speeds training.
+    :param weightFormat: "dense" for dense float64 weights, or "sparse" to
+            keep only the connections between cells that are at most
+            connectionRadius apart, in float32 sparse matrices.  The sparse
+            format is meant for simulating large hardwired networks and
+            doesn't support learning.
+    :param connectionRadius: The longest connection kept by the sparse
+            format, as a fraction of the ring of cells.
 
     """
-    # Synapse weights.  We assume dense connections.
-    # Inhibitory neuron recurrent weights.
-    self.weightsII = np.random.random_sample((numInhibitory, numInhibitory))* \
-                     initialWeightScale * -1.
-
-    # Excitatory-to-inhibitory weights
-    self.weightsELI = np.random.random_sample((numExcitatory, numInhibitory))* \
-                      initialWeightScale
-    self.weightsERI = np.random.random_sample((numExcitatory, numInhibitory))* \
-                      initialWeightScale
-
-    # Inhibitory-to-excitatory weights
-    self.weightsIEL = np.random.random_sample((numInhibitory, numExcitatory))* \
-                      initialWeightScale * -1.
-    self.weightsIER = np.random.random_sample((numInhibitory, numExcitatory))* \
-                      initialWeightScale * -1.
+    if weightFormat not in ("dense", "sparse"):
+      raise ValueError("Unknown weight format: {}".format(weightFormat))
+    self.weightFormat = weightFormat
+    self.connectionRadius = connectionRadius
+
+    if weightFormat == "dense":
+      # Synapse weights.  We assume dense connections.
+      # Inhibitory neuron recurrent weights.
+      self.weightsII = np.random.random_sample((numInhibitory, numInhibitory))* \
+                       initialWeightScale * -1.
+
+      # Excitatory-to-inhibitory weights
+      self.weightsELI = np.random.random_sample((numExcitatory, numInhibitory))* \
+                        initialWeightScale
+      self.weightsERI = np.random.random_sample((numExcitatory, numInhibitory))* \
+                        initialWeightScale
+
+      # Inhibitory-to-excitatory weights
+      self.weightsIEL = np.random.random_sample((numInhibitory, numExcitatory))* \
+                        initialWeightScale * -1.
+      self.weightsIER = np.random.random_sample((numInhibitory, numExcitatory))* \
+                        initialWeightScale * -1.
+    else:
+      # The same weights, restricted to local connections.
+      self.weightsII = bandedRandomWeights(numInhibitory, numInhibitory,
+                                           connectionRadius,
+                                           initialWeightScale) * -1.
+      self.weightsELI = bandedRandomWeights(numExcitatory, numInhibitory,
+                                            connectionRadius,
+                                            initialWeightScale)
+      self.weightsERI = bandedRandomWeights(numExcitatory, numInhibitory,
+                                            connectionRadius,
+                                            initialWeightScale)
+      self.weightsIEL = bandedRandomWeights(numInhibitory, numExcitatory,
+                                            connectionRadius,
+                                            initialWeightScale) * -1.
+      self.weightsIER = bandedRandomWeights(numInhibitory, numExcitatory,
+                                            connectionRadius,
+                                            initialWeightScale) * -1.
 
     # Determine a starting place code, which will govern activation
     # during learning.  This code is ignored during testing.
@@ -373,6 +407,13 @@ class CAN1DNetwork(object):
       self.weightsIEL = -1. * G_I_EL
       self.weightsIER = -1. * G_I_ER
 
+    if self.weightFormat == "sparse":
+      self.weightsII = bandedWeights(self.weightsII, self.connectionRadius)
+      self.weightsELI = bandedWeights(self.weightsELI, self.connectionRadius)
+      self.weightsERI = bandedWeights(self.weightsERI, self.connectionRadius)
+      self.weightsIEL = bandedWeights(self.weightsIEL, self.connectionRadius)
+      self.weightsIER = bandedWeights(self.weightsIER, self.connectionRadius)
+
 
   def simulate(self, time,
                feedforwardInputI,
@@ -463,11 +504,11 @@ class CAN1DNetwork(object):
     self.instantaneousER += feedforwardInputE
 
     if enforceDale:
-      weightsII =  np.minimum(self.weightsII, 0)
-      weightsIER = np.minimum(self.weightsIER, 0)
-      weightsIEL = np.minimum(self.weightsIEL, 0)
-      weightsELI = np.maximum(self.weightsELI, 0)
-      weightsERI = np.maximum(self.weightsERI, 0)
+      weightsII =  clipWeights(self.weightsII, maximum=0)
+      weightsIER = clipWeights(self.weightsIER, maximum=0)
+      weightsIEL = clipWeights(self.weightsIEL, maximum=0)
+      weightsELI = clipWeights(self.weightsELI, minimum=0)
+      weightsERI = clipWeights(self.weightsERI, minimum=0)
     else:
       weightsII =  self.weightsII
       weightsIER = self.weightsIER
@@ -476,12 +517,12 @@ class CAN1DNetwork(object):
       weightsERI = self.weightsERI
 
     if recurrent:
-      self.instantaneousI += (np.matmul(self.activationsEL, weightsELI) +\
-                np.matmul(self.activationsER, weightsERI) +\
-                np.matmul(self.activationsI, weightsII))
+      self.instantaneousI += (presynapticProduct(self.activationsEL, weightsELI) +\
+                presynapticProduct(self.activationsER, weightsERI) +\
+                presynapticProduct(self.activationsI, weightsII))
 
-      self.instantaneousEL += np.matmul(self.activationsI, weightsIEL)
-      self.instantaneousER += np.matmul(self.activationsI, weightsIER)
+      self.instantaneousEL += presynapticProduct(self.activationsI, weightsIEL)
+      self.instantaneousER += presynapticProduct(self.activationsI, weightsIER)
 
     self.instantaneousEL *= max((1 - self.velocityGain*v), 0)
     self.instantaneousER *= max((1 + self.velocityGain*v), 0)
@@ -550,6 +591,8 @@ class CAN1DNetwork(object):
             run, to better simulate real learning.  Can degrade performance.
             Only supported in periodic environments.
     """
+    self._checkLearnable()
+
     # Set up plotting
     if self.plotting:
       self.fig = plt.figure()
@@ -652,7 +695,7 @@ class CAN1DNetwork(object):
                self.weightsELI, self.weightsERI]
     norms = [IIMax, IEMax, IEMax, EIMax, EIMax]
     for w, n in zip(weights, norms):
-      maximum = np.amax(np.abs(w))
+      maximum = maxAbsWeight(w)
       w /= maximum
       w *= n
 
@@ -712,6 +755,12 @@ class CAN1DNetwork(object):
 
     self.fig.canvas.draw()
 
+  def _checkLearnable(self):
+    if self.weightFormat != "dense":
+      raise ValueError("Learning requires dense weights, not {}".format(
+        self.weightFormat))
+
+
   def stdpUpdate(self, time, clearBuffer=False):
     """
     Adds the current activations to the tracking queue, and then performs an
@@ -720,6 +769,8 @@ class CAN1DNetwork(object):
     :param clearBuffer: Set as True to clear the activation buffer.
             This should be done at the end of training.
     """
+    self._checkLearnable()
+
     if clearBuffer:
       while len(self.activationBuffer) > 1:
         baseI, baseEL, baseER, t = self.activationBuffer.popleft()
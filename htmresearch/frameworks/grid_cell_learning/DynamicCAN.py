@@ -20,12 +20,13 @@
 # ----------------------------------------------------------------------
 
 import numpy as np
-from collections import deque
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import copy
 import os
 from compute_hardwired_weights import compute_hardwired_weights
+from weight_formats import (WEIGHT_FORMATS, COMPACT_DTYPE, ConvolutionWeights,
+                            clipWeights, kernelToSparse, postsynapticProduct)
 
 # STDP kernel time constant in seconds.  Used for the default kernel.
 STDP_TIME_CONSTANT = 0.012
@@ -99,6 +100,115 @@ def placeSTDPKernel(placeActivation, otherActivation, dt):
 
 
 
+def kernelTimeFactors(kernel, dts, *args):
+  """
+  Evaluate an STDP kernel's scaling at several time differences, so that the
+  updates of a whole window can be summed with one matrix product.  Assumes
+  the kernel has the form np.outer(preSynActivation*f(dt), postSynActivation),
+  like the kernels above.
+  :param kernel: The STDP kernel.
+  :param dts: Array of time differences (in seconds).
+  :param args: Extra arguments for the kernel, e.g. inhibitoryPresyn.
+  :return: An array shaped like dts holding f(dt).
+  """
+  unit = np.ones((1,))
+  dts = np.asarray(dts, dtype="float")
+  factors = [kernel(unit, unit, dt, *args)[0, 0] for dt in dts.flat]
+  return np.reshape(factors, dts.shape)
+
+
+
+def chainedTimeDifferences(times, dt):
+  """
+  Time differences used when the activation buffer is flushed.  Each entry is
+  paired with every later entry, and the time difference of a pair is computed
+  from the one before it, as in the original sequential flush.
+  :param times: The times of the buffered activations, oldest first.
+  :param dt: The time step.
+  :return: A matrix whose (j, k) entry is the time difference of the pair
+           (j, k), for k > j.  Entries on and below the diagonal are unused.
+  """
+  n = len(times)
+  differences = np.zeros((n, n))
+  for j in xrange(n):
+    t = times[j]
+    for k in xrange(j + 1, n):
+      t = (times[k] - t) * dt
+      differences[j, k] = t
+  return differences
+
+
+
+class ActivationBuffer(object):
+  """
+  A fixed-size ring buffer of recent activations, used for STDP.  Each
+  population's activations are stored in one stacked array, so an update over
+  the whole window is a single matrix product.
+  """
+
+  def __init__(self, maxlen):
+    """
+    :param maxlen: How many time steps to keep.
+    """
+    self.maxlen = maxlen
+    self.arrays = {}
+    self.times = np.zeros((maxlen,))
+    self.start = 0
+    self.size = 0
+
+
+  def __len__(self):
+    return self.size
+
+
+  def append(self, time, activations):
+    """
+    Add the activations of one time step, dropping the oldest ones if the
+    buffer is full.
+    :param time: The time of the activations.
+    :param activations: A dict mapping population names to activation vectors.
+            The vectors are copied into the buffer.
+    """
+    if self.maxlen == 0:
+      return
+
+    if self.size == self.maxlen:
+      slot = self.start
+      self.start = (self.start + 1) % self.maxlen
+    else:
+      slot = (self.start + self.size) % self.maxlen
+      self.size += 1
+
+    for name, activation in activations.iteritems():
+      if name not in self.arrays:
+        activation = np.asarray(activation)
+        self.arrays[name] = np.zeros((self.maxlen,) + activation.shape,
+                                     dtype=activation.dtype)
+      self.arrays[name][slot] = activation
+    self.times[slot] = time
+
+
+  def ordered(self):
+    """
+    :return: A dict mapping population names to stacked activations (one row
+             per time step), and the array of times, both oldest first.
+    """
+    order = (self.start + np.arange(self.size)) % max(self.maxlen, 1)
+    return (dict((name, array[order])
+                 for name, array in self.arrays.iteritems()),
+            self.times[order])
+
+
+  def keepLast(self):
+    """
+    Drop everything but the most recent time step.
+    """
+    if self.size > 1:
+      self.start = (self.start + self.size - 1) % self.maxlen
+      self.size = 1
+
+
+
 class Dynamic1DCAN(object):
   """
   This class provides a framework for learning a continuous attractor model of
@@ -166,7 +276,9 @@ class Dynamic1DCAN(object):
     :param placeGainI: Multiplier scaling impact of place code on I cells.
     :param sigmaLoc: Multiplier scaling width of place code bump.
     :param stdpKernel: The STDP kernel to be used.  See the function
-            defaultSTDPKernel for an example.
+            defaultSTDPKernel for an example.  It must return the outer
+            product of the scaled pre-synaptic activations and the
+            post-synaptic activations, see kernelTimeFactors.
     :param tonicMagnitude: The magnitude of the global tonic input
             during training.
     :param learnFactorII: Extra learning rate for II connections.
@@ -245,7 +357,7 @@ class Dynamic1DCAN(object):
     self.stdpWindow = stdpWindow
     self.stdpKernel = stdpKernel
 
-    self.activationBuffer = deque(maxlen=int(self.stdpWindow))
+    self.activationBuffer = ActivationBuffer(int(self.stdpWindow))
 
     self.tonicMagnitude = tonicMagnitude
 
@@ -899,120 +1011,76 @@ class Dynamic1DCAN(object):
   def stdpUpdate(self, time, clearBuffer=False, onlyPlace=False):
     """
     Adds the current activations to the tracking queue, and then performs an
-    STDP update if possible.
+    STDP update if possible.  The kernel is evaluated once per buffered time
+    step, and the updates of the whole window are summed with one matrix
+    product per weight matrix.
     :param time: The current time.  Must be provided.
     :param clearBuffer: Set as True to clear the activation buffer.
             This should be done at the end of training.
     :param onlyPlace: Only learn place connections.
     """
-    if clearBuffer:
-      while len(self.activationBuffer) > 1:
-        baseI, baseEL, baseER, baseP, t = self.activationBuffer.popleft()
-        for (I, EL, ER, P, i) in self.activationBuffer:
-          t = (i - t) * self.dt
-          self.weightsPI += placeSTDPKernel(self.learningRate *\
-                                            self.learnFactorP *\
-                                            self.dt *\
-                                            baseP, I, t,
-                                            )
-
-          self.weightsPEL += placeSTDPKernel(self.learningRate *\
-                                             self.learnFactorP *\
-                                             self.dt *\
-                                             baseP, EL, t,
-                                             )
-
-          self.weightsPER += placeSTDPKernel(self.learningRate *\
-                                             self.learnFactorP *\
-                                             self.dt *\
-                                             baseP, ER, t,
-                                             )
-
-          if not onlyPlace:
-            self.weightsELI += self.stdpKernel(self.learningRate *\
-                                               self.learnFactorEI *\
-                                               self.dt *\
-                                               baseEL, I, t,
-                                               False, True)
-
-            self.weightsERI += self.stdpKernel(self.learningRate *\
-                                               self.learnFactorEI *\
-                                               self.dt *\
-                                               baseER, I, t,
-                                               False, True)
+    placeRate = self.learningRate * self.learnFactorP * self.dt
+    recurrentRate = self.learningRate * self.learnFactorEI * self.dt
 
-    else:
-      for I, EL, ER, P, i in reversed(self.activationBuffer):
-        t = (i - time) * self.dt
-        self.weightsPI +=  placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           self.activationsP, I, t,
-                                           )
-
-        self.weightsPEL += placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           self.activationsP, EL, t,
-                                           )
-
-        self.weightsPER += placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           self.activationsP, ER, t,
-                                           )
+    if clearBuffer:
+      if len(self.activationBuffer) > 1:
+        history, times = self.activationBuffer.ordered()
+        dts = chainedTimeDifferences(times, self.dt)
+        pairs = np.triu(np.ones(dts.shape), 1)
+
+        # Each buffered step is paired with all the later ones.
+        placeFactors = kernelTimeFactors(placeSTDPKernel, dts) * pairs
+        P = placeRate * history["P"]
+        self.weightsPI += np.dot(P.T, np.dot(placeFactors, history["I"]))
+        self.weightsPEL += np.dot(P.T, np.dot(placeFactors, history["EL"]))
+        self.weightsPER += np.dot(P.T, np.dot(placeFactors, history["ER"]))
 
         if not onlyPlace:
-          self.weightsELI += self.stdpKernel(self.learningRate *\
-                                             self.learnFactorEI *\
-                                             self.dt *\
-                                             self.instantaneousEL, I, t,
-                                             False, True)
-
-          self.weightsERI += self.stdpKernel(self.learningRate *\
-                                             self.learnFactorEI *\
-                                             self.dt *\
-                                             self.instantaneousER, I, t,
-                                             False, True)
-
-      for I, EL, ER, P, i in self.activationBuffer:
-        t = (time - i) * self.dt
-        self.weightsPI +=  placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           P, self.instantaneousI, t,
-                                           )
-
-        self.weightsPEL += placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           P, self.instantaneousEL, t,
-                                           )
-
-        self.weightsPER += placeSTDPKernel(self.learningRate *\
-                                           self.learnFactorP *\
-                                           self.dt *\
-                                           P, self.instantaneousER, t,
-                                           )
+          factors = kernelTimeFactors(self.stdpKernel, dts, False, True) * pairs
+          afterI = np.dot(factors, history["I"])
+          self.weightsELI += np.dot(recurrentRate * history["EL"].T, afterI)
+          self.weightsERI += np.dot(recurrentRate * history["ER"].T, afterI)
 
-        if not onlyPlace:
-          self.weightsELI += self.stdpKernel(self.learningRate *\
-                                             self.learnFactorEI *\
-                                             self.dt *\
-                                             EL, self.instantaneousI, t,
-                                             False, True)
+        self.activationBuffer.keepLast()
 
-          self.weightsERI += self.stdpKernel(self.learningRate *\
-                                             self.learnFactorEI *\
-                                             self.dt *\
-                                             ER, self.instantaneousI, t,
-                                             False, True)
+    else:
+      if len(self.activationBuffer) > 0:
+        history, times = self.activationBuffer.ordered()
+        before = (times - time) * self.dt
+        after = (time - times) * self.dt
+
+        # Current activity paired with the buffer, then the buffer paired with
+        # the current activity.
+        placeBefore = kernelTimeFactors(placeSTDPKernel, before)
+        placeAfter = kernelTimeFactors(placeSTDPKernel, after)
+        P = placeRate * self.activationsP
+        pastP = placeRate * np.dot(placeAfter, history["P"])
+        self.weightsPI += (np.outer(P, np.dot(placeBefore, history["I"])) +
+                           np.outer(pastP, self.instantaneousI))
+        self.weightsPEL += (np.outer(P, np.dot(placeBefore, history["EL"])) +
+                            np.outer(pastP, self.instantaneousEL))
+        self.weightsPER += (np.outer(P, np.dot(placeBefore, history["ER"])) +
+                            np.outer(pastP, self.instantaneousER))
 
-      self.activationBuffer.append((np.copy(self.instantaneousI),
-                                    np.copy(self.instantaneousEL),
-                                    np.copy(self.instantaneousER),
-                                    np.copy(self.activationsP),
-                                    time))
+        if not onlyPlace:
+          factorsBefore = kernelTimeFactors(self.stdpKernel, before,
+                                            False, True)
+          factorsAfter = kernelTimeFactors(self.stdpKernel, after,
+                                           False, True)
+          pastI = np.dot(factorsBefore, history["I"])
+          self.weightsELI += (
+            np.outer(recurrentRate * self.instantaneousEL, pastI) +
+            np.outer(recurrentRate * np.dot(factorsAfter, history["EL"]),
+                     self.instantaneousI))
+          self.weightsERI += (
+            np.outer(recurrentRate * self.instantaneousER, pastI) +
+            np.outer(recurrentRate * np.dot(factorsAfter, history["ER"]),
+                     self.instantaneousI))
+
+      self.activationBuffer.append(time, {"I": self.instantaneousI,
+                                          "EL": self.instantaneousEL,
+                                          "ER": self.instantaneousER,
+                                          "P": self.activationsP})
 
 
 
@@ -1061,7 +1129,8 @@ class Dynamic2DCAN(Dynamic1DCAN):
                boostEffect=10,
                boostTarget=0.1,
                periodic=True,
-               hardwireEnvelope=False,):
+               hardwireEnvelope=False,
+               weightFormat="dense"):
     """
     :param dimensions: The number of neuron groups in each direction
             on the sheet.  2-tuple.  Will have the product as number of groups.
@@ -1077,7 +1146,9 @@ class Dynamic2DCAN(Dynamic1DCAN):
     :param placeGainI: Multiplier scaling impact of place code on I cells.
     :param sigmaLoc: Multiplier scaling width of place code bump.
     :param stdpKernel: The STDP kernel to be used.  See the function
-            defaultSTDPKernel for an example.
+            defaultSTDPKernel for an example.  It must return the outer
+            product of the scaled pre-synaptic activations and the
+            post-synaptic activations, see kernelTimeFactors.
     :param tonicMagnitude: The magnitude of the global tonic input
             during training.
     :param learnFactorII: Extra learning rate for II connections.
@@ -1098,8 +1169,21 @@ class Dynamic2DCAN(Dynamic1DCAN):
     :param periodic: Whether or not to use toroidal weight structures.
     :param hardwireEnvelope: Whether or not to weaken connections to enveloped
             cells instead of suppressing them.
+    :param weightFormat: How the recurrent weights are stored.  "dense" uses
+            dense float64 matrices.  "sparse" stores only the nonzero
+            hardwired connections in float32 sparse matrices, and
+            "convolution" stores the translation-invariant hardwired weights
+            as a float32 kernel.  The compact formats make large sheets
+            affordable, but they can't learn recurrent weights.  Place
+            weights stay dense, in float32.  Without periodic, the compact
+            hardwired weights match the dense ones.  With periodic, the
+            compact formats wrap hardwiredKernel around the sheet, which
+            differs from the dense periodic wiring.
 
     """
+    if weightFormat not in WEIGHT_FORMATS:
+      raise ValueError("Unknown weight format: {}".format(weightFormat))
+    self.weightFormat = weightFormat
 
     # Determine a starting place code, which will govern activation
     # during learning.  This code is ignored during testing.
@@ -1144,19 +1228,37 @@ class Dynamic2DCAN(Dynamic1DCAN):
     self.histories = dict((k, np.zeros(self.numExcitatory))
                             for k in self.directions.iterkeys())
 
-    self.weightsEI = dict((k, np.zeros((self.numInhibitory, self.numExcitatory)))
-                                 for k in self.directions.iterkeys())
-    self.weightsIE = dict((k, np.zeros((self.numExcitatory, self.numInhibitory)))
-                                 for k in self.directions.iterkeys())
-    self.weightsII = np.zeros((self.numInhibitory, self.numInhibitory))
-    self.weightsPE = dict((k, np.zeros((self.numExcitatory, self.numPlaces)))
-                                 for k in self.directions.iterkeys())
-    self.weightsPI = np.zeros((self.numInhibitory, self.numPlaces))
+    if weightFormat == "dense":
+      self.weightsEI = dict((k, np.zeros((self.numInhibitory, self.numExcitatory)))
+                                   for k in self.directions.iterkeys())
+      self.weightsIE = dict((k, np.zeros((self.numExcitatory, self.numInhibitory)))
+                                   for k in self.directions.iterkeys())
+      self.weightsII = np.zeros((self.numInhibitory, self.numInhibitory))
+      self.weightsPE = dict((k, np.zeros((self.numExcitatory, self.numPlaces)))
+                                   for k in self.directions.iterkeys())
+      self.weightsPI = np.zeros((self.numInhibitory, self.numPlaces))
+    else:
+      # Empty recurrent weights, replaced below if they're hardwired.
+      if weightFormat == "convolution":
+        self.weightsII = ConvolutionWeights(np.zeros((1, 1)), dimensions,
+                                            periodic)
+      else:
+        self.weightsII = kernelToSparse(np.zeros((1, 1)), dimensions,
+                                        periodic)
+      self.weightsEI = dict((k, self.weightsII)
+                            for k in self.directions.iterkeys())
+      self.weightsIE = dict((k, self.weightsII)
+                            for k in self.directions.iterkeys())
+      self.weightsPE = dict((k, np.zeros((self.numExcitatory, self.numPlaces),
+                                         dtype=COMPACT_DTYPE))
+                            for k in self.directions.iterkeys())
+      self.weightsPI = np.zeros((self.numInhibitory, self.numPlaces),
+                                dtype=COMPACT_DTYPE)
 
     self.stdpWindow = stdpWindow
     self.stdpKernel = stdpKernel
 
-    self.activationBuffer = deque(maxlen=int(self.stdpWindow))
+    self.activationBuffer = ActivationBuffer(int(self.stdpWindow))
 
     self.tonicMagnitude = tonicMagnitude
 
@@ -1167,13 +1269,28 @@ class Dynamic2DCAN(Dynamic1DCAN):
 
     self.clip = clip
     self.plotting = plotting
+    self.movie = movie
 
     self.boostEffect = boostEffect
     self.boostTarget = boostTarget
 
     self.envelope = self.computeEnvelope()
 
-    if hardwireI:
+    if hardwireI and weightFormat != "dense":
+      kernel = self.hardwiredKernel(periodic)
+      if weightFormat == "convolution":
+        self.weightsII = ConvolutionWeights(
+          kernel, dimensions, periodic,
+          self.envelope if hardwireEnvelope else None)
+      else:
+        self.weightsII = kernelToSparse(kernel, dimensions, periodic)
+        if hardwireEnvelope:
+          self.weightsII = self.weightsII.multiply(
+            self.envelope.astype(COMPACT_DTYPE)[np.newaxis, :]).tocsr()
+      self.weightsIE = dict((k, self.weightsII)
+                            for k in self.directions.iterkeys())
+
+    elif hardwireI:
       # Calculate it once
       if periodic:
         jCoord0 = np.unravel_index(0, self.dimensions)
@@ -1232,7 +1349,7 @@ class Dynamic2DCAN(Dynamic1DCAN):
 
         np.save(str(self.dimensions)+"weightCache.npz", self.weightsII)
 
-    if hardwireEnvelope:
+    if hardwireEnvelope and weightFormat == "dense":
       self.weightsII *= self.envelope
       for k, w in self.weightsIE.items():
         w *= self.envelope
@@ -1339,9 +1456,8 @@ class Dynamic2DCAN(Dynamic1DCAN):
     np.matmul(self.weightsPI, self.activationsP*self.placeGainI,
               self.instantaneousI)
     if recurrent:
-      self.instantaneousI += np.matmul(np.minimum(self.weightsII, 0),
-                                       self.activationsI,
-                                       )
+      self.instantaneousI += postsynapticProduct(
+        clipWeights(self.weightsII, maximum=0), self.activationsI)
     self.instantaneousI += self.boostEffect*self.activationHistoryI +\
                            feedforwardInputI + self.tonicMagnitude
 
@@ -1410,6 +1526,28 @@ class Dynamic2DCAN(Dynamic1DCAN):
     return np.asarray(np.outer(envelopeX, envelopeY).flatten())
 
 
+  def hardwiredKernel(self, periodic, radius=20):
+    """
+    The translation-invariant profile of the hardwired inhibitory weights.
+    :param periodic: Whether the sheet wraps around.  If so, the kernel is
+            cut to fit in the sheet.
+    :param radius: Longest connection, as a Manhattan distance in cells.
+    :return: A kernel for the compact weight formats, whose center is the
+             weight between a cell and itself.
+    """
+    radii = [radius, radius]
+    if periodic:
+      radii = [min(radius, (size - 1) // 2) for size in self.dimensions]
+
+    offsets = np.meshgrid(np.arange(-radii[0], radii[0] + 1),
+                          np.arange(-radii[1], radii[1] + 1),
+                          indexing="ij")
+    distanceComponents = np.abs(np.asarray(offsets))
+    kernel = 1000*w_0(distanceComponents*2)
+    kernel[distanceComponents[0] + distanceComponents[1] > radius] = 0
+    return kernel
+
+
   def decayWeights(self, decayConst=60):
     """
     Decay the network's weights.
@@ -1418,12 +1556,22 @@ class Dynamic2DCAN(Dynamic1DCAN):
             Note: If applied, decay must be used extremely carefully, as
             it has a tendency to cause asymmetries in the network weights.
     """
-    self.weightsII -= self.weightsII*self.dt/decayConst
+    if self.weightFormat == "dense":
+      self.weightsII -= self.weightsII*self.dt/decayConst
+      for k, w in self.weightsIE.items():
+        w -= w*self.dt/decayConst
+      for k, w in self.weightsEI.items():
+        w -= w*self.dt/decayConst
+    else:
+      # Compact weights may be shared, so they're replaced, not modified.
+      factor = 1 - self.dt/decayConst
+      self.weightsII = self.weightsII*factor
+      for k in self.weightsIE:
+        self.weightsIE[k] = self.weightsIE[k]*factor
+      for k in self.weightsEI:
+        self.weightsEI[k] = self.weightsEI[k]*factor
+
     self.weightsPI -= self.weightsPI*self.dt/decayConst
-    for k, w in self.weightsIE.items():
-      w -= w*self.dt/decayConst
-    for k, w in self.weightsEI.items():
-      w -= w*self.dt/decayConst
     for k, w in self.weightsPE.items():
       w -= w*self.dt/decayConst
 
@@ -1555,13 +1703,15 @@ class Dynamic2DCAN(Dynamic1DCAN):
 
       self.stdpUpdate(t, onlyPlace=not learnRecurrent, clearBuffer=True)
 
-      # Enforce Dale's law
-      np.minimum(self.weightsII, 0, self.weightsII)
+      # Enforce Dale's law.  Compact recurrent weights aren't learned, and
+      # are clipped when they're used.
+      if self.weightFormat == "dense":
+        np.minimum(self.weightsII, 0, self.weightsII)
+        for k, w in self.weightsIE.items():
+          np.minimum(w, 0, w)
+        for k, w in self.weightsEI.items():
+          np.maximum(w, 0, w)
       np.maximum(self.weightsPI, 0, self.weightsPI)
-      for k, w in self.weightsIE.items():
-        np.minimum(w, 0, w)
-      for k, w in self.weightsEI.items():
-        np.maximum(w, 0, w)
       for k, w in self.weightsPE.items():
         np.maximum(w, 0, w)
 
@@ -1604,30 +1754,34 @@ class Dynamic2DCAN(Dynamic1DCAN):
     self.fig.canvas.draw()
 
 
-  def stdpKernels(self, t, I, E, baseI, baseE, baseP, onlyPlace=False):
-    self.weightsPI += placeSTDPKernel(self.learningRate * \
-                                      self.learnFactorP * \
-                                      self.dt * \
-                                      baseP, I, t,
-                                      )
-    for k, a in E.items():
-      self.weightsPE[k] += placeSTDPKernel(self.learningRate * \
-                                           self.learnFactorP * \
-                                           self.dt * \
-                                           baseP, E[k], t,
-                                           )
+  def stdpKernels(self, placeFactors, factors, I, E, baseI, baseE, baseP,
+                  onlyPlace=False):
+    """
+    Apply the STDP updates between every pair of base and other activations.
+    All activations are stacked, one row per time step.
+    :param placeFactors: Time factors of placeSTDPKernel (see
+            kernelTimeFactors), one row per base time step and one column per
+            other time step.
+    :param factors: Time factors of the recurrent STDP kernel, shaped like
+            placeFactors.
+    :param I: The other inhibitory activations.
+    :param E: Dict of the other excitatory activations, keyed by direction.
+    :param baseI, baseE, baseP: The base inhibitory, excitatory and place
+            activations.
+    :param onlyPlace: Only learn place connections.
+    """
+    rate = self.learningRate * self.learnFactorP * self.dt
+
+    def contract(base, timeFactors, other):
+      return np.dot((rate * base).T, np.dot(timeFactors, other))
+
+    self.weightsPI += contract(baseP, placeFactors, I)
+    for k in E:
+      self.weightsPE[k] += contract(baseP, placeFactors, E[k])
 
       if not onlyPlace:
-        self.weightsEI[k] += self.stdpKernel(self.learningRate * \
-                                             self.learnFactorP * \
-                                             self.dt * \
-                                             baseE[k], I, t,
-                                             )
-        self.weightsIE[k] += self.stdpKernel(self.learningRate * \
-                                             self.learnFactorP * \
-                                             self.dt * \
-                                             baseI, E[k], t,
-                                             )
+        self.weightsEI[k] += contract(baseE[k], factors, I)
+        self.weightsIE[k] += contract(baseI, factors, E[k])
 
 
   def createMovie(self, data, name, nx, ny):
@@ -1647,42 +1801,60 @@ class Dynamic2DCAN(Dynamic1DCAN):
   def stdpUpdate(self, time, clearBuffer=False, onlyPlace=False):
     """
     Adds the current activations to the tracking queue, and then performs an
-    STDP update if possible.
+    STDP update if possible.  The kernel is evaluated once per buffered time
+    step, and the updates of the whole window are summed with matrix
+    products.
     :param time: The current time.  Must be provided.
     :param clearBuffer: Set as True to clear the activation buffer.
             This should be done at the end of training.
     :param onlyPlace: Only learn place connections.
     """
+    if not onlyPlace and self.weightFormat != "dense":
+      raise ValueError("Recurrent weights can only be learned in the dense "
+                       "format, not {}".format(self.weightFormat))
+
     if clearBuffer:
-      while len(self.activationBuffer) > 1:
-        baseI, baseE, baseP, t = self.activationBuffer.popleft()
-        for (I, E, P, i) in self.activationBuffer:
-          t = (i - t) * self.dt
-          self.sdtpKernels(t, I, E, baseI, baseE, baseP, onlyPlace=onlyPlace)
+      if len(self.activationBuffer) > 1:
+        history, times = self.activationBuffer.ordered()
+        I = history["I"]
+        E = dict((k, history["E" + k]) for k in self.instantaneous)
+
+        # Each buffered step is paired with all the later ones.
+        dts = chainedTimeDifferences(times, self.dt)
+        pairs = np.triu(np.ones(dts.shape), 1)
+        self.stdpKernels(kernelTimeFactors(placeSTDPKernel, dts) * pairs,
+                         kernelTimeFactors(self.stdpKernel, dts) * pairs,
+                         I, E, I, E, history["P"],
+                         onlyPlace=onlyPlace)
+
+        self.activationBuffer.keepLast()
 
     else:
-      for I, E, P, i in reversed(self.activationBuffer):
-        t = (i - time) * self.dt
-        self.sdtpKernels(t,
-                         I,
-                         E,
-                         self.instantaneousI,
-                         self.instantaneous,
-                         self.activationsP,
+      if len(self.activationBuffer) > 0:
+        history, times = self.activationBuffer.ordered()
+        I = history["I"]
+        E = dict((k, history["E" + k]) for k in self.instantaneous)
+        currentI = self.instantaneousI[np.newaxis, :]
+        currentE = dict((k, self.instantaneous[k][np.newaxis, :])
+                        for k in self.instantaneous)
+        currentP = self.activationsP[np.newaxis, :]
+
+        # The current activations as the base, paired with the buffer.
+        before = ((times - time) * self.dt)[np.newaxis, :]
+        self.stdpKernels(kernelTimeFactors(placeSTDPKernel, before),
+                         kernelTimeFactors(self.stdpKernel, before),
+                         I, E, currentI, currentE, currentP,
                          onlyPlace=onlyPlace)
 
-      for I, E, P, i in self.activationBuffer:
-        t = (time - i) * self.dt
-        self.sdtpKernels(t,
-                         self.instantaneousI,
-                         self.instantaneous,
-                         I,
-                         E,
-                         P,
+        # The buffer as the base, paired with the current activations.
+        after = ((time - times) * self.dt)[:, np.newaxis]
+        self.stdpKernels(kernelTimeFactors(placeSTDPKernel, after),
+                         kernelTimeFactors(self.stdpKernel, after),
+                         currentI, currentE, I, E, history["P"],
                          onlyPlace=onlyPlace)
 
-      self.activationBuffer.append((np.copy(self.instantaneousI),
-                                    {k: np.copy(self.instantaneous[k])
-                                    for k in self.instantaneous},
-                                    np.copy(self.activationsP),
-                                    time))
+      activations = dict(("E" + k, self.instantaneous[k])
+                         for k in self.instantaneous)
+      activations["I"] = self.instantaneousI
+      activations["P"] = self.activationsP
+      self.activationBuffer.append(time, activations)
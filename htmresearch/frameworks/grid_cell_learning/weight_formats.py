@@ -0,0 +1,269 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compact storage for the mostly local weights of the CAN networks, so that
+large sheets of cells can be simulated.
+
+Weights are either dense numpy arrays, float32 scipy.sparse matrices holding
+only the local connections, or ConvolutionWeights for translation-invariant
+weights on a 2D sheet.  The helpers below work with all three.
+"""
+
+import numpy as np
+from scipy import sparse
+
+# Storage formats of the recurrent weights
+WEIGHT_FORMATS = ("dense", "sparse", "convolution")
+
+# Data type of the sparse and convolution formats
+COMPACT_DTYPE = np.float32
+
+
+
+def ringBand(numRows, numCols, radius):
+  """
+  Find the pairs of cells of two populations laid out on the same ring that
+  are at most radius apart.  Cell i of a population of n cells sits at i/n.
+  :param numRows: Size of the first population.
+  :param numCols: Size of the second population.
+  :param radius: Maximum distance, as a fraction of the ring.
+  :return: The row and column indices of the pairs.
+  """
+  offsets = (np.arange(numRows)[:, np.newaxis] / float(numRows) -
+             np.arange(numCols)[np.newaxis, :] / float(numCols))
+  distances = np.abs(offsets - np.round(offsets))
+  return np.nonzero(distances <= radius)
+
+
+
+def bandedRandomWeights(numRows, numCols, radius, scale):
+  """
+  Random weights in [0, scale), kept only between cells at most radius apart
+  (see ringBand).
+  :return: A scipy.sparse.csr_matrix of COMPACT_DTYPE.
+  """
+  rows, cols = ringBand(numRows, numCols, radius)
+  values = np.random.random_sample(len(rows)) * scale
+  return sparse.csr_matrix((values.astype(COMPACT_DTYPE), (rows, cols)),
+                           shape=(numRows, numCols))
+
+
+
+def bandedWeights(weights, radius):
+  """
+  Keep the weights between cells at most radius apart (see ringBand).
+  :param weights: Dense weight matrix.
+  :return: A scipy.sparse.csr_matrix of COMPACT_DTYPE.
+  """
+  weights = np.asarray(weights)
+  rows, cols = ringBand(weights.shape[0], weights.shape[1], radius)
+  return sparse.csr_matrix(
+    (weights[rows, cols].astype(COMPACT_DTYPE), (rows, cols)),
+    shape=weights.shape)
+
+
+
+def kernelToSparse(kernel, dimensions, periodic):
+  """
+  Expand a translation-invariant kernel on a 2D sheet into a sparse matrix.
+  Entry (i, j) is the kernel at the offset of cell j from cell i.
+  :param kernel: 2D array with odd sides, centered on offset (0, 0).
+  :param dimensions: The shape of the sheet.
+  :param periodic: Whether the sheet wraps around.
+  :return: A scipy.sparse.csr_matrix of COMPACT_DTYPE.
+  """
+  numCells = dimensions[0] * dimensions[1]
+  radius = np.asarray(kernel.shape) // 2
+  rowCoords, colCoords = np.unravel_index(np.arange(numCells), dimensions)
+
+  rows = [np.empty(0, dtype="int64")]
+  cols = [np.empty(0, dtype="int64")]
+  values = [np.empty(0, dtype=COMPACT_DTYPE)]
+  for dy, dx in zip(*np.nonzero(kernel)):
+    targetRows = rowCoords + dy - radius[0]
+    targetCols = colCoords + dx - radius[1]
+    if periodic:
+      targetRows %= dimensions[0]
+      targetCols %= dimensions[1]
+      valid = np.ones(numCells, dtype="bool")
+    else:
+      valid = ((targetRows >= 0) & (targetRows < dimensions[0]) &
+               (targetCols >= 0) & (targetCols < dimensions[1]))
+    rows.append(np.nonzero(valid)[0])
+    cols.append(np.ravel_multi_index((targetRows[valid], targetCols[valid]),
+                                     dimensions))
+    values.append(np.full(valid.sum(), kernel[dy, dx], dtype=COMPACT_DTYPE))
+
+  return sparse.csr_matrix(
+    (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+    shape=(numCells, numCells))
+
+
+
+class ConvolutionWeights(object):
+  """
+  Translation-invariant weights between two populations on the same 2D sheet,
+  stored as a kernel.  Entry (i, j) of the equivalent matrix is the kernel at
+  the offset of cell j from cell i, times presynapticScale[j].  Products are
+  computed with FFTs, so they cost O(N log N) for N cells whatever the size of
+  the kernel.
+  """
+
+  def __init__(self, kernel, dimensions, periodic, presynapticScale=None):
+    """
+    :param kernel: 2D array with odd sides, centered on offset (0, 0).  Must
+            be smaller than the sheet if periodic.
+    :param dimensions: The shape of the sheet.
+    :param periodic: Whether the sheet wraps around.
+    :param presynapticScale: Optional per-cell factor applied to the
+            presynaptic activations, e.g. an envelope.
+    """
+    self.kernel = np.asarray(kernel, dtype=COMPACT_DTYPE)
+    self.dimensions = tuple(dimensions)
+    self.periodic = periodic
+    self.presynapticScale = presynapticScale
+
+    numCells = self.dimensions[0] * self.dimensions[1]
+    self.shape = (numCells, numCells)
+    self.dtype = self.kernel.dtype
+
+    radius = np.asarray(self.kernel.shape) // 2
+    if periodic:
+      # out[i] = sum_j kernel[j - i] x[j] is a circular correlation.
+      self.fftShape = self.dimensions
+      wrapped = np.zeros(self.fftShape)
+      for dy, dx in zip(*np.nonzero(self.kernel)):
+        wrapped[(dy - radius[0]) % self.fftShape[0],
+                (dx - radius[1]) % self.fftShape[1]] += self.kernel[dy, dx]
+      self.kernelFFT = np.conj(np.fft.rfft2(wrapped))
+    else:
+      # A linear convolution with the flipped kernel, padded so it doesn't
+      # wrap, then cropped back to the sheet.
+      self.fftShape = (self.dimensions[0] + self.kernel.shape[0] - 1,
+                       self.dimensions[1] + self.kernel.shape[1] - 1)
+      self.kernelFFT = np.fft.rfft2(self.kernel[::-1, ::-1], self.fftShape)
+    self.radius = radius
+    self._clipped = {}
+
+
+  def dot(self, activations):
+    """
+    Compute the input to each cell, like np.dot(weights, activations).
+    """
+    x = np.asarray(activations, dtype="float").reshape(self.dimensions)
+    if self.presynapticScale is not None:
+      x = x * np.reshape(self.presynapticScale, self.dimensions)
+
+    result = np.fft.irfft2(np.fft.rfft2(x, self.fftShape) * self.kernelFFT,
+                           self.fftShape)
+    if not self.periodic:
+      result = result[self.radius[0]:self.radius[0] + self.dimensions[0],
+                      self.radius[1]:self.radius[1] + self.dimensions[1]]
+    return result.reshape(-1).astype(self.dtype)
+
+
+  def clip(self, minimum=None, maximum=None):
+    """
+    :return: ConvolutionWeights with the kernel clipped to [minimum, maximum].
+             The presynaptic scale must be nonnegative.
+    """
+    key = (minimum, maximum)
+    if key not in self._clipped:
+      kernel = self.kernel
+      if minimum is not None:
+        kernel = np.maximum(kernel, minimum)
+      if maximum is not None:
+        kernel = np.minimum(kernel, maximum)
+      self._clipped[key] = ConvolutionWeights(kernel, self.dimensions,
+                                              self.periodic,
+                                              self.presynapticScale)
+    return self._clipped[key]
+
+
+  def __mul__(self, factor):
+    return ConvolutionWeights(self.kernel * factor, self.dimensions,
+                              self.periodic, self.presynapticScale)
+
+
+  def toarray(self):
+    """
+    :return: The equivalent dense weight matrix.
+    """
+    weights = kernelToSparse(self.kernel, self.dimensions,
+                             self.periodic).toarray()
+    if self.presynapticScale is not None:
+      weights *= self.presynapticScale
+    return weights
+
+
+
+def clipWeights(weights, minimum=None, maximum=None):
+  """
+  Clip weights of any format, e.g. to enforce Dale's law.  Sparse weights can
+  only be clipped to ranges that contain zero.
+  :return: The clipped weights, in the same format.
+  """
+  if isinstance(weights, ConvolutionWeights):
+    return weights.clip(minimum, maximum)
+
+  if minimum is not None:
+    weights = (weights.maximum(minimum) if sparse.issparse(weights)
+               else np.maximum(weights, minimum))
+  if maximum is not None:
+    weights = (weights.minimum(maximum) if sparse.issparse(weights)
+               else np.minimum(weights, maximum))
+  return weights
+
+
+
+def maxAbsWeight(weights):
+  """
+  :return: The largest absolute weight of dense or sparse weights.
+  """
+  if sparse.issparse(weights):
+    weights = np.append(weights.data, 0)
+  return np.amax(np.abs(weights))
+
+
+
+def presynapticProduct(activations, weights):
+  """
+  Compute np.matmul(activations, weights) for dense or sparse weights, where
+  weights[i, j] connects presynaptic cell i to postsynaptic cell j.  Sparse
+  products are computed in the weights' data type.
+  """
+  if sparse.issparse(weights):
+    return weights.T.dot(np.asarray(activations, dtype=weights.dtype))
+  return np.matmul(activations, weights)
+
+
+
+def postsynapticProduct(weights, activations):
+  """
+  Compute np.matmul(weights, activations) for weights of any format, where
+  weights[i, j] connects presynaptic cell j to postsynaptic cell i.
+  """
+  if sparse.issparse(weights):
+    return weights.dot(np.asarray(activations, dtype=weights.dtype))
+  elif isinstance(weights, ConvolutionWeights):
+    return weights.dot(activations)
+  return np.matmul(weights, activations)
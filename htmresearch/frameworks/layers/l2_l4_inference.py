@@ -93,7 +93,10 @@ from nupic.bindings.math import SparseMatrix
 
 from htmresearch.support.logging_decorator import LoggingDecorator
 from htmresearch.support.register_regions import registerAllResearchRegions
+from htmresearch.support.sparse_links import getLinkCells
 from htmresearch.frameworks.layers.laminar_network import createNetwork
+from htmresearch.frameworks.layers.object_classifier_index import (
+  ObjectClassifierIndex)
 
 
 
@@ -151,7 +154,8 @@ class L4L2Experiment(object):
                enableFeedForwardSP=False,
                feedForwardSPOverrides=None,
                objectNamesAreIndices=False,
-               enableFeedback=True
+               enableFeedback=True,
+               sparseLinks=False
                ):
     """
     Creates the network.
@@ -228,6 +232,10 @@ class L4L2Experiment(object):
     @param   enableFeedback (bool)
              If True, enable feedback between L2 and L4
 
+    @param   sparseLinks (bool)
+             If True, the regions send each other sorted cell indices instead
+             of 0/1 arrays. Can't be combined with the SP regions.
+
     """
     # Handle logging - this has to be done first
     self.logCalls = logCalls
@@ -241,6 +249,7 @@ class L4L2Experiment(object):
     self.externalInputSize = externalInputSize
     self.numInputBits = numInputBits
     self.objectNamesAreIndices = objectNamesAreIndices
+    self.sparseLinks = sparseLinks
 
     # seed
     self.seed = seed
@@ -251,6 +260,7 @@ class L4L2Experiment(object):
       "networkType": networkType,
       "longDistanceConnections": longDistanceConnections,
       "enableFeedback": enableFeedback,
+      "sparseLinks": sparseLinks,
       "numCorticalColumns": numCorticalColumns,
       "externalInputSize": externalInputSize,
       "sensorInputSize": inputSize,
@@ -320,6 +330,7 @@ class L4L2Experiment(object):
       SparseMatrix(0, self.config["L2Params"]["cellCount"])
       for _ in xrange(self.numColumns)]
     self.objectNameToIndex = {}
+    self._classifierIndex = None
     self.resetStatistics()
 
 
@@ -373,22 +384,11 @@ class L4L2Experiment(object):
       if len(sensationList) == 0:
         continue
 
-      # keep track of numbers of iterations to run
-      iterations = 0
-
-      for sensations in sensationList:
-        # learn each pattern multiple times
-        for _ in xrange(self.numLearningPoints):
-
-          for col in xrange(self.numColumns):
-            location, feature = sensations[col]
-            self.sensorInputs[col].addDataToQueue(list(feature), 0, 0)
-            self.externalInputs[col].addDataToQueue(list(location), 0, 0)
-          iterations += 1
+      # learn each pattern multiple times
+      self._queueSensations(sensationList, self.numLearningPoints)
 
       # actually learn the objects
-      if iterations > 0:
-        self.network.run(iterations)
+      self.network.run(len(sensationList) * self.numLearningPoints)
 
       # update L2 representations
       self._saveL2Representation(objectName)
@@ -444,13 +444,10 @@ class L4L2Experiment(object):
     self._unsetLearningMode()
     statistics = collections.defaultdict(list)
 
-    for sensations in sensationList:
+    # feed all columns with sensations
+    self._queueSensations(sensationList)
 
-      # feed all columns with sensations
-      for col in xrange(self.numColumns):
-        location, feature = sensations[col]
-        self.sensorInputs[col].addDataToQueue(list(feature), 0, 0)
-        self.externalInputs[col].addDataToQueue(list(location), 0, 0)
+    for _ in xrange(len(sensationList)):
       self.network.run(1)
       self._updateInferenceStats(statistics, objectName)
 
@@ -470,6 +467,7 @@ class L4L2Experiment(object):
     Record the current active L2 cells as the representation for 'objectName'.
     """
     self.objectL2Representations[objectName] = self.getL2Representations()
+    self._classifierIndex = None
 
     try:
       objectIndex = self.objectNameToIndex[objectName]
@@ -493,6 +491,47 @@ class L4L2Experiment(object):
                               np.ones(len(activeCells), dtype="float32"))
 
 
+  def _queueSensations(self, sensationList, repeats=1):
+    """
+    Queue a list of sensations in the sensors of every column, as one batch
+    per sensor.
+
+    @param sensationList (list)
+    Sensations in the canonical format, see infer()
+
+    @param repeats (int)
+    Number of consecutive times each sensation is sent
+    """
+    if len(sensationList) == 0:
+      return
+
+    for col in xrange(self.numColumns):
+      locations = [sensations[col][0] for sensations in sensationList]
+      features = [sensations[col][1] for sensations in sensationList]
+      self.sensorInputs[col].addBatchToQueue(
+        *self._encodeSensationBatch(features, repeats))
+      self.externalInputs[col].addBatchToQueue(
+        *self._encodeSensationBatch(locations, repeats))
+
+
+  @staticmethod
+  def _encodeSensationBatch(sdrs, repeats):
+    """
+    Concatenate a list of SDRs into a CSR-style batch for the sensors.
+
+    @return (tuple)
+    The active bits of all SDRs and the offset of each SDR in them
+    """
+    sdrs = [np.fromiter(sdr, dtype="uint32", count=len(sdr)) for sdr in sdrs]
+    if repeats > 1:
+      sdrs = [sdr for sdr in sdrs for _ in xrange(repeats)]
+
+    offsets = np.zeros(len(sdrs) + 1, dtype="int64")
+    np.cumsum([len(sdr) for sdr in sdrs], out=offsets[1:])
+
+    return np.concatenate(sdrs), offsets
+
+
   def _sendReset(self, sequenceId=0):
     """
     Sends a reset signal to the network.
@@ -702,7 +741,8 @@ class L4L2Experiment(object):
     """
     Returns the active representation in L4.
     """
-    return [set(column.getOutputData("activeCells").nonzero()[0])
+    return [set(getLinkCells(column.getOutputData("activeCells"),
+                             self.sparseLinks))
             for column in self.L4Regions]
 
 
@@ -710,7 +750,8 @@ class L4L2Experiment(object):
     """
     Returns the cells in L4 that were predicted by the location input.
     """
-    return [set(column.getOutputData("predictedCells").nonzero()[0])
+    return [set(getLinkCells(column.getOutputData("predictedCells"),
+                             self.sparseLinks))
             for column in self.L4Regions]
 
 
@@ -719,7 +760,8 @@ class L4L2Experiment(object):
     Returns the cells in L4 that were predicted by the location signal
     and are currently active.  Does not consider apical input.
     """
-    return [set(column.getOutputData("predictedActiveCells").nonzero()[0])
+    return [set(getLinkCells(column.getOutputData("predictedActiveCells"),
+                             self.sparseLinks))
             for column in self.L4Regions]
 
 
@@ -768,7 +810,8 @@ class L4L2Experiment(object):
     return overlaps
 
 
-  def getCurrentClassification(self, minOverlap=None, includeZeros=True):
+  def getCurrentClassification(self, minOverlap=None, includeZeros=True,
+                               topK=None):
     """
     Return the current classification for every object.  Returns a dict with a
     score for each object. Score goes from 0 to 1. A 1 means every col (that has
@@ -780,35 +823,30 @@ class L4L2Experiment(object):
 
     :param includeZeros: if True, include scores for all objects, even if 0
 
+    :param topK: if specified, only return the topK highest scoring objects
+
     :return: dict of object names and their score
     """
-    results = {}
-    l2sdr = self.getL2Representations()
+    index = self._getClassifierIndex()
     sdrSize = self.config["L2Params"]["sdrSize"]
     if minOverlap is None:
       minOverlap = sdrSize / 2
 
-    for objectName, objectSdr in self.objectL2Representations.iteritems():
-      count = 0
-      score = 0.0
-      for col in xrange(self.numColumns):
-        # Ignore inactive column
-        if len(l2sdr[col]) == 0:
-          continue
-
-        count += 1
-        overlap = len(l2sdr[col] & objectSdr[col])
-        if overlap >= minOverlap:
-          score += 1
-
-      if count == 0:
-        if includeZeros:
-          results[objectName] = 0
-      else:
-        if includeZeros or score>0.0:
-          results[objectName] = score / count
+    scores = index.computeScores(self.getL2Representations(), minOverlap)
+    if scores is None:
+      scores = np.zeros(len(index.objectNames), dtype="int64")
+
+    if includeZeros:
+      selected = np.arange(len(scores))
+    else:
+      selected = np.flatnonzero(scores)
 
-    return results
+    if topK is not None and topK < len(selected):
+      best = np.argpartition(-scores[selected], topK - 1)[:topK]
+      selected = selected[best]
+
+    return dict((index.objectNames[i], score)
+                for i, score in zip(selected, scores[selected].tolist()))
 
 
   def isObjectClassified(self, objectName, minOverlap=None, maxL2Size=None):
@@ -826,23 +864,47 @@ class L4L2Experiment(object):
 
     :return: True/False
     """
-    L2Representation = self.getL2Representations()
-    objectRepresentation = self.objectL2Representations[objectName]
+    return objectName in self.getClassifiedObjects(minOverlap, maxL2Size)
+
+
+  def getClassifiedObjects(self, minOverlap=None, maxL2Size=None):
+    """
+    Return every object that is currently classified by every L2 column, as
+    defined by isObjectClassified.
+
+    :param minOverlap: min overlap to consider the object as recognized.
+                       Defaults to half of the SDR size
+
+    :param maxL2Size: max size for the L2 representation
+                       Defaults to 1.5 * SDR size
+
+    :return: list of object names
+    """
+    index = self._getClassifierIndex()
     sdrSize = self.config["L2Params"]["sdrSize"]
     if minOverlap is None:
       minOverlap = sdrSize / 2
     if maxL2Size is None:
       maxL2Size = 1.5*sdrSize
 
-    numCorrectClassifications = 0
-    for col in xrange(self.numColumns):
-      overlapWithObject = len(objectRepresentation[col] & L2Representation[col])
+    classified = index.classify(self.getL2Representations(), minOverlap,
+                                maxL2Size)
+    return [index.objectNames[i] for i in np.flatnonzero(classified)]
 
-      if ( overlapWithObject >= minOverlap  and
-           len(L2Representation[col]) <= maxL2Size ):
-        numCorrectClassifications += 1
 
-    return numCorrectClassifications == self.numColumns
+  def _getClassifierIndex(self):
+    """
+    Return an index of objectL2Representations, rebuilding it if objects were
+    learned since it was built.
+    """
+    index = getattr(self, "_classifierIndex", None)
+    if index is None or not index.isCurrent(self.objectL2Representations):
+      index = ObjectClassifierIndex(self.objectL2Representations,
+                                    self.numColumns,
+                                    self.config["L2Params"]["cellCount"])
+      self._classifierIndex = index
+
+    return index
 
 
   def getDefaultL4Params(self, inputSize, numInputBits):
@@ -219,6 +219,11 @@ def createL4L2Column(network, networkConfig, suffix=""):
     If externalInputSize is 0, the externalInput sensor (and SP if appropriate)
     will NOT be created. In this case it is expected that L4 is a sequence
     memory region (e.g. ApicalTMSequenceRegion)
+
+    If "sparseLinks" is True, the sensors, L4 and L2 send each other sorted
+    cell indices rather than 0/1 arrays (see htmresearch.support.sparse_links).
+    This requires an L4 region that supports the sparseLinks parameter, and it
+    can't be combined with the spatial pooler regions.
   """
 
   externalInputName = "externalInput" + suffix
@@ -229,14 +234,24 @@ def createL4L2Column(network, networkConfig, suffix=""):
   L4Params = copy.deepcopy(networkConfig["L4Params"])
   L4Params["basalInputWidth"] = networkConfig["externalInputSize"]
   L4Params["apicalInputWidth"] = networkConfig["L2Params"]["cellCount"]
+  L2Params = copy.deepcopy(networkConfig["L2Params"])
+  externalInputParams = {"outputWidth": networkConfig["externalInputSize"]}
+  sensorInputParams = {"outputWidth": networkConfig["sensorInputSize"]}
+
+  if networkConfig.get("sparseLinks", False):
+    if ("lateralSPParams" in networkConfig or
+        "feedForwardSPParams" in networkConfig):
+      raise ValueError("sparseLinks can't be used with SP regions")
+    for params in (L4Params, L2Params, externalInputParams, sensorInputParams):
+      params["sparseLinks"] = True
 
   if networkConfig["externalInputSize"] > 0:
     network.addRegion(
       externalInputName, "py.RawSensor",
-      json.dumps({"outputWidth": networkConfig["externalInputSize"]}))
+      json.dumps(externalInputParams))
   network.addRegion(
     sensorInputName, "py.RawSensor",
-    json.dumps({"outputWidth": networkConfig["sensorInputSize"]}))
+    json.dumps(sensorInputParams))
 
   # Fixup network to include SP, if defined in networkConfig
   if networkConfig["externalInputSize"] > 0:
@@ -248,7 +263,7 @@ def createL4L2Column(network, networkConfig, suffix=""):
     json.dumps(L4Params))
   network.addRegion(
     L2ColumnName, "py.ColumnPoolerRegion",
-    json.dumps(networkConfig["L2Params"]))
+    json.dumps(L2Params))
 
   # Set phases appropriately so regions are executed in the proper sequence
   # This is required when we create multiple columns - the order of execution
@@ -0,0 +1,141 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Classify the current multi-column representation against every learned object
+at once.
+"""
+
+import numpy as np
+
+
+
+class ObjectClassifierIndex(object):
+  """
+  Stores the learned object representations of every column as a cell ->
+  objects map in CSR form. The overlap of a representation with every object
+  is then computed by visiting only the entries of its active cells.
+  """
+
+  def __init__(self, objectRepresentations, numColumns, cellCount):
+    """
+    @param objectRepresentations (dict)
+    Maps each object name to a list with the object's cells in each column
+
+    @param numColumns (int)
+
+    @param cellCount (int)
+    Number of cells in each column
+    """
+    self.objectRepresentations = objectRepresentations
+    self.objectNames = list(objectRepresentations.keys())
+    self.numColumns = numColumns
+    self.cellCount = cellCount
+
+    self._cellOffsets = []
+    self._objectsByCell = []
+    for col in xrange(numColumns):
+      cells = [np.fromiter(objectRepresentations[name][col], dtype="int64",
+                           count=len(objectRepresentations[name][col]))
+               for name in self.objectNames]
+      objects = np.repeat(np.arange(len(cells), dtype="int64"),
+                          [len(objectCells) for objectCells in cells])
+      cells = (np.concatenate(cells) if len(cells) > 0
+               else np.empty(0, dtype="int64"))
+
+      order = np.argsort(cells, kind="mergesort")
+      self._objectsByCell.append(objects[order])
+      self._cellOffsets.append(np.searchsorted(cells[order],
+                                               np.arange(cellCount + 1)))
+
+
+  def isCurrent(self, objectRepresentations):
+    """
+    @return (bool)
+    True if this index was built from these representations and no objects
+    were added since.
+    """
+    return (objectRepresentations is self.objectRepresentations and
+            len(objectRepresentations) == len(self.objectNames))
+
+
+  def computeOverlaps(self, activeCellsByColumn):
+    """
+    @param activeCellsByColumn (list)
+    The active cells of each column
+
+    @return (numpy array)
+    A numColumns x numObjects array of overlaps
+    """
+    overlaps = np.zeros((self.numColumns, len(self.objectNames)),
+                        dtype="uint32")
+
+    for col, activeCells in enumerate(activeCellsByColumn):
+      activeCells = np.fromiter(activeCells, dtype="int64",
+                                count=len(activeCells))
+      offsets = self._cellOffsets[col]
+      starts = offsets[activeCells]
+      lengths = offsets[activeCells + 1] - starts
+
+      # Gather the object lists of all active cells.
+      total = lengths.sum()
+      entries = (np.repeat(starts - np.cumsum(lengths) + lengths, lengths) +
+                 np.arange(total))
+      overlaps[col, :] = np.bincount(self._objectsByCell[col][entries],
+                                     minlength=len(self.objectNames))
+
+    return overlaps
+
+
+  def computeScores(self, activeCellsByColumn, minOverlap):
+    """
+    Score every object by the fraction of columns that have input and whose
+    overlap with the object is at least minOverlap.
+
+    @return (numpy array or None)
+    The score of each object, or None if no column has input
+    """
+    overlaps = self.computeOverlaps(activeCellsByColumn)
+    activeColumns = np.array([len(activeCells) > 0
+                              for activeCells in activeCellsByColumn])
+    count = np.count_nonzero(activeColumns)
+    if count == 0:
+      return None
+
+    matches = (overlaps[activeColumns] >= minOverlap).sum(axis=0)
+    return matches / float(count)
+
+
+  def classify(self, activeCellsByColumn, minOverlap, maxSize):
+    """
+    An object is classified if every column has overlap of at least minOverlap
+    with it and a representation of no more than maxSize cells.
+
+    @return (numpy array)
+    A boolean for each object
+    """
+    overlaps = self.computeOverlaps(activeCellsByColumn)
+    sizesOk = all(len(activeCells) <= maxSize
+                  for activeCells in activeCellsByColumn)
+    if not sizesOk:
+      return np.zeros(len(self.objectNames), dtype="bool")
+
+    return (overlaps >= minOverlap).all(axis=0)
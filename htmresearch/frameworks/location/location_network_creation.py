@@ -32,6 +32,7 @@ from nupic.engine import Network
 from htmresearch.frameworks.location.path_integration_union_narrowing import (
   computeRatModuleParametersFromReadoutResolution,
   computeRatModuleParametersFromCellCount)
+from htmresearch.support import snapshots
 from htmresearch.support.logging_decorator import LoggingDecorator
 
 
@@ -554,6 +555,95 @@ class L246aNetwork(object):
       # update L2 representations for the object
       self.learnedObjects[objectName] = self.getL2Representations()
 
+  def saveSnapshot(self, directory):
+    """
+    Save the learned synapses of every region and the learned object
+    representations, so that another L246aNetwork created with the same
+    parameters can restore them with :meth:`loadSnapshot` instead of
+    relearning the objects.
+
+    :param directory: Directory for the snapshot files
+    :type directory: str
+    """
+    arrays = {}
+    for col in xrange(self.numColumns):
+      prefix = "C{}.".format(col)
+
+      pooler = self.L2Regions[col].getSelf()._pooler
+      arrays.update(snapshots.sparseMatrixToArrays(
+        prefix + "L2.proximal", pooler.proximalPermanences))
+      arrays.update(snapshots.sparseMatrixToArrays(
+        prefix + "L2.internalDistal", pooler.internalDistalPermanences))
+      for i, permanences in enumerate(pooler.distalPermanences):
+        arrays.update(snapshots.sparseMatrixToArrays(
+          prefix + "L2.distal.{}".format(i), permanences))
+
+      tm = self.L4Regions[col].getSelf()._tm
+      arrays.update(snapshots.connectionsToArrays(
+        prefix + "L4.basal", tm.basalConnections))
+      arrays.update(snapshots.connectionsToArrays(
+        prefix + "L4.apical", tm.apicalConnections))
+
+      L6a = self.L6aRegions[col].getSelf()
+      for i, module in enumerate(L6a.getModules()):
+        arrays.update(snapshots.connectionsToArrays(
+          prefix + "L6a.{}".format(i), module.connections))
+      if L6a._projection is not None:
+        arrays[prefix + "L6a.projection"] = np.array(L6a._projection)
+
+    objectNames = sorted(self.learnedObjects.keys())
+    arrays.update(snapshots.raggedToArrays(
+      "learnedObjects", [sorted(self.learnedObjects[objectName][col])
+                         for objectName in objectNames
+                         for col in xrange(self.numColumns)]))
+
+    snapshots.saveSnapshot(directory, arrays, {"objectNames": objectNames})
+
+  @LoggingDecorator()
+  def loadSnapshot(self, directory, mmap=True):
+    """
+    Restore a snapshot saved by :meth:`saveSnapshot`. This network must have
+    been created with the same parameters and must not have learned anything
+    yet.
+
+    :param directory: Directory holding the snapshot files
+    :type directory: str
+    :param mmap: Memory-map the snapshot files instead of reading them
+    :type mmap: bool
+    """
+    arrays, state = snapshots.loadSnapshot(directory, mmap)
+
+    for col in xrange(self.numColumns):
+      prefix = "C{}.".format(col)
+
+      pooler = self.L2Regions[col].getSelf()._pooler
+      snapshots.restoreSparseMatrix(
+        prefix + "L2.proximal", pooler.proximalPermanences, arrays)
+      snapshots.restoreSparseMatrix(
+        prefix + "L2.internalDistal", pooler.internalDistalPermanences, arrays)
+      for i, permanences in enumerate(pooler.distalPermanences):
+        snapshots.restoreSparseMatrix(
+          prefix + "L2.distal.{}".format(i), permanences, arrays)
+
+      tm = self.L4Regions[col].getSelf()._tm
+      snapshots.restoreConnections(
+        prefix + "L4.basal", tm.basalConnections, arrays)
+      snapshots.restoreConnections(
+        prefix + "L4.apical", tm.apicalConnections, arrays)
+
+      L6a = self.L6aRegions[col].getSelf()
+      for i, module in enumerate(L6a.getModules()):
+        snapshots.restoreConnections(
+          prefix + "L6a.{}".format(i), module.connections, arrays)
+      if prefix + "L6a.projection" in arrays:
+        L6a._projection = list(np.array(arrays[prefix + "L6a.projection"]))
+
+    representations = iter(snapshots.arraysToRagged("learnedObjects", arrays))
+    self.learnedObjects = dict(
+      (objectName, [set(next(representations))
+                    for _ in xrange(self.numColumns)])
+      for objectName in state["objectNames"])
+
   def infer(self, sensations, stats=None, objname=None):
     """
     Attempt to recognize the object given a list of sensations.
@@ -34,7 +34,9 @@ import numpy as np
 from htmresearch.algorithms.apical_tiebreak_temporal_memory import (
   ApicalTiebreakPairMemory)
 from htmresearch.algorithms.location_modules import (
-  Superficial2DLocationModule, ThresholdedGaussian2DLocationModule)
+  FusedThresholdedGaussian2DLocationModules, Superficial2DLocationModule,
+  ThresholdedGaussian2DLocationModule)
+from htmresearch.support import snapshots
 
 
 RAT_BUMP_SIGMA = 0.18172
@@ -149,13 +151,19 @@ class PIUNCorticalColumn(object):
   arrives, call sensoryCompute.
   """
 
-  def __init__(self, locationConfigs, L4Overrides=None, bumpType="gaussian"):
+  def __init__(self, locationConfigs, L4Overrides=None, bumpType="gaussian",
+               fuseModules=False):
     """
     @param L4Overrides (dict)
     Custom parameters for L4
 
     @param locationConfigs (sequence of dicts)
     Parameters for the location modules
+
+    @param fuseModules (bool)
+    If True, run the gaussian location modules as one
+    FusedThresholdedGaussian2DLocationModules. L6aModules then contains that
+    single fused module rather than one object per module.
     """
     self.bumpType = bumpType
 
@@ -181,6 +189,14 @@ class PIUNCorticalColumn(object):
     else:
       raise ValueError("Invalid bumpType", bumpType)
 
+    if fuseModules:
+      if bumpType == "square":
+        raise ValueError("Only gaussian modules can be fused")
+      self.L6aModules = [
+        FusedThresholdedGaussian2DLocationModules.fromModules(
+          self.L6aModules, anchorInputSize=L4cellCount,
+          connectionsClass=type(self.L6aModules[0].connections))]
+
     L4Params = {
       "columnCount": 150,
       "cellsPerColumn": 16,
@@ -630,6 +646,91 @@ class PIUNExperiment(object):
         break
 
 
+  def saveSnapshot(self, directory):
+    """
+    Save everything this experiment has learned: the synapses of L4 and of the
+    location modules, the feature SDRs, and the learned objects and their
+    representations. Use loadSnapshot to restore it.
+
+    @param directory (str)
+    """
+    arrays = {}
+    arrays.update(snapshots.connectionsToArrays(
+      "L4.basal", self.column.L4.basalConnections))
+    arrays.update(snapshots.connectionsToArrays(
+      "L4.apical", self.column.L4.apicalConnections))
+    for i, module in enumerate(self.column.L6aModules):
+      arrays.update(snapshots.connectionsToArrays(
+        "L6a.{}".format(i), module.connections))
+
+    featureNames = sorted(self.features.keys())
+    arrays.update(snapshots.raggedToArrays(
+      "features", [self.features[k] for k in featureNames]))
+
+    locationKeys = sorted(self.locationRepresentations.keys())
+    arrays.update(snapshots.raggedToArrays(
+      "locationRepresentations",
+      [representation
+       for k in locationKeys
+       for representation in self.locationRepresentations[k]]))
+
+    inputKeys = sorted(self.inputRepresentations.keys())
+    arrays.update(snapshots.raggedToArrays(
+      "inputRepresentations", [self.inputRepresentations[k]
+                               for k in inputKeys]))
+
+    state = {
+      "featureNames": featureNames,
+      "locationKeys": [(k, len(self.locationRepresentations[k]))
+                       for k in locationKeys],
+      "inputKeys": inputKeys,
+      "learnedObjects": self.learnedObjects,
+    }
+
+    snapshots.saveSnapshot(directory, arrays, state)
+
+
+  def loadSnapshot(self, directory, mmap=True):
+    """
+    Restore a snapshot saved by saveSnapshot. This experiment's column must
+    have been created with the same parameters, and must not have learned
+    anything yet.
+
+    @param mmap (bool)
+    If True, the feature SDRs and representations are read-only views of the
+    memory-mapped snapshot files.
+    """
+    arrays, state = snapshots.loadSnapshot(directory, mmap)
+
+    snapshots.restoreConnections(
+      "L4.basal", self.column.L4.basalConnections, arrays)
+    snapshots.restoreConnections(
+      "L4.apical", self.column.L4.apicalConnections, arrays)
+    for i, module in enumerate(self.column.L6aModules):
+      snapshots.restoreConnections(
+        "L6a.{}".format(i), module.connections, arrays)
+
+    self.features = dict(zip(state["featureNames"],
+                             snapshots.arraysToRagged("features", arrays)))
+
+    locationRepresentations = iter(
+      snapshots.arraysToRagged("locationRepresentations", arrays))
+    self.locationRepresentations = defaultdict(list)
+    for k, count in state["locationKeys"]:
+      self.locationRepresentations[k] = [next(locationRepresentations)
+                                         for _ in xrange(count)]
+
+    self.inputRepresentations = dict(zip(
+      state["inputKeys"],
+      snapshots.arraysToRagged("inputRepresentations", arrays)))
+
+    self.learnedObjects = state["learnedObjects"]
+    self.representationSet = set(
+      tuple(representation)
+      for representations in self.locationRepresentations.itervalues()
+      for representation in representations)
+
+
   def addMonitor(self, monitor):
     """
     Subscribe to PIUNExperimentMonitor events.
@@ -151,6 +151,7 @@ class CIFARExperiment(PyExperimentSuite):
     self.linear_sparsity = params.get("linear_sparsity", 0.0)
     self.linear_weight_sparsity = params.get("linear_weight_sparsity", 0.3)
     self.linear_n = params.get("linear_n", 500)
+    self.weight_execution = params.get("weight_execution", "dense")
     self.avg_pool_size = params.get("avg_pool_size", 2)
     self.dense_c1_out_planes = params.get("dense_c1_out_planes", 4*self.growth_rate)
 
@@ -299,6 +300,7 @@ class CIFARExperiment(PyExperimentSuite):
         linear_n=self.linear_n,
         avg_pool_size=self.avg_pool_size,
         k_inference_factor=self.k_inference_factor,
+        weight_execution=self.weight_execution,
       )
 
 
@@ -20,3 +20,4 @@
 # ----------------------------------------------------------------------
 
 from .k_winners import *
+from .sparse_matmul import *
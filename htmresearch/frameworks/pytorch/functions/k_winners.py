@@ -93,20 +93,23 @@ class k_winners(torch.autograd.Function):
     :return: 
       A tensor representing the activity of x after k-winner take all.
     """
+    x = x.detach()
     if boostStrength > 0.0:
       targetDensity = float(k) / x.size(1)
       boostFactors = torch.exp((targetDensity - dutyCycles) * boostStrength)
-      boosted = x.detach() * boostFactors
+
+      # Compute the boosted values in the tensor that will hold the output, so
+      # boosting doesn't allocate a separate temporary.
+      res = torch.mul(x, boostFactors)
+      topk, indices = res.topk(k, dim=1, sorted=False)
+      res.zero_()
     else:
-      boosted = x.detach()
+      topk, indices = x.topk(k, dim=1, sorted=False)
+      res = torch.zeros_like(x)
 
-    # Take the boosted version of the input x, find the top k winners.
     # Compute an output that contains the values of x corresponding to the top k
     # boosted values
-    res = torch.zeros_like(x)
-    topk, indices = boosted.topk(k, sorted=False)
-    for i in range(x.shape[0]):
-      res[i, indices[i]] = x[i, indices[i]]
+    res.scatter_(1, indices, x.gather(1, indices))
 
     ctx.save_for_backward(indices)
     return res
@@ -119,12 +122,8 @@ class k_winners(torch.autograd.Function):
     for the others.
     """
     indices, = ctx.saved_tensors
-    grad_x = torch.zeros_like(grad_output, requires_grad=True)
-
-    # Probably a better way to do it, but this is not terrible as it only loops
-    # over the batch size.
-    for i in range(grad_output.size(0)):
-      grad_x[i, indices[i]] = grad_output[i, indices[i]]
+    grad_x = torch.zeros_like(grad_output, requires_grad=False)
+    grad_x.scatter_(1, indices, grad_output.gather(1, indices))
 
     return grad_x, None, None, None
 
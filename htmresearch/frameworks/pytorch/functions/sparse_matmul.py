@@ -0,0 +1,97 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+from __future__ import print_function
+
+import torch
+
+# Upper bound on the number of elements in the temporary tensors used to
+# compute the gradient of the nonzero weights
+MAX_TEMPORARY_ELEMENTS = 2 ** 24
+
+
+
+class sparse_matmul(torch.autograd.Function):
+  """
+  Multiply a sparse weight matrix by a dense matrix, computing gradients for
+  the nonzero weights only.
+
+  The weight matrix is described by its nonzero values and their (row, column)
+  indices, so the dense weight matrix is never materialized, neither in the
+  forward nor in the backward pass.
+  """
+
+
+  @staticmethod
+  def forward(ctx, values, indices, shape, dense):
+    """
+    :param ctx:
+      Place where we can store information we will need to compute the gradients
+      for the backward pass.
+
+    :param values:
+      1D tensor with the nonzero weights
+
+    :param indices:
+      (2, numNonZeros) long tensor with the row and column of each weight
+
+    :param shape:
+      (rows, columns) of the weight matrix
+
+    :param dense:
+      (columns, n) dense matrix
+
+    :return: (rows, n) dense matrix
+    """
+    weight = torch.sparse_coo_tensor(indices, values, shape)
+    ctx.save_for_backward(values, indices, dense)
+    ctx.shape = shape
+    return torch.sparse.mm(weight, dense)
+
+
+  @staticmethod
+  def backward(ctx, grad_output):
+    """
+    The gradient of the dense matrix is the transposed sparse matrix times the
+    output gradient. The gradient of each nonzero weight is the dot product of
+    its row of the output gradient and its column of the dense matrix, computed
+    in chunks to bound the memory used.
+    """
+    values, indices, dense = ctx.saved_tensors
+    grad_values = grad_dense = None
+
+    if ctx.needs_input_grad[3]:
+      rows, columns = ctx.shape
+      weightT = torch.sparse_coo_tensor(indices[[1, 0]], values,
+                                        (columns, rows))
+      grad_dense = torch.sparse.mm(weightT, grad_output)
+
+    if ctx.needs_input_grad[0]:
+      grad_values = torch.zeros_like(values)
+      n = dense.shape[1]
+      chunkSize = max(1, MAX_TEMPORARY_ELEMENTS // max(1, values.numel()))
+      for start in range(0, n, chunkSize):
+        end = min(n, start + chunkSize)
+        grad_values += (grad_output[indices[0], start:end] *
+                        dense[indices[1], start:end]).sum(1)
+
+    return grad_values, None, None, grad_dense
@@ -136,7 +136,8 @@ class NotSoDenseNet(nn.Module):
                linear_n=500,
                avg_pool_size=4,
                k_inference_factor=1.5,
-               image_width=32):
+               image_width=32,
+               weight_execution="dense"):
     super(NotSoDenseNet, self).__init__()
     self.growth_rate = growth_rate
     self.iteration = 0
@@ -216,7 +217,8 @@ class NotSoDenseNet(nn.Module):
 
     if self.linear_sparsity > 0:
       self.linear1 = SparseWeights(nn.Linear(bn_outputs, linear_n),
-                                   weightSparsity=linear_weight_sparsity)
+                                   weightSparsity=linear_weight_sparsity,
+                                   execution=weight_execution)
       k = int(linear_n*linear_sparsity)
       self.linear1KWinners = KWinners(
         n=linear_n, k=k, kInferenceFactor=k_inference_factor,
@@ -304,11 +306,10 @@ class NotSoDenseNet(nn.Module):
     return out
 
 
-  def forward(self, x):
-    self.iteration += 1
-    if self.iteration == 1:
-      return self.forwardWithTable(x)
-
+  def features(self, x):
+    """
+    Flattened output of the convolutional layers, the input of the linear layers
+    """
     out = self.conv1(x)
     if self.conv1Sparsity < 0.5:
       out = self.conv1kwinners(out)
@@ -318,7 +319,15 @@ class NotSoDenseNet(nn.Module):
     out = self.trans3(self.dense3(out))
     out = self.dense4(out)
     out = F.avg_pool2d(F.relu(self.bn(out)), self.avg_pool_size)
-    out = out.view(out.size(0), -1)
+    return out.view(out.size(0), -1)
+
+
+  def forward(self, x):
+    self.iteration += 1
+    if self.iteration == 1:
+      return self.forwardWithTable(x)
+
+    out = self.features(x)
     if self.linear_sparsity > 0:
       out = self.linear1KWinners(self.linear1(out))
 
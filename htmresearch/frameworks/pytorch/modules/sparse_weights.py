@@ -24,7 +24,13 @@ import math
 import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
+from htmresearch.frameworks.pytorch.functions import sparse_matmul
+
+# Weight density below which "auto" execution uses the sparse kernels. Above
+# it, the dense BLAS kernels are faster on CPU than the sparse ones.
+SPARSE_EXECUTION_DENSITY = 0.1
 
 
 def rezeroWeights(m):
@@ -37,7 +43,7 @@ def rezeroWeights(m):
   :param m: SparseWeightsBase module
   """
   if isinstance(m, SparseWeightsBase):
-    if m.training:
+    if m.training and not m.sparseExecution:
       m.rezeroWeights()
 
 
@@ -50,12 +56,15 @@ def normalizeSparseWeights(m):
   to the input size
   """
   if isinstance(m, SparseWeightsBase):
-    _, inputSize = m.module.weight.shape
+    inputSize = int(np.prod(m.denseWeightShape[1:]))
     fan = int(inputSize * m.weightSparsity)
     gain = nn.init.calculate_gain('leaky_relu', math.sqrt(5))
     std = gain / np.math.sqrt(fan)
     bound = math.sqrt(3.0) * std  # Calculate uniform bounds from standard deviation
-    nn.init.uniform_(m.module.weight, -bound, bound)
+    if m.sparseExecution:
+      nn.init.uniform_(m.sparseWeights, -bound, bound)
+    else:
+      nn.init.uniform_(m.module.weight, -bound, bound)
     if m.module.bias is not None:
       bound = 1 / math.sqrt(fan)
       nn.init.uniform_(m.module.bias, -bound, bound)
@@ -69,28 +78,117 @@ class SparseWeightsBase(nn.Module):
   __metaclass__ = abc.ABCMeta
 
 
-  def __init__(self, module, weightSparsity):
+  def __init__(self, module, weightSparsity, execution="dense"):
     """
     :param module:
       The module to sparsify the weights
     :param weightSparsity:
       Pct of weights that are allowed to be non-zero in the layer.
+    :param execution:
+      "dense" keeps the full weight matrix and zeroes the selected weights on
+      every training forward pass. "sparse" stores only the non-zero weights
+      and runs forward and backward with sparse kernels. "auto" measures the
+      weight density and uses "sparse" when it is below
+      SPARSE_EXECUTION_DENSITY.
     """
     super(SparseWeightsBase, self).__init__()
     assert 0 < weightSparsity < 1
+    assert execution in ("dense", "sparse", "auto")
 
     self.module = module
     self.weightSparsity = weightSparsity
+    self.denseWeightShape = tuple(module.weight.shape)
+    self.sparseExecution = False
     self.register_buffer("zeroWts", self.computeIndices())
     self.rezeroWeights()
 
+    if execution == "auto":
+      execution = ("sparse"
+                   if self.weightDensity() < SPARSE_EXECUTION_DENSITY
+                   else "dense")
+    if execution == "sparse":
+      self.toSparse()
+
+
+  def __setstate__(self, state):
+    super(SparseWeightsBase, self).__setstate__(state)
+    # Modules saved before sparse execution only have the dense weights
+    if "sparseExecution" not in self.__dict__:
+      self.sparseExecution = False
+      self.denseWeightShape = tuple(self.module.weight.shape)
+
 
   def forward(self, x):
+    if self.sparseExecution:
+      return self.sparseForward(x)
     if self.training:
       self.rezeroWeights()
     return self.module.forward(x)
 
 
+  def weightDensity(self):
+    """
+    :return: Fraction of the weights that are non-zero
+    """
+    if self.sparseExecution:
+      values = self.sparseWeights.data
+      total = np.prod(self.denseWeightShape)
+    else:
+      values = self.module.weight.data
+      total = values.numel()
+    return float((values != 0).sum().item()) / total
+
+
+  def toSparse(self):
+    """
+    Replace the dense weight matrix of the module with the weights that are
+    allowed to be non-zero. The optimizer must be created after calling this
+    method, since the weight parameters change.
+    """
+    if self.sparseExecution:
+      return
+
+    weight = self.module.weight.data.view(self.denseWeightShape[0], -1)
+    mask = torch.ones_like(weight, dtype=torch.uint8)
+    mask[self.zeroWts[0], self.zeroWts[1]] = 0
+    indices = mask.nonzero().t().contiguous()
+
+    self.register_buffer("sparseIndices", indices)
+    self.sparseWeights = nn.Parameter(weight[indices[0], indices[1]].clone())
+    del self.module.weight
+    self.module.register_parameter("weight", None)
+    self.sparseExecution = True
+
+
+  def toDense(self):
+    """
+    Restore the dense weight matrix of the module. See :meth:`toSparse`
+    """
+    if not self.sparseExecution:
+      return
+
+    values = self.sparseWeights.data
+    weight = values.new_zeros(self.denseWeightShape[0],
+                              int(np.prod(self.denseWeightShape[1:])))
+    weight[self.sparseIndices[0], self.sparseIndices[1]] = values
+
+    del self.module.weight
+    self.module.weight = nn.Parameter(weight.view(self.denseWeightShape))
+    del self.sparseWeights
+    del self.sparseIndices
+    self.sparseExecution = False
+
+
+  def sparseMatmul(self, dense):
+    """
+    Multiply the sparse weight matrix, viewed as (outputs, inputs), by a dense
+    (inputs, n) matrix.
+    """
+    shape = (self.denseWeightShape[0], int(np.prod(self.denseWeightShape[1:])))
+    return sparse_matmul.apply(self.sparseWeights, self.sparseIndices, shape,
+                               dense)
+
+
   @abc.abstractmethod
   def computeIndices(self):
     """
@@ -108,9 +206,18 @@ class SparseWeightsBase(nn.Module):
     raise NotImplementedError
 
 
+  @abc.abstractmethod
+  def sparseForward(self, x):
+    """
+    Compute the output of the module from the sparse weights. See
+    :meth:`toSparse`
+    """
+    raise NotImplementedError
+
+
 
 class SparseWeights(SparseWeightsBase):
-  def __init__(self, module, weightSparsity):
+  def __init__(self, module, weightSparsity, execution="dense"):
     """
     Enforce weight sparsity on linear module during training.
 
@@ -123,8 +230,10 @@ class SparseWeights(SparseWeightsBase):
       The module to sparsify the weights
     :param weightSparsity:
       Pct of weights that are allowed to be non-zero in the layer.
+    :param execution:
+      "dense", "sparse" or "auto". See :class:`SparseWeightsBase`
     """
-    super(SparseWeights, self).__init__(module, weightSparsity)
+    super(SparseWeights, self).__init__(module, weightSparsity, execution)
 
 
   def computeIndices(self):
@@ -149,9 +258,17 @@ class SparseWeights(SparseWeightsBase):
     self.module.weight.data[zeroIdx] = 0.0
 
 
+  def sparseForward(self, x):
+    inputSize = self.denseWeightShape[1]
+    out = self.sparseMatmul(x.reshape(-1, inputSize).t()).t()
+    if self.module.bias is not None:
+      out = out + self.module.bias
+    return out.reshape(x.shape[:-1] + (self.denseWeightShape[0],))
+
+
 
 class SparseWeights2d(SparseWeightsBase):
-  def __init__(self, module, weightSparsity):
+  def __init__(self, module, weightSparsity, execution="dense"):
     """
     Enforce weight sparsity on CNN modules
     Sample usage:
@@ -163,8 +280,14 @@ class SparseWeights2d(SparseWeightsBase):
       The module to sparsify the weights
     :param weightSparsity:
       Pct of weights that are allowed to be non-zero in the layer.
+    :param execution:
+      "dense", "sparse" or "auto". Sparse execution unfolds the input patches
+      and doesn't support grouped convolutions.
+      See :class:`SparseWeightsBase`
     """
-    super(SparseWeights2d, self).__init__(module, weightSparsity)
+    if execution != "dense":
+      assert module.groups == 1
+    super(SparseWeights2d, self).__init__(module, weightSparsity, execution)
 
 
   def computeIndices(self):
@@ -192,3 +315,24 @@ class SparseWeights2d(SparseWeightsBase):
   def rezeroWeights(self):
     zeroIdx = (self.zeroWts[0], self.zeroWts[1])
     self.module.weight.data.view(self.module.out_channels, -1)[zeroIdx] = 0.0
+
+
+  def sparseForward(self, x):
+    m = self.module
+    batchSize, _, height, width = x.shape
+    outHeight = (height + 2 * m.padding[0]
+                 - m.dilation[0] * (m.kernel_size[0] - 1) - 1) // m.stride[0] + 1
+    outWidth = (width + 2 * m.padding[1]
+                - m.dilation[1] * (m.kernel_size[1] - 1) - 1) // m.stride[1] + 1
+
+    # (batch, inputs, positions) -> (inputs, batch * positions)
+    patches = F.unfold(x, m.kernel_size, dilation=m.dilation, padding=m.padding,
+                       stride=m.stride)
+    numInputs, positions = patches.shape[1:]
+    patches = patches.transpose(0, 1).reshape(numInputs, -1)
+
+    out = self.sparseMatmul(patches).view(m.out_channels, batchSize, positions)
+    out = out.transpose(0, 1)
+    if m.bias is not None:
+      out = out + m.bias.view(1, -1, 1)
+    return out.reshape(batchSize, m.out_channels, outHeight, outWidth)
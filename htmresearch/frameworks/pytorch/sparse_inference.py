@@ -0,0 +1,343 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+Inference-only execution of trained sparse networks.
+
+After a KWinners layer only k units are active, so the following linear layer
+only needs the k columns of its weight matrix corresponding to the winners.
+:func:`freezeSparseNet` and :func:`freezeNotSoDenseNet` convert trained models
+into a :class:`FrozenSparseNet` where each KWinners layer passes the (indices,
+values) of its winners to the next linear layer, which computes its output
+with a gather-matmul. Frozen models can be traced and saved for CPU serving
+with :func:`saveFrozenModel`.
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import copy
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from htmresearch.frameworks.pytorch.modules import (
+  Flatten, KWinnersBase, SparseWeightsBase
+)
+
+
+
+class KWinnersInference(nn.Module):
+  """
+  Inference-only version of :class:`KWinners` and :class:`KWinners2d`. The
+  duty cycles are frozen, so the boost factors are computed once.
+  """
+
+
+  def __init__(self, kwinners, sparseOutput):
+    """
+    :param kwinners:
+      Trained KWinners or KWinners2d module
+    :param sparseOutput:
+      If True, return the (indices, values) of the winners in the flattened
+      input. Otherwise return the same dense output as the original module.
+    """
+    super(KWinnersInference, self).__init__()
+    n = kwinners.n
+    self.k = min(int(round(kwinners.k * kwinners.kInferenceFactor)), n)
+    self.sparseOutput = sparseOutput
+
+    if kwinners.boostStrength > 0.0:
+      targetDensity = float(self.k) / n
+      boostFactors = torch.exp((targetDensity - kwinners.dutyCycle) *
+                               kwinners.boostStrength)
+      # KWinners2d duty cycles are per channel, shared by the channel's units
+      boostFactors = boostFactors.reshape(-1, 1)
+      boostFactors = boostFactors.expand(-1, n // boostFactors.shape[0])
+      self.register_buffer("boostFactors", boostFactors.reshape(-1).clone())
+    else:
+      self.boostFactors = None
+
+
+  def forward(self, x):
+    flat = x.reshape(x.shape[0], -1)
+    if self.boostFactors is not None:
+      boosted = flat * self.boostFactors
+    else:
+      boosted = flat
+    _, indices = boosted.topk(self.k, dim=1, sorted=False)
+    values = flat.gather(1, indices)
+
+    if self.sparseOutput:
+      return indices, values
+
+    return torch.zeros_like(flat).scatter_(1, indices, values).reshape(x.shape)
+
+
+
+class FrozenLinear(nn.Module):
+  """
+  Linear layer with constant weights, used on dense inputs.
+  """
+
+
+  def __init__(self, weight, bias):
+    super(FrozenLinear, self).__init__()
+    self.register_buffer("weight", weight)
+    self.register_buffer("bias", bias)
+
+
+  def forward(self, x):
+    return F.linear(x, self.weight, self.bias)
+
+
+
+class SparseInputLinear(nn.Module):
+  """
+  Linear layer whose input is given as the (indices, values) of its k
+  non-zero units. Only the k corresponding weight columns are used, so the
+  cost is proportional to k instead of the input size.
+  """
+
+
+  def __init__(self, weight, bias):
+    super(SparseInputLinear, self).__init__()
+    # Transposed so the columns for each input unit are contiguous rows
+    self.register_buffer("weightT", weight.t().contiguous())
+    self.register_buffer("bias", bias)
+
+
+  def forward(self, x):
+    indices, values = x
+    out = torch.bmm(values.unsqueeze(1), self.weightT[indices]).squeeze(1)
+    return out + self.bias
+
+
+
+class FrozenSparseNet(nn.Module):
+  """
+  Sequence of inference modules. See :func:`freezeLayers`
+  """
+
+
+  def __init__(self, layers):
+    super(FrozenSparseNet, self).__init__()
+    self.layers = nn.ModuleList(layers)
+
+
+  def forward(self, x):
+    for layer in self.layers:
+      x = layer(x)
+    return x
+
+
+
+def _linearModule(layer):
+  """
+  :return: The nn.Linear wrapped by the layer, or None
+  """
+  if isinstance(layer, SparseWeightsBase):
+    layer = layer.module
+  return layer if isinstance(layer, nn.Linear) else None
+
+
+
+def _feedsLinear(layers):
+  """
+  :return: True if the first of the layers, ignoring Flatten, is linear
+  """
+  for layer in layers:
+    if not isinstance(layer, Flatten):
+      return _linearModule(layer) is not None
+  return False
+
+
+
+def freezeLayers(layers):
+  """
+  Convert a sequence of trained modules into inference modules. KWinners
+  layers followed by a linear layer output the (indices, values) of their
+  winners, and the linear layer becomes a :class:`SparseInputLinear`.
+  BatchNorm1d layers following a linear layer are folded into its weights.
+  Dropout layers are removed, and other modules are kept as they are.
+
+  :param layers: modules applied one after another, in eval mode
+  :return: list of inference modules
+  """
+  layers = [layer for layer in layers if not isinstance(layer, nn.Dropout)]
+
+  # Linear layers are kept as [weight, bias, sparseInput] until the following
+  # layers are known, so batch norms can be folded into them
+  stages = []
+  sparseInput = False
+  for i, layer in enumerate(layers):
+    linear = _linearModule(layer)
+    if linear is not None:
+      weight = linear.weight.detach().clone()
+      if linear.bias is not None:
+        bias = linear.bias.detach().clone()
+      else:
+        bias = weight.new_zeros(weight.shape[0])
+      stages.append([weight, bias, sparseInput])
+      sparseInput = False
+
+    elif (isinstance(layer, nn.BatchNorm1d) and stages and
+          isinstance(stages[-1], list)):
+      weight, bias, _ = stages[-1]
+      scale = torch.rsqrt(layer.running_var + layer.eps)
+      shift = -layer.running_mean * scale
+      if layer.affine:
+        scale = scale * layer.weight.detach()
+        shift = shift * layer.weight.detach() + layer.bias.detach()
+      stages[-1][0] = weight * scale.unsqueeze(1)
+      stages[-1][1] = bias * scale + shift
+
+    elif isinstance(layer, KWinnersBase):
+      if layer.k < layer.n:
+        sparseInput = _feedsLinear(layers[i + 1:])
+        stages.append(KWinnersInference(layer, sparseOutput=sparseInput))
+      else:
+        stages.append(nn.ReLU())
+
+    elif isinstance(layer, Flatten) and sparseInput:
+      # The winner indices already refer to the flattened input
+      continue
+
+    else:
+      stages.append(layer)
+
+  frozen = []
+  for stage in stages:
+    if isinstance(stage, list):
+      weight, bias, sparseInput = stage
+      if sparseInput:
+        frozen.append(SparseInputLinear(weight, bias))
+      else:
+        frozen.append(FrozenLinear(weight, bias))
+    else:
+      frozen.append(stage)
+
+  return frozen
+
+
+
+def _prepareForInference(model):
+  """
+  :return: An eval mode copy of the model with dense SparseWeights modules
+  """
+  model = copy.deepcopy(model)
+  model.eval()
+  for module in model.modules():
+    if isinstance(module, SparseWeightsBase):
+      module.toDense()
+
+  return model
+
+
+
+def _replaceKWinners(module):
+  """
+  Recursively replace KWinners modules by their dense inference version
+  """
+  for name, child in module.named_children():
+    if isinstance(child, KWinnersBase):
+      if child.k < child.n:
+        setattr(module, name, KWinnersInference(child, sparseOutput=False))
+      else:
+        setattr(module, name, nn.ReLU())
+    else:
+      _replaceKWinners(child)
+
+
+
+def freezeSparseNet(model):
+  """
+  :param model: trained :class:`SparseNet`
+  :return: :class:`FrozenSparseNet` computing the same inference output
+  """
+  model = _prepareForInference(model)
+
+  layers = []
+  if model.cnnSdr is not None:
+    layers.extend(model.cnnSdr.children())
+  layers.append(model.flatten)
+  layers.extend(model.linearSdr.children())
+  layers.append(model.fc)
+  if model.softmax is not None:
+    layers.append(model.softmax)
+
+  return FrozenSparseNet(freezeLayers(layers))
+
+
+
+class _NotSoDenseNetFeatures(nn.Module):
+  def __init__(self, model):
+    super(_NotSoDenseNetFeatures, self).__init__()
+    self.model = model
+
+
+  def forward(self, x):
+    return self.model.features(x)
+
+
+
+def freezeNotSoDenseNet(model):
+  """
+  The convolutional blocks run densely, with frozen KWinners2d layers. The
+  linear layers on top of them use the sparse path.
+
+  :param model: trained :class:`NotSoDenseNet`
+  :return: :class:`FrozenSparseNet` computing the same inference output
+  """
+  model = _prepareForInference(model)
+
+  if model.linear1KWinners is not None:
+    tail = [model.linear1, model.linear1KWinners, model.linearOut]
+  else:
+    tail = [model.linearOut]
+  for name in ("linear1", "linear1KWinners", "linearOut"):
+    if hasattr(model, name):
+      delattr(model, name)
+  _replaceKWinners(model)
+
+  return FrozenSparseNet([_NotSoDenseNetFeatures(model)] + freezeLayers(tail))
+
+
+
+def saveFrozenModel(model, exampleInput, path):
+  """
+  Trace a frozen model and save it, so it can be served without Python
+  model code. See :func:`loadFrozenModel`
+
+  :param model: :class:`FrozenSparseNet`
+  :param exampleInput: batch with the shape of the model inputs
+  :param path: file name
+  """
+  with torch.no_grad():
+    traced = torch.jit.trace(model, exampleInput)
+  traced.save(path)
+
+
+
+def loadFrozenModel(path):
+  """
+  :return: The traced model saved by :func:`saveFrozenModel`, on CPU
+  """
+  return torch.jit.load(path, map_location="cpu")
@@ -51,7 +51,8 @@ class SparseNet(nn.Module):
                normalizeWeights=False,
                useSoftmax=True,
                padding=0,
-               maxPoolKernel=2):
+               maxPoolKernel=2,
+               weightExecution="dense"):
     """
     A network with one or more hidden layers, which can be a sequence of
     k-sparse CNN followed by a sequence of k-sparse linear layer with optional
@@ -152,6 +153,11 @@ class SparseNet(nn.Module):
     :param maxPoolKernel:
       The size of the window to take a max over
     :type maxPoolKernel: int
+
+    :param weightExecution:
+      Execution of the layers with weight sparsity: "dense", "sparse" or
+      "auto". See :class:`SparseWeightsBase`
+    :type weightExecution: str
     """
     super(SparseNet, self).__init__()
 
@@ -223,7 +229,8 @@ class SparseNet(nn.Module):
                         stride=stride[i])
 
         if 0 < weightSparsityCNN[i] < 1:
-          sparseCNN = htm.SparseWeights2d(cnn, weightSparsityCNN[i])
+          sparseCNN = htm.SparseWeights2d(cnn, weightSparsityCNN[i],
+                                          execution=weightExecution)
           cnnSdr.add_module("cnnSdr{}_cnn".format(i + 1), sparseCNN)
         else:
           cnnSdr.add_module("cnnSdr{}_cnn".format(i + 1), cnn)
@@ -269,7 +276,8 @@ class SparseNet(nn.Module):
       if n[i] != 0:
         linear = nn.Linear(inputFeatures, n[i])
         if 0 < weightSparsity[i] < 1:
-          linear = htm.SparseWeights(linear, weightSparsity=weightSparsity[i])
+          linear = htm.SparseWeights(linear, weightSparsity=weightSparsity[i],
+                                     execution=weightExecution)
           if normalizeWeights:
             linear.apply(htm.normalizeSparseWeights)
         self.linearSdr.add_module("linearSdr{}".format(i + 1), linear)
@@ -117,7 +117,8 @@ class SparseSpeechExperiment(PyExperimentSuite):
         boostStrengthFactor=params["boost_strength_factor"],
         kInferenceFactor=params["k_inference_factor"],
         useBatchNorm=params["use_batch_norm"],
-        normalizeWeights=params.get("normalize_weights", False)
+        normalizeWeights=params.get("normalize_weights", False),
+        weightExecution=params.get("weight_execution", "dense")
       )
     elif params["model_type"] == "resnet9":
       sp_model = resnet9(num_classes=len(self.train_loader.dataset.classes),
@@ -134,7 +135,8 @@ class SparseSpeechExperiment(PyExperimentSuite):
         kInferenceFactor=params["k_inference_factor"],
         dropout=params["dropout"],
         useBatchNorm=params["use_batch_norm"],
-        normalizeWeights=params.get("normalize_weights", False)
+        normalizeWeights=params.get("normalize_weights", False),
+        weightExecution=params.get("weight_execution", "dense")
       )
     else:
       raise RuntimeError("Unknown model type")
@@ -29,9 +29,11 @@ import cPickle as pickle
 import gc
 import itertools
 import os
+import tempfile
 
 import librosa
 import numpy as np
+import torch
 from torch.utils.data import Dataset
 
 __all__ = ['CLASSES', 'SpeechCommandsDataset', 'BackgroundNoiseDataset',
@@ -157,20 +159,30 @@ class PreprocessedSpeechDataset(Dataset):
   """
   Google Speech Commands dataset preprocessed with with all transforms already
   applied. Use the 'process_dataset.py' script to create preprocessed dataset
+
+  The pickled epochs are converted once into a tensor cache: one contiguous
+  file with the input features of every epoch, memory-mapped when the dataset
+  is opened, and a small index with the targets and the offset of each epoch.
+  Switching epochs doesn't load anything, and DataLoader workers share the
+  pages of the memory map instead of each holding a copy of the data.
   """
 
-  def __init__(self, root, subset, classes=CLASSES, silence_percentage=0.1):
+  def __init__(self, root, subset, classes=CLASSES, silence_percentage=0.1,
+               use_tensor_cache=True):
     """
     :param root: Dataset root directory
     :param subset: Which dataset subset to use ("train", "test", "valid", "noise")
     :param classes: List of classes to load. See CLASSES for valid options
     :param silence_percentage: Percentage of the dataset to be filled with silence
+    :param use_tensor_cache: Read the data from the tensor cache, creating it
+                             the first time. See :meth:`createTensorCache`
     """
     self.classes = classes
 
     self._root = root
     self._subset = subset
     self._silence_percentage = silence_percentage
+    self._use_tensor_cache = use_tensor_cache
 
     self.data = None
 
@@ -178,11 +190,18 @@ class PreprocessedSpeechDataset(Dataset):
     epochs = sorted([int(e) for e in os.listdir(root) if e.isdigit()])
     self._all_epochs = itertools.cycle(epochs)
 
+    if use_tensor_cache:
+      if not os.path.exists(self._cacheIndexPath(root, subset)):
+        self.createTensorCache(root, subset, classes)
+      self._openTensorCache()
+
     # load first epoch
     self.next_epoch()
 
 
   def __len__(self):
+    if self._use_tensor_cache:
+      return self._numSamples + self._numSilence
     return len(self.data)
 
 
@@ -193,7 +212,21 @@ class PreprocessedSpeechDataset(Dataset):
     :return: (audio, target) where target is index of the target class.
     :rtype: tuple[dict, int]
     """
-    return self.data[index]
+    if not self._use_tensor_cache:
+      return self.data[index]
+
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError(index)
+
+    if index < self._numSamples:
+      row = self._start + index
+    else:
+      row = self._silenceRow
+
+    audio = {"input": torch.from_numpy(np.array(self._features[row]))}
+    return audio, int(self._targets[row])
 
 
   def next_epoch(self):
@@ -201,6 +234,20 @@ class PreprocessedSpeechDataset(Dataset):
     Load next epoch from disk
     """
     epoch = next(self._all_epochs)
+
+    if self._use_tensor_cache:
+      i = self._epochs.index(epoch)
+      self._silenceRow = int(self._silence[i])
+      self._start = int(self._offsets[i])
+      self._numSamples = int(self._offsets[i + 1]) - self._start
+      if self._silenceRow >= 0:
+        # The silence sample is stored as the last row of the epoch
+        self._numSamples -= 1
+        self._numSilence = int(self._numSamples * self._silence_percentage)
+      else:
+        self._numSilence = 0
+      return epoch
+
     folder = os.path.join(self._root, str(epoch), self._subset)
     self.data = []
     silence = None
@@ -226,20 +273,135 @@ class PreprocessedSpeechDataset(Dataset):
     return epoch
 
 
+  def targets(self):
+    """
+    :return: The target of every sample in the current epoch
+    :rtype: numpy.ndarray
+    """
+    if not self._use_tensor_cache:
+      return np.array([item[1] for item in self.data], dtype=np.int64)
+
+    targets = self._targets[self._start:self._start + self._numSamples]
+    if self._numSilence > 0:
+      silence = np.full(self._numSilence, self._targets[self._silenceRow],
+                        dtype=np.int64)
+      targets = np.concatenate((targets, silence))
+    return np.asarray(targets, dtype=np.int64)
+
+
   def make_weights_for_balanced_classes(self):
     """adopted from https://discuss.pytorch.org/t/balanced-sampling-between-classes-with-torchvision-dataloader/2703/3"""
 
     nclasses = len(self.classes)
-    count = np.ones(nclasses)
-    for item in self.data:
-      count[item[1]] += 1
+    targets = self.targets()
+    count = 1.0 + np.bincount(targets, minlength=nclasses)
 
     N = float(sum(count))
     weight_per_class = N / count
-    weight = np.zeros(len(self.data))
-    for idx, item in enumerate(self.data):
-      weight[idx] = weight_per_class[item[1]]
-    return weight
+    return weight_per_class[targets]
+
+
+  @staticmethod
+  def _cacheIndexPath(root, subset):
+    return os.path.join(root, "tensor_cache", "{}.index.npz".format(subset))
+
+
+  @staticmethod
+  def _cacheFeaturesPath(root, subset):
+    return os.path.join(root, "tensor_cache", "{}.features.f32".format(subset))
+
+
+  @staticmethod
+  def createTensorCache(root, subset, classes=CLASSES):
+    """
+    Convert the pickled epochs of a subset into the tensor cache. Each epoch
+    is loaded and appended to the features file one at a time, so the whole
+    dataset is never held in memory.
+
+    :param root: Dataset root directory
+    :param subset: Which dataset subset to convert
+    :param classes: List of classes used to compute the targets
+    """
+    featuresPath = PreprocessedSpeechDataset._cacheFeaturesPath(root, subset)
+    indexPath = PreprocessedSpeechDataset._cacheIndexPath(root, subset)
+    cacheDir = os.path.dirname(indexPath)
+    if not os.path.exists(cacheDir):
+      os.makedirs(cacheDir)
+
+    epochs = sorted([int(e) for e in os.listdir(root) if e.isdigit()])
+    offsets = [0]
+    silenceRows = []
+    targets = []
+    featureShape = None
+
+    # Write to temporary files that are only renamed once they're complete,
+    # so an interrupted conversion isn't used. Each process gets its own
+    # files, so processes creating the same cache don't corrupt each other's.
+    fd, tmpFeaturesPath = tempfile.mkstemp(dir=cacheDir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as featuresFile:
+      for epoch in epochs:
+        folder = os.path.join(root, str(epoch), subset)
+        features = []
+        silence = None
+
+        gc.disable()
+        try:
+          for filename in os.listdir(folder):
+            command = os.path.splitext(os.path.basename(filename))[0]
+            with open(os.path.join(folder, filename), "r") as pkl_file:
+              audio = pickle.load(pkl_file)
+
+            if command == "silence":
+              silence = audio
+            else:
+              features.extend(item["input"].numpy() for item in audio)
+              targets.extend([classes.index(command)] * len(audio))
+        finally:
+          gc.enable()
+
+        if silence is not None:
+          silenceRows.append(offsets[-1] + len(features))
+          features.append(silence["input"].numpy())
+          targets.append(classes.index("silence"))
+        else:
+          silenceRows.append(-1)
+
+        features = np.stack(features).astype(np.float32)
+        featureShape = features.shape[1:]
+        features.tofile(featuresFile)
+        offsets.append(offsets[-1] + len(features))
+
+    os.rename(tmpFeaturesPath, featuresPath)
+
+    # The index is renamed last: a cache with an index is complete.
+    fd, tmpIndexPath = tempfile.mkstemp(dir=cacheDir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as indexFile:
+      np.savez(indexFile,
+               epochs=np.array(epochs, dtype=np.int64),
+               offsets=np.array(offsets, dtype=np.int64),
+               silence=np.array(silenceRows, dtype=np.int64),
+               targets=np.array(targets, dtype=np.int64),
+               featureShape=np.array(featureShape, dtype=np.int64),
+               classes=np.array(classes))
+    os.rename(tmpIndexPath, indexPath)
+
+
+  def _openTensorCache(self):
+    with np.load(self._cacheIndexPath(self._root, self._subset)) as index:
+      if list(index["classes"]) != list(self.classes):
+        raise ValueError("The tensor cache of {} was created for other "
+                         "classes. Delete it to recreate it.".format(self._root))
+
+      self._epochs = list(index["epochs"])
+      self._offsets = index["offsets"]
+      self._silence = index["silence"]
+      self._targets = index["targets"]
+      featureShape = tuple(int(d) for d in index["featureShape"])
+
+    shape = (int(self._offsets[-1]),) + featureShape
+    self._features = np.memmap(self._cacheFeaturesPath(self._root,
+                                                       self._subset),
+                               dtype=np.float32, mode="r", shape=shape)
 
 
   @staticmethod
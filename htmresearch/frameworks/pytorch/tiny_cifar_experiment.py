@@ -112,7 +112,8 @@ class TinyCIFARExperiment(CIFARExperiment):
       SparseWeights2d(
         nn.Conv2d(in_channels=out_planes, out_channels=out_planes,
                   kernel_size=3, padding=1, bias=False),
-        weightSparsity=0.5
+        weightSparsity=0.5,
+        execution=self.weight_execution
       ),
       nn.BatchNorm2d(out_planes),
       nn.AvgPool2d(kernel_size=2),
@@ -26,8 +26,13 @@ import random
 
 import matplotlib.pyplot as plt
 import numpy as np
+from scipy import sparse
 
+from nupic.algorithms.spatial_pooler import SpatialPooler as PYSpatialPooler
+from nupic.bindings.algorithms import SpatialPooler as CPPSpatialPooler
 from nupic.bindings.math import GetNTAReal
+
+from htmresearch.algorithms.faulty_spatial_pooler import FaultySpatialPooler
 # !/usr/bin/env python
 # ----------------------------------------------------------------------
 # Numenta Platform for Intelligent Computing (NuPIC)
@@ -420,6 +425,27 @@ def percentOverlap(x1, x2):
 
 
 
+def percentOverlapBatch(x1, x2):
+  """
+  Row by row percentOverlap of two stacks of binary vectors.
+
+  @param x1 (array) binary vectors, one per row
+  @param x2 (array) binary vectors, one per row
+
+  @return percentOverlap (array) percentage overlap between x1[i] and x2[i]
+  """
+  x1 = np.asarray(x1) > 0
+  x2 = np.asarray(x2) > 0
+  minX1X2 = np.minimum(x1.sum(axis=1), x2.sum(axis=1))
+  overlap = (x1 & x2).sum(axis=1)
+
+  percentOverlap = np.zeros(len(minX1X2))
+  nonZero = minX1X2 > 0
+  percentOverlap[nonZero] = overlap[nonZero] / minX1X2[nonZero].astype(float)
+  return percentOverlap
+
+
+
 def addNoiseToVector(inputVector, noiseLevel, vectorType):
   """
   Add noise to SDRs
@@ -477,36 +503,168 @@ def corruptSparseVector(sdr, noiseLevel):
 
 
 
+def _selectRandomBits(candidates, numBits):
+  """
+  Pick numBits[i] random True entries of each row of candidates.
+  """
+  numBits = np.minimum(numBits, candidates.sum(axis=1))
+  keys = np.where(candidates, np.random.random(candidates.shape), 2.)
+  sortedKeys = np.sort(keys, axis=1)
+  kth = sortedKeys[np.arange(len(numBits)), np.maximum(numBits - 1, 0)]
+  return (keys <= kth[:, np.newaxis]) & (numBits > 0)[:, np.newaxis]
+
+
+
+def corruptSparseVectors(sdrs, noiseLevel):
+  """
+  Batch version of corruptSparseVector. In each row, turn off
+  int(noiseLevel * numActiveBits) active bits and turn on as many inactive
+  bits.
+  @param sdrs       (array) Numpy array of SDRs, one per row
+  @param noiseLevel (float) amount of noise to be applied on the vectors.
+  @return (array) the corrupted copy of sdrs
+  """
+  sdrs = np.asarray(sdrs)
+  active = sdrs > 0
+  numNoiseBits = (noiseLevel * active.sum(axis=1)).astype("int64")
+
+  corrupted = sdrs.copy()
+  corrupted[_selectRandomBits(active, numNoiseBits)] = 0
+  corrupted[_selectRandomBits(~active, numNoiseBits)] = 1
+  return corrupted
+
+
+
+def getConnectedMatrix(sp):
+  """
+  @return (scipy.sparse.csr_matrix) the connected synapses of the sp, one row
+  per column
+  """
+  return sparse.csr_matrix(getConnectedSyns(sp))
+
+
+
+# Spatial poolers whose compute without learning only picks the winners of the
+# overlaps and advances the iteration number. Subclasses, such as the monitored
+# spatial poolers, may do more in compute.
+_BATCH_SP_TYPES = (PYSpatialPooler, CPPSpatialPooler, FaultySpatialPooler)
+
+
+
+def _numActiveColumnsGlobal(sp):
+  """
+  Number of winners of the sp's global inhibition, or None if the sp uses
+  local inhibition. Follows SpatialPooler._inhibitColumns.
+  """
+  columnDimensions = np.asarray(sp.getColumnDimensions())
+  numColumns = np.prod(columnDimensions)
+  inhibitionRadius = sp.getInhibitionRadius()
+
+  if not (sp.getGlobalInhibition() or
+          inhibitionRadius > columnDimensions.max()):
+    return None
+
+  if sp.getLocalAreaDensity() > 0:
+    density = sp.getLocalAreaDensity()
+  else:
+    inhibitionArea = ((2 * inhibitionRadius + 1) ** columnDimensions.size)
+    inhibitionArea = min(numColumns, inhibitionArea)
+    density = float(sp.getNumActiveColumnsPerInhArea()) / inhibitionArea
+    density = min(density, 0.5)
+
+  return int(density * numColumns)
+
+
+
+def inferSPOnBatch(sp, inputVectors, connectedMatrix=None, blockSize=1024):
+  """
+  Compute the sp output for every input vector, without learning. The
+  overlaps of blockSize inputs come from one sparse product with the
+  connected synapses, and the winners are picked with a stable sort, like the
+  sp's global inhibition. Like sp.compute, this advances the sp's iteration
+  number once per input.
+
+  SPs with local inhibition, and SPs of other classes than the py, cpp and
+  faulty spatial poolers (e.g. monitored SPs, which record every compute), are
+  run one input at a time.
+
+  @param sp a spatial pooler instance
+  @param inputVectors (array) input vectors, one per row
+  @param connectedMatrix (csr_matrix) result of getConnectedMatrix(sp). Pass
+                         it in to reuse it across calls, it only changes when
+                         the sp learns.
+  @param blockSize (int) number of inputs per sparse product
+  @return outputColumns (array) the sp outputs, one per row
+  """
+  inputVectors = np.asarray(inputVectors)
+  numInputVector = inputVectors.shape[0]
+  numColumns = np.prod(sp.getColumnDimensions())
+  outputColumns = np.zeros((numInputVector, numColumns), dtype=uintType)
+
+  numActive = None
+  if type(sp) in _BATCH_SP_TYPES:
+    numActive = _numActiveColumnsGlobal(sp)
+  if numActive is None:
+    for i in xrange(numInputVector):
+      sp.compute(inputVectors[i][:], False, outputColumns[i][:])
+    return outputColumns
+
+  if connectedMatrix is None:
+    connectedMatrix = getConnectedMatrix(sp)
+  stimulusThreshold = sp.getStimulusThreshold()
+
+  for start in xrange(0, numInputVector, blockSize):
+    stop = min(start + blockSize, numInputVector)
+    inputs = sparse.csr_matrix(inputVectors[start:stop], dtype="float32")
+    overlaps = inputs.dot(connectedMatrix.T).toarray()
+
+    if numActive > 0:
+      rows = np.arange(stop - start)[:, np.newaxis]
+      winners = np.argsort(overlaps, axis=1, kind="mergesort")[:, -numActive:]
+      isWinner = overlaps[rows, winners] >= stimulusThreshold
+      outputColumns[start + rows, winners] = isWinner
+
+  # The iteration number sets the update rounds and the duty cycle period of
+  # later learning.
+  sp.setIterationNum(sp.getIterationNum() + numInputVector)
+
+  return outputColumns
+
+
+
 def calculateOverlapCurve(sp, inputVectors):
   """
-  Evalulate noise robustness of SP for a given set of SDRs
+  Evalulate noise robustness of SP for a given set of SDRs. The sp's iteration
+  number advances by two per input and noise level, as if the clean and the
+  corrupted input were computed at every noise level.
   @param sp a spatial pooler instance
   @param inputVectors list of arrays.
   :return:
   """
-  columnNumber = np.prod(sp.getColumnDimensions())
+  inputVectors = np.asarray(inputVectors)
   numInputVector, inputSize = inputVectors.shape
 
-  outputColumns = np.zeros((numInputVector, columnNumber), dtype=uintType)
-  outputColumnsCorrupted = np.zeros((numInputVector, columnNumber),
-                                    dtype=uintType)
+  connectedMatrix = getConnectedMatrix(sp)
+  outputColumns = inferSPOnBatch(sp, inputVectors, connectedMatrix)
 
   noiseLevelList = np.linspace(0, 1.0, 21)
   inputOverlapScore = np.zeros((numInputVector, len(noiseLevelList)))
   outputOverlapScore = np.zeros((numInputVector, len(noiseLevelList)))
-  for i in range(numInputVector):
-    for j in range(len(noiseLevelList)):
-      inputVectorCorrupted = copy.deepcopy(inputVectors[i][:])
-      corruptSparseVector(inputVectorCorrupted, noiseLevelList[j])
-
-      sp.compute(inputVectors[i][:], False, outputColumns[i][:])
-      sp.compute(inputVectorCorrupted, False,
-                 outputColumnsCorrupted[i][:])
-
-      inputOverlapScore[i][j] = percentOverlap(inputVectors[i][:],
-                                               inputVectorCorrupted)
-      outputOverlapScore[i][j] = percentOverlap(outputColumns[i][:],
-                                                outputColumnsCorrupted[i][:])
+  for j in range(len(noiseLevelList)):
+    inputVectorsCorrupted = corruptSparseVectors(inputVectors,
+                                                 noiseLevelList[j])
+    outputColumnsCorrupted = inferSPOnBatch(sp, inputVectorsCorrupted,
+                                            connectedMatrix)
+
+    inputOverlapScore[:, j] = percentOverlapBatch(inputVectors,
+                                                  inputVectorsCorrupted)
+    outputOverlapScore[:, j] = percentOverlapBatch(outputColumns,
+                                                   outputColumnsCorrupted)
+
+  # The clean outputs were computed once instead of at every noise level.
+  # Later learning depends on the iteration number, so skip as many.
+  sp.setIterationNum(sp.getIterationNum() +
+                     numInputVector * (len(noiseLevelList) - 1))
 
   return noiseLevelList, inputOverlapScore, outputOverlapScore
 
@@ -529,6 +687,33 @@ def classifySPoutput(targetOutputColumns, outputColumns):
 
 
 
+def classifySPoutputBatch(targetOutputColumns, outputColumns,
+                          blockSize=1024):
+  """
+  Classify many SP outputs, like classifySPoutput
+  @param targetOutputColumns (array) The target outputs, corresponding to
+                                     different classes
+  @param outputColumns (array) The current outputs, one per row
+  @param blockSize (int) number of outputs classified at a time
+  @return classLabels (array) classification outcomes
+  """
+  targets = (np.asarray(targetOutputColumns) > 0).astype("float32")
+  targetCounts = targets.sum(axis=1)
+  outputColumns = np.asarray(outputColumns)
+
+  classLabels = np.zeros(len(outputColumns), dtype="int64")
+  for start in xrange(0, len(outputColumns), blockSize):
+    outputs = (outputColumns[start:start + blockSize] > 0).astype("float32")
+    overlap = np.dot(outputs, targets.T)
+    minCounts = np.minimum(outputs.sum(axis=1)[:, np.newaxis],
+                           targetCounts[np.newaxis, :])
+    overlap[minCounts > 0] /= minCounts[minCounts > 0]
+    overlap[minCounts == 0] = 0
+    classLabels[start:start + blockSize] = np.argmax(overlap, axis=1)
+  return classLabels
+
+
+
 def classificationAccuracyVsNoise(sp, inputVectors, noiseLevelList):
   """
   Evaluate whether the SP output is classifiable, with varying amount of noise
@@ -537,32 +722,29 @@ def classificationAccuracyVsNoise(sp, inputVectors, noiseLevelList):
   @param noiseLevelList (list) list of noise levels
   :return:
   """
+  inputVectors = np.asarray(inputVectors)
   numInputVector, inputSize = inputVectors.shape
 
   if sp is None:
-    targetOutputColumns = copy.deepcopy(inputVectors)
+    targetOutputColumns = inputVectors
   else:
-    columnNumber = np.prod(sp.getColumnDimensions())
     # calculate target output given the uncorrupted input vectors
-    targetOutputColumns = np.zeros((numInputVector, columnNumber),
-                                   dtype=uintType)
-    for i in range(numInputVector):
-      sp.compute(inputVectors[i][:], False, targetOutputColumns[i][:])
+    connectedMatrix = getConnectedMatrix(sp)
+    targetOutputColumns = inferSPOnBatch(sp, inputVectors, connectedMatrix)
 
   outcomes = np.zeros((len(noiseLevelList), numInputVector))
   for i in range(len(noiseLevelList)):
-    for j in range(numInputVector):
-      corruptedInputVector = copy.deepcopy(inputVectors[j][:])
-      corruptSparseVector(corruptedInputVector, noiseLevelList[i])
-
-      if sp is None:
-        outputColumns = copy.deepcopy(corruptedInputVector)
-      else:
-        outputColumns = np.zeros((columnNumber, ), dtype=uintType)
-        sp.compute(corruptedInputVector, False, outputColumns)
+    corruptedInputVectors = corruptSparseVectors(inputVectors,
+                                                 noiseLevelList[i])
+    if sp is None:
+      outputColumns = corruptedInputVectors
+    else:
+      outputColumns = inferSPOnBatch(sp, corruptedInputVectors,
+                                     connectedMatrix)
 
-      predictedClassLabel = classifySPoutput(targetOutputColumns, outputColumns)
-      outcomes[i][j] = predictedClassLabel == j
+    predictedClassLabels = classifySPoutputBatch(targetOutputColumns,
+                                                 outputColumns)
+    outcomes[i] = predictedClassLabels == np.arange(numInputVector)
 
   predictionAccuracy = np.mean(outcomes, 1)
   return predictionAccuracy
@@ -847,7 +1029,8 @@ def reconstructionError(sp, inputVectors, activeColumnVectors, threshold=0.):
   return Err/batchSize
 
 
-def witnessError(sp, inputVectors, activeColumnsCurrentEpoch):
+def witnessError(sp, inputVectors, activeColumnsCurrentEpoch,
+                 blockSize=1024):
   """
   Computes a variation of a reconstruction error. It measures the average 
   hamming distance of an active column's connected synapses vector and its witnesses. 
@@ -864,27 +1047,80 @@ def witnessError(sp, inputVectors, activeColumnsCurrentEpoch):
   \]
   It can be shown that the error is optimized by the Hebbian-like update rule 
   of the spatial pooler. 
+
+  The distances are computed for blockSize inputs at a time. Every input must
+  have at least one active column.
   """
   connectionMatrix = getConnectedSyns(sp)
+  inputVectors = np.asarray(inputVectors)
+  activeColumnsCurrentEpoch = np.asarray(activeColumnsCurrentEpoch)
   batchSize        = inputVectors.shape[0]
 
+  binary = (np.all((connectionMatrix == 0) | (connectionMatrix == 1)) and
+            np.all((inputVectors == 0) | (inputVectors == 1)))
+  if binary:
+    # For binary vectors |x - y|_1 = |x|_1 + |y|_1 - 2 x.y, so all the
+    # distances of a block of inputs come from one matrix product
+    connectionMatrix = connectionMatrix.astype("float64")
+    connectedCounts = connectionMatrix.sum(axis=1)
+
+  # Per input error, the average distance to its active columns' synapses
+  inputErrors = np.empty(batchSize)
+  for start in xrange(0, batchSize, blockSize):
+    stop = min(start + blockSize, batchSize)
+    active = activeColumnsCurrentEpoch[start:stop] > 0.
+    if binary:
+      inputs = inputVectors[start:stop].astype("float64")
+      distances = (connectedCounts[np.newaxis, :] +
+                   inputs.sum(axis=1)[:, np.newaxis] -
+                   2 * np.dot(inputs, connectionMatrix.T))
+      errors = np.where(active, distances, 0.).sum(axis=1)
+    else:
+      # Add up the distances in the same order as a loop over the columns
+      errors = np.array([
+        sum(np.absolute(connectionMatrix[activeRow] -
+                        inputVectors[i]).sum(axis=1), 0.)
+        for i, activeRow in enumerate(active, start)])
+
+    numActiveColumns = active.sum(axis=1)
+    if np.any(numActiveColumns == 0):
+      raise ZeroDivisionError("witnessError needs at least one active column "
+                              "for every input")
+    inputErrors[start:stop] = errors / numActiveColumns
+
   # 1st sum... over each input in batch
   Err = 0.
-  for i in range(batchSize):
-    activeColumns    = np.where(activeColumnsCurrentEpoch[i] > 0.)[0]
-    numActiveColumns = activeColumns.shape[0]
-    # 2nd sum... over each active colum
-    err = 0.
-    for j in activeColumns:
-      # Compute hamming distance and accumulate
-      err += np.sum(np.absolute(connectionMatrix[j] - inputVectors[i]))
-
-    Err += err/numActiveColumns
+  for err in inputErrors:
+    Err += err
 
   return Err/batchSize
 
 
 
+def _mutualInformationFromCounts(batchSize, ci, cj, cij):
+  """
+  Mutual information of pairs of binary variables, given how often each one
+  is active (ci, cj) and how often both are active together (cij). The counts
+  can be arrays, which are broadcast.
+  """
+  batchSize = float(batchSize)
+  pi = ci/batchSize
+  pj = cj/batchSize
+
+  Iij = 0.
+  for pij, pa, pb in [((batchSize - ci - cj + cij)/batchSize, 1. - pi, 1. - pj),
+                      ((ci - cij)/batchSize, pi, 1. - pj),
+                      ((cj - cij)/batchSize, 1. - pi, pj),
+                      (cij/batchSize, pi, pj)]:
+    # Add current term of mutual information
+    with np.errstate(divide="ignore", invalid="ignore"):
+      term = pij * np.log2(pij/(pa*pb))
+    Iij = Iij + np.where(pij > 0, term, 0.)
+
+  return Iij
+
+
+
 def mutualInformation(sp, activeColumnsCurrentEpoch, column_1, column_2):
   """
   Computes the mutual information of the binary variables that represent 
@@ -899,45 +1135,49 @@ def mutualInformation(sp, activeColumnsCurrentEpoch, column_1, column_2):
   batchSize   = activeColumnsCurrentEpoch.shape[0]
 
   # Activity Counts
-  ci, cj, cij = 0., 0., dict([((0,0),0.), ((1,0),0.), ((0,1),0.), ((1,1),0.)])
-  for t in range(batchSize):
-    ai = activeColumnsCurrentEpoch[t, i]
-    aj = activeColumnsCurrentEpoch[t, j]
-    cij[(ai, aj)] += 1.
-    ci += ai
-    cj += aj
-
-  # Mutual information calculation 
-  Iij = 0
-  for a,b in [(0,0), (1,0), (0,1), (1,1)]:
-    # Compute probabilities
-    pij = cij[(a,b)]/batchSize
-    pi  = ci/batchSize if a == 1 else 1. - ci/batchSize
-    pj  = cj/batchSize if b == 1 else 1. - cj/batchSize
-    # Add current term of mutual information 
-    Iij += pij * np.log2(pij/(pi*pj)) if pij > 0 else 0
+  ai = np.asarray(activeColumnsCurrentEpoch[:, i], dtype="float64")
+  aj = np.asarray(activeColumnsCurrentEpoch[:, j], dtype="float64")
 
-  return Iij
+  return float(_mutualInformationFromCounts(batchSize, ai.sum(), aj.sum(),
+                                            np.dot(ai, aj)))
 
 
 
-def meanMutualInformation(sp, activeColumnsCurrentEpoch, columnsUnderInvestigation = []):
+def meanMutualInformation(sp, activeColumnsCurrentEpoch,
+                          columnsUnderInvestigation = [], blockSize=1024):
   """
   Computes the mean of the mutual information 
   of pairs taken from a list of columns. 
+
+  The co-activation counts of all the pairs come from A.T A, where A is the
+  activation history. They're computed for blockSize columns at a time, so
+  memory stays bounded for large numbers of columns. The mutual information
+  of the pairs is added up one pair at a time, in the order of a loop over the
+  pairs, so the result doesn't depend on blockSize.
   """
   if len(columnsUnderInvestigation) == 0:
     columns = range(np.prod(sp.getColumnDimensions()))
   else:
     columns = columnsUnderInvestigation
   numCols = len(columns)
-  sumMutualInfo = 0
   normalizingConst = numCols*(numCols - 1)/2
-  for i in range(numCols):
-    for j in range(i+1, numCols):
-      sumMutualInfo += mutualInformation(sp, activeColumnsCurrentEpoch, columns[i], columns[j])
-
-  return sumMutualInfo/normalizingConst
 
+  activity = np.asarray(activeColumnsCurrentEpoch,
+                        dtype="float64")[:, columns]
+  batchSize = activity.shape[0]
+  counts = activity.sum(axis=0)
 
+  sumMutualInfo = 0
+  for start in xrange(0, numCols, blockSize):
+    stop = min(start + blockSize, numCols)
+    # Pairs (i, j) with i in this block and j >= i
+    coactivity = np.dot(activity[:, start:stop].T, activity[:, start:])
+    mutualInfo = _mutualInformationFromCounts(
+      batchSize, counts[start:stop, np.newaxis], counts[np.newaxis, start:],
+      coactivity)
+    pairs = np.triu(np.ones(mutualInfo.shape, dtype="bool"), k=1)
+    # cumsum adds sequentially, unlike sum
+    sumMutualInfo = np.cumsum(np.append(sumMutualInfo,
+                                        mutualInfo[pairs]))[-1]
 
+  return sumMutualInfo/normalizingConst
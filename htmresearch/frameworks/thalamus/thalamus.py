@@ -207,21 +207,23 @@ class Thalamus(object):
     or bursting.
 
     :param feedForwardInput:
-      a numpy matrix of shape relayCellShape containing 0's and 1's
+      a numpy matrix of shape relayCellShape containing 0's and 1's, or a
+      stack of such matrices with shape (numFrames,) + relayCellShape. Every
+      frame uses the current burst-ready cells.
 
     :return:
       feedForwardInput is modified to contain 0, 1, or 2. A "2" indicates
       bursting cells.
     """
     ff = feedForwardInput.copy()
-    # For each relay cell, see if any of its FF inputs are active.
-    for x in range(self.relayWidth):
-      for y in range(self.relayHeight):
-        inputCells = self._preSynapticFFCells(x, y)
-        for idx in inputCells:
-          if feedForwardInput[idx] != 0:
-            ff[x, y] = 1.0
-            continue
+
+    # A relay cell is active if any of the FF inputs in its 3x3 fan-in are
+    # active, i.e. a 3x3 dilation of the active inputs.
+    relayFF = ff[..., :self.relayWidth, :self.relayHeight]
+    relayFF[...] = np.where(
+      self._dilateFFInput(feedForwardInput != 0)[
+        ..., :self.relayWidth, :self.relayHeight],
+      1.0, relayFF)
 
     # If yes, and it is in burst mode, this cell bursts
     # If yes, and it is not in burst mode, then we just get tonic input.
@@ -231,6 +233,30 @@ class Thalamus(object):
     return ff2
 
 
+  @staticmethod
+  def _dilateFFInput(activeInput):
+    """
+    For each position of the input, find whether any input in the 3x3 square
+    around it is active. The square is cut off at the edges of the input.
+
+    :param activeInput:
+      a boolean array whose last two dimensions are the input shape
+
+    :return:
+      a boolean array with the same shape
+    """
+    padWidth = [(0, 0)] * (activeInput.ndim - 2) + [(1, 1), (1, 1)]
+    padded = np.pad(activeInput, padWidth, mode="constant")
+    width, height = activeInput.shape[-2:]
+
+    dilated = np.zeros(activeInput.shape, dtype="bool")
+    for dx in range(3):
+      for dy in range(3):
+        dilated |= padded[..., dx:dx + width, dy:dy + height]
+
+    return dilated
+
+
   def reset(self):
     """
     Set everything back to zero
@@ -297,18 +323,28 @@ class Thalamus(object):
     Initialize TRN to relay cell connectivity. For each relay cell, create a
     dendritic segment for each TRN cell it connects to.
     """
-    for x in range(self.relayWidth):
-      for y in range(self.relayHeight):
-
-        # Create one dendrite for each trn cell that projects to this relay cell
-        # This dendrite contains one synapse corresponding to this TRN->relay
-        # connection.
-        relayCellIndex = self.relayCellIndex((x,y))
-        trnCells = self._preSynapticTRNCells(x, y)
-        for trnCell in trnCells:
-          newSegment = self.relayConnections.createSegments([relayCellIndex])
-          self.relayConnections.growSynapses(newSegment,
-                                             [self.trnCellIndex(trnCell)], 1.0)
+    # Create one dendrite for each trn cell that projects to each relay cell.
+    # This dendrite contains one synapse corresponding to this TRN->relay
+    # connection. The segments are ordered by relay cell x, then relay cell y,
+    # then TRN cell x, then TRN cell y.
+    relayX, relayY = np.meshgrid(np.arange(self.relayWidth),
+                                 np.arange(self.relayHeight), indexing="ij")
+    offsetX, offsetY = np.meshgrid([-1, 0, 1], [-1, 0, 1], indexing="ij")
+    trnX = relayX.reshape(-1, 1) + offsetX.reshape(1, -1)
+    trnY = relayY.reshape(-1, 1) + offsetY.reshape(1, -1)
+
+    valid = ((trnX >= 0) & (trnX < self.trnWidth) &
+             (trnY >= 0) & (trnY < self.trnHeight))
+    relayCells = np.broadcast_to(
+      self.relayCellIndex((relayX.reshape(-1, 1), relayY.reshape(-1, 1))),
+      valid.shape)[valid]
+    trnCells = self.trnCellIndex((trnX[valid], trnY[valid]))
+
+    newSegments = self.relayConnections.createSegments(
+      relayCells.astype("uint32"))
+    self.relayConnections.matrix.setElements(
+      np.asarray(newSegments, dtype="uint32"), trnCells.astype("uint32"),
+      np.ones(len(trnCells), dtype="float32"))
 
 
   def _initializeRelayCellDendrites(self):
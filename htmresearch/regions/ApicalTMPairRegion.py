@@ -27,6 +27,9 @@ import numpy as np
 
 from nupic.bindings.regions.PyRegion import PyRegion
 
+from htmresearch.support.sparse_links import (
+  getLinkCells, sparseLinkWidth, writeSparseOutput)
+
 
 
 class ApicalTMPairRegion(PyRegion):
@@ -304,6 +307,15 @@ class ApicalTMPairRegion(PyRegion):
           "constraints": ("enum: ApicalTiebreak, ApicalTiebreakCPP, ApicalDependent"),
           "defaultValue": "ApicalTiebreakCPP"
         },
+        "sparseLinks": {
+          "description": ("If true, inputs and outputs hold sorted cell "
+                          "indices preceded by their count instead of 0s and "
+                          "1s. See htmresearch.support.sparse_links."),
+          "accessMode": "Read",
+          "dataType": "Bool",
+          "count": 1,
+          "defaultValue": "false"
+        },
       },
     }
 
@@ -337,6 +349,7 @@ class ApicalTMPairRegion(PyRegion):
                # Region params
                implementation="ApicalTiebreak",
                learn=True,
+               sparseLinks=False,
                **kwargs):
 
     # Input sizes (the network API doesn't provide these during initialize)
@@ -364,6 +377,7 @@ class ApicalTMPairRegion(PyRegion):
     # Region params
     self.implementation = implementation
     self.learn = learn
+    self.sparseLinks = sparseLinks
 
     PyRegion.__init__(self, **kwargs)
 
@@ -431,36 +445,50 @@ class ApicalTMPairRegion(PyRegion):
       if inputs["resetIn"][0] != 0:
         # send empty output
         self._tm.reset()
-        outputs["activeCells"][:] = 0
-        outputs["predictedActiveCells"][:] = 0
-        outputs["winnerCells"][:] = 0
+        for name in ("activeCells", "predictedActiveCells", "winnerCells"):
+          if self.sparseLinks:
+            writeSparseOutput(outputs[name], ())
+          else:
+            outputs[name][:] = 0
         return
 
-    activeColumns = inputs["activeColumns"].nonzero()[0]
+    activeColumns = getLinkCells(inputs["activeColumns"], self.sparseLinks)
 
     if "basalInput" in inputs:
-      basalInput = inputs["basalInput"].nonzero()[0]
+      basalInput = getLinkCells(inputs["basalInput"], self.sparseLinks)
     else:
       basalInput = np.empty(0, dtype="uint32")
 
     if "apicalInput" in inputs:
-      apicalInput = inputs["apicalInput"].nonzero()[0]
+      apicalInput = getLinkCells(inputs["apicalInput"], self.sparseLinks)
     else:
       apicalInput = np.empty(0, dtype="uint32")
 
     if "basalGrowthCandidates" in inputs:
-      basalGrowthCandidates = inputs["basalGrowthCandidates"].nonzero()[0]
+      basalGrowthCandidates = getLinkCells(inputs["basalGrowthCandidates"],
+                                           self.sparseLinks)
     else:
       basalGrowthCandidates = basalInput
 
     if "apicalGrowthCandidates" in inputs:
-      apicalGrowthCandidates = inputs["apicalGrowthCandidates"].nonzero()[0]
+      apicalGrowthCandidates = getLinkCells(inputs["apicalGrowthCandidates"],
+                                            self.sparseLinks)
     else:
       apicalGrowthCandidates = apicalInput
 
     self._tm.compute(activeColumns, basalInput, apicalInput,
                      basalGrowthCandidates, apicalGrowthCandidates, self.learn)
 
+    if self.sparseLinks:
+      activeCells = self._tm.getActiveCells()
+      predictedCells = self._tm.getPredictedCells()
+      writeSparseOutput(outputs["activeCells"], activeCells)
+      writeSparseOutput(outputs["predictedCells"], predictedCells)
+      writeSparseOutput(outputs["predictedActiveCells"],
+                        np.intersect1d(activeCells, predictedCells))
+      writeSparseOutput(outputs["winnerCells"], self._tm.getWinnerCells())
+      return
+
     # Extract the active / predicted cells and put them into binary arrays.
     outputs["activeCells"][:] = 0
     outputs["activeCells"][self._tm.getActiveCells()] = 1
@@ -507,6 +535,8 @@ class ApicalTMPairRegion(PyRegion):
     """
     if name in ["activeCells", "predictedCells", "predictedActiveCells",
                 "winnerCells"]:
+      if self.sparseLinks:
+        return sparseLinkWidth(self.cellsPerColumn * self.columnCount)
       return self.cellsPerColumn * self.columnCount
     else:
       raise Exception("Invalid output name specified: %s" % name)
@@ -25,6 +25,8 @@ import inspect
 
 from nupic.bindings.regions.PyRegion import PyRegion
 from htmresearch.algorithms.column_pooler import ColumnPooler
+from htmresearch.support.sparse_links import (
+  getLinkCells, sparseLinkWidth, writeSparseOutput)
 
 
 def getConstructorArguments():
@@ -311,6 +313,14 @@ class ColumnPoolerRegion(PyRegion):
           count=0,
           constraints="enum: active,predicted,predictedActiveCells",
           defaultValue="active"),
+        sparseLinks=dict(
+          description="If true, inputs and outputs hold sorted cell indices "
+                      "preceded by their count instead of 0s and 1s. See "
+                      "htmresearch.support.sparse_links.",
+          accessMode="Read",
+          dataType="Bool",
+          count=1,
+          defaultValue="false"),
       ),
       commands=dict(
         reset=dict(description="Explicitly reset TM states now."),
@@ -349,6 +359,7 @@ class ColumnPoolerRegion(PyRegion):
 
                seed=42,
                defaultOutputType = "active",
+               sparseLinks=False,
                **kwargs):
 
     # Used to derive Column Pooler params
@@ -380,6 +391,7 @@ class ColumnPoolerRegion(PyRegion):
     # Region params
     self.learningMode = True
     self.defaultOutputType = defaultOutputType
+    self.sparseLinks = sparseLinks
 
     self._pooler = None
 
@@ -433,22 +445,25 @@ class ColumnPoolerRegion(PyRegion):
       if inputs["resetIn"][0] != 0:
         # send empty output
         self.reset()
-        outputs["feedForwardOutput"][:] = 0
-        outputs["activeCells"][:] = 0
+        if self.sparseLinks:
+          writeSparseOutput(outputs["activeCells"], ())
+          writeSparseOutput(outputs["feedForwardOutput"], ())
+        else:
+          outputs["feedForwardOutput"][:] = 0
+          outputs["activeCells"][:] = 0
         return
 
-    feedforwardInput = numpy.asarray(inputs["feedforwardInput"].nonzero()[0],
-                                     dtype="uint32")
+    feedforwardInput = getLinkCells(inputs["feedforwardInput"],
+                                    self.sparseLinks)
 
     if "feedforwardGrowthCandidates" in inputs:
-      feedforwardGrowthCandidates = numpy.asarray(
-        inputs["feedforwardGrowthCandidates"].nonzero()[0], dtype="uint32")
+      feedforwardGrowthCandidates = getLinkCells(
+        inputs["feedforwardGrowthCandidates"], self.sparseLinks)
     else:
       feedforwardGrowthCandidates = feedforwardInput
 
     if "lateralInput" in inputs:
-      lateralInputs = tuple(numpy.asarray(singleInput.nonzero()[0],
-                                          dtype="uint32")
+      lateralInputs = tuple(getLinkCells(singleInput, self.sparseLinks)
                             for singleInput
                             in numpy.split(inputs["lateralInput"],
                                            self.numOtherCorticalColumns))
@@ -456,8 +471,8 @@ class ColumnPoolerRegion(PyRegion):
       lateralInputs = ()
 
     if "predictedInput" in inputs:
-      predictedInput = numpy.asarray(
-        inputs["predictedInput"].nonzero()[0], dtype="uint32")
+      predictedInput = getLinkCells(inputs["predictedInput"],
+                                    self.sparseLinks)
     else:
       predictedInput = None
 
@@ -466,6 +481,17 @@ class ColumnPoolerRegion(PyRegion):
                          feedforwardGrowthCandidates, learn=self.learningMode,
                          predictedInput = predictedInput)
 
+    if self.sparseLinks:
+      # Only write the active cells, not the whole array.
+      activeCells = self._pooler.getActiveCells()
+      writeSparseOutput(outputs["activeCells"], activeCells)
+
+      if self.defaultOutputType == "active":
+        writeSparseOutput(outputs["feedForwardOutput"], activeCells)
+      else:
+        raise Exception("Unknown outputType: " + self.defaultOutputType)
+      return
+
     # Extract the active / predicted cells and put them into binary arrays.
     outputs["activeCells"][:] = 0
     outputs["activeCells"][self._pooler.getActiveCells()] = 1
@@ -507,6 +533,8 @@ class ColumnPoolerRegion(PyRegion):
     Return the number of elements for the given output.
     """
     if name in ["feedForwardOutput", "activeCells"]:
+      if self.sparseLinks:
+        return sparseLinkWidth(self.cellCount)
       return self.cellCount
     else:
       raise Exception("Invalid output name specified: " + name)
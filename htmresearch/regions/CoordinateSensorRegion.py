@@ -37,6 +37,10 @@ class CoordinateSensorRegion(PyRegion):
 
   Each data record consists of the coordinate in an N-dimensional integer
   coordinate space, a 0/1 reset flag, and an integer sequence ID.
+
+  Many records can be queued at once with addBatchToQueue(), which takes a
+  matrix with one coordinate per row. The matrix is read in place with a
+  cursor.
   """
 
   def __init__(self,
@@ -130,20 +134,16 @@ class CoordinateSensorRegion(PyRegion):
     @param inputs This parameter is ignored. The data comes from the queue
     @param outputs See definition in the spec above.
     """
-    if len(self.queue) > 0:
-      data = self.queue.pop()
-
-    else:
-      raise Exception("CoordinateSensor: No data to encode: queue is empty")
+    coordinate, reset, sequenceId = self._nextRecord()
 
-    outputs["resetOut"][0] = data["reset"]
-    outputs["sequenceIdOut"][0] = data["sequenceId"]
-    sdr = self.encoder.encode((numpy.array(data["coordinate"]), self.radius))
+    outputs["resetOut"][0] = reset
+    outputs["sequenceIdOut"][0] = sequenceId
+    sdr = self.encoder.encode((numpy.array(coordinate), self.radius))
     outputs["dataOut"][:] = sdr
 
     if self.verbosity > 1:
       print "CoordinateSensor outputs:"
-      print "Coordinate = ", data["coordinate"]
+      print "Coordinate = ", coordinate
       print "sequenceIdOut: ", outputs["sequenceIdOut"]
       print "resetOut: ", outputs["resetOut"]
       print "dataOut: ", outputs["dataOut"].nonzero()[0]
@@ -176,6 +176,40 @@ class CoordinateSensorRegion(PyRegion):
       "coordinate": coordinateList,
     })
 
+  def addBatchToQueue(self, coordinates, resets=None, sequenceIds=None):
+    """
+    Add a batch of records to the sensor's internal queue. The batch is
+    dequeued one row per call to compute, in FIFO order with the other queued
+    items.
+
+    The arrays are not copied, so they can be memory-mapped, e.g. with
+    numpy.load(filename, mmap_mode="r").
+
+    @param coordinates (numpy array)
+    A matrix with one N-dimensional integer coordinate per row
+
+    @param resets (numpy array or None)
+    The 0/1 reset flag of each record. If None, no record is a reset.
+
+    @param sequenceIds (numpy array or None)
+    The sequence ID of each record. If None, all IDs are 0.
+    """
+    numRecords = len(coordinates)
+    if numRecords == 0:
+      return
+
+    for values in (resets, sequenceIds):
+      if values is not None and len(values) != numRecords:
+        raise ValueError("Expected {} values, got {}".format(numRecords,
+                                                             len(values)))
+
+    self.queue.appendleft({
+      "coordinates": coordinates,
+      "resets": resets,
+      "sequenceIds": sequenceIds,
+      "cursor": 0,
+    })
+
   def addResetToQueue(self, sequenceId):
     """
     Add a reset signal to the sensor's internal queue. Calls to compute
@@ -190,6 +224,34 @@ class CoordinateSensorRegion(PyRegion):
       "coordinate": [],
     })
 
+  def _nextRecord(self):
+    """
+    Dequeue the next record.
+
+    @return (tuple)
+    The coordinate, the reset flag and the sequence ID
+    """
+    if len(self.queue) == 0:
+      raise Exception("CoordinateSensor: No data to encode: queue is empty")
+
+    data = self.queue[-1]
+
+    if "coordinates" not in data:
+      self.queue.pop()
+      return data["coordinate"], data["reset"], data["sequenceId"]
+
+    i = data["cursor"]
+    coordinate = data["coordinates"][i]
+    reset = (data["resets"][i] if data["resets"] is not None else 0)
+    sequenceId = (data["sequenceIds"][i] if data["sequenceIds"] is not None
+                  else 0)
+
+    data["cursor"] = i + 1
+    if data["cursor"] == len(data["coordinates"]):
+      self.queue.pop()
+
+    return coordinate, reset, sequenceId
+
   def getOutputElementCount(self, name):
     """Returns the width of dataOut."""
 
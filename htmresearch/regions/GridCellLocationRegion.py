@@ -23,7 +23,10 @@ import numpy as np
 from nupic.bindings.regions.PyRegion import PyRegion
 
 from htmresearch.algorithms.location_modules import (
+  FusedThresholdedGaussian2DLocationModules,
   ThresholdedGaussian2DLocationModule)
+from htmresearch.support.sparse_links import (
+  getLinkCells, sparseLinkWidth, writeSparseOutput)
 
 
 
@@ -292,6 +295,24 @@ class GridCellLocationRegion(PyRegion):
           dataType="UInt32",
           count=1,
           defaultValue=42
+        ),
+        sparseLinks=dict(
+          description="If true, the cell inputs and outputs hold sorted cell "
+                      "indices preceded by their count instead of 0s and 1s. "
+                      "See htmresearch.support.sparse_links.",
+          dataType="Bool",
+          accessMode="Read",
+          count=1,
+          defaultValue=False
+        ),
+        fuseModules=dict(
+          description="If true, all modules are computed together by a "
+                      "FusedThresholdedGaussian2DLocationModules instead of "
+                      "one module at a time.",
+          dataType="Bool",
+          accessMode="Read",
+          count=1,
+          defaultValue=False
         )
       ),
       commands=dict(
@@ -323,6 +344,8 @@ class GridCellLocationRegion(PyRegion):
                seed=42,
                dualPhase=True,
                dimensions=2,
+               sparseLinks=False,
+               fuseModules=False,
                **kwargs):
     if moduleCount <= 0 or cellsPerAxis <= 0:
       raise TypeError("Parameters moduleCount and cellsPerAxis must be > 0")
@@ -352,6 +375,8 @@ class GridCellLocationRegion(PyRegion):
     self.dualPhase = dualPhase
     self.dimensions = dimensions
     self.seed = seed
+    self.sparseLinks = sparseLinks
+    self.fuseModules = fuseModules
 
     # This flag controls whether the region is processing sensation or movement
     # on dual phase configuration
@@ -368,7 +393,26 @@ class GridCellLocationRegion(PyRegion):
 
     if self._modules is None:
       self._modules = []
-      for i in xrange(self.moduleCount):
+      if self.fuseModules:
+        self._modules.append(FusedThresholdedGaussian2DLocationModules(
+          cellsPerAxis=self.cellsPerAxis,
+          scales=self.scale,
+          orientations=self.orientation,
+          anchorInputSize=self.anchorInputSize,
+          activeFiringRate=self.activeFiringRate,
+          bumpSigma=self.bumpSigma,
+          activationThreshold=self.activationThreshold,
+          initialPermanence=self.initialPermanence,
+          connectedPermanence=self.connectedPermanence,
+          learningThreshold=self.learningThreshold,
+          sampleSize=self.sampleSize,
+          permanenceIncrement=self.permanenceIncrement,
+          permanenceDecrement=self.permanenceDecrement,
+          maxSynapsesPerSegment=self.maxSynapsesPerSegment,
+          bumpOverlapMethod=self.bumpOverlapMethod,
+          seed=self.seed))
+
+      for i in xrange(0 if self.fuseModules else self.moduleCount):
         self._modules.append(ThresholdedGaussian2DLocationModule(
           cellsPerAxis=self.cellsPerAxis,
           scale=self.scale[i],
@@ -413,14 +457,23 @@ class GridCellLocationRegion(PyRegion):
         self.activateRandomLocation()
 
       # send empty output
-      outputs["activeCells"][:] = 0
-      outputs["learnableCells"][:] = 0
-      outputs["sensoryAssociatedCells"][:] = 0
+      for name in ("activeCells", "learnableCells", "sensoryAssociatedCells"):
+        if self.sparseLinks:
+          writeSparseOutput(outputs[name], ())
+        else:
+          outputs[name][:] = 0
       return
 
     displacement = inputs.get("displacement", np.array([]))
-    anchorInput = inputs.get("anchorInput", np.array([])).nonzero()[0]
-    anchorGrowthCandidates = inputs.get("anchorGrowthCandidates", np.array([])).nonzero()[0]
+    if "anchorInput" in inputs:
+      anchorInput = getLinkCells(inputs["anchorInput"], self.sparseLinks)
+    else:
+      anchorInput = np.array([], dtype=np.uint32)
+    if "anchorGrowthCandidates" in inputs:
+      anchorGrowthCandidates = getLinkCells(inputs["anchorGrowthCandidates"],
+                                            self.sparseLinks)
+    else:
+      anchorGrowthCandidates = np.array([], dtype=np.uint32)
 
     # Concatenate the output of all modules
     activeCells = np.array([], dtype=np.uint32)
@@ -444,13 +497,15 @@ class GridCellLocationRegion(PyRegion):
       # Toggle between movement and sensation
       self._sensing = not self._sensing
 
-    for i in xrange(self.moduleCount):
-      module = self._modules[i]
+    if self.fuseModules and shouldMove and self.dimensions > 2:
+      # Project n-dimension displacements to 2D, one row per module
+      displacement = np.matmul(self._projection, displacement)
 
+    for i, module in enumerate(self._modules):
       # Compute movement
       if shouldMove:
         movement = displacement
-        if self.dimensions > 2:
+        if self.dimensions > 2 and not self.fuseModules:
           # Project n-dimension displacements to 2D
           movement = np.matmul(self._projection[i], movement)
 
@@ -470,6 +525,13 @@ class GridCellLocationRegion(PyRegion):
       sensoryAssociatedCells = np.append(sensoryAssociatedCells,
                                          module.getSensoryAssociatedCells() + start)
 
+    if self.sparseLinks:
+      writeSparseOutput(outputs["activeCells"], activeCells)
+      writeSparseOutput(outputs["learnableCells"], learnableCells)
+      writeSparseOutput(outputs["sensoryAssociatedCells"],
+                        sensoryAssociatedCells)
+      return
+
     outputs["activeCells"][:] = 0
     outputs["activeCells"][activeCells] = 1
     outputs["learnableCells"][:] = 0
@@ -504,13 +566,16 @@ class GridCellLocationRegion(PyRegion):
     Returns the size of the output array
     """
     if name in ["activeCells", "learnableCells", "sensoryAssociatedCells"]:
+      if self.sparseLinks:
+        return sparseLinkWidth(self.cellCount * self.moduleCount)
       return self.cellCount * self.moduleCount
     else:
       raise Exception("Invalid output name specified: " + name)
 
   def getModules(self):
     """
-    Returns underlying list of modules used by this region
+    Returns underlying list of modules used by this region. When fuseModules
+    is enabled the list holds a single FusedThresholdedGaussian2DLocationModules
     """
     return self._modules
 
@@ -20,8 +20,13 @@
 # ----------------------------------------------------------------------
 
 from collections import deque
+
+import numpy as np
 from nupic.bindings.regions.PyRegion import PyRegion
 
+from htmresearch.support.sparse_links import (
+  getLinkCells, sparseLinkWidth, writeSparseOutput)
+
 
 class RawSensor(PyRegion):
   """
@@ -33,14 +38,20 @@ class RawSensor(PyRegion):
 
   Each data record consists of the non-zero indices of the sparse vector,
   a 0/1 reset flag, and an integer sequence ID.
+
+  Many records can be queued at once with addBatchToQueue(), which takes the
+  records as a CSR-style pair of arrays (indices + offsets). The batch is read
+  in place with a cursor, so no per-record Python objects are created.
   """
 
   def __init__(self,
                outputWidth=2048,
-               verbosity=0):
+               verbosity=0,
+               sparseLinks=False):
     """Create an instance with the appropriate output size."""
     self.verbosity = verbosity
     self.outputWidth = outputWidth
+    self.sparseLinks = sparseLinks
     self.queue = deque()
 
 
@@ -90,6 +101,15 @@ class RawSensor(PyRegion):
           "defaultValue": 2048,
           "constraints":"",
         },
+        "sparseLinks":{
+          "description":"If true, dataOut holds the sorted non-zero indices "
+                        "preceded by their count instead of 0s and 1s. See "
+                        "htmresearch.support.sparse_links.",
+          "dataType":"Bool",
+          "accessMode":"Read",
+          "count":1,
+          "defaultValue":"false",
+        },
       },
       "commands":{
         "addDataToQueue": {
@@ -106,24 +126,22 @@ class RawSensor(PyRegion):
     Get the next record from the queue and encode it. The fields for inputs and
     outputs are as defined in the spec above.
     """
-    if len(self.queue) > 0:
-      # Take the top element of the data queue
-      data = self.queue.pop()
-
-    else:
-      raise Exception("RawSensor: No data to encode: queue is empty ")
+    nonZeros, reset, sequenceId = self._nextRecord()
 
     # Copy data into output vectors
-    outputs["resetOut"][0] = data["reset"]
-    outputs["sequenceIdOut"][0] = data["sequenceId"]
-    outputs["dataOut"][:] = 0
-    outputs["dataOut"][data["nonZeros"]] = 1
+    outputs["resetOut"][0] = reset
+    outputs["sequenceIdOut"][0] = sequenceId
+    if self.sparseLinks:
+      writeSparseOutput(outputs["dataOut"], nonZeros)
+    else:
+      outputs["dataOut"][:] = 0
+      outputs["dataOut"][nonZeros] = 1
 
     if self.verbosity > 1:
       print "RawSensor outputs:"
       print "sequenceIdOut: ", outputs["sequenceIdOut"]
       print "resetOut: ", outputs["resetOut"]
-      print "dataOut: ", outputs["dataOut"].nonzero()[0]
+      print "dataOut: ", getLinkCells(outputs["dataOut"], self.sparseLinks)
 
 
   def addDataToQueue(self, nonZeros, reset, sequenceId):
@@ -154,6 +172,46 @@ class RawSensor(PyRegion):
     })
 
 
+  def addBatchToQueue(self, indices, offsets, resets=None, sequenceIds=None):
+    """
+    Add a batch of records to the sensor's internal queue. Record i has the
+    non-zero elements indices[offsets[i]:offsets[i+1]]. The batch is dequeued
+    one record per call to compute, in FIFO order with the other queued items.
+
+    The arrays are not copied, so they can be memory-mapped, e.g. with
+    numpy.load(filename, mmap_mode="r").
+
+    @param indices (numpy array)
+    The non-zero elements of all records, concatenated
+
+    @param offsets (numpy array)
+    Where each record starts in 'indices', followed by len(indices). Its size
+    is the number of records + 1.
+
+    @param resets (numpy array or None)
+    The 0/1 reset flag of each record. If None, no record is a reset.
+
+    @param sequenceIds (numpy array or None)
+    The sequence ID of each record. If None, all IDs are 0.
+    """
+    numRecords = len(offsets) - 1
+    if numRecords <= 0:
+      return
+
+    for values in (resets, sequenceIds):
+      if values is not None and len(values) != numRecords:
+        raise ValueError("Expected {} values, got {}".format(numRecords,
+                                                             len(values)))
+
+    self.queue.appendleft({
+      "indices": indices,
+      "offsets": offsets,
+      "resets": resets,
+      "sequenceIds": sequenceIds,
+      "cursor": 0,
+    })
+
+
   def addResetToQueue(self, sequenceId):
     """
     Add a reset signal to the sensor's internal queue. Calls to compute
@@ -169,6 +227,38 @@ class RawSensor(PyRegion):
     })
 
 
+  def _nextRecord(self):
+    """
+    Dequeue the next record.
+
+    @return (tuple)
+    The non-zero elements, the reset flag and the sequence ID
+    """
+    if len(self.queue) == 0:
+      raise Exception("RawSensor: No data to encode: queue is empty ")
+
+    # Take the top element of the data queue
+    data = self.queue[-1]
+
+    if "offsets" not in data:
+      self.queue.pop()
+      return data["nonZeros"], data["reset"], data["sequenceId"]
+
+    i = data["cursor"]
+    offsets = data["offsets"]
+    nonZeros = np.asarray(data["indices"][offsets[i]:offsets[i + 1]],
+                          dtype="uint32")
+    reset = (data["resets"][i] if data["resets"] is not None else 0)
+    sequenceId = (data["sequenceIds"][i] if data["sequenceIds"] is not None
+                  else 0)
+
+    data["cursor"] = i + 1
+    if data["cursor"] == len(offsets) - 1:
+      self.queue.pop()
+
+    return nonZeros, reset, sequenceId
+
+
   def getOutputElementCount(self, name):
     """Returns the width of dataOut."""
 
@@ -177,6 +267,8 @@ class RawSensor(PyRegion):
       return 1
 
     elif name == "dataOut":
+      if self.sparseLinks:
+        return sparseLinkWidth(self.outputWidth)
       return self.outputWidth
 
     else:
@@ -25,14 +25,15 @@ Apical Temporal Memory pair mixin that enables detailed monitoring of history.
 
 from collections import defaultdict
 
-import copy
-
+import numpy
 from prettytable import PrettyTable
 
 from nupic.algorithms.monitor_mixin.metric import Metric
 from nupic.algorithms.monitor_mixin.monitor_mixin_base import MonitorMixinBase
-from nupic.algorithms.monitor_mixin.trace import (IndicesTrace, CountsTrace,
-                                                BoolsTrace, StringsTrace)
+
+from htmresearch.support.columnar_trace import (
+  ColumnarIndicesTrace, ColumnarCountsTrace, ColumnarBoolsTrace,
+  ColumnarStringsTrace, createMetricFromTrace)
 
 
 
@@ -40,9 +41,20 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
   """
   Mixin for Apical TemporalMemory + pairs that stores a detailed history, for
   inspection and debugging.
+
+  The history is stored in columnar traces. Pass mmTraceLength to keep only
+  the most recent time steps, and mmTraceDirectory to keep the traces in
+  memory-mapped files in that directory.
+
+  The transition traces and the cells of each sequence are updated as each
+  time step arrives, so the metrics can be polled during long runs.
   """
 
   def __init__(self, *args, **kwargs):
+    self._mmTraceOptions = {
+      "maxLength": kwargs.pop("mmTraceLength", None),
+      "directory": kwargs.pop("mmTraceDirectory", None),
+    }
     super(ApicalTMPairMonitorMixin, self).__init__(*args, **kwargs)
 
     self._mmResetActive = True  # First iteration is always a reset
@@ -108,7 +120,6 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
     """
     @return (Trace) Trace of predicted => active cells
     """
-    self._mmComputeTransitionTraces()
     return self._mmTraces["predictedActiveCells"]
 
 
@@ -116,7 +127,6 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
     """
     @return (Trace) Trace of predicted => inactive cells
     """
-    self._mmComputeTransitionTraces()
     return self._mmTraces["predictedInactiveCells"]
 
 
@@ -124,7 +134,6 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
     """
     @return (Trace) Trace of predicted => active columns
     """
-    self._mmComputeTransitionTraces()
     return self._mmTraces["predictedActiveColumns"]
 
 
@@ -132,7 +141,6 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
     """
     @return (Trace) Trace of predicted => inactive columns
     """
-    self._mmComputeTransitionTraces()
     return self._mmTraces["predictedInactiveColumns"]
 
 
@@ -140,7 +148,6 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
     """
     @return (Trace) Trace of unpredicted => active columns
     """
-    self._mmComputeTransitionTraces()
     return self._mmTraces["unpredictedActiveColumns"]
 
 
@@ -153,8 +160,8 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
 
     @return (Metric) Metric over trace excluding resets
     """
-    return Metric.createFromTrace(trace.makeCountsTrace(),
-                                  excludeResets=self.mmGetTraceResets())
+    return createMetricFromTrace(trace.makeCountsTrace(),
+                                 excludeResets=self.mmGetTraceResets())
 
 
   def mmGetMetricSequencesPredictedActiveCellsPerColumn(self):
@@ -163,18 +170,9 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
 
     @return (Metric) metric
     """
-    self._mmComputeTransitionTraces()
-
-    numCellsPerColumn = []
-
-    for predictedActiveCells in (
-        self._mmData["predictedActiveCellsForSequence"].values()):
-      cellsForColumn = self.mapCellsToColumns(predictedActiveCells)
-      numCellsPerColumn += [len(x) for x in cellsForColumn.values()]
-
     return Metric(self,
                   "# predicted => active cells per column for each sequence",
-                  numCellsPerColumn)
+                  self._mmData["numCellsForSequenceColumn"].values())
 
 
   def mmGetMetricSequencesPredictedActiveCellsShared(self):
@@ -185,18 +183,9 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
 
     @return (Metric) metric
     """
-    self._mmComputeTransitionTraces()
-
-    numSequencesForCell = defaultdict(lambda: 0)
-
-    for predictedActiveCells in (
-          self._mmData["predictedActiveCellsForSequence"].values()):
-      for cell in predictedActiveCells:
-        numSequencesForCell[cell] += 1
-
     return Metric(self,
                   "# sequences each predicted => active cells appears in",
-                  numSequencesForCell.values())
+                  self._mmData["numSequencesForCell"].values())
 
 
   def mmPrettyPrintConnections(self):
@@ -255,7 +244,6 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
 
     @return (string) Pretty-printed text
     """
-    self._mmComputeTransitionTraces()
     table = PrettyTable(["Pattern", "Column", "predicted=>active cells"])
 
     for sequenceLabel, predictedActiveCells in (
@@ -271,9 +259,9 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
   # Helper methods
   # ==============================
 
-  def _mmComputeTransitionTraces(self):
+  def _mmAppendTransitions(self):
     """
-    Computes the transition traces, if necessary.
+    Appends the last time step to the transition traces.
 
     Transition traces are the following:
 
@@ -283,56 +271,72 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
         predicted => inactive columns
         unpredicted => active columns
     """
-    if not self._mmTransitionTracesStale:
-      return
+    predictedCells = self._mmTraces["predictedCells"].data.stepIndices(-1)
+    activeColumns = self._mmTraces["activeColumns"].data.stepIndices(-1)
 
-    self._mmData["predictedActiveCellsForSequence"] = defaultdict(set)
+    predictedColumns = predictedCells // self.getCellsPerColumn()
+    correct = numpy.in1d(predictedColumns, activeColumns)
+    predictedActiveColumns = numpy.unique(predictedColumns[correct])
 
-    self._mmTraces["predictedActiveCells"] = IndicesTrace(self,
-      "predicted => active cells (correct)")
-    self._mmTraces["predictedInactiveCells"] = IndicesTrace(self,
-      "predicted => inactive cells (extra)")
-    self._mmTraces["predictedActiveColumns"] = IndicesTrace(self,
-      "predicted => active columns (correct)")
-    self._mmTraces["predictedInactiveColumns"] = IndicesTrace(self,
-      "predicted => inactive columns (extra)")
-    self._mmTraces["unpredictedActiveColumns"] = IndicesTrace(self,
-      "unpredicted => active columns (bursting)")
-
-    predictedCellsTrace = self._mmTraces["predictedCells"]
-
-    for i, activeColumns in enumerate(self.mmGetTraceActiveColumns().data):
-      predictedActiveCells = set()
-      predictedInactiveCells = set()
-      predictedActiveColumns = set()
-      predictedInactiveColumns = set()
-
-      for predictedCell in predictedCellsTrace.data[i]:
-        predictedColumn = self.columnForCell(predictedCell)
-
-        if predictedColumn  in activeColumns:
-          predictedActiveCells.add(predictedCell)
-          predictedActiveColumns.add(predictedColumn)
-
-          sequenceLabel = self.mmGetTraceSequenceLabels().data[i]
-          if sequenceLabel is not None:
-            self._mmData["predictedActiveCellsForSequence"][sequenceLabel].add(
-              predictedCell)
-        else:
-          predictedInactiveCells.add(predictedCell)
-          predictedInactiveColumns.add(predictedColumn)
-
-      unpredictedActiveColumns = set(activeColumns) - set(predictedActiveColumns)
-
-      self._mmTraces["predictedActiveCells"].data.append(predictedActiveCells)
-      self._mmTraces["predictedInactiveCells"].data.append(predictedInactiveCells)
-      self._mmTraces["predictedActiveColumns"].data.append(predictedActiveColumns)
-      self._mmTraces["predictedInactiveColumns"].data.append(
-        predictedInactiveColumns)
-      self._mmTraces["unpredictedActiveColumns"].data.append(
-        unpredictedActiveColumns)
-
-    self._mmTransitionTracesStale = False
+    self._mmTraces["predictedActiveCells"].data.append(
+      predictedCells[correct])
+    self._mmTraces["predictedInactiveCells"].data.append(
+      predictedCells[~correct])
+    self._mmTraces["predictedActiveColumns"].data.append(
+      predictedActiveColumns)
+    self._mmTraces["predictedInactiveColumns"].data.append(
+      predictedColumns[~correct])
+    self._mmTraces["unpredictedActiveColumns"].data.append(
+      numpy.setdiff1d(activeColumns, predictedActiveColumns))
+
+
+  def _mmUpdateSequenceCells(self, sequenceLabel, predictedActiveCells,
+                             delta):
+    """
+    Adds or removes the predicted => active cells of a time step from the
+    cells of its sequence.
+
+    A cell belongs to a sequence while it's predicted => active in at least one
+    of the time steps in the history with that sequence label.
+
+    @param sequenceLabel        (string) Sequence label of the time step
+    @param predictedActiveCells (numpy.ndarray) Its predicted => active cells
+    @param delta                (int) 1 to add the time step, -1 to remove it
+    """
+    if sequenceLabel is None:
+      return
+
+    cellsForSequence = self._mmData["predictedActiveCellsForSequence"]
+    numStepsForSequenceCell = self._mmData["numStepsForSequenceCell"]
+    numCellsForSequenceColumn = self._mmData["numCellsForSequenceColumn"]
+    numSequencesForCell = self._mmData["numSequencesForCell"]
+    cellsPerColumn = self.getCellsPerColumn()
+
+    for cell in predictedActiveCells.tolist():
+      key = (sequenceLabel, cell)
+      numStepsForSequenceCell[key] += delta
+      numSteps = numStepsForSequenceCell[key]
+
+      if numSteps == 1 and delta > 0:
+        change = 1
+        cellsForSequence[sequenceLabel].add(cell)
+      elif numSteps == 0:
+        change = -1
+        del numStepsForSequenceCell[key]
+        cellsForSequence[sequenceLabel].discard(cell)
+        if not cellsForSequence[sequenceLabel]:
+          del cellsForSequence[sequenceLabel]
+      else:
+        continue
+
+      column = (sequenceLabel, cell // cellsPerColumn)
+      numCellsForSequenceColumn[column] += change
+      if numCellsForSequenceColumn[column] == 0:
+        del numCellsForSequenceColumn[column]
+
+      numSequencesForCell[cell] += change
+      if numSequencesForCell[cell] == 0:
+        del numSequencesForCell[cell]
 
 
   # ==============================
@@ -351,9 +355,15 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
       activeColumns, basalInput, apicalInput, basalGrowthCandidates,
       apicalGrowthCandidates, learn)
 
-    self._mmTraces["predictedCells"].data.append(
-      set(self.getPredictedCells()))
-    self._mmTraces["activeCells"].data.append(set(self.getActiveCells()))
+    # The oldest time step is about to leave the history.
+    maxLength = self._mmTraceOptions["maxLength"]
+    if maxLength and len(self._mmTraces["resets"].data) == maxLength:
+      self._mmUpdateSequenceCells(
+        self._mmTraces["sequenceLabels"].data[0],
+        self._mmTraces["predictedActiveCells"].data.stepIndices(0), -1)
+
+    self._mmTraces["predictedCells"].data.append(self.getPredictedCells())
+    self._mmTraces["activeCells"].data.append(self.getActiveCells())
     self._mmTraces["activeColumns"].data.append(activeColumns)
     self._mmTraces["numBasalSegments"].data.append(
       self.basalConnections.numSegments())
@@ -367,7 +377,10 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
     self._mmTraces["resets"].data.append(self._mmResetActive)
     self._mmResetActive = False
 
-    self._mmTransitionTracesStale = True
+    self._mmAppendTransitions()
+    self._mmUpdateSequenceCells(
+      sequenceLabel,
+      self._mmTraces["predictedActiveCells"].data.stepIndices(-1), 1)
 
 
   def reset(self):
@@ -401,9 +414,9 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
 
   def mmGetDefaultMetrics(self, verbosity=1):
     resetsTrace = self.mmGetTraceResets()
-    return ([Metric.createFromTrace(trace, excludeResets=resetsTrace)
+    return ([createMetricFromTrace(trace, excludeResets=resetsTrace)
               for trace in self.mmGetDefaultTraces()[:-3]] +
-            [Metric.createFromTrace(trace)
+            [createMetricFromTrace(trace)
               for trace in self.mmGetDefaultTraces()[-3:-1]] +
             [self.mmGetMetricSequencesPredictedActiveCellsPerColumn(),
              self.mmGetMetricSequencesPredictedActiveCellsShared()])
@@ -412,16 +425,40 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
   def mmClearHistory(self):
     super(ApicalTMPairMonitorMixin, self).mmClearHistory()
 
-    self._mmTraces["activeColumns"] = IndicesTrace(self, "active columns")
-    self._mmTraces["activeCells"] = IndicesTrace(self, "active cells")
-    self._mmTraces["predictedCells"] = IndicesTrace(self, "predicted cells")
-    self._mmTraces["numBasalSegments"] = CountsTrace(self, "# basal segments")
-    self._mmTraces["numBasalSynapses"] = CountsTrace(self, "# basal synapses")
-    self._mmTraces["numApicalSegments"] = CountsTrace(self, "# apical segments")
-    self._mmTraces["numApicalSynapses"] = CountsTrace(self, "# apical synapses")
-    self._mmTraces["sequenceLabels"] = StringsTrace(self, "sequence labels")
-    self._mmTraces["resets"] = BoolsTrace(self, "resets")
-    self._mmTransitionTracesStale = True
+    options = self._mmTraceOptions
+    self._mmTraces["activeColumns"] = ColumnarIndicesTrace(
+      self, "active columns", **options)
+    self._mmTraces["activeCells"] = ColumnarIndicesTrace(
+      self, "active cells", **options)
+    self._mmTraces["predictedCells"] = ColumnarIndicesTrace(
+      self, "predicted cells", **options)
+    self._mmTraces["numBasalSegments"] = ColumnarCountsTrace(
+      self, "# basal segments", **options)
+    self._mmTraces["numBasalSynapses"] = ColumnarCountsTrace(
+      self, "# basal synapses", **options)
+    self._mmTraces["numApicalSegments"] = ColumnarCountsTrace(
+      self, "# apical segments", **options)
+    self._mmTraces["numApicalSynapses"] = ColumnarCountsTrace(
+      self, "# apical synapses", **options)
+    self._mmTraces["sequenceLabels"] = ColumnarStringsTrace(
+      self, "sequence labels", **options)
+    self._mmTraces["resets"] = ColumnarBoolsTrace(self, "resets", **options)
+
+    self._mmTraces["predictedActiveCells"] = ColumnarIndicesTrace(
+      self, "predicted => active cells (correct)", **options)
+    self._mmTraces["predictedInactiveCells"] = ColumnarIndicesTrace(
+      self, "predicted => inactive cells (extra)", **options)
+    self._mmTraces["predictedActiveColumns"] = ColumnarIndicesTrace(
+      self, "predicted => active columns (correct)", **options)
+    self._mmTraces["predictedInactiveColumns"] = ColumnarIndicesTrace(
+      self, "predicted => inactive columns (extra)", **options)
+    self._mmTraces["unpredictedActiveColumns"] = ColumnarIndicesTrace(
+      self, "unpredicted => active columns (bursting)", **options)
+
+    self._mmData["predictedActiveCellsForSequence"] = defaultdict(set)
+    self._mmData["numStepsForSequenceCell"] = defaultdict(int)
+    self._mmData["numCellsForSequenceColumn"] = defaultdict(int)
+    self._mmData["numSequencesForCell"] = defaultdict(int)
 
 
   def mmGetCellActivityPlot(self, title="", showReset=False,
@@ -444,12 +481,8 @@ class ApicalTMPairMonitorMixin(MonitorMixinBase):
 
     @return (Plot) plot
     """
-    if activityType == "predictedActiveCells":
-      self._mmComputeTransitionTraces()
-
-    cellTrace = copy.deepcopy(self._mmTraces[activityType].data)
-    for i in xrange(len(cellTrace)):
-      cellTrace[i] = self.getCellIndices(cellTrace[i])
+    cellTrace = [self.getCellIndices(cells)
+                 for cells in self._mmTraces[activityType].data]
 
     return self.mmGetCellTracePlot(cellTrace, self.numberOfCells(),
                                    activityType, title, showReset,
@@ -0,0 +1,502 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Monitor mixin traces that store their history in numpy arrays rather than in
+one Python object per time step, so that monitoring can stay enabled in long
+runs.
+
+The indices of all time steps (e.g. the active cells) are concatenated into one
+uint32 array, with an array of offsets marking where each time step starts.
+Scalars and labels are stored in one array per trace. Every trace can be
+limited to its most recent time steps, and its arrays can be kept in
+memory-mapped files.
+
+The data of these traces still behaves like the lists of the nupic traces: it
+can be appended to, indexed, sliced and iterated, and the indices of a time
+step are returned as a set. The arrays are available for vectorized
+computations, such as the overlaps between time steps below.
+"""
+
+import tempfile
+
+import numpy
+import scipy.sparse
+
+from nupic.algorithms.monitor_mixin.metric import Metric
+from nupic.algorithms.monitor_mixin.trace import (IndicesTrace, CountsTrace,
+                                                  BoolsTrace, StringsTrace,
+                                                  MetricsTrace)
+
+
+
+class GrowingArray(object):
+  """
+  A 1D array with amortized O(1) appends. It is held in memory, or in a
+  memory-mapped temporary file in a directory.
+  """
+
+  INITIAL_CAPACITY = 64
+
+  def __init__(self, dtype, directory=None):
+    """
+    @param dtype     (numpy.dtype) Type of the elements
+    @param directory (string) If not None, keep the elements in a file in this
+                     directory. Object arrays are always held in memory.
+    """
+    self.dtype = numpy.dtype(dtype)
+    self.size = 0
+
+    self._file = None
+    if directory is not None and not self.dtype.hasobject:
+      # The file is deleted when it's closed.
+      self._file = tempfile.TemporaryFile(dir=directory)
+
+    self._array = numpy.empty(0, dtype=self.dtype)
+    self._reserve(self.INITIAL_CAPACITY)
+
+
+  def values(self):
+    """
+    @return (numpy.ndarray) View of the elements
+    """
+    return self._array[:self.size]
+
+
+  def append(self, value):
+    self._reserve(self.size + 1)
+    self._array[self.size] = value
+    self.size += 1
+
+
+  def extend(self, values):
+    values = numpy.asarray(values)
+    self._reserve(self.size + len(values))
+    self._array[self.size:self.size + len(values)] = values
+    self.size += len(values)
+
+
+  def dropFirst(self, n):
+    """
+    Remove the first n elements, moving the others to the front.
+    """
+    remaining = self.size - n
+    self._array[:remaining] = self._array[n:self.size]
+    self.size = remaining
+
+
+  def _reserve(self, capacity):
+    if capacity <= len(self._array):
+      return
+
+    capacity = max(capacity, 2 * len(self._array))
+
+    if self._file is None:
+      array = numpy.empty(capacity, dtype=self.dtype)
+      array[:self.size] = self._array[:self.size]
+      self._array = array
+    else:
+      # The existing elements stay in the file when it's extended.
+      self._file.truncate(capacity * self.dtype.itemsize)
+      self._array = numpy.memmap(self._file, dtype=self.dtype, mode="r+",
+                                 shape=(capacity,))
+
+
+
+class _ColumnarData(object):
+  """
+  Base class of the data of the columnar traces: a sequence of time steps of
+  which only the last maxLength are visible.
+
+  Subclasses store each time step at a position in their arrays. The oldest
+  positions are only dropped once there are twice maxLength of them, so that
+  dropping them costs O(1) amortized per time step.
+  """
+
+  def __init__(self, maxLength=None):
+    """
+    @param maxLength (int) If not None, the number of time steps to keep
+    """
+    self.maxLength = maxLength
+
+
+  def _numStored(self):
+    raise NotImplementedError
+
+
+  def _dropFirst(self, n):
+    raise NotImplementedError
+
+
+  def _getStep(self, position):
+    raise NotImplementedError
+
+
+  def _firstVisible(self):
+    """
+    @return (int) The position of the oldest visible time step
+    """
+    if self.maxLength is None:
+      return 0
+    return max(0, self._numStored() - self.maxLength)
+
+
+  def _trim(self):
+    if (self.maxLength is not None and
+        self._numStored() >= 2 * max(self.maxLength, 1)):
+      self._dropFirst(self._numStored() - self.maxLength)
+
+
+  def __len__(self):
+    return self._numStored() - self._firstVisible()
+
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [self[j] for j in xrange(*i.indices(len(self)))]
+
+    if i < 0:
+      i += len(self)
+    if i < 0 or i >= len(self):
+      raise IndexError("time step index out of range")
+    return self._getStep(self._firstVisible() + i)
+
+
+  def __iter__(self):
+    for i in xrange(len(self)):
+      yield self[i]
+
+
+
+class ColumnarIndices(_ColumnarData):
+  """
+  The data of a ColumnarIndicesTrace: the sorted, unique indices of every time
+  step, concatenated, and the offset of each time step.
+  """
+
+  def __init__(self, maxLength=None, directory=None):
+    super(ColumnarIndices, self).__init__(maxLength)
+    self._indices = GrowingArray("uint32", directory)
+    self._offsets = GrowingArray("int64", directory)
+    self._offsets.append(0)
+
+
+  def append(self, indices):
+    """
+    Add the indices of a time step.
+
+    @param indices (iterable) Indices. Duplicates are removed.
+    """
+    if isinstance(indices, (set, frozenset)):
+      indices = numpy.fromiter(indices, dtype="int64", count=len(indices))
+    self._indices.extend(numpy.unique(numpy.asarray(indices,
+                                                    dtype="int64")))
+    self._offsets.append(self._indices.size)
+    self._trim()
+
+
+  def extend(self, indices, counts):
+    """
+    Add several time steps at once.
+
+    @param indices (numpy.ndarray) The sorted, unique indices of each time
+                   step, concatenated
+    @param counts  (numpy.ndarray) The number of indices of each time step
+    """
+    start = self._indices.size
+    self._indices.extend(indices)
+    self._offsets.extend(start + numpy.cumsum(counts))
+    self._trim()
+
+
+  def arrays(self):
+    """
+    @return (tuple) The indices of the visible time steps, concatenated, and
+            an array of len(self) + 1 offsets, starting at 0. The indices of
+            time step i are indices[offsets[i]:offsets[i + 1]].
+    """
+    offsets = self._offsets.values()[self._firstVisible():]
+    indices = self._indices.values()[offsets[0]:offsets[-1]]
+    return indices, offsets - offsets[0]
+
+
+  def counts(self):
+    """
+    @return (numpy.ndarray) The number of indices of each visible time step
+    """
+    return numpy.diff(self._offsets.values()[self._firstVisible():])
+
+
+  def timeSteps(self):
+    """
+    @return (numpy.ndarray) The time step of each of the indices returned by
+            arrays()
+    """
+    counts = self.counts()
+    return numpy.repeat(numpy.arange(len(counts)), counts)
+
+
+  def stepIndices(self, i):
+    """
+    @return (numpy.ndarray) The indices of time step i, without building a set
+    """
+    if i < 0:
+      i += len(self)
+    offsets = self._offsets.values()
+    position = self._firstVisible() + i
+    return self._indices.values()[offsets[position]:offsets[position + 1]]
+
+
+  def _numStored(self):
+    return self._offsets.size - 1
+
+
+  def _dropFirst(self, n):
+    start = self._offsets.values()[n]
+    self._indices.dropFirst(start)
+    self._offsets.dropFirst(n)
+    self._offsets.values()[:] -= start
+
+
+  def _getStep(self, position):
+    offsets = self._offsets.values()
+    return set(self._indices.values()[offsets[position]:
+                                      offsets[position + 1]].tolist())
+
+
+
+class ColumnarValues(_ColumnarData):
+  """
+  The data of the columnar traces of scalars: one element per time step.
+  """
+
+  def __init__(self, dtype, maxLength=None, directory=None):
+    super(ColumnarValues, self).__init__(maxLength)
+    self._values = GrowingArray(dtype, directory)
+
+
+  @classmethod
+  def fromArray(cls, values, maxLength=None):
+    data = cls(numpy.asarray(values).dtype, maxLength)
+    data.extend(values)
+    return data
+
+
+  def append(self, value):
+    self._values.append(value)
+    self._trim()
+
+
+  def extend(self, values):
+    self._values.extend(values)
+    self._trim()
+
+
+  def array(self):
+    """
+    @return (numpy.ndarray) The values of the visible time steps
+    """
+    return self._values.values()[self._firstVisible():]
+
+
+  def _numStored(self):
+    return self._values.size
+
+
+  def _dropFirst(self, n):
+    self._values.dropFirst(n)
+
+
+  def _getStep(self, position):
+    return self._values.values()[position]
+
+
+
+class ColumnarLabels(ColumnarValues):
+  """
+  The data of a ColumnarStringsTrace: a code per time step, and the list of
+  distinct labels. None has the code -1.
+  """
+
+  def __init__(self, maxLength=None, directory=None):
+    super(ColumnarLabels, self).__init__("int32", maxLength, directory)
+    self.labels = []
+    self._codes = {}
+
+
+  def append(self, label):
+    super(ColumnarLabels, self).append(self.codeForLabel(label))
+
+
+  def codeForLabel(self, label):
+    """
+    @return (int) The code of a label, adding it if it's new
+    """
+    if label is None:
+      return -1
+    code = self._codes.get(label)
+    if code is None:
+      code = len(self.labels)
+      self._codes[label] = code
+      self.labels.append(label)
+    return code
+
+
+  def _getStep(self, position):
+    code = self._values.values()[position]
+    return self.labels[code] if code >= 0 else None
+
+
+
+class ColumnarIndicesTrace(IndicesTrace):
+  """
+  IndicesTrace that stores its data in ColumnarIndices.
+  """
+
+  def __init__(self, monitor, title, maxLength=None, directory=None):
+    super(ColumnarIndicesTrace, self).__init__(monitor, title)
+    self.data = ColumnarIndices(maxLength, directory)
+
+
+  def makeCountsTrace(self):
+    trace = ColumnarCountsTrace(self.monitor, "# {0}".format(self.title))
+    trace.data = ColumnarValues.fromArray(self.data.counts())
+    return trace
+
+
+  def makeCumCountsTrace(self):
+    trace = ColumnarCountsTrace(self.monitor,
+                                "# (cumulative) {0}".format(self.title))
+    trace.data = ColumnarValues.fromArray(numpy.cumsum(self.data.counts()))
+    return trace
+
+
+
+class ColumnarCountsTrace(CountsTrace):
+  """
+  CountsTrace that stores its data in ColumnarValues.
+  """
+
+  def __init__(self, monitor, title, maxLength=None, directory=None):
+    super(ColumnarCountsTrace, self).__init__(monitor, title)
+    self.data = ColumnarValues("int64", maxLength, directory)
+
+
+
+class ColumnarBoolsTrace(BoolsTrace):
+  """
+  BoolsTrace that stores its data in ColumnarValues.
+  """
+
+  def __init__(self, monitor, title, maxLength=None, directory=None):
+    super(ColumnarBoolsTrace, self).__init__(monitor, title)
+    self.data = ColumnarValues("bool", maxLength, directory)
+
+
+
+class ColumnarStringsTrace(StringsTrace):
+  """
+  StringsTrace that stores its data in ColumnarLabels.
+  """
+
+  def __init__(self, monitor, title, maxLength=None, directory=None):
+    super(ColumnarStringsTrace, self).__init__(monitor, title)
+    self.data = ColumnarLabels(maxLength, directory)
+
+
+
+class ColumnarMetricsTrace(MetricsTrace):
+  """
+  MetricsTrace that keeps only its most recent time steps. The metrics are
+  always held in memory.
+  """
+
+  def __init__(self, monitor, title, maxLength=None, directory=None):
+    super(ColumnarMetricsTrace, self).__init__(monitor, title)
+    self.data = ColumnarValues(object, maxLength)
+
+
+
+def traceArray(trace):
+  """
+  @param trace (Trace) Trace of scalars, columnar or not
+
+  @return (numpy.ndarray) The data of the trace
+  """
+  if isinstance(trace.data, ColumnarValues):
+    return trace.data.array()
+  return numpy.asarray(list(trace.data))
+
+
+
+def createMetricFromTrace(trace, excludeResets=None):
+  """
+  Vectorized Metric.createFromTrace.
+
+  @param trace         (Trace) Trace of scalars
+  @param excludeResets (BoolsTrace) If not None, leave out the time steps that
+                       follow a reset
+
+  @return (Metric) Metric over the trace
+  """
+  data = traceArray(trace)
+  if excludeResets is not None:
+    data = data[~traceArray(excludeResets).astype("bool")]
+  return Metric(trace.monitor, trace.title, data)
+
+
+
+def computeOverlapMatrix(data, numBits):
+  """
+  @param data    (ColumnarIndices) Indices of each time step
+  @param numBits (int) Upper bound of the indices
+
+  @return (numpy.ndarray) Matrix of the number of indices that each pair of
+          time steps have in common
+  """
+  indices, offsets = data.arrays()
+  steps = scipy.sparse.csr_matrix(
+    (numpy.ones(len(indices), dtype="int64"), indices, offsets),
+    shape=(len(offsets) - 1, numBits))
+  return steps.dot(steps.T).toarray()
+
+
+
+def labeledPairs(sequenceLabelsTrace, resetsTrace):
+  """
+  Find the pairs of time steps i > j that both have a sequence label and don't
+  follow a reset, ordered by i and then j.
+
+  @param sequenceLabelsTrace (ColumnarStringsTrace) Trace of sequence labels
+  @param resetsTrace         (BoolsTrace) Trace of resets
+
+  @return (tuple) The arrays of i and j, and whether each pair of time steps
+          has the same label
+  """
+  codes = sequenceLabelsTrace.data.array()
+  labeled = (codes >= 0) & ~traceArray(resetsTrace).astype("bool")
+
+  rows, columns = numpy.tril_indices(len(codes), -1)
+  pairs = labeled[rows] & labeled[columns]
+  rows = rows[pairs]
+  columns = columns[pairs]
+
+  return rows, columns, codes[rows] == codes[columns]
@@ -20,26 +20,96 @@
 #############################################################################
 
 from ConfigParser import ConfigParser
+from collections import deque
 from multiprocessing import Process, Pool, cpu_count
 from numpy import *
-import json, os, sys, time, itertools, re, optparse, types
+import json, os, sys, time, itertools, re, optparse, types, shutil
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 def mp_runrep(args):
     """ Helper function to allow multiprocessing support. """
     return PyExperimentSuite.run_rep(*args)
 
+def mp_runrep_pinned(args, cpu):
+    """ Helper function running one repetition in a worker process, pinned
+        to the given cpu unless it is None.
+    """
+    if cpu is not None:
+        pin_to_cpu(cpu)
+    mp_runrep(args)
+
+def available_cpus():
+    """ Helper function returning the cpus the current process can run on. """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    if psutil is not None:
+        return sorted(psutil.Process().cpu_affinity())
+    return range(cpu_count())
+
+def pin_to_cpu(cpu):
+    """ Helper function to restrict the current process to one cpu. """
+    try:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, [cpu])
+        elif psutil is not None:
+            psutil.Process().cpu_affinity([cpu])
+        else:
+            print 'Warning: cpu pinning requires psutil, running unpinned'
+    except Exception as e:
+        print 'Warning: could not pin to cpu %i (%s), running unpinned'%(cpu, e)
+
+def index_name(logname):
+    """ Helper function returning the index file of a log file. """
+    return os.path.splitext(logname)[0] + '.idx'
+
+def write_index(logname, iterations, logsize):
+    """ Helper function to record the number of completed iterations of a
+        repetition and the size of its log file after them.
+    """
+    indexname = index_name(logname)
+    with open(indexname + '.tmp', 'w') as f:
+        json.dump({'iterations': iterations, 'logsize': logsize}, f)
+    os.rename(indexname + '.tmp', indexname)
+
+def completed_iterations(logname):
+    """ Helper function returning the number of completed iterations of a
+        repetition and the size of its log file after them. The index file
+        is used if it exists, otherwise (runs started before index files
+        existed) the complete lines of the log are counted.
+    """
+    if not os.path.exists(logname):
+        return 0, 0
+    indexname = index_name(logname)
+    if os.path.exists(indexname):
+        with open(indexname, 'r') as f:
+            index = json.load(f)
+        return index['iterations'], index['logsize']
+    with open(logname, 'r') as f:
+        contents = f.read()
+    logsize = contents.rfind('\n') + 1
+    return contents.count('\n'), logsize
+
+def format_seconds(seconds):
+    """ Helper function to format a duration as h:mm:ss. """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%i:%02i:%02i'%(hours, minutes, seconds)
+
+def column_store_name(logname):
+    """ Helper function returning the column store directory of a log file. """
+    return os.path.splitext(logname)[0] + '.columns'
+
 def progress(params, rep):
     """ Helper function to calculate the progress made on one experiment. """
     name = params['name']
     fullpath = os.path.join(params['path'], params['name'])
     logname = os.path.join(fullpath, '%i.log'%rep)
-    if os.path.exists(logname):
-        logfile = open(logname, 'r')
-        lines = logfile.readlines()
-        logfile.close()
-        return int(100 * len(lines) / params['iterations'])
-    else: 
-        return 0
+    iterations, _ = completed_iterations(logname)
+    return int(100 * iterations / params['iterations'])
 
 def convert_param_to_dirname(param):
     """ Helper function to convert a parameter value to a valid directory name. """
@@ -49,6 +119,84 @@ def convert_param_to_dirname(param):
         return re.sub("0+$", '0', '%f'%param)
 
 
+class ColumnStore(object):
+    """ append-only columnar storage for the iteration dictionaries of one
+        repetition. each tag is stored in its own file with one json value
+        per iteration, so queries only read the tags they need. a small index
+        holds the number of rows and the size of each column file; anything
+        written after the last index update is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.indexname = os.path.join(path, 'index.json')
+        if os.path.exists(self.indexname):
+            with open(self.indexname, 'r') as f:
+                index = json.load(f)
+            self.rows = index['rows']
+            self.columns = index['columns']
+        else:
+            self.rows = 0
+            self.columns = {}
+
+    def append(self, dic):
+        """ appends one iteration dictionary. tags that are missing from it
+            get a null value, and new tags are padded with nulls for the
+            previous iterations.
+        """
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+        for tag in dic:
+            if tag not in self.columns:
+                filename = '%i.col'%len(self.columns)
+                with open(os.path.join(self.path, filename), 'w') as f:
+                    f.write('null\n' * self.rows)
+                    self.columns[tag] = {'file': filename, 'size': f.tell()}
+
+        for tag, column in self.columns.iteritems():
+            with open(os.path.join(self.path, column['file']), 'a') as f:
+                json.dump(dic.get(tag), f)
+                f.write('\n')
+                column['size'] = f.tell()
+
+        self.rows += 1
+        with open(self.indexname + '.tmp', 'w') as f:
+            json.dump({'rows': self.rows, 'columns': self.columns}, f)
+        os.rename(self.indexname + '.tmp', self.indexname)
+
+    def truncate(self):
+        """ removes anything written to the columns after the last index
+            update, e.g. by a crashed run.
+        """
+        for column in self.columns.itervalues():
+            with open(os.path.join(self.path, column['file']), 'r+') as f:
+                f.truncate(column['size'])
+
+    def clear(self):
+        """ removes all the rows. """
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        self.rows = 0
+        self.columns = {}
+
+    def tags(self):
+        return self.columns.keys()
+
+    def read(self, tags):
+        """ returns a dictionary with the list of values of each tag. """
+        results = {}
+        for tag in tags:
+            if tag not in self.columns:
+                results[tag] = [None] * self.rows
+                continue
+            column = self.columns[tag]
+            with open(os.path.join(self.path, column['file']), 'r') as f:
+                lines = f.read(column['size']).splitlines()
+            results[tag] = json.loads('[' + ','.join(lines) + ']')
+        return results
+
+
 class PyExperimentSuite(object):
     
     # change this in subclass, if you support restoring state on iteration level
@@ -82,6 +230,12 @@ class PyExperimentSuite(object):
         optparser.add_option('-p', '--progress',
             action='store_true', dest='progress', default=False, 
             help="like browse, but only shows name and progress bar")
+        optparser.add_option('-r', '--retries',
+            action='store', dest='retries', type='int', default=1,
+            help="number of times a failed or crashed repetition is restarted, default is 1")
+        optparser.add_option('--pin',
+            action='store_true', dest='pin', default=False,
+            help="pin each worker process to its own cpu")
 
         options, args = optparser.parse_args()
         self.options = options
@@ -188,38 +342,48 @@ class PyExperimentSuite(object):
         if tags != 'all' and not hasattr(tags, '__iter__'):
             tags = [tags] 
         
-        results = {}
-        logfile = os.path.join(exp, '%i.log'%rep)
-        try:
-            f = open(logfile)
-        except IOError:
-            if len(tags) == 1:
-                return []
-            else:
-                return {}
-
-        for line in f:
-            dic = json.loads(line)
-            for tag in tags:
-              if not tag in results:
-                results[tag] = []
-
-              if tag in dic:
-                results[tag].append(dic[tag])
-              else:
-                results[tag].append(None)
-                            
-        f.close()
+        results = self.read_history(exp, rep, tags)
         if len(results) == 0:
             if len(tags) == 1:
                 return []
             else:
                 return {}
             # raise ValueError('tag(s) not found: %s'%str(tags))
-        if len(tags) == 1:
+        if tags != 'all' and len(tags) == 1:
             return results[results.keys()[0]]
         else:
             return results
+
+    def read_history(self, exp, rep, tags):
+        """ returns a dictionary with the history of each tag (a list of tags
+            or 'all') for one repetition. only the requested columns are read 
+            from the column store. runs without a column store, or whose
+            column store doesn't match the log's index (e.g. because the log
+            was deleted or rewritten), are read from their json log file.
+        """
+        logfile = os.path.join(exp, '%i.log'%rep)
+        store = ColumnStore(column_store_name(logfile))
+        if (store.rows > 0 and os.path.exists(logfile) and
+            os.path.exists(index_name(logfile))):
+            iterations, logsize = completed_iterations(logfile)
+            if (iterations == store.rows and
+                logsize == os.path.getsize(logfile)):
+                return store.read(store.tags() if tags == 'all' else tags)
+
+        try:
+            f = open(logfile)
+        except IOError:
+            return {}
+
+        dics = [json.loads(line) for line in f]
+        f.close()
+        if tags == 'all':
+            tags = sorted(set(tag for dic in dics for tag in dic))
+
+        results = {}
+        for tag in tags:
+            results[tag] = [dic.get(tag) for dic in dics]
+        return results
     
     
     def get_history_tags(self, exp, rep=0):
@@ -323,16 +487,20 @@ class PyExperimentSuite(object):
         if not hasattr(tags, '__iter__'):
             tags = [tags]
          
+        # read the requested tags of each repetition once
+        repetitions = [self.read_history(exp, i, tags)
+                       for i in range(params['repetitions'])]
+
         results = {}
         for tag in tags:
             # get all histories
             histories = zeros((params['repetitions'], params['iterations']))
             skipped = []
             for i in range(params['repetitions']):
+                h = repetitions[i].get(tag, [])
                 try:
-                    histories[i, :] = self.get_history(exp, i, tag)
+                    histories[i, :] = h
                 except ValueError:
-                    h = self.get_history(exp, i, tag)
                     if len(h) == 0:
                         # history not existent, skip it
                         print('warning: history %i has length 0 (expected: %i). it will be skipped.'%(i, params['iterations'])) 
@@ -382,16 +550,20 @@ class PyExperimentSuite(object):
         if not hasattr(tags, '__iter__'):
             tags = [tags]
 
+        # read the requested tags of each repetition once
+        repetitions = [self.read_history(exp, i, tags)
+                       for i in range(params['repetitions'])]
+
         results = {}
         for tag in tags:
             # get all histories
             histories = zeros((params['repetitions'], params['iterations']))
             skipped = []
             for i in range(params['repetitions']):
+                h = repetitions[i].get(tag, [])
                 try:
-                    histories[i, :] = self.get_history(exp, i, tag)
+                    histories[i, :] = h
                 except ValueError:
-                    h = self.get_history(exp, i, tag)
                     if len(h) == 0:
                         # history not existent, skip it
                         print(
@@ -540,9 +712,14 @@ class PyExperimentSuite(object):
         fullpath = os.path.join(params['path'], params['name'])
         self.mkdir(fullpath)
 
-        # delete old histories if --del flag is active
+        # delete old histories and their column stores if --del flag is active
         if delete and os.path.exists(fullpath):
-            os.system('rm %s/*' % fullpath)
+            for filename in os.listdir(fullpath):
+                path = os.path.join(fullpath, filename)
+                if os.path.isfile(path):
+                    os.remove(path)
+                elif filename.endswith('.columns'):
+                    shutil.rmtree(path)
      
         # write a config file for this single exp. in the folder
         self.write_config_file(params, fullpath)
@@ -598,11 +775,72 @@ class PyExperimentSuite(object):
             for e in explist:
                 mp_runrep(e)
         else:
-            # create worker processes    
-            pool = Pool(processes=self.options.ncores)
-            pool.map(mp_runrep, explist)
+            return self.schedule(explist)
         
         return True        
+
+
+    def schedule(self, explist):
+        """ runs each repetition of explist in its own worker process, with at
+            most ncores processes at a time, so a slow repetition never holds
+            back others. a repetition whose worker fails or crashes is 
+            restarted (and resumed, if restore_supported) up to 
+            options.retries times. prints the progress and an estimate of the 
+            remaining time whenever a repetition finishes. returns False if
+            some repetitions could not be completed.
+        """
+        ncores = self.options.ncores
+        retries = getattr(self.options, 'retries', 1)
+        pin = getattr(self.options, 'pin', False)
+
+        pending = deque((e, 0) for e in explist)
+        running = {}
+        free_cpus = available_cpus()[:ncores]
+        completed = 0
+        failed = 0
+        start = time.time()
+
+        try:
+            while pending or running:
+                # dispatch tasks to idle workers
+                while pending and len(running) < ncores:
+                    e, attempts = pending.popleft()
+                    cpu = free_cpus.pop(0) if pin and free_cpus else None
+                    worker = Process(target=mp_runrep_pinned, args=(e, cpu))
+                    worker.start()
+                    running[worker] = (e, attempts, cpu)
+
+                time.sleep(0.5)
+
+                for worker in [w for w in running if not w.is_alive()]:
+                    worker.join()
+                    e, attempts, cpu = running.pop(worker)
+                    if cpu is not None:
+                        free_cpus.append(cpu)
+                    name, rep = e[1]['name'], e[2]
+
+                    if worker.exitcode == 0:
+                        completed += 1
+                    elif attempts < retries:
+                        print 'repetition %i of %s failed (exit code %i), retrying'%(rep, name, worker.exitcode)
+                        pending.append((e, attempts + 1))
+                        continue
+                    else:
+                        failed += 1
+                        print 'repetition %i of %s failed (exit code %i), giving up'%(rep, name, worker.exitcode)
+
+                    elapsed = time.time() - start
+                    remaining = len(explist) - completed - failed
+                    eta = elapsed / (completed + failed) * remaining
+                    print '%i/%i repetitions done (%s rep %i), elapsed %s, eta %s'%(
+                        completed + failed, len(explist), name, rep,
+                        format_seconds(elapsed), format_seconds(eta))
+        finally:
+            # don't leave workers behind if interrupted
+            for worker in running:
+                worker.terminate()
+
+        return failed == 0
         
        
     def run_rep(self, params, rep):
@@ -614,28 +852,42 @@ class PyExperimentSuite(object):
             # check if repetition exists and has been completed
             restore = 0
             if os.path.exists(logname):
-                logfile = open(logname, 'r')
-                lines = logfile.readlines()
-                logfile.close()
+                iterations, logsize = completed_iterations(logname)
 
                 # if completed, continue loop
-                if 'iterations' in params and len(lines) == params['iterations']:
+                if 'iterations' in params and iterations == params['iterations']:
                     return False
                 # if not completed, check if restore_state is supported
                 if not self.restore_supported:
                     # not supported, delete repetition and start over
                     # print 'restore not supported, deleting %s' % logname
                     os.remove(logname)
+                    if os.path.exists(index_name(logname)):
+                        os.remove(index_name(logname))
                     restore = 0
                 else:
-                    restore = len(lines)
+                    restore = iterations
 
             self.reset(params, rep)
 
+            store = ColumnStore(column_store_name(logname))
             if restore:
-                logfile = open(logname, 'a')
+                # drop anything written after the last completed iteration
+                logfile = open(logname, 'r+')
+                logfile.truncate(logsize)
+                logfile.seek(0)
+                if store.rows == restore:
+                    store.truncate()
+                else:
+                    # out of sync with the log (or created by an older
+                    # version), rebuild it from the log
+                    store.clear()
+                    for line in logfile:
+                        store.append(json.loads(line))
+                logfile.seek(logsize)
                 self.restore_state(params, rep, restore)
             else:
+                store.clear()
                 logfile = open(logname, 'w')
 
             # loop through iterations and call iterate
@@ -650,6 +902,8 @@ class PyExperimentSuite(object):
                   json.dump(dic, logfile)
                   logfile.write('\n')
                   logfile.flush()
+                  store.append(dic)
+                  write_index(logname, it + 1, logfile.tell())
 
             logfile.close()
 
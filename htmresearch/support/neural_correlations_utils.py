@@ -36,6 +36,10 @@ except ImportError:
     capnp = None
 if capnp:
     from nupic.proto import TemporalMemoryProto_capnp
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
 
 
 
@@ -140,29 +144,91 @@ def generateRandomSequence(numSymbols, numColumns, sparsity):
   return sequence
 
 
-def computePWCorrelations(spikeTrains, removeAutoCorr):
+def computePWCorrelations(spikeTrains, removeAutoCorr, chunkSize=None):
   """
   Computes pairwise correlations from spikeTrains
   
   @param spikeTrains (array) spike trains obtained from the activation of cells in the TM
-         the array dimensions are: numCells x timeSteps
+         the array dimensions are: numCells x timeSteps. This can also be a
+         scipy.sparse matrix.
   @param removeAutoCorr (boolean) if true, auto-correlations are removed by substracting
          the diagonal of the correlation matrix         
+  @param chunkSize (int) if specified, the spike trains are processed this many
+         time-steps at a time, which bounds the size of the temporary arrays
   @return corrMatrix (array) numCells x numCells matrix containing the Pearson correlation
           coefficient of spike trains of cell i and cell j
   @return numNegPCC (int) number of negative pairwise correlations (PCC(i,j) < 0)
   """
-  numCells = np.shape(spikeTrains)[0]
-  corrMatrix = np.zeros((numCells, numCells))
-  numNegPCC = 0
-  for i in range(numCells):
-    for j in range(numCells):
-      if i == j and removeAutoCorr == True:
-        continue
-      if not all(spikeTrains[i,:] == 0) and not all(spikeTrains[j,:] == 0):
-        corrMatrix[i,j] = np.corrcoef(spikeTrains[i,:], spikeTrains[j,:])[0,1]    
-        if corrMatrix[i,j] < 0:
-          numNegPCC += 1
+  totalTS = np.shape(spikeTrains)[1]
+  if chunkSize is None:
+    chunkSize = max(totalTS, 1)
+
+  chunks = (spikeTrains[:, start:(start + chunkSize)]
+            for start in xrange(0, totalTS, chunkSize))
+  return computePWCorrelationsFromChunks(chunks, removeAutoCorr)
+
+
+def computePWCorrelationsFromChunks(spikeTrainChunks, removeAutoCorr):
+  """
+  Computes the same pairwise correlations as computePWCorrelations, streaming
+  over spike trains that are too large to hold in memory at once.
+
+  @param spikeTrainChunks (iterable) consecutive pieces of the spike trains,
+         each of them a numCells x chunkTimeSteps array or scipy.sparse matrix
+  @param removeAutoCorr (boolean) if true, auto-correlations are removed
+  @return corrMatrix (array) numCells x numCells correlation matrix
+  @return numNegPCC (int) number of negative pairwise correlations (PCC(i,j) < 0)
+  """
+  # Accumulate the moments of the spike trains. The correlations follow from
+  # the sums and the matrix of cross products.
+  sums = None
+  crossProducts = None
+  totalTS = 0
+  for chunk in spikeTrainChunks:
+    if sparse is not None and sparse.issparse(chunk):
+      chunk = chunk.tocsr().astype("float64")
+      chunkCrossProducts = chunk.dot(chunk.T).toarray()
+      chunkSums = np.asarray(chunk.sum(axis=1)).ravel()
+    else:
+      chunk = np.asarray(chunk, dtype="float64")
+      chunkCrossProducts = np.dot(chunk, chunk.T)
+      chunkSums = chunk.sum(axis=1)
+
+    if crossProducts is None:
+      crossProducts = chunkCrossProducts
+      sums = chunkSums
+    else:
+      crossProducts += chunkCrossProducts
+      sums += chunkSums
+    totalTS += chunk.shape[1]
+
+  return _correlationsFromMoments(crossProducts, sums, totalTS,
+                                  removeAutoCorr)
+
+
+def _correlationsFromMoments(crossProducts, sums, totalTS, removeAutoCorr):
+  """
+  Computes Pearson correlations from the sum of each spike train and the dot
+  product of every pair of spike trains.
+  """
+  covariances = crossProducts - np.outer(sums, sums) / totalTS
+  variances = np.diag(covariances)
+
+  # Like np.corrcoef, a cell that fires at every time-step has an undefined
+  # correlation (nan).
+  with np.errstate(divide="ignore", invalid="ignore"):
+    corrMatrix = covariances / np.sqrt(np.outer(variances, variances))
+  np.clip(corrMatrix, -1, 1, out=corrMatrix)
+
+  # Cells that never fire have no correlation with anything.
+  silentCells = np.diag(crossProducts) == 0
+  corrMatrix[silentCells, :] = 0
+  corrMatrix[:, silentCells] = 0
+  if removeAutoCorr == True:
+    np.fill_diagonal(corrMatrix, 0)
+
+  with np.errstate(invalid="ignore"):
+    numNegPCC = int(np.count_nonzero(corrMatrix < 0))
   return (corrMatrix, numNegPCC)
 
   
@@ -233,6 +299,37 @@ def sampleCellsAcrossColumns(numCellPairs, cellsPerColumn, numColumns, seed=42):
   return cellPairs
 
 
+def _sampleTimeWindow(totalTS, currentTS, timeWindow):
+  """
+  Chooses the time-steps sampled by subSample and subSampleWholeColumn.
+
+  @return (tuple) first time-step and end (exclusive) of the sample
+  """
+  if currentTS > 0 and currentTS < timeWindow:
+    return (0, currentTS)
+  elif currentTS > 0 and currentTS >= timeWindow:
+    return (currentTS - timeWindow, currentTS)
+  elif currentTS == 0:
+    # This option takes the whole spike train history
+    return (0, totalTS)
+  else:
+    # This option takes a timestep at random and a time window 
+    # specified by the user after the chosen time step
+    rnd = random.randrange(totalTS - timeWindow)
+    print "Starting from timestep: " + str(rnd)
+    return (rnd, rnd + timeWindow)
+
+
+def _selectSpikeTrains(spikeTrains, cells, start, end):
+  """
+  Copies the spike trains of the given cells over time-steps [start, end) in
+  one indexing operation. Sparse spike trains stay sparse.
+  """
+  if sparse is not None and sparse.issparse(spikeTrains):
+    return spikeTrains.tocsr()[cells][:, start:end].astype("uint32")
+  return np.array(spikeTrains[cells, start:end], dtype="uint32")
+
+
 def subSample(spikeTrains, numCells, totalCells, currentTS, timeWindow):
   """
   Obtains a random sample of cells from the whole spike train matrix consisting of numCells cells
@@ -246,31 +343,9 @@ def subSample(spikeTrains, numCells, totalCells, currentTS, timeWindow):
   @return subSpikeTrains (array) spike train matrix sampled from the total spike train matrix
   """
   indices = np.random.permutation(np.arange(totalCells))
-  if currentTS > 0 and currentTS < timeWindow:
-    subSpikeTrains = np.zeros((numCells, currentTS), dtype = "uint32")
-    for i in range(numCells):
-      subSpikeTrains[i,:] = spikeTrains[indices[i],:]
-  elif currentTS > 0 and currentTS >= timeWindow:
-    subSpikeTrains = np.zeros((numCells, timeWindow), dtype = "uint32")    
-    for i in range(numCells):
-      subSpikeTrains[i,:] = spikeTrains[indices[i],(currentTS-timeWindow):currentTS]
-  elif currentTS == 0:
-    # This option takes the whole spike train history
-    totalTS = np.shape(spikeTrains)[1]
-    subSpikeTrains = np.zeros((numCells, totalTS), dtype = "uint32")
-    for i in range(numCells):
-      subSpikeTrains[i,:] = spikeTrains[indices[i],:]
-  elif currentTS < 0:
-    # This option takes a timestep at random and a time window 
-    # specified by the user after the chosen time step
-    totalTS = np.shape(spikeTrains)[1]
-    subSpikeTrains = np.zeros((numCells, timeWindow), dtype = "uint32")
-    rnd = random.randrange(totalTS - timeWindow)
-    print "Starting from timestep: " + str(rnd)
-    for i in range(numCells):
-      subSpikeTrains[i,:] = spikeTrains[indices[i],rnd:(rnd+timeWindow)]
-    
-  return subSpikeTrains
+  start, end = _sampleTimeWindow(np.shape(spikeTrains)[1], currentTS,
+                                 timeWindow)
+  return _selectSpikeTrains(spikeTrains, indices[:numCells], start, end)
 
 
 def subSampleWholeColumn(spikeTrains, colIndices, cellsPerColumn, currentTS, timeWindow):
@@ -285,44 +360,11 @@ def subSampleWholeColumn(spikeTrains, colIndices, cellsPerColumn, currentTS, tim
   @param timeWindow (int) number of time-steps to sample from the spike trains
   @return subSpikeTrains (array) spike train matrix sampled from the total spike train matrix
   """
-  numColumns = np.shape(colIndices)[0]
-  numCells = numColumns * cellsPerColumn
-
-  if currentTS > 0 and currentTS < timeWindow:
-    subSpikeTrains = np.zeros((numCells, currentTS), dtype = "uint32")
-    for i in range(numColumns):
-      currentCol = colIndices[i]
-      initialCell = cellsPerColumn * currentCol
-      for j in range(cellsPerColumn):
-        subSpikeTrains[(cellsPerColumn*i) + j,:] = spikeTrains[initialCell + j,:]
-  elif currentTS > 0 and currentTS >= timeWindow:
-    subSpikeTrains = np.zeros((numCells, timeWindow), dtype = "uint32")
-    for i in range(numColumns):
-      currentCol = colIndices[i]
-      initialCell = cellsPerColumn * currentCol
-      for j in range(cellsPerColumn):
-        subSpikeTrains[(cellsPerColumn*i) + j,:] = spikeTrains[initialCell + j,(currentTS-timeWindow):currentTS]
-  elif currentTS == 0:
-    # This option takes the whole spike train history
-    totalTS = np.shape(spikeTrains)[1]
-    subSpikeTrains = np.zeros((numCells, totalTS), dtype = "uint32")
-    for i in range(numColumns):
-      currentCol = colIndices[i]
-      initialCell = cellsPerColumn * currentCol
-      for j in range(cellsPerColumn):
-        subSpikeTrains[(cellsPerColumn*i) + j,:] = spikeTrains[initialCell + j,:]
-  elif currentTS < 0:
-    totalTS = np.shape(spikeTrains)[1]
-    subSpikeTrains = np.zeros((numCells, timeWindow), dtype = "uint32")
-    rnd = random.randrange(totalTS - timeWindow)
-    print "Starting from timestep: " + str(rnd)
-    for i in range(numColumns):
-      currentCol = colIndices[i]
-      initialCell = cellsPerColumn * currentCol
-      for j in range(cellsPerColumn):
-        subSpikeTrains[(cellsPerColumn*i) + j,:] = spikeTrains[initialCell + j,rnd:(rnd+timeWindow)]
-    
-  return subSpikeTrains
+  cells = (np.asarray(colIndices)[:, np.newaxis] * cellsPerColumn +
+           np.arange(cellsPerColumn)).ravel()
+  start, end = _sampleTimeWindow(np.shape(spikeTrains)[1], currentTS,
+                                 timeWindow)
+  return _selectSpikeTrains(spikeTrains, cells, start, end)
 
 
 def computeEntropy(spikeTrains):
@@ -554,22 +596,26 @@ def computePWCorrelationsWithinCol(spikeTrains, removeAutoCorr, cellsPerColumn):
       coefficient of spike trains of cell i and cell j
   @return numNegPCC (int) number of negative pairwise correlations (PCC(i,j) < 0)
   """
-  numCells = np.shape(spikeTrains)[0]
+  numCells, totalTS = np.shape(spikeTrains)
   numCols = numCells / cellsPerColumn
   corrMatrix = np.zeros((numCells, numCells))
   numNegPCC = 0
-  indices = np.zeros(cellsPerColumn, dtype="uint32")
-  
+
+  # Compute the moments of every column's cells with one batched product.
+  columnSpikeTrains = np.asarray(
+    spikeTrains[:(numCols * cellsPerColumn)], dtype="float64").reshape(
+      numCols, cellsPerColumn, totalTS)
+  crossProducts = np.matmul(columnSpikeTrains,
+                            columnSpikeTrains.transpose(0, 2, 1))
+  sums = columnSpikeTrains.sum(axis=2)
+
   for col in range(numCols):
-    for k in range(cellsPerColumn):
-      indices[k] = (cellsPerColumn * col) + k
-    for i in indices:
-      for j in indices:
-        if i == j and removeAutoCorr == True:
-          continue
-        if not all(spikeTrains[i,:] == 0) and not all(spikeTrains[j,:] == 0):          
-          corrMatrix[i,j] = np.corrcoef(spikeTrains[i,:], spikeTrains[j,:])[0,1]  
-          if corrMatrix[i,j] < 0:
-            numNegPCC += 1
-          
+    (colCorrMatrix,
+     colNumNegPCC) = _correlationsFromMoments(crossProducts[col], sums[col],
+                                              totalTS, removeAutoCorr)
+    start = cellsPerColumn * col
+    corrMatrix[start:(start + cellsPerColumn),
+               start:(start + cellsPerColumn)] = colCorrMatrix
+    numNegPCC += colNumNegPCC
+
   return (corrMatrix, numNegPCC)
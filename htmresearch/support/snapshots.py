@@ -0,0 +1,219 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Save and restore the learned state of a model as a snapshot directory.
+
+A snapshot holds one .npy file per array and a pickled "state.pkl" for the
+small, non-array parts (object descriptions, names, offsets...). Arrays are
+memory-mapped when the snapshot is loaded, so many workers can load the same
+trained model quickly and share its pages.
+
+Learned synapses are stored as flat arrays, so they're written and restored
+with a few vectorized calls. A snapshot is restored into a model that was
+constructed with the same parameters and hasn't learned anything yet.
+"""
+
+import cPickle
+import os
+
+import numpy as np
+
+
+STATE_FILENAME = "state.pkl"
+
+# The cell that SparseMatrixConnections maps destroyed segments to.
+DESTROYED_SEGMENT_CELL = np.iinfo("uint32").max
+
+
+def saveSnapshot(directory, arrays, state):
+  """
+  @param directory (str)
+  Created if it doesn't exist.
+
+  @param arrays (dict)
+  Maps array names to numpy arrays.
+
+  @param state (picklable object)
+  Everything else that needs to be restored.
+  """
+  if not os.path.exists(directory):
+    os.makedirs(directory)
+
+  for name, array in arrays.iteritems():
+    np.save(os.path.join(directory, name + ".npy"), np.asarray(array))
+
+  with open(os.path.join(directory, STATE_FILENAME), "wb") as f:
+    cPickle.dump({"arrayNames": sorted(arrays.keys()),
+                  "state": state}, f, cPickle.HIGHEST_PROTOCOL)
+
+
+def loadSnapshot(directory, mmap=True):
+  """
+  @param mmap (bool)
+  If True, the arrays are read-only memory maps of the snapshot's files.
+
+  @return (tuple)
+  The (arrays, state) that were passed to saveSnapshot.
+  """
+  with open(os.path.join(directory, STATE_FILENAME), "rb") as f:
+    contents = cPickle.load(f)
+
+  mmapMode = "r" if mmap else None
+  arrays = dict((name, np.load(os.path.join(directory, name + ".npy"),
+                               mmap_mode=mmapMode))
+                for name in contents["arrayNames"])
+
+  return arrays, contents["state"]
+
+
+def connectionsToArrays(prefix, connections):
+  """
+  Flatten the segments and synapses of a SparseMatrixConnections (or anything
+  with its interface, e.g. CSRConnections).
+
+  Every segment number up to the highest one is saved, including destroyed
+  segments, which get the cell DESTROYED_SEGMENT_CELL and no synapses. This
+  way the restored segments keep their numbers.
+
+  @return (dict)
+  Arrays named prefix + ".segmentCells", ".synapseSegments", ".synapseInputs"
+  and ".synapsePermanences".
+  """
+  numSegments = connections.matrix.nRows()
+  segmentCells = connections.mapSegmentsToCells(
+    np.arange(numSegments, dtype="uint32"))
+
+  rows = [connections.matrix.rowNonZeros(segment)
+          for segment in xrange(numSegments)]
+  counts = np.array([len(inputs) for inputs, _ in rows], dtype="int64")
+
+  return {
+    prefix + ".segmentCells": np.asarray(segmentCells, dtype="uint32"),
+    prefix + ".synapseSegments": np.repeat(
+      np.arange(numSegments, dtype="uint32"), counts),
+    prefix + ".synapseInputs": np.concatenate(
+      [np.empty(0, dtype="uint32")] +
+      [np.asarray(inputs, dtype="uint32") for inputs, _ in rows]),
+    prefix + ".synapsePermanences": np.concatenate(
+      [np.empty(0, dtype="float32")] +
+      [np.asarray(permanences, dtype="float32") for _, permanences in rows]),
+  }
+
+
+def restoreConnections(prefix, connections, arrays):
+  """
+  Recreate the segments and synapses saved by connectionsToArrays.
+
+  @param connections (SparseMatrixConnections)
+  An empty connections object with the same dimensions as the saved one.
+  """
+  if connections.numSegments() != 0:
+    raise ValueError("Snapshots can only be restored into empty connections")
+
+  # Destroyed segments are created on cell 0 and destroyed again, so the
+  # other segments keep their numbers.
+  segmentCells = np.array(arrays[prefix + ".segmentCells"], dtype="uint32")
+  destroyed = segmentCells == DESTROYED_SEGMENT_CELL
+  segmentCells[destroyed] = 0
+
+  segments = np.asarray(connections.createSegments(segmentCells),
+                        dtype="uint32")
+  synapseSegments = segments[arrays[prefix + ".synapseSegments"]]
+
+  if len(synapseSegments) > 0:
+    connections.matrix.setElements(
+      synapseSegments,
+      np.array(arrays[prefix + ".synapseInputs"], dtype="uint32"),
+      np.array(arrays[prefix + ".synapsePermanences"], dtype="float32"))
+
+  if destroyed.any():
+    connections.destroySegments(segments[destroyed])
+
+
+def sparseMatrixToArrays(prefix, matrix):
+  """
+  Flatten the nonzeros of a SparseMatrix, e.g. the permanences of a
+  ColumnPooler.
+
+  @return (dict)
+  Arrays named prefix + ".rows", ".cols" and ".values".
+  """
+  rows = [matrix.rowNonZeros(row) for row in xrange(matrix.nRows())]
+  counts = np.array([len(cols) for cols, _ in rows], dtype="int64")
+
+  return {
+    prefix + ".rows": np.repeat(np.arange(matrix.nRows(), dtype="uint32"),
+                                counts),
+    prefix + ".cols": np.concatenate(
+      [np.empty(0, dtype="uint32")] +
+      [np.asarray(cols, dtype="uint32") for cols, _ in rows]),
+    prefix + ".values": np.concatenate(
+      [np.empty(0, dtype="float32")] +
+      [np.asarray(values, dtype="float32") for _, values in rows]),
+  }
+
+
+def restoreSparseMatrix(prefix, matrix, arrays):
+  """
+  Set the nonzeros saved by sparseMatrixToArrays.
+
+  @param matrix (SparseMatrix)
+  An all-zero matrix with the same dimensions as the saved one.
+  """
+  if matrix.nNonZeros() != 0:
+    raise ValueError("Snapshots can only be restored into empty matrices")
+
+  if len(arrays[prefix + ".rows"]) > 0:
+    matrix.setElements(
+      np.array(arrays[prefix + ".rows"], dtype="uint32"),
+      np.array(arrays[prefix + ".cols"], dtype="uint32"),
+      np.array(arrays[prefix + ".values"], dtype="float32"))
+
+
+def raggedToArrays(prefix, sequences):
+  """
+  Store a list of 1D arrays as one concatenated array and their offsets.
+
+  @return (dict)
+  Arrays named prefix + ".values" and ".offsets".
+  """
+  lengths = np.array([len(sequence) for sequence in sequences], dtype="int64")
+  offsets = np.zeros(len(sequences) + 1, dtype="int64")
+  np.cumsum(lengths, out=offsets[1:])
+
+  return {
+    prefix + ".values": np.concatenate(
+      [np.empty(0, dtype="uint32")] +
+      [np.asarray(sequence, dtype="uint32") for sequence in sequences]),
+    prefix + ".offsets": offsets,
+  }
+
+
+def arraysToRagged(prefix, arrays):
+  """
+  @return (list of numpy arrays)
+  Views into the array saved by raggedToArrays. These are memory-mapped if the
+  snapshot was loaded with mmap=True.
+  """
+  values = arrays[prefix + ".values"]
+  offsets = arrays[prefix + ".offsets"]
+  return [values[offsets[i]:offsets[i+1]] for i in xrange(len(offsets) - 1)]
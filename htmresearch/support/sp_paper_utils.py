@@ -28,7 +28,7 @@ import matplotlib.cm as cm
 import matplotlib as mpl
 
 from htmresearch.frameworks.sp_paper.sp_metrics import (
-calculateInputOverlapMat, percentOverlap
+calculateInputOverlapMat, percentOverlap, inferSPOnBatch
 )
 from nupic.bindings.math import GetNTAReal
 
@@ -283,28 +283,28 @@ def runSPOnBatch(sp, inputVectors, learn, sdrOrders=None, verbose=0):
   numInputVector, inputSize = inputVectors.shape
   numColumns = np.prod(sp.getColumnDimensions())
 
+  if not learn:
+    # Without learning the order doesn't matter, run the whole batch at once
+    outputColumns = inferSPOnBatch(sp, inputVectors)
+    return outputColumns, np.ones((numColumns,), dtype=realDType)
+
   if sdrOrders is None:
     sdrOrders = range(numInputVector)
 
   outputColumns = np.zeros((numInputVector, numColumns), dtype=uintType)
-  if learn:
-    avgBoostFactors = np.zeros((numColumns,), dtype=realDType)
-  else:
-    avgBoostFactors = np.ones((numColumns,), dtype=realDType)
+  avgBoostFactors = np.zeros((numColumns,), dtype=realDType)
 
   for i in range(numInputVector):
     sp.compute(inputVectors[sdrOrders[i]][:], learn, outputColumns[sdrOrders[i]][:])
-    if learn:
-      boostFactors = np.zeros((numColumns,), dtype=realDType)
-      sp.getBoostFactors(boostFactors)
-      avgBoostFactors += boostFactors
+    boostFactors = np.zeros((numColumns,), dtype=realDType)
+    sp.getBoostFactors(boostFactors)
+    avgBoostFactors += boostFactors
 
     if verbose > 0:
       if i % 200 == 0:
         print "{} % finished".format(100 * float(i) / float(numInputVector))
 
-  if learn:
-    avgBoostFactors = avgBoostFactors/numInputVector
+  avgBoostFactors = avgBoostFactors/numInputVector
   return outputColumns, avgBoostFactors
 
 
@@ -0,0 +1,116 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Helpers for regions that send cell activity over "sparse links".
+
+By default regions send activity as dense arrays of 0s and 1s, so every compute
+zeroes and refills a cellCount-sized output, and the receiving region calls
+nonzero() to get the indices back. With sparse links a region instead writes
+
+  [n, cell_0, cell_1, ..., cell_(n-1), <unused>...]
+
+into an output of size cellCount + 1, where the cells are sorted and unique.
+The network links copy these arrays unchanged, so an input that is linked to k
+outputs holds k of these blocks, one after another.
+
+The element type of the links is still Real32, which represents every cell
+index below 2**24 exactly.
+"""
+
+import numpy as np
+
+
+def sparseLinkWidth(cellCount):
+  """
+  @param cellCount (int)
+  Number of cells represented by the link
+
+  @return (int)
+  The size of the output that holds the sparse representation
+  """
+  return cellCount + 1
+
+
+def writeSparseOutput(output, cells):
+  """
+  Write cell indices into a sparse link output. Only the first len(cells) + 1
+  elements are touched.
+
+  @param output (numpy array)
+  The region's output array
+
+  @param cells (numpy array)
+  Indices of the cells to send. They're sorted and deduplicated here.
+  """
+  cells = np.unique(cells)
+  output[0] = len(cells)
+  output[1:len(cells) + 1] = cells
+
+
+def readSparseInput(inputArray):
+  """
+  Read the cell indices from an input that is linked to one sparse output.
+
+  @param inputArray (numpy array)
+
+  @return (numpy array)
+  Sorted uint32 cell indices
+  """
+  n = int(inputArray[0])
+  return inputArray[1:n + 1].astype("uint32")
+
+
+def sparseLinkToDense(inputArray, cellCount):
+  """
+  Compatibility shim for code that expects a dense 0/1 array.
+
+  @param inputArray (numpy array)
+  A sparse link array, e.g. the result of getOutputData() on a region that uses
+  sparse links
+
+  @param cellCount (int)
+
+  @return (numpy array)
+  A dense Real32 array of 0s and 1s of size cellCount
+  """
+  dense = np.zeros(cellCount, dtype="float32")
+  dense[readSparseInput(inputArray)] = 1
+  return dense
+
+
+def getLinkCells(linkArray, sparse):
+  """
+  Get the cell indices out of a region output or input, whichever encoding it
+  uses.
+
+  @param linkArray (numpy array)
+
+  @param sparse (bool)
+  Whether the array uses the sparse link encoding
+
+  @return (numpy array)
+  Sorted uint32 cell indices
+  """
+  if sparse:
+    return readSparseInput(linkArray)
+  else:
+    return np.asarray(linkArray.nonzero()[0], dtype="uint32")
@@ -30,8 +30,11 @@ import numpy
 from nupic.algorithms.monitor_mixin.metric import Metric
 from nupic.algorithms.monitor_mixin.monitor_mixin_base import MonitorMixinBase
 from nupic.algorithms.monitor_mixin.plot import Plot
-from nupic.algorithms.monitor_mixin.trace import (
-  IndicesTrace, StringsTrace, BoolsTrace, MetricsTrace)
+
+from htmresearch.support.columnar_trace import (
+  ColumnarIndicesTrace, ColumnarStringsTrace, ColumnarBoolsTrace,
+  ColumnarMetricsTrace, computeOverlapMatrix, createMetricFromTrace,
+  labeledPairs)
 
 
 
@@ -39,9 +42,17 @@ class TemporalPoolerMonitorMixin(MonitorMixinBase):
   """
   Mixin for TemporalPooler that stores a detailed history, for inspection and
   debugging.
+
+  The history is stored in columnar traces. Pass mmTraceLength to keep only
+  the most recent time steps, and mmTraceDirectory to keep the traces in
+  memory-mapped files in that directory.
   """
 
   def __init__(self, *args, **kwargs):
+    self._mmTraceOptions = {
+      "maxLength": kwargs.pop("mmTraceLength", None),
+      "directory": kwargs.pop("mmTraceDirectory", None),
+    }
     super(TemporalPoolerMonitorMixin, self).__init__(*args, **kwargs)
 
     self._mmResetActive = True  # First iteration is always a reset
@@ -206,27 +217,15 @@ class TemporalPoolerMonitorMixin(MonitorMixinBase):
     sequenceLabelsTrace = self.mmGetTraceSequenceLabels()
     resetsTrace = self.mmGetTraceResets()
 
-    n = len(activeCellsTrace.data)
-    overlap = numpy.empty((n, n), dtype=int)
-    stabilityConfusion = []
-    distinctnessConfusion = []
-
-    for i in xrange(n):
-      for j in xrange(i+1):
-        numActiveCells = len(activeCellsTrace.data[i])
-        numOverlap = len(activeCellsTrace.data[i] & activeCellsTrace.data[j])
-        overlap[i][j] = numOverlap
-        overlap[j][i] = numOverlap
-
-        if (i != j and
-            sequenceLabelsTrace.data[i] is not None and
-            not resetsTrace.data[i] and
-            sequenceLabelsTrace.data[j] is not None and
-            not resetsTrace.data[j]):
-          if sequenceLabelsTrace.data[i] == sequenceLabelsTrace.data[j]:
-            stabilityConfusion.append(numActiveCells - numOverlap)
-          else:
-            distinctnessConfusion.append(numOverlap)
+    overlap = computeOverlapMatrix(activeCellsTrace.data,
+                                   self.getNumColumns()).astype(int)
+
+    rows, columns, sameSequence = labeledPairs(sequenceLabelsTrace,
+                                               resetsTrace)
+    numOverlap = overlap[rows, columns]
+    numActiveCells = activeCellsTrace.data.counts()[rows]
+    stabilityConfusion = (numActiveCells - numOverlap)[sameSequence].tolist()
+    distinctnessConfusion = numOverlap[~sameSequence].tolist()
 
     self._mmData["overlap"] = overlap
     self._mmData["stabilityConfusion"] = stabilityConfusion
@@ -247,7 +246,6 @@ class TemporalPoolerMonitorMixin(MonitorMixinBase):
 
     activeColumns = super(TemporalPoolerMonitorMixin, self).compute(*args,
                                                                     **kwargs)
-    activeColumns = set(activeColumns)
     activeCells = activeColumns  # TODO: Update when moving to a cellular TP
 
     self._mmTraces["activeCells"].data.append(activeCells)
@@ -281,7 +279,7 @@ class TemporalPoolerMonitorMixin(MonitorMixinBase):
 
 
   def mmGetDefaultMetrics(self, verbosity=1):
-    metrics = ([Metric.createFromTrace(trace)
+    metrics = ([createMetricFromTrace(trace)
                 for trace in self.mmGetDefaultTraces()[:-2]])
 
     connectionsPerColumnMetricIntial = (
@@ -302,10 +300,13 @@ class TemporalPoolerMonitorMixin(MonitorMixinBase):
   def mmClearHistory(self):
     super(TemporalPoolerMonitorMixin, self).mmClearHistory()
 
-    self._mmTraces["activeCells"] = IndicesTrace(self, "active cells")
-    self._mmTraces["sequenceLabels"] = StringsTrace(self, "sequence labels")
-    self._mmTraces["resets"] = BoolsTrace(self, "resets")
-    self._mmTraces["connectionsPerColumnMetric"] = MetricsTrace(
-      self, "connections per column (metric)")
+    options = self._mmTraceOptions
+    self._mmTraces["activeCells"] = ColumnarIndicesTrace(
+      self, "active cells", **options)
+    self._mmTraces["sequenceLabels"] = ColumnarStringsTrace(
+      self, "sequence labels", **options)
+    self._mmTraces["resets"] = ColumnarBoolsTrace(self, "resets", **options)
+    self._mmTraces["connectionsPerColumnMetric"] = ColumnarMetricsTrace(
+      self, "connections per column (metric)", **options)
 
     self._sequenceRepresentationDataStale = True
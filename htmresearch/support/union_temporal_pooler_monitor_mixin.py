@@ -31,8 +31,10 @@ from nupic.algorithms.monitor_mixin.metric import Metric
 from nupic.algorithms.monitor_mixin.monitor_mixin_base import MonitorMixinBase
 from htmresearch.algorithms.union_temporal_pooler import UnionTemporalPooler
 from nupic.algorithms.monitor_mixin.plot import Plot
-from nupic.algorithms.monitor_mixin.trace import (
-  IndicesTrace, StringsTrace, BoolsTrace, MetricsTrace, CountsTrace)
+from htmresearch.support.columnar_trace import (
+  ColumnarIndicesTrace, ColumnarStringsTrace, ColumnarBoolsTrace,
+  ColumnarMetricsTrace, ColumnarCountsTrace, computeOverlapMatrix,
+  createMetricFromTrace, labeledPairs)
 
 from nupic.bindings.math import GetNTAReal
 
@@ -46,9 +48,17 @@ class UnionTemporalPoolerMonitorMixin(MonitorMixinBase):
   """
   Mixin for UnionTemporalPooler that stores a detailed history, for inspection and
   debugging.
+
+  The history is stored in columnar traces. Pass mmTraceLength to keep only
+  the most recent time steps, and mmTraceDirectory to keep the traces in
+  memory-mapped files in that directory.
   """
 
   def __init__(self, *args, **kwargs):
+    self._mmTraceOptions = {
+      "maxLength": kwargs.pop("mmTraceLength", None),
+      "directory": kwargs.pop("mmTraceDirectory", None),
+    }
     super(UnionTemporalPoolerMonitorMixin, self).__init__(*args, **kwargs)
 
     self._mmResetActive = True  # First iteration is always a reset
@@ -421,7 +431,7 @@ class UnionTemporalPoolerMonitorMixin(MonitorMixinBase):
     period = self.getDutyCyclePeriod()
 
     unionSDRArray = numpy.zeros(self.getNumColumns())
-    unionSDRArray[list(self._mmTraces["unionSDR"].data[-1])] = 1
+    unionSDRArray[self._mmTraces["unionSDR"].data.stepIndices(-1)] = 1
 
     self._mmData["unionSDRDutyCycle"] = \
       UnionTemporalPoolerMonitorMixin._mmUpdateDutyCyclesHelper(
@@ -446,27 +456,14 @@ class UnionTemporalPoolerMonitorMixin(MonitorMixinBase):
     sequenceLabelsTrace = self.mmGetTraceSequenceLabels()
     resetsTrace = self.mmGetTraceResets()
 
-    n = len(unionSDRTrace.data)
-    overlapMatrix = numpy.empty((n, n), dtype=uintType)
-    stabilityConfusionUnionSDR = []
-    distinctnessConfusionUnionSDR = []
-
-    for i in xrange(n):
-      for j in xrange(i+1):
-        overlapUnionSDR = len(unionSDRTrace.data[i] & unionSDRTrace.data[j])
-
-        overlapMatrix[i][j] = overlapUnionSDR
-        overlapMatrix[j][i] = overlapUnionSDR
+    overlapMatrix = computeOverlapMatrix(unionSDRTrace.data,
+                                         self.getNumColumns()).astype(uintType)
 
-        if (i != j and
-            sequenceLabelsTrace.data[i] is not None and
-            not resetsTrace.data[i] and
-            sequenceLabelsTrace.data[j] is not None and
-            not resetsTrace.data[j]):
-          if sequenceLabelsTrace.data[i] == sequenceLabelsTrace.data[j]:
-            stabilityConfusionUnionSDR.append(overlapUnionSDR)
-          else:
-            distinctnessConfusionUnionSDR.append(overlapUnionSDR)
+    rows, columns, sameSequence = labeledPairs(sequenceLabelsTrace,
+                                               resetsTrace)
+    overlapUnionSDR = overlapMatrix[rows, columns]
+    stabilityConfusionUnionSDR = overlapUnionSDR[sameSequence].tolist()
+    distinctnessConfusionUnionSDR = overlapUnionSDR[~sameSequence].tolist()
 
     self._mmData["overlap"] = overlapMatrix
     self._mmData["stabilityConfusion"] = stabilityConfusionUnionSDR
@@ -479,21 +476,34 @@ class UnionTemporalPoolerMonitorMixin(MonitorMixinBase):
     """
     @return (list) Life duration of all active bits
     """
-    bitLifeList = []
     traceData = self._mmTraces["unionSDR"].data
     n = len(traceData)
-    bitLifeCounter = numpy.zeros(self.getNumColumns())
-    preActiveCells = set()
-    for t in xrange(n-1):
-      preActiveCells = set(numpy.where(bitLifeCounter>0)[0])
-      newActiveCells = list(traceData[t] - preActiveCells)
-      stopActiveCells = list(preActiveCells - traceData[t])
-      continuousActiveCells = list(preActiveCells & traceData[t] )
-      bitLifeList += list(bitLifeCounter[stopActiveCells])
-
-      bitLifeCounter[stopActiveCells] = 0
-      bitLifeCounter[newActiveCells] = 1
-      bitLifeCounter[continuousActiveCells] += 1
+    indices, _ = traceData.arrays()
+    timeSteps = traceData.timeSteps()
+
+    # Only the time steps before the last one are considered.
+    considered = timeSteps < n - 1
+    order = numpy.lexsort((timeSteps[considered], indices[considered]))
+    bits = indices[considered][order]
+    timeSteps = timeSteps[considered][order]
+    if len(bits) == 0:
+      return []
+
+    # Split the active time steps of each bit into runs of consecutive steps.
+    runStarts = numpy.flatnonzero(
+      numpy.concatenate(([True],
+                         (numpy.diff(bits) != 0) |
+                         (numpy.diff(timeSteps) != 1))))
+    runEnds = numpy.append(runStarts[1:], len(bits)) - 1
+    firstSteps = timeSteps[runStarts]
+    lastSteps = timeSteps[runEnds]
+
+    # A run is counted once it has stopped within the considered time steps,
+    # in the order in which the runs stop.
+    stopped = lastSteps + 1 < n - 1
+    stopOrder = numpy.lexsort((bits[runStarts][stopped], lastSteps[stopped]))
+    bitLifeList = (lastSteps - firstSteps + 1)[stopped][stopOrder].astype(
+      float).tolist()
 
     return bitLifeList
 
@@ -516,7 +526,7 @@ class UnionTemporalPoolerMonitorMixin(MonitorMixinBase):
     self.getConnectedCounts(connectedCounts)
     numConnections = numpy.sum(connectedCounts)
 
-    self._mmTraces["unionSDR"].data.append(set(unionSDR))
+    self._mmTraces["unionSDR"].data.append(unionSDR)
     self._mmTraces["numConnections"].data.append(numConnections)
     self._mmTraces["sequenceLabels"].data.append(sequenceLabel)
     self._mmTraces["resets"].data.append(self._mmResetActive)
@@ -547,7 +557,7 @@ class UnionTemporalPoolerMonitorMixin(MonitorMixinBase):
 
 
   def mmGetDefaultMetrics(self, verbosity=1):
-    metrics = ([Metric.createFromTrace(trace)
+    metrics = ([createMetricFromTrace(trace)
                 for trace in self.mmGetDefaultTraces()[:-2]])
 
     connectionsPerColumnMetricIntial = (
@@ -568,16 +578,20 @@ class UnionTemporalPoolerMonitorMixin(MonitorMixinBase):
   def mmClearHistory(self):
     super(UnionTemporalPoolerMonitorMixin, self).mmClearHistory()
 
-    self._mmTraces["unionSDR"] = IndicesTrace(self, "union SDR")
-    self._mmTraces["sequenceLabels"] = StringsTrace(self, "sequence labels")
-    self._mmTraces["resets"] = BoolsTrace(self, "resets")
-    self._mmTraces["connectionsPerColumnMetric"] = MetricsTrace(
-      self, "connections per column (metric)")
+    options = self._mmTraceOptions
+    self._mmTraces["unionSDR"] = ColumnarIndicesTrace(
+      self, "union SDR", **options)
+    self._mmTraces["sequenceLabels"] = ColumnarStringsTrace(
+      self, "sequence labels", **options)
+    self._mmTraces["resets"] = ColumnarBoolsTrace(self, "resets", **options)
+    self._mmTraces["connectionsPerColumnMetric"] = ColumnarMetricsTrace(
+      self, "connections per column (metric)", **options)
 
     self._mmData["unionSDRDutyCycle"] = numpy.zeros(self.getNumColumns(), dtype=realDType)
     self._mmData["persistenceDutyCycle"] = numpy.zeros(self.getNumColumns(), dtype=realDType)
 
-    self._mmTraces["numConnections"] = CountsTrace(self, "connections")
+    self._mmTraces["numConnections"] = ColumnarCountsTrace(
+      self, "connections", **options)
 
     self._sequenceRepresentationDataStale = True
 
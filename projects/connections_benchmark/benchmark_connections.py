@@ -0,0 +1,148 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the speed of SparseMatrixConnections and CSRConnections by running the
+shared sequence memory tests on an ApicalTiebreakSequenceMemory with each of
+them.
+
+Usage:
+  python benchmark_connections.py
+  python benchmark_connections.py --tests testB1 testB4 --repeat 3
+"""
+
+import argparse
+import time
+import unittest
+
+import numpy as np
+from nupic.bindings.math import SparseMatrixConnections
+
+from htmresearch.algorithms.apical_tiebreak_temporal_memory import (
+  ApicalTiebreakSequenceMemory)
+from htmresearch.algorithms.csr_connections import CSRConnections
+from htmresearch.support.shared_tests.sequence_memory_test_base import (
+  SequenceMemoryTestBase)
+
+
+
+def createTestCaseClass(connectionsClass):
+  """
+  Create a unittest class that runs the sequence memory tests with the
+  specified connections class.
+  """
+
+  class SequenceMemoryBenchmark(SequenceMemoryTestBase, unittest.TestCase):
+
+    def constructTM(self, columnCount, cellsPerColumn, initialPermanence,
+                    connectedPermanence, minThreshold, sampleSize,
+                    permanenceIncrement, permanenceDecrement,
+                    predictedSegmentDecrement, activationThreshold, seed):
+      self.tm = ApicalTiebreakSequenceMemory(
+        columnCount=columnCount,
+        cellsPerColumn=cellsPerColumn,
+        initialPermanence=initialPermanence,
+        connectedPermanence=connectedPermanence,
+        minThreshold=minThreshold,
+        sampleSize=sampleSize,
+        permanenceIncrement=permanenceIncrement,
+        permanenceDecrement=permanenceDecrement,
+        basalPredictedSegmentDecrement=predictedSegmentDecrement,
+        activationThreshold=activationThreshold,
+        seed=seed,
+        connectionsClass=connectionsClass)
+
+    def compute(self, activeColumns, learn):
+      self.tm.compute(np.array(sorted(activeColumns), dtype="uint32"),
+                      learn=learn)
+
+    def reset(self):
+      self.tm.reset()
+
+    def getActiveCells(self):
+      return self.tm.getActiveCells()
+
+    def getPredictedCells(self):
+      return self.tm.getPredictedCells()
+
+  return SequenceMemoryBenchmark
+
+
+
+def timeTest(testCaseClass, testName, repeat):
+  """
+  @return (float or None)
+  The fastest time of 'repeat' runs, or None if the test failed
+  """
+  times = []
+  for _ in xrange(repeat):
+    result = unittest.TestResult()
+    start = time.time()
+    testCaseClass(testName).run(result)
+    times.append(time.time() - start)
+
+    if not result.wasSuccessful():
+      return None
+
+  return min(times)
+
+
+
+def runBenchmark(testNames, repeat):
+  implementations = [("SparseMatrixConnections", SparseMatrixConnections),
+                     ("CSRConnections", CSRConnections)]
+  testCaseClasses = [createTestCaseClass(connectionsClass)
+                     for _, connectionsClass in implementations]
+
+  if not testNames:
+    testNames = unittest.TestLoader().getTestCaseNames(testCaseClasses[0])
+
+  print "{:<10}{:>26}{:>18}{:>10}".format(
+    "test", implementations[0][0], implementations[1][0], "ratio")
+
+  totals = [0.0, 0.0]
+  for testName in testNames:
+    times = [timeTest(testCaseClass, testName, repeat)
+             for testCaseClass in testCaseClasses]
+    if None in times:
+      print "{:<10}{:>26}{:>18}".format(
+        testName, *["failed" if t is None else "{:.3f}s".format(t)
+                    for t in times])
+      continue
+
+    totals = [total + t for total, t in zip(totals, times)]
+    print "{:<10}{:>25.3f}s{:>17.3f}s{:>9.2f}x".format(
+      testName, times[0], times[1], times[1] / times[0])
+
+  print "{:<10}{:>25.3f}s{:>17.3f}s{:>9.2f}x".format(
+    "total", totals[0], totals[1], totals[1] / max(totals[0], 1e-9))
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--tests", nargs="+", default=None,
+                      help="The sequence memory tests to run, e.g. testB1")
+  parser.add_argument("--repeat", type=int, default=1,
+                      help="Report the fastest of this many runs")
+  args = parser.parse_args()
+
+  runBenchmark(args.tests, args.repeat)
@@ -0,0 +1,240 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+Compare the speed of the windowed STDP update of the dynamic CAN networks to
+the previous implementation, which applied the kernel to one pair of buffered
+time steps at a time.
+
+The 1D network is timed with Dynamic1DCAN.learn.  Dynamic2DCAN.learnPlaceCode
+can't currently run a trajectory, so the 2D network is timed by driving
+stdpUpdate with random activations, the way learnPlaceCode does.
+
+tests/algorithms/dynamic_can_stdp_test.py checks that both give the same
+weights.
+
+Usage:
+  python benchmark_stdp.py
+  python benchmark_stdp.py --windows 10 100 --cells 200 --dimensions 20
+"""
+
+import argparse
+import time
+from collections import deque
+
+import numpy as np
+
+from htmresearch.frameworks.grid_cell_learning.DynamicCAN import (
+  Dynamic1DCAN, Dynamic2DCAN, placeSTDPKernel)
+
+
+
+class LoopSTDP1DCAN(Dynamic1DCAN):
+  """
+  Dynamic1DCAN with the previous stdpUpdate, kept here for timing.
+  """
+
+  def __init__(self, *args, **kwargs):
+    super(LoopSTDP1DCAN, self).__init__(*args, **kwargs)
+    self.activationBuffer = deque(maxlen=int(self.stdpWindow))
+
+
+  def stdpUpdate(self, time, clearBuffer=False, onlyPlace=False):
+    placeRate = self.learningRate * self.learnFactorP * self.dt
+    recurrentRate = self.learningRate * self.learnFactorEI * self.dt
+
+    if clearBuffer:
+      while len(self.activationBuffer) > 1:
+        baseI, baseEL, baseER, baseP, t = self.activationBuffer.popleft()
+        for (I, EL, ER, P, i) in self.activationBuffer:
+          t = (i - t) * self.dt
+          self.weightsPI += placeSTDPKernel(placeRate * baseP, I, t)
+          self.weightsPEL += placeSTDPKernel(placeRate * baseP, EL, t)
+          self.weightsPER += placeSTDPKernel(placeRate * baseP, ER, t)
+          if not onlyPlace:
+            self.weightsELI += self.stdpKernel(recurrentRate * baseEL, I, t,
+                                               False, True)
+            self.weightsERI += self.stdpKernel(recurrentRate * baseER, I, t,
+                                               False, True)
+
+    else:
+      for I, EL, ER, P, i in reversed(self.activationBuffer):
+        t = (i - time) * self.dt
+        P0 = placeRate * self.activationsP
+        self.weightsPI += placeSTDPKernel(P0, I, t)
+        self.weightsPEL += placeSTDPKernel(P0, EL, t)
+        self.weightsPER += placeSTDPKernel(P0, ER, t)
+        if not onlyPlace:
+          self.weightsELI += self.stdpKernel(
+            recurrentRate * self.instantaneousEL, I, t, False, True)
+          self.weightsERI += self.stdpKernel(
+            recurrentRate * self.instantaneousER, I, t, False, True)
+
+      for I, EL, ER, P, i in self.activationBuffer:
+        t = (time - i) * self.dt
+        self.weightsPI += placeSTDPKernel(placeRate * P,
+                                          self.instantaneousI, t)
+        self.weightsPEL += placeSTDPKernel(placeRate * P,
+                                           self.instantaneousEL, t)
+        self.weightsPER += placeSTDPKernel(placeRate * P,
+                                           self.instantaneousER, t)
+        if not onlyPlace:
+          self.weightsELI += self.stdpKernel(recurrentRate * EL,
+                                             self.instantaneousI, t,
+                                             False, True)
+          self.weightsERI += self.stdpKernel(recurrentRate * ER,
+                                             self.instantaneousI, t,
+                                             False, True)
+
+      self.activationBuffer.append((np.copy(self.instantaneousI),
+                                    np.copy(self.instantaneousEL),
+                                    np.copy(self.instantaneousER),
+                                    np.copy(self.activationsP),
+                                    time))
+
+
+
+class LoopSTDP2DCAN(Dynamic2DCAN):
+  """
+  Dynamic2DCAN with the previous stdpUpdate, kept here for timing.
+  """
+
+  def __init__(self, *args, **kwargs):
+    super(LoopSTDP2DCAN, self).__init__(*args, **kwargs)
+    self.activationBuffer = deque(maxlen=int(self.stdpWindow))
+
+
+  def pairKernels(self, t, I, E, baseI, baseE, baseP, onlyPlace=False):
+    rate = self.learningRate * self.learnFactorP * self.dt
+    self.weightsPI += placeSTDPKernel(rate * baseP, I, t)
+    for k in E:
+      self.weightsPE[k] += placeSTDPKernel(rate * baseP, E[k], t)
+      if not onlyPlace:
+        self.weightsEI[k] += self.stdpKernel(rate * baseE[k], I, t)
+        self.weightsIE[k] += self.stdpKernel(rate * baseI, E[k], t)
+
+
+  def stdpUpdate(self, time, clearBuffer=False, onlyPlace=False):
+    if clearBuffer:
+      while len(self.activationBuffer) > 1:
+        baseI, baseE, baseP, t = self.activationBuffer.popleft()
+        for (I, E, P, i) in self.activationBuffer:
+          t = (i - t) * self.dt
+          self.pairKernels(t, I, E, baseI, baseE, baseP, onlyPlace=onlyPlace)
+
+    else:
+      for I, E, P, i in reversed(self.activationBuffer):
+        t = (i - time) * self.dt
+        self.pairKernels(t, I, E, self.instantaneousI, self.instantaneous,
+                         self.activationsP, onlyPlace=onlyPlace)
+
+      for I, E, P, i in self.activationBuffer:
+        t = (time - i) * self.dt
+        self.pairKernels(t, self.instantaneousI, self.instantaneous, I, E, P,
+                         onlyPlace=onlyPlace)
+
+      self.activationBuffer.append((np.copy(self.instantaneousI),
+                                    dict((k, np.copy(self.instantaneous[k]))
+                                         for k in self.instantaneous),
+                                    np.copy(self.activationsP),
+                                    time))
+
+
+
+def time1D(cls, window, cells, runs, learnRecurrent):
+  np.random.seed(42)
+  net = cls(numExcitatory=cells,
+            numInhibitory=cells,
+            numPlaces=cells,
+            learningRate=0.005,
+            dt=0.002,
+            stdpWindow=window,
+            hardwireI=False,
+            plotting=False)
+
+  start = time.time()
+  net.learn(runs, periodic=True, learnRecurrent=learnRecurrent)
+  return time.time() - start
+
+
+
+def time2D(cls, window, dimensions, steps, learnRecurrent):
+  np.random.seed(42)
+  net = cls(numPlaces=dimensions * dimensions,
+            learningRate=0.005,
+            dt=0.002,
+            dimensions=(dimensions, dimensions),
+            stdpWindow=window,
+            hardwireI=False,
+            plotting=False,
+            movie=False)
+
+  rng = np.random.RandomState(42)
+  start = time.time()
+  for step in xrange(steps):
+    net.instantaneousI = rng.random_sample(net.numInhibitory)
+    for k in sorted(net.instantaneous):
+      net.instantaneous[k] = rng.random_sample(net.numExcitatory)
+    net.activationsP = rng.random_sample(net.numPlaces)
+    net.stdpUpdate(step * net.dt, onlyPlace=not learnRecurrent)
+  net.stdpUpdate(step * net.dt, onlyPlace=not learnRecurrent,
+                 clearBuffer=True)
+  return time.time() - start
+
+
+
+def report(name, window, loopTime, windowedTime):
+  print "{:>4}{:>8}{:>12.2f}s{:>12.2f}s{:>9.1f}x".format(
+    name, window, loopTime, windowedTime, loopTime / windowedTime)
+
+
+
+def runBenchmark(windows, cells, runs, dimensions, steps, learnRecurrent):
+  print "{:>4}{:>8}{:>13}{:>13}{:>10}".format(
+    "net", "window", "loop", "windowed", "speedup")
+
+  for window in windows:
+    report("1D", window,
+           time1D(LoopSTDP1DCAN, window, cells, runs, learnRecurrent),
+           time1D(Dynamic1DCAN, window, cells, runs, learnRecurrent))
+
+  for window in windows:
+    report("2D", window,
+           time2D(LoopSTDP2DCAN, window, dimensions, steps, learnRecurrent),
+           time2D(Dynamic2DCAN, window, dimensions, steps, learnRecurrent))
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--windows", type=int, nargs="+", default=[10, 50, 200])
+  parser.add_argument("--cells", type=int, default=200,
+                      help="Cells per population of the 1D network")
+  parser.add_argument("--runs", type=int, default=1,
+                      help="Learning runs of the 1D network")
+  parser.add_argument("--dimensions", type=int, default=16,
+                      help="Side of the 2D sheet")
+  parser.add_argument("--steps", type=int, default=500,
+                      help="Learning steps of the 2D network")
+  parser.add_argument("--learnRecurrent", action="store_true")
+  args = parser.parse_args()
+
+  runBenchmark(args.windows, args.cells, args.runs, args.dimensions,
+               args.steps, args.learnRecurrent)
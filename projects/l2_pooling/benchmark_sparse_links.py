@@ -0,0 +1,126 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Measure the time per network step of an L4L2Experiment with dense 0/1 links
+and with sparse links, on the same objects and sensations. Also checks that
+both networks end up with the same L2 representations.
+
+Usage:
+  python benchmark_sparse_links.py
+  python benchmark_sparse_links.py --columns 1 3 9 --l2CellCount 8192
+"""
+
+import argparse
+import random
+import time
+
+from htmresearch.frameworks.layers.object_machine_factory import (
+  createObjectMachine
+)
+from htmresearch.frameworks.layers.l2_l4_inference import L4L2Experiment
+
+
+
+def createSensations(objects, numColumns, numSteps):
+  """
+  Each column senses random pairs of object 0.
+  """
+  pairs = {col: [random.choice(objects[0]) for _ in xrange(numSteps)]
+           for col in xrange(numColumns)}
+  return objects.provideObjectToInfer({"numSteps": numSteps,
+                                       "pairs": pairs})
+
+
+
+def timeExperiment(sparseLinks, numColumns, l2CellCount, objects,
+                   sensations):
+  """
+  @return (tuple)
+  The learning and inference time per step in seconds, and the final L2
+  representations
+  """
+  exp = L4L2Experiment(
+    "sparse_links" if sparseLinks else "dense_links",
+    numCorticalColumns=numColumns,
+    L2Overrides={"cellCount": l2CellCount},
+    sparseLinks=sparseLinks,
+  )
+
+  objectsToLearn = objects.provideObjectsToLearn()
+  learnSteps = sum(len(sensationList)
+                   for sensationList in objectsToLearn.itervalues())
+  start = time.time()
+  exp.learnObjects(objectsToLearn)
+  learnTime = (time.time() - start) / (learnSteps * exp.numLearningPoints)
+
+  start = time.time()
+  exp.infer(sensations, objectName=0, reset=False)
+  inferTime = (time.time() - start) / len(sensations)
+
+  return learnTime, inferTime, exp.getL2Representations()
+
+
+
+def runBenchmark(columnCounts, l2CellCount, numObjects, numSteps):
+  print "{:>8}{:>16}{:>16}{:>16}{:>16}".format(
+    "columns", "dense learn", "sparse learn", "dense infer", "sparse infer")
+
+  for numColumns in columnCounts:
+    random.seed(42)
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=1024,
+      externalInputSize=1024,
+      numCorticalColumns=numColumns,
+    )
+    objects.createRandomObjects(numObjects, 10, numLocations=10,
+                                numFeatures=10)
+    sensations = createSensations(objects, numColumns, numSteps)
+
+    (denseLearn, denseInfer,
+     denseL2) = timeExperiment(False, numColumns, l2CellCount, objects,
+                               sensations)
+    (sparseLearn, sparseInfer,
+     sparseL2) = timeExperiment(True, numColumns, l2CellCount, objects,
+                                sensations)
+
+    if denseL2 != sparseL2:
+      print "Warning: the L2 representations differ for", numColumns, "columns"
+
+    print "{:>8}{:>14.2f}ms{:>14.2f}ms{:>14.2f}ms{:>14.2f}ms".format(
+      numColumns, denseLearn * 1000, sparseLearn * 1000,
+      denseInfer * 1000, sparseInfer * 1000)
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--columns", type=int, nargs="+", default=[1, 3, 5],
+                      help="The numbers of cortical columns to try")
+  parser.add_argument("--l2CellCount", type=int, default=4096)
+  parser.add_argument("--numObjects", type=int, default=10)
+  parser.add_argument("--numSteps", type=int, default=20,
+                      help="Number of inference steps")
+  args = parser.parse_args()
+
+  runBenchmark(args.columns, args.l2CellCount, args.numObjects, args.numSteps)
@@ -93,7 +93,7 @@ class MultiColumn2DExperiment(object):
 
   def __init__(self, objects, objectPlacements, featureNames, locationConfigs,
                numCorticalColumns, worldDimensions, featureW=15,
-               cellsPerColumn=32):
+               cellsPerColumn=32, implicitMetricConnections=False):
 
     self.objects = objects
     self.objectPlacements = objectPlacements
@@ -133,7 +133,8 @@ class MultiColumn2DExperiment(object):
           "cellDimensions": config["cellDimensions"],
           "anchorInputSize": inputLayer.numberOfCells(),
           "initialPermanence": 1.0,
-          "seed": random.randint(0,2048)})
+          "seed": random.randint(0,2048),
+          "implicitMetricConnections": implicitMetricConnections})
         for config in locationConfigs]
 
       self.corticalColumns.append(
@@ -142,7 +143,8 @@ class MultiColumn2DExperiment(object):
 
     self.bodyToSpecificObjectModules = []
     for iModule, config in enumerate(locationConfigs):
-      module = BodyToSpecificObjectModule2D(config["cellDimensions"])
+      module = BodyToSpecificObjectModule2D(config["cellDimensions"],
+                                            implicitMetricConnections)
       pairedSensorModules = [c.sensorToSpecificObjectModules[iModule]
                              for c in self.corticalColumns]
       module.formReciprocalSynapses(pairedSensorModules)
@@ -0,0 +1,129 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+Compare the speed of the batched k_winners function to the previous
+implementation, which copied the winners one sample at a time.
+
+Usage:
+  python benchmark_k_winners.py
+  python benchmark_k_winners.py --batchSizes 64 512 --ks 50 200 --units 2000
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+import argparse
+import time
+
+import torch
+
+from htmresearch.frameworks.pytorch.functions import k_winners
+
+
+
+class loop_k_winners(torch.autograd.Function):
+  """
+  The previous k_winners implementation, kept here as a reference.
+  """
+
+
+  @staticmethod
+  def forward(ctx, x, dutyCycles, k, boostStrength):
+    if boostStrength > 0.0:
+      targetDensity = float(k) / x.size(1)
+      boostFactors = torch.exp((targetDensity - dutyCycles) * boostStrength)
+      boosted = x.detach() * boostFactors
+    else:
+      boosted = x.detach()
+
+    res = torch.zeros_like(x)
+    topk, indices = boosted.topk(k, sorted=False)
+    for i in range(x.shape[0]):
+      res[i, indices[i]] = x[i, indices[i]]
+
+    ctx.save_for_backward(indices)
+    return res
+
+
+  @staticmethod
+  def backward(ctx, grad_output):
+    indices, = ctx.saved_tensors
+    grad_x = torch.zeros_like(grad_output, requires_grad=True)
+    for i in range(grad_output.size(0)):
+      grad_x[i, indices[i]] = grad_output[i, indices[i]]
+
+    return grad_x, None, None, None
+
+
+
+def timeFunction(function, x, dutyCycles, k, boostStrength, repetitions):
+  """
+  :return: The average time of a forward and backward pass, in seconds, and
+           the output and gradient of the last pass
+  """
+  start = time.time()
+  for _ in range(repetitions):
+    x.grad = None
+    out = function.apply(x, dutyCycles, k, boostStrength)
+    out.sum().backward()
+
+  return (time.time() - start) / repetitions, out.detach(), x.grad.clone()
+
+
+
+def runBenchmark(batchSizes, ks, units, boostStrength, repetitions):
+  print("{:>8}{:>8}{:>14}{:>14}{:>10}".format(
+    "batch", "k", "loop", "batched", "speedup"))
+
+  for batchSize in batchSizes:
+    for k in ks:
+      torch.manual_seed(42)
+      x = torch.randn(batchSize, units, requires_grad=True)
+      dutyCycles = torch.rand(units) * 2 * k / units
+
+      (loopTime, loopOut,
+       loopGrad) = timeFunction(loop_k_winners, x, dutyCycles, k,
+                                boostStrength, repetitions)
+      (batchedTime, batchedOut,
+       batchedGrad) = timeFunction(k_winners, x, dutyCycles, k, boostStrength,
+                                   repetitions)
+
+      if not (torch.equal(loopOut, batchedOut) and
+              torch.equal(loopGrad, batchedGrad)):
+        print("Warning: the outputs differ for batch", batchSize, "k", k)
+
+      print("{:>8}{:>8}{:>12.3f}ms{:>12.3f}ms{:>9.1f}x".format(
+        batchSize, k, loopTime * 1000, batchedTime * 1000,
+        loopTime / batchedTime))
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--batchSizes", type=int, nargs="+",
+                      default=[1, 16, 128, 512])
+  parser.add_argument("--ks", type=int, nargs="+", default=[20, 100, 400])
+  parser.add_argument("--units", type=int, default=2000)
+  parser.add_argument("--boostStrength", type=float, default=1.5)
+  parser.add_argument("--repetitions", type=int, default=20)
+  args = parser.parse_args()
+
+  runBenchmark(args.batchSizes, args.ks, args.units, args.boostStrength,
+               args.repetitions)
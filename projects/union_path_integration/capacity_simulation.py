@@ -25,12 +25,14 @@ accuracy.
 """
 
 import argparse
+import copy
 import io
 import math
 import os
 import random
 from multiprocessing import cpu_count, Pool
-from copy import copy
+import shutil
+import tempfile
 import time
 import json
 
@@ -44,6 +46,13 @@ from htmresearch.frameworks.location.two_layer_tracing import (
 
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 
+# Distributions that generate every object independently. With these, a set of
+# objects can be extended without changing the statistics of the set, so the
+# capacity search can keep its learned objects between probes.
+INDEPENDENT_OBJECT_DISTRIBUTIONS = ("AllFeaturesEqual_Replacement",
+                                    "TwoPools_Replacement",
+                                    "TwoPools_Structured")
+
 
 
 class PIUNCellActivityTracer(PIUNExperimentMonitor):
@@ -85,7 +94,8 @@ def doExperiment(locationModuleWidth,
                  thresholds,
                  seed1,
                  seed2,
-                 anchoringMethod):
+                 anchoringMethod,
+                 relearn=False):
   """
   Finds the capacity of the specified model and object configuration. The
   algorithm has two stages. First it finds an upper bound for the capacity by
@@ -113,6 +123,12 @@ def doExperiment(locationModuleWidth,
 
   @param minAccuracy (float)
   The recognition success rate that the model must achieve.
+
+  @param relearn (bool)
+  If False, each probe restores a snapshot of the experiment of the last
+  successful probe and only learns the additional objects. This requires a
+  featureDistribution in INDEPENDENT_OBJECT_DISTRIBUTIONS; with other
+  distributions every probe learns a new set of objects from scratch.
   """
   if not os.path.exists("traces"):
     os.makedirs("traces")
@@ -170,11 +186,28 @@ def doExperiment(locationModuleWidth,
     "cellsPerColumn": 16,
   }
 
+  def createExperiment():
+    column = PIUNCorticalColumn(locationConfigs, L4Overrides=l4Overrides,
+                                bumpType=bumpType)
+    return PIUNExperiment(column, featureNames=features,
+                          numActiveMinicolumns=10,
+                          noiseFactor=noiseFactor,
+                          moduleNoiseFactor=moduleNoiseFactor)
+
+  reuseLearning = (not relearn and
+                   featureDistribution in INDEPENDENT_OBJECT_DISTRIBUTIONS)
+
   numObjects = 0
   accuracy = None
   allLocationsAreUnique = None
   occurrencesConvergenceLog = []
 
+  # When reusing learning: every object generated so far, and a snapshot of
+  # the experiment that has learned the first numObjects of them. Each probe
+  # forks a fresh experiment from the snapshot.
+  objectPool = []
+  learnedSnapshot = None
+
   increment = initialIncrement
   foundUpperBound = False
 
@@ -183,19 +216,33 @@ def doExperiment(locationModuleWidth,
     numFailuresAllowed = currentNumObjects * (1 - minAccuracy)
     print "Testing", currentNumObjects
 
-    objects = generateObjects(currentNumObjects, featuresPerObject, objectWidth,
-                              numFeatures, featureDistribution)
-
-    column = PIUNCorticalColumn(locationConfigs, L4Overrides=l4Overrides,
-                                bumpType=bumpType)
-    exp = PIUNExperiment(column, featureNames=features,
-                         numActiveMinicolumns=10,
-                         noiseFactor=noiseFactor,
-                         moduleNoiseFactor=moduleNoiseFactor)
-
-    currentLocsUnique = True
+    if reuseLearning:
+      if len(objectPool) < currentNumObjects:
+        newObjects = generateObjects(currentNumObjects - len(objectPool),
+                                     featuresPerObject, objectWidth,
+                                     numFeatures, featureDistribution)
+        for objectDescription in newObjects:
+          objectDescription["name"] = str(len(objectPool))
+          objectPool.append(objectDescription)
+
+      objects = objectPool[:currentNumObjects]
+
+      exp = createExperiment()
+      if learnedSnapshot is None:
+        objectsToLearn = objects
+        currentLocsUnique = True
+      else:
+        exp.loadSnapshot(learnedSnapshot, mmap=False)
+        objectsToLearn = objects[numObjects:]
+        currentLocsUnique = allLocationsAreUnique
+    else:
+      objects = generateObjects(currentNumObjects, featuresPerObject,
+                                objectWidth, numFeatures, featureDistribution)
+      exp = createExperiment()
+      objectsToLearn = objects
+      currentLocsUnique = True
 
-    for objectDescription in objects:
+    for objectDescription in objectsToLearn:
       objLocsUnique = exp.learnObject(objectDescription)
       currentLocsUnique = currentLocsUnique and objLocsUnique
 
@@ -230,6 +277,11 @@ def doExperiment(locationModuleWidth,
       numObjects = currentNumObjects
       accuracy = float(currentNumObjects - numFailures) / currentNumObjects
       allLocationsAreUnique = currentLocsUnique
+      if reuseLearning:
+        if learnedSnapshot is not None:
+          shutil.rmtree(learnedSnapshot)
+        learnedSnapshot = tempfile.mkdtemp()
+        exp.saveSnapshot(learnedSnapshot)
     else:
       foundUpperBound = True
 
@@ -245,6 +297,9 @@ def doExperiment(locationModuleWidth,
       if increment < goalResolution:
         break
 
+  if learnedSnapshot is not None:
+    shutil.rmtree(learnedSnapshot)
+
   result = {
     "numObjects": numObjects,
     "accuracy": accuracy,
@@ -271,7 +326,7 @@ def runMultiprocessNoiseExperiment(resultName, repeat, numWorkers,
       newExperiments = []
       for experiment in experiments:
         for val in values:
-          newExperiment = copy(experiment)
+          newExperiment = copy.copy(experiment)
           newExperiment[key] = val
           newExperiments.append(newExperiment)
       experiments = newExperiments
@@ -281,27 +336,53 @@ def runMultiprocessNoiseExperiment(resultName, repeat, numWorkers,
   newExperiments = []
   for experiment in experiments:
     for _ in xrange(repeat):
-      newExperiments.append(copy(experiment))
+      newExperiments.append(copy.copy(experiment))
   experiments = newExperiments
 
   return runExperiments(experiments, resultName, numWorkers, appendResults)
 
 
+def indexedExperimentWrapper(indexedArgs):
+  i, args = indexedArgs
+  return i, doExperiment(**args)
+
+
+def estimateExperimentCost(args):
+  """
+  A rough estimate of how long a capacity search takes, used for ordering. The
+  capacity, and so the number of objects learned in every probe, grows with the
+  number of location cells and with the number of unique features.
+  """
+  return (args.get("numModules", 1) *
+          args.get("locationModuleWidth", 1)**2 *
+          args.get("numFeatures", 1))
+
+
 def runExperiments(experiments, resultName, numWorkers=-1, appendResults=False):
   if numWorkers == -1:
     numWorkers = cpu_count()
 
   if numWorkers > 1:
+    # Start the most expensive searches first, and hand out one search at a
+    # time, so that the long ones don't end up running alone at the end while
+    # the other workers are idle.
+    order = sorted(xrange(len(experiments)),
+                   key=lambda i: -estimateExperimentCost(experiments[i]))
+
     pool = Pool(processes=numWorkers)
-    rs = pool.map_async(experimentWrapper, experiments, chunksize=1)
-    while not rs.ready():
-      remaining = rs._number_left
-      pctDone = 100.0 - (100.0*remaining) / len(experiments)
-      print "    =>", remaining, "experiments remaining, percent complete=",pctDone
-      time.sleep(5)
+    result = [None] * len(experiments)
+    startTime = time.time()
+    for numDone, (i, res) in enumerate(pool.imap_unordered(
+        indexedExperimentWrapper,
+        [(i, experiments[i]) for i in order],
+        chunksize=1), 1):
+      result[i] = res
+      remaining = len(experiments) - numDone
+      pctDone = (100.0*numDone) / len(experiments)
+      print "    =>", remaining, "experiments remaining, percent complete=",pctDone,
+      print "elapsed={:.0f}s".format(time.time() - startTime)
     pool.close()  # No more work
     pool.join()
-    result = rs.get()
   else:
     result = []
     for arg in experiments:
@@ -355,6 +436,10 @@ if __name__ == "__main__":
   parser.add_argument("--repeat", type=int, default=1)
   parser.add_argument("--appendResults", action="store_true")
   parser.add_argument("--numWorkers", type=int, default=cpu_count())
+  parser.add_argument(
+    "--relearn", action="store_true",
+    help="Learn every probe's objects from scratch instead of adding to the "
+         "objects learned in the previous successful probe")
 
   args = parser.parse_args()
 
@@ -386,4 +471,5 @@ if __name__ == "__main__":
     anchoringMethod=args.anchoringMethod,
     seed1=args.seed1,
     seed2=args.seed2,
+    relearn=args.relearn,
   )
@@ -0,0 +1,134 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Check that batched inference on the ApicalTiebreakTemporalMemory gives the same
+results as running each stream separately.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.apical_tiebreak_temporal_memory import (
+  ApicalTiebreakPairMemory, ApicalTiebreakSequenceMemory)
+
+
+class ApicalTiebreakTM_BatchInferenceTests(unittest.TestCase):
+
+  columnCount = 256
+  cellsPerColumn = 8
+  basalInputSize = 512
+  apicalInputSize = 512
+  w = 10
+
+
+  def setUp(self):
+    self.rng = np.random.RandomState(42)
+
+
+  def randomPattern(self, size):
+    return np.sort(self.rng.choice(size, self.w,
+                                   replace=False)).astype("uint32")
+
+
+  def testPairMemoryBatchMatchesSingleStream(self):
+    tm = ApicalTiebreakPairMemory(columnCount=self.columnCount,
+                                  basalInputSize=self.basalInputSize,
+                                  apicalInputSize=self.apicalInputSize,
+                                  cellsPerColumn=self.cellsPerColumn,
+                                  initialPermanence=0.6,
+                                  activationThreshold=8,
+                                  reducedBasalThreshold=6,
+                                  minThreshold=6,
+                                  sampleSize=self.w)
+
+    triples = [(self.randomPattern(self.columnCount),
+                self.randomPattern(self.basalInputSize),
+                self.randomPattern(self.apicalInputSize))
+               for _ in xrange(5)]
+    for _ in xrange(3):
+      for activeColumns, basalInput, apicalInput in triples:
+        tm.compute(activeColumns, basalInput, apicalInput, learn=True)
+
+    # Mix learned and novel inputs, with and without apical input.
+    streams = triples + [(triples[0][0], triples[1][1], ()),
+                         (triples[2][0], np.union1d(triples[2][1],
+                                                    triples[3][1]),
+                          triples[2][2]),
+                         (self.randomPattern(self.columnCount), (), ())]
+
+    (predictedCells,
+     activeCells) = tm.computeBatch([s[0] for s in streams],
+                                    [s[1] for s in streams],
+                                    [s[2] for s in streams])
+    predictedCells = tm.splitStreamCells(predictedCells, len(streams))
+    activeCells = tm.splitStreamCells(activeCells, len(streams))
+
+    for i, (activeColumns, basalInput, apicalInput) in enumerate(streams):
+      tm.compute(activeColumns, basalInput, apicalInput, learn=False)
+      self.assertEqual(np.unique(tm.getPredictedCells()).tolist(),
+                       predictedCells[i].tolist())
+      self.assertEqual(tm.getActiveCells().tolist(),
+                       activeCells[i].tolist())
+
+
+  def testSequenceMemoryBatchMatchesSingleStream(self):
+    tm = ApicalTiebreakSequenceMemory(columnCount=self.columnCount,
+                                      cellsPerColumn=self.cellsPerColumn,
+                                      initialPermanence=0.6,
+                                      activationThreshold=8,
+                                      minThreshold=6,
+                                      sampleSize=self.w)
+
+    sequences = [[self.randomPattern(self.columnCount) for _ in xrange(4)]
+                 for _ in xrange(3)]
+    for _ in xrange(3):
+      for sequence in sequences:
+        tm.reset()
+        for activeColumns in sequence:
+          tm.compute(activeColumns, learn=True)
+
+    predictedCells = np.empty(0, dtype="int64")
+    batchActiveCells = []
+    batchPredictedCells = []
+    for step in xrange(4):
+      (activeCells,
+       predictedCells) = tm.computeBatch([s[step] for s in sequences],
+                                         predictedCells)
+      batchActiveCells.append(
+        tm.splitStreamCells(activeCells, len(sequences)))
+      batchPredictedCells.append(
+        tm.splitStreamCells(predictedCells, len(sequences)))
+
+    for i, sequence in enumerate(sequences):
+      tm.reset()
+      for step, activeColumns in enumerate(sequence):
+        tm.compute(activeColumns, learn=False)
+        self.assertEqual(tm.getActiveCells().tolist(),
+                         batchActiveCells[step][i].tolist())
+        self.assertEqual(np.unique(tm.getNextPredictedCells()).tolist(),
+                         batchPredictedCells[step][i].tolist())
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the columnar traces to the lists of the nupic traces.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from htmresearch.support.columnar_trace import (
+  ColumnarIndicesTrace, ColumnarStringsTrace, ColumnarBoolsTrace,
+  computeOverlapMatrix, createMetricFromTrace, labeledPairs)
+
+
+class ColumnarTraceTest(unittest.TestCase):
+
+  def setUp(self):
+    self.rng = np.random.RandomState(42)
+
+
+  def randomIndices(self):
+    return set(self.rng.randint(50, size=self.rng.randint(10)).tolist())
+
+
+  def assertSameIndices(self, maxLength=None, directory=None):
+    trace = ColumnarIndicesTrace(None, "indices", maxLength, directory)
+    steps = []
+    for _ in xrange(100):
+      indices = self.randomIndices()
+      trace.data.append(np.array(sorted(indices)))
+      steps.append(indices)
+
+      expected = steps[-maxLength:] if maxLength is not None else steps
+      self.assertEqual(len(trace.data), len(expected))
+      self.assertEqual(list(trace.data), expected)
+      self.assertEqual(trace.data[-1], expected[-1])
+      self.assertEqual(trace.data[1:3], expected[1:3])
+      self.assertEqual(trace.makeCountsTrace().data.array().tolist(),
+                       [len(indices) for indices in expected])
+
+
+  def testIndices(self):
+    self.assertSameIndices()
+
+
+  def testIndicesWindow(self):
+    self.assertSameIndices(maxLength=7)
+
+
+  def testIndicesInFiles(self):
+    directory = tempfile.mkdtemp()
+    try:
+      self.assertSameIndices(maxLength=30, directory=directory)
+    finally:
+      shutil.rmtree(directory)
+
+
+  def testOverlapsAndPairs(self):
+    indicesTrace = ColumnarIndicesTrace(None, "indices", maxLength=20)
+    labelsTrace = ColumnarStringsTrace(None, "labels", maxLength=20)
+    resetsTrace = ColumnarBoolsTrace(None, "resets", maxLength=20)
+
+    for _ in xrange(50):
+      indicesTrace.data.append(self.randomIndices())
+      labelsTrace.data.append(["A", "B", None][self.rng.randint(3)])
+      resetsTrace.data.append(self.rng.rand() < 0.2)
+
+    steps = list(indicesTrace.data)
+    labels = list(labelsTrace.data)
+    resets = list(resetsTrace.data)
+
+    overlaps = computeOverlapMatrix(indicesTrace.data, 50)
+    self.assertEqual(overlaps.tolist(),
+                     [[len(a & b) for b in steps] for a in steps])
+
+    expectedPairs = [(i, j, labels[i] == labels[j])
+                     for i in xrange(len(steps)) for j in xrange(i)
+                     if (labels[i] is not None and not resets[i] and
+                         labels[j] is not None and not resets[j])]
+    rows, columns, sameSequence = labeledPairs(labelsTrace, resetsTrace)
+    self.assertEqual(zip(rows.tolist(), columns.tolist(),
+                         sameSequence.tolist()),
+                     expectedPairs)
+
+    metric = createMetricFromTrace(indicesTrace.makeCountsTrace(),
+                                   excludeResets=resetsTrace)
+    counts = [len(indices) for indices, reset in zip(steps, resets)
+              if not reset]
+    self.assertEqual(metric.sum, sum(counts))
+    self.assertEqual(metric.max, max(counts))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
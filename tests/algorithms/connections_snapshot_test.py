@@ -0,0 +1,88 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Check that snapshots of connections keep the segment numbers, including when
+segments have been destroyed.
+"""
+
+import unittest
+
+import numpy as np
+
+from nupic.bindings.math import SparseMatrixConnections
+
+from htmresearch.algorithms.csr_connections import CSRConnections
+from htmresearch.support import snapshots
+
+
+class ConnectionsSnapshotTest(unittest.TestCase):
+
+  cellCount = 32
+  inputSize = 100
+
+
+  def assertRestoresSegments(self, connectionsClass):
+    rng = np.random.RandomState(42)
+    connections = connectionsClass(self.cellCount, self.inputSize)
+    segments = connections.createSegments(
+      rng.randint(self.cellCount, size=10).astype("uint32"))
+    for segment in segments:
+      connections.growSynapses(
+        np.array([segment], dtype="uint32"),
+        np.unique(rng.randint(self.inputSize, size=8)).astype("uint32"),
+        0.3)
+    destroyed = segments[[2, 5, 6]]
+    connections.destroySegments(destroyed)
+
+    arrays = snapshots.connectionsToArrays("c", connections)
+    restored = connectionsClass(self.cellCount, self.inputSize)
+    snapshots.restoreConnections("c", restored, arrays)
+
+    live = np.setdiff1d(segments, destroyed).astype("uint32")
+    self.assertEqual(restored.numSegments(), connections.numSegments())
+    self.assertEqual(restored.matrix.nRows(), connections.matrix.nRows())
+    np.testing.assert_equal(restored.mapSegmentsToCells(live),
+                            connections.mapSegmentsToCells(live))
+    for segment in segments:
+      np.testing.assert_equal(restored.matrix.getRow(segment),
+                              connections.matrix.getRow(segment))
+    np.testing.assert_equal(
+      restored.getSegmentCounts(np.arange(self.cellCount, dtype="uint32")),
+      connections.getSegmentCounts(np.arange(self.cellCount, dtype="uint32")))
+
+    # The destroyed segment numbers are reused by both.
+    newCells = np.array([1, 2, 3], dtype="uint32")
+    np.testing.assert_equal(np.sort(restored.createSegments(newCells)),
+                            np.sort(connections.createSegments(newCells)))
+
+
+  def testSparseMatrixConnections(self):
+    self.assertRestoresSegments(SparseMatrixConnections)
+
+
+  def testCSRConnections(self):
+    self.assertRestoresSegments(CSRConnections)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
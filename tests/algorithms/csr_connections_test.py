@@ -0,0 +1,169 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2017, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare CSRConnections to SparseMatrixConnections on deterministic operations.
+"""
+
+import unittest
+
+import numpy as np
+
+from nupic.bindings.math import Random, SparseMatrixConnections
+
+from htmresearch.algorithms.csr_connections import CSRConnections
+
+
+class CSRConnectionsTest(unittest.TestCase):
+
+  cellCount = 64
+  inputSize = 200
+
+
+  def setUp(self):
+    self.rng = np.random.RandomState(42)
+    self.cpp = SparseMatrixConnections(self.cellCount, self.inputSize)
+    self.csr = CSRConnections(self.cellCount, self.inputSize)
+
+
+  def randomInput(self, w=20):
+    return np.sort(self.rng.choice(self.inputSize, w,
+                                   replace=False)).astype("uint32")
+
+
+  def both(self, methodName, *args):
+    results = [getattr(connections, methodName)(*args)
+               for connections in (self.cpp, self.csr)]
+    return results
+
+
+  def assertSameActivity(self, activeInput):
+    for threshold in (None, 0.3, 0.5):
+      cppOverlaps, csrOverlaps = self.both("computeActivity", activeInput,
+                                           threshold)
+      np.testing.assert_equal(cppOverlaps, csrOverlaps)
+
+
+  def testSegmentBookkeeping(self):
+    cells = np.array([3, 3, 7, 63], dtype="uint32")
+    cppSegments, csrSegments = self.both("createSegments", cells)
+    np.testing.assert_equal(cppSegments, csrSegments)
+
+    np.testing.assert_equal(*self.both("mapSegmentsToCells", csrSegments))
+    np.testing.assert_equal(*self.both("getSegmentCounts",
+                                       np.arange(self.cellCount,
+                                                 dtype="uint32")))
+    np.testing.assert_equal(*self.both("filterSegmentsByCell", csrSegments,
+                                       np.array([3, 63], dtype="uint32")))
+
+
+  def testGrowAndAdjust(self):
+    segments = self.csr.createSegments(
+      np.arange(0, self.cellCount, 2, dtype="uint32"))
+    self.cpp.createSegments(np.arange(0, self.cellCount, 2, dtype="uint32"))
+
+    # Grow past the initial row capacity several times, so rows get moved.
+    for _ in xrange(10):
+      chosen = np.sort(self.rng.choice(segments, 10,
+                                       replace=False)).astype("uint32")
+      self.both("growSynapses", chosen, self.randomInput(), 0.21)
+      self.both("adjustSynapses", chosen, self.randomInput(), 0.1, -0.05)
+      self.assertSameActivity(self.randomInput())
+
+    np.testing.assert_equal(*self.both("mapSegmentsToSynapseCounts",
+                                       segments))
+
+    # Decrement until synapses are removed.
+    for _ in xrange(5):
+      self.both("adjustSynapses", segments, (), 0.0, -0.1)
+      self.assertSameActivity(self.randomInput(60))
+
+    np.testing.assert_equal(*self.both("mapSegmentsToSynapseCounts",
+                                       segments))
+
+
+  def testInputIndexMatchesScan(self):
+    segments = self.csr.createSegments(
+      np.arange(self.cellCount, dtype="uint32"))
+    self.csr.growSynapses(segments, self.randomInput(100), 0.4)
+    self.csr.adjustSynapses(segments[::2], self.randomInput(100), 0.2, 0.0)
+
+    activeInput = self.randomInput()
+    expected = self.csr.computeActivity(activeInput, 0.5)
+    for _ in xrange(CSRConnections.INDEX_AFTER_CALLS):
+      self.csr.computeActivity(activeInput)
+
+    self.assertIsNotNone(self.csr._inputIndexSlots)
+    np.testing.assert_equal(expected,
+                            self.csr.computeActivity(activeInput, 0.5))
+
+
+  def testGrowSynapsesToSample(self):
+    segments = self.csr.createSegments(np.array([1, 2, 3], dtype="uint32"))
+    activeInput = self.randomInput(30)
+    self.csr.growSynapses(segments[:1], activeInput[:10], 0.21)
+
+    self.csr.growSynapsesToSample(segments, activeInput,
+                                  np.array([5, 40, 0]), 0.21, Random(42))
+
+    np.testing.assert_equal([15, 30, 0],
+                            self.csr.mapSegmentsToSynapseCounts(segments))
+    np.testing.assert_equal([15, 30, 0],
+                            self.csr.computeActivity(activeInput))
+
+
+  def testDestroyedSegmentsAreReused(self):
+    segments = self.csr.createSegments(np.array([1, 2, 3], dtype="uint32"))
+    self.csr.growSynapses(segments, self.randomInput(), 0.21)
+
+    self.csr.destroySegments(segments[1:2])
+    np.testing.assert_equal([1, 0, 1],
+                            self.csr.getSegmentCounts([1, 2, 3]))
+    np.testing.assert_equal([CSRConnections.DESTROYED_SEGMENT_CELL],
+                            self.csr.mapSegmentsToCells(segments[1:2]))
+    self.assertEqual(0, self.csr.computeActivity(
+      np.arange(self.inputSize))[segments[1]])
+
+    reused = self.csr.createSegments(np.array([9], dtype="uint32"))
+    np.testing.assert_equal(segments[1:2], reused)
+    np.testing.assert_equal([9], self.csr.mapSegmentsToCells(reused))
+    np.testing.assert_equal([0], self.csr.mapSegmentsToSynapseCounts(reused))
+
+
+  def testMatrixView(self):
+    segments = self.csr.createSegments(np.array([1, 2], dtype="uint32"))
+    self.csr.matrix.setElements(np.array([0, 0, 1], dtype="uint32"),
+                                np.array([5, 9, 5], dtype="uint32"),
+                                np.float32(0.4))
+    self.csr.matrix.setElements(np.array([0], dtype="uint32"),
+                                np.array([9], dtype="uint32"),
+                                np.float32(0.7))
+
+    row = self.csr.matrix.getRow(segments[0])
+    self.assertAlmostEqual(0.4, row[5])
+    self.assertAlmostEqual(0.7, row[9])
+    self.assertEqual(2, np.count_nonzero(row))
+    self.assertEqual(3, self.csr.matrix.nNonZeros())
+
+
+
+if __name__ == "__main__":
+  unittest.main()
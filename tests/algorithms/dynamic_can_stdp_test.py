@@ -0,0 +1,268 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the windowed STDP update of the dynamic CAN networks to applying the
+kernel to one pair of buffered time steps at a time.
+"""
+
+import unittest
+from collections import deque
+
+import numpy as np
+
+from htmresearch.frameworks.grid_cell_learning.DynamicCAN import (
+  Dynamic1DCAN, Dynamic2DCAN, placeSTDPKernel)
+
+
+
+class LoopSTDP1DCAN(Dynamic1DCAN):
+  """
+  Dynamic1DCAN with a loop over the buffered time steps in stdpUpdate.
+  """
+
+  def __init__(self, *args, **kwargs):
+    super(LoopSTDP1DCAN, self).__init__(*args, **kwargs)
+    self.activationBuffer = deque(maxlen=int(self.stdpWindow))
+
+
+  def stdpUpdate(self, time, clearBuffer=False, onlyPlace=False):
+    placeRate = self.learningRate * self.learnFactorP * self.dt
+    recurrentRate = self.learningRate * self.learnFactorEI * self.dt
+
+    if clearBuffer:
+      while len(self.activationBuffer) > 1:
+        baseI, baseEL, baseER, baseP, t = self.activationBuffer.popleft()
+        for (I, EL, ER, P, i) in self.activationBuffer:
+          t = (i - t) * self.dt
+          self.weightsPI += placeSTDPKernel(placeRate * baseP, I, t)
+          self.weightsPEL += placeSTDPKernel(placeRate * baseP, EL, t)
+          self.weightsPER += placeSTDPKernel(placeRate * baseP, ER, t)
+          if not onlyPlace:
+            self.weightsELI += self.stdpKernel(recurrentRate * baseEL, I, t,
+                                               False, True)
+            self.weightsERI += self.stdpKernel(recurrentRate * baseER, I, t,
+                                               False, True)
+
+    else:
+      for I, EL, ER, P, i in reversed(self.activationBuffer):
+        t = (i - time) * self.dt
+        P0 = placeRate * self.activationsP
+        self.weightsPI += placeSTDPKernel(P0, I, t)
+        self.weightsPEL += placeSTDPKernel(P0, EL, t)
+        self.weightsPER += placeSTDPKernel(P0, ER, t)
+        if not onlyPlace:
+          self.weightsELI += self.stdpKernel(
+            recurrentRate * self.instantaneousEL, I, t, False, True)
+          self.weightsERI += self.stdpKernel(
+            recurrentRate * self.instantaneousER, I, t, False, True)
+
+      for I, EL, ER, P, i in self.activationBuffer:
+        t = (time - i) * self.dt
+        self.weightsPI += placeSTDPKernel(placeRate * P,
+                                          self.instantaneousI, t)
+        self.weightsPEL += placeSTDPKernel(placeRate * P,
+                                           self.instantaneousEL, t)
+        self.weightsPER += placeSTDPKernel(placeRate * P,
+                                           self.instantaneousER, t)
+        if not onlyPlace:
+          self.weightsELI += self.stdpKernel(recurrentRate * EL,
+                                             self.instantaneousI, t,
+                                             False, True)
+          self.weightsERI += self.stdpKernel(recurrentRate * ER,
+                                             self.instantaneousI, t,
+                                             False, True)
+
+      self.activationBuffer.append((np.copy(self.instantaneousI),
+                                    np.copy(self.instantaneousEL),
+                                    np.copy(self.instantaneousER),
+                                    np.copy(self.activationsP),
+                                    time))
+
+
+
+class LoopSTDP2DCAN(Dynamic2DCAN):
+  """
+  Dynamic2DCAN with a loop over the buffered time steps in stdpUpdate.
+  """
+
+  def __init__(self, *args, **kwargs):
+    super(LoopSTDP2DCAN, self).__init__(*args, **kwargs)
+    self.activationBuffer = deque(maxlen=int(self.stdpWindow))
+
+
+  def pairKernels(self, t, I, E, baseI, baseE, baseP, onlyPlace=False):
+    rate = self.learningRate * self.learnFactorP * self.dt
+    self.weightsPI += placeSTDPKernel(rate * baseP, I, t)
+    for k in E:
+      self.weightsPE[k] += placeSTDPKernel(rate * baseP, E[k], t)
+      if not onlyPlace:
+        self.weightsEI[k] += self.stdpKernel(rate * baseE[k], I, t)
+        self.weightsIE[k] += self.stdpKernel(rate * baseI, E[k], t)
+
+
+  def stdpUpdate(self, time, clearBuffer=False, onlyPlace=False):
+    if clearBuffer:
+      while len(self.activationBuffer) > 1:
+        baseI, baseE, baseP, t = self.activationBuffer.popleft()
+        for (I, E, P, i) in self.activationBuffer:
+          t = (i - t) * self.dt
+          self.pairKernels(t, I, E, baseI, baseE, baseP, onlyPlace=onlyPlace)
+
+    else:
+      for I, E, P, i in reversed(self.activationBuffer):
+        t = (i - time) * self.dt
+        self.pairKernels(t, I, E, self.instantaneousI, self.instantaneous,
+                         self.activationsP, onlyPlace=onlyPlace)
+
+      for I, E, P, i in self.activationBuffer:
+        t = (time - i) * self.dt
+        self.pairKernels(t, self.instantaneousI, self.instantaneous, I, E, P,
+                         onlyPlace=onlyPlace)
+
+      self.activationBuffer.append((np.copy(self.instantaneousI),
+                                    dict((k, np.copy(self.instantaneous[k]))
+                                         for k in self.instantaneous),
+                                    np.copy(self.activationsP),
+                                    time))
+
+
+
+class DynamicCANSTDPTest(unittest.TestCase):
+
+  window = 5
+
+
+  def create1D(self, cls):
+    np.random.seed(42)
+    return cls(numExcitatory=20,
+               numInhibitory=16,
+               numPlaces=12,
+               learningRate=0.005,
+               dt=0.002,
+               stdpWindow=self.window,
+               hardwireI=False,
+               plotting=False)
+
+
+  def create2D(self, cls):
+    # stdpUpdate adds place updates shaped (places, cells) to the 2D place
+    # weights, which are shaped (cells, places), so they must be square.
+    np.random.seed(42)
+    return cls(numPlaces=36,
+               learningRate=0.005,
+               dt=0.002,
+               dimensions=(6, 6),
+               stdpWindow=self.window,
+               hardwireI=False,
+               plotting=False,
+               movie=False)
+
+
+  @staticmethod
+  def weights1D(net):
+    return [net.weightsPI, net.weightsPEL, net.weightsPER, net.weightsELI,
+            net.weightsERI]
+
+
+  @staticmethod
+  def weights2D(net):
+    return ([net.weightsPI] +
+            [net.weightsPE[k] for k in sorted(net.weightsPE)] +
+            [net.weightsEI[k] for k in sorted(net.weightsEI)] +
+            [net.weightsIE[k] for k in sorted(net.weightsIE)])
+
+
+  @staticmethod
+  def setActivations1D(net, rng):
+    net.instantaneousI = rng.random_sample(net.instantaneousI.shape)
+    net.instantaneousEL = rng.random_sample(net.instantaneousEL.shape)
+    net.instantaneousER = rng.random_sample(net.instantaneousER.shape)
+    net.activationsP = rng.random_sample(net.activationsP.shape)
+
+
+  @staticmethod
+  def setActivations2D(net, rng):
+    net.instantaneousI = rng.random_sample(net.numInhibitory)
+    for k in sorted(net.instantaneous):
+      net.instantaneous[k] = rng.random_sample(net.numExcitatory)
+    net.activationsP = rng.random_sample(net.numPlaces)
+
+
+  def runSTDP(self, net, setActivations, onlyPlace):
+    """
+    Learn for more steps than the window holds, flush the buffer, and keep
+    learning from the step left in the buffer.
+    """
+    rng = np.random.RandomState(7)
+    for step in xrange(12):
+      setActivations(net, rng)
+      net.stdpUpdate(step, onlyPlace=onlyPlace)
+    net.stdpUpdate(step, clearBuffer=True, onlyPlace=onlyPlace)
+
+    for step in xrange(12, 15):
+      setActivations(net, rng)
+      net.stdpUpdate(step, onlyPlace=onlyPlace)
+    net.stdpUpdate(step, clearBuffer=True, onlyPlace=onlyPlace)
+
+
+  def assertSameWeights(self, loop, windowed, weights, setActivations,
+                        onlyPlace):
+    initialWeights = np.copy(weights(windowed)[0])
+
+    self.runSTDP(loop, setActivations, onlyPlace)
+    self.runSTDP(windowed, setActivations, onlyPlace)
+
+    for expected, actual in zip(weights(loop), weights(windowed)):
+      np.testing.assert_allclose(actual, expected, rtol=1e-10, atol=1e-12)
+    self.assertFalse(np.array_equal(weights(windowed)[0], initialWeights))
+
+
+  def test1DPlaceWeights(self):
+    self.assertSameWeights(self.create1D(LoopSTDP1DCAN),
+                           self.create1D(Dynamic1DCAN),
+                           self.weights1D, self.setActivations1D,
+                           onlyPlace=True)
+
+
+  def test1DAllWeights(self):
+    self.assertSameWeights(self.create1D(LoopSTDP1DCAN),
+                           self.create1D(Dynamic1DCAN),
+                           self.weights1D, self.setActivations1D,
+                           onlyPlace=False)
+
+
+  def test2DPlaceWeights(self):
+    self.assertSameWeights(self.create2D(LoopSTDP2DCAN),
+                           self.create2D(Dynamic2DCAN),
+                           self.weights2D, self.setActivations2D,
+                           onlyPlace=True)
+
+
+  def test2DAllWeights(self):
+    self.assertSameWeights(self.create2D(LoopSTDP2DCAN),
+                           self.create2D(Dynamic2DCAN),
+                           self.weights2D, self.setActivations2D,
+                           onlyPlace=False)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,127 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare FusedThresholdedGaussian2DLocationModules to a list of
+ThresholdedGaussian2DLocationModules.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.location_modules import (
+  FusedThresholdedGaussian2DLocationModules,
+  ThresholdedGaussian2DLocationModule)
+
+
+class FusedLocationModulesTest(unittest.TestCase):
+
+  cellsPerAxis = 10
+  anchorInputSize = 300
+
+
+  def setUp(self):
+    # With sampleSize=-1 learning grows synapses to every input, so it doesn't
+    # depend on the random number generators, which differ between the two.
+    params = {
+      "cellsPerAxis": self.cellsPerAxis,
+      "anchorInputSize": self.anchorInputSize,
+      "activeFiringRate": 0.85,
+      "bumpSigma": 0.18172,
+      "initialPermanence": 0.6,
+      "sampleSize": -1,
+    }
+    rng = np.random.RandomState(42)
+    self.modules = [
+      ThresholdedGaussian2DLocationModule(scale=scale,
+                                          orientation=rng.rand() * np.pi / 3,
+                                          **params)
+      for scale in (10., 14., 20., 28., 40.)]
+    self.fused = FusedThresholdedGaussian2DLocationModules.fromModules(
+      self.modules, self.anchorInputSize)
+
+    self.inputs = [
+      np.sort(rng.choice(self.anchorInputSize, 30,
+                         replace=False)).astype("uint32")
+      for _ in xrange(6)]
+
+
+  def assertSameCells(self):
+    cellsPerModule = self.cellsPerAxis * self.cellsPerAxis
+    for getter in ("getActiveCells", "getLearnableCells",
+                   "getSensoryAssociatedCells"):
+      expected = np.concatenate([getattr(module, getter)() + i*cellsPerModule
+                                 for i, module in enumerate(self.modules)])
+      np.testing.assert_equal(getattr(self.fused, getter)(), expected)
+
+
+  def testMovementMatchesModules(self):
+    np.random.seed(1)
+    for module in self.modules:
+      module.activateRandomLocation()
+    np.random.seed(1)
+    self.fused.activateRandomLocation()
+    self.assertSameCells()
+
+    for i in xrange(5):
+      np.random.seed(i)
+      for module in self.modules:
+        module.movementCompute([3., -2.], noiseFactor=0.5)
+      np.random.seed(i)
+      self.fused.movementCompute([3., -2.], noiseFactor=0.5)
+      self.assertSameCells()
+
+
+  def testInferenceMatchesModules(self):
+    np.random.seed(1)
+    for module in self.modules:
+      module.activateRandomLocation()
+    np.random.seed(1)
+    self.fused.activateRandomLocation()
+
+    for anchorInput in self.inputs:
+      for module in self.modules:
+        module.movementCompute([5., 5.])
+        module.sensoryCompute(anchorInput, anchorInput, learn=True)
+      self.fused.movementCompute([5., 5.])
+      self.fused.sensoryCompute(anchorInput, anchorInput, learn=True)
+      self.assertSameCells()
+
+    for module in self.modules:
+      module.reset()
+    self.fused.reset()
+
+    for anchorInput in self.inputs[:3]:
+      for module in self.modules:
+        module.sensoryCompute(anchorInput, anchorInput, learn=False)
+      self.fused.sensoryCompute(anchorInput, anchorInput, learn=False)
+      self.assertSameCells()
+
+      for module in self.modules:
+        module.movementCompute([5., 5.])
+      self.fused.movementCompute([5., 5.])
+      self.assertSameCells()
+
+
+
+if __name__ == "__main__":
+  unittest.main()
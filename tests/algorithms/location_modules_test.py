@@ -0,0 +1,173 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the excitation lookup table of ThresholdedGaussian2DLocationModule to
+the exact computation, and the implicit metric connections to the explicit
+wiring.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.location_modules import (
+  BodyToSpecificObjectModule2D, SensorToSpecificObjectModule,
+  ThresholdedGaussian2DLocationModule)
+
+
+class ExcitationTableTest(unittest.TestCase):
+
+  cellsPerAxis = 10
+  bumpSigma = 0.18172
+  resolution = 200
+
+
+  def setUp(self):
+    cellPhasesAxis = np.linspace(0., 1., self.cellsPerAxis, endpoint=False)
+    self.cellPhases = np.array([np.repeat(cellPhasesAxis, self.cellsPerAxis),
+                                np.tile(cellPhasesAxis, self.cellsPerAxis)])
+    self.cellPhases += 0.5 / self.cellsPerAxis
+
+    self.bumpPhases = np.random.RandomState(42).random_sample((2, 7))
+    self.table = ThresholdedGaussian2DLocationModule.buildExcitationTable(
+      self.resolution, self.bumpSigma)
+
+
+  def testLookupMatchesExactExcitations(self):
+    for bumpOverlapMethod in ("probabilistic", "sum"):
+      for numBumps in (1, 3, 7):
+        bumpPhases = self.bumpPhases[:, :numBumps]
+        exact = ThresholdedGaussian2DLocationModule.getCellExcitations(
+          self.cellPhases, bumpPhases, self.bumpSigma, bumpOverlapMethod)
+        lookedUp = ThresholdedGaussian2DLocationModule.lookupCellExcitations(
+          self.table, self.cellPhases, bumpPhases, bumpOverlapMethod)
+        np.testing.assert_allclose(lookedUp, exact, atol=0.02)
+
+
+  def testTableIsExactOnGrid(self):
+    # Bumps that sit on the table's grid have no rounding error.
+    bumpPhases = np.array([[0.25, 0.6], [0.1, 0.95]])
+    cellPhases = np.array([[0.0, 0.5, 0.73], [0.3, 0.3, 0.005]])
+    exact = ThresholdedGaussian2DLocationModule.getCellExcitations(
+      cellPhases, bumpPhases, self.bumpSigma, "sum")
+    lookedUp = ThresholdedGaussian2DLocationModule.lookupCellExcitations(
+      self.table, cellPhases, bumpPhases, "sum")
+    np.testing.assert_allclose(lookedUp, exact, rtol=1e-9)
+
+
+  def testEmptyBumps(self):
+    excitations = ThresholdedGaussian2DLocationModule.lookupCellExcitations(
+      self.table, self.cellPhases, np.empty((2, 0)), "probabilistic")
+    np.testing.assert_equal(excitations, 0.)
+
+
+
+
+class ImplicitMetricConnectionsTest(unittest.TestCase):
+
+  cellDimensions = (6, 8)
+  numColumns = 3
+
+
+  def buildModules(self, implicit):
+    sensorModules = [
+      SensorToSpecificObjectModule(self.cellDimensions, anchorInputSize=100,
+                                   implicitMetricConnections=implicit)
+      for _ in xrange(self.numColumns)]
+    bodyModule = BodyToSpecificObjectModule2D(self.cellDimensions,
+                                              implicit)
+    bodyModule.formReciprocalSynapses(sensorModules)
+
+    bodyModule.reset()
+    for module in sensorModules:
+      module.reset()
+
+    return bodyModule, sensorModules
+
+
+  def randomCells(self, rng, w):
+    cellCount = np.prod(self.cellDimensions)
+    return np.sort(rng.choice(cellCount, w, replace=False)).astype("uint32")
+
+
+  def testSameActivityAsExplicitWiring(self):
+    explicitBody, explicitSensors = self.buildModules(False)
+    implicitBody, implicitSensors = self.buildModules(True)
+
+    rng = np.random.RandomState(42)
+    for w in (0, 1, 3, 10):
+      sensorToBodyByColumn = [self.randomCells(rng, w)
+                              for _ in xrange(self.numColumns)]
+      bodyToSpecificObject = self.randomCells(rng, w)
+
+      for explicit, implicit, sensorToBody in zip(explicitSensors,
+                                                  implicitSensors,
+                                                  sensorToBodyByColumn):
+        explicit.metricCompute(sensorToBody, bodyToSpecificObject)
+        implicit.metricCompute(sensorToBody, bodyToSpecificObject)
+        np.testing.assert_equal(implicit.activeMetricSegments,
+                                explicit.activeMetricSegments)
+        np.testing.assert_equal(implicit.getActiveCells(),
+                                explicit.getActiveCells())
+
+      sensorToSpecificObjectByColumn = [
+        module.getActiveCells() for module in explicitSensors]
+      explicitBody.compute(sensorToBodyByColumn,
+                           sensorToSpecificObjectByColumn)
+      implicitBody.compute(sensorToBodyByColumn,
+                           sensorToSpecificObjectByColumn)
+      for explicitSegments, implicitSegments in zip(
+          explicitBody.activeSegmentsByColumn,
+          implicitBody.activeSegmentsByColumn):
+        np.testing.assert_equal(implicitSegments, explicitSegments)
+      np.testing.assert_equal(implicitBody.getActiveCells(),
+                              explicitBody.getActiveCells())
+      np.testing.assert_equal(implicitBody.inhibitedCells,
+                              explicitBody.inhibitedCells)
+
+
+  def testMixedWiring(self):
+    # A body module with implicit connections still wires up the sensor
+    # modules that use explicit ones.
+    sensorModules = [
+      SensorToSpecificObjectModule(self.cellDimensions, anchorInputSize=100,
+                                   implicitMetricConnections=True),
+      SensorToSpecificObjectModule(self.cellDimensions, anchorInputSize=100)]
+    bodyModule = BodyToSpecificObjectModule2D(self.cellDimensions, True)
+    bodyModule.formReciprocalSynapses(sensorModules)
+
+    cellCount = np.prod(self.cellDimensions)
+    self.assertEqual(
+      sensorModules[1].metricConnections.connectionsBySource[
+        "sensorToBody"].numSegments(),
+      4 * cellCount * cellCount)
+
+    sensorToBody = np.array([3, 20], dtype="uint32")
+    bodyToSpecificObject = np.array([7, 41], dtype="uint32")
+    for module in sensorModules:
+      module.metricCompute(sensorToBody, bodyToSpecificObject)
+    np.testing.assert_equal(sensorModules[0].getActiveCells(),
+                            sensorModules[1].getActiveCells())
+
+
+if __name__ == "__main__":
+  unittest.main()
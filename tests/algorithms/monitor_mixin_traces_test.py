@@ -0,0 +1,446 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the data that the monitor mixins derive from their columnar traces to
+loops over the time steps as sets.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.apical_tiebreak_temporal_memory import (
+  ApicalTiebreakPairMemory)
+from htmresearch.support.apical_tm_pair_monitor_mixin import (
+  ApicalTMPairMonitorMixin)
+from htmresearch.support.temporal_pooler_monitor_mixin import (
+  TemporalPoolerMonitorMixin)
+from htmresearch.support.union_temporal_pooler_monitor_mixin import (
+  UnionTemporalPoolerMonitorMixin)
+
+
+LABELS = ["A", "B", None, "C"]
+
+
+
+class RandomPooler(object):
+  """
+  Just enough of a (union) temporal pooler for the mixins, with random active
+  columns.
+  """
+
+  numColumns = 30
+
+
+  def __init__(self, seed):
+    self.rng = np.random.RandomState(seed)
+    self._connectedCounts = np.arange(self.numColumns)
+    self._poolingActivation = np.zeros(self.numColumns)
+    self.activeColumns = np.empty(0, dtype="uint32")
+
+
+  def getNumColumns(self):
+    return self.numColumns
+
+
+  def getDutyCyclePeriod(self):
+    return 10
+
+
+  def getConnectedCounts(self, connectedCounts):
+    connectedCounts[:] = self._connectedCounts
+
+
+  def compute(self, *args, **kwargs):
+    # Keep bits on for a while, so that they have bitlives to measure.
+    if self.rng.rand() < 0.3:
+      self.activeColumns = np.unique(
+        self.rng.randint(self.numColumns,
+                         size=self.rng.randint(10))).astype("uint32")
+    return self.activeColumns
+
+
+  def reset(self):
+    pass
+
+
+
+class RandomConnections(object):
+
+  def numSegments(self):
+    return 3
+
+
+  def numSynapses(self):
+    return 7
+
+
+
+class RandomTemporalMemory(object):
+  """
+  Just enough of an apical TM for the mixin, with random predicted and active
+  cells.
+  """
+
+  numColumns = 20
+  cellsPerColumn = 4
+
+
+  def __init__(self, seed):
+    self.rng = np.random.RandomState(seed)
+    self.basalConnections = RandomConnections()
+    self.apicalConnections = RandomConnections()
+
+
+  def getCellsPerColumn(self):
+    return self.cellsPerColumn
+
+
+  def compute(self, activeColumns, *args):
+    numCells = self.numColumns * self.cellsPerColumn
+    self.predictedCells = np.unique(
+      self.rng.randint(numCells, size=self.rng.randint(12))).astype("uint32")
+    self.activeCells = np.unique(
+      self.rng.randint(numCells, size=8)).astype("uint32")
+
+
+  def getPredictedCells(self):
+    return self.predictedCells
+
+
+  def getActiveCells(self):
+    return self.activeCells
+
+
+  def reset(self):
+    pass
+
+
+
+class MonitoredTemporalPooler(TemporalPoolerMonitorMixin, RandomPooler):
+  pass
+
+
+
+class MonitoredUnionTemporalPooler(UnionTemporalPoolerMonitorMixin,
+                                   RandomPooler):
+  pass
+
+
+
+class MonitoredTemporalMemory(ApicalTMPairMonitorMixin, RandomTemporalMemory):
+  pass
+
+
+
+class MonitoredApicalTiebreakPairMemory(ApicalTMPairMonitorMixin,
+                                        ApicalTiebreakPairMemory):
+  pass
+
+
+
+def setConfusion(steps, labels, resets, stability):
+  """
+  The overlap matrix and the stability and distinctness confusion lists,
+  computed from sets like the mixins used to.
+
+  @param stability (function) Stability confusion of the active cells of a
+                   time step and their overlap with another time step
+  """
+  n = len(steps)
+  overlap = np.empty((n, n), dtype=int)
+  stabilityConfusion = []
+  distinctnessConfusion = []
+
+  for i in xrange(n):
+    for j in xrange(i+1):
+      numOverlap = len(steps[i] & steps[j])
+      overlap[i][j] = numOverlap
+      overlap[j][i] = numOverlap
+
+      if (i != j and
+          labels[i] is not None and not resets[i] and
+          labels[j] is not None and not resets[j]):
+        if labels[i] == labels[j]:
+          stabilityConfusion.append(stability(steps[i], numOverlap))
+        else:
+          distinctnessConfusion.append(numOverlap)
+
+  return overlap, stabilityConfusion, distinctnessConfusion
+
+
+
+def setBitlife(steps, numColumns):
+  """
+  The bitlives of the union SDR bits, computed from sets like the union
+  temporal pooler mixin used to. The bits that stop at the same time step are
+  sorted.
+  """
+  bitLifeList = []
+  bitLifeCounter = np.zeros(numColumns)
+  for t in xrange(len(steps) - 1):
+    preActiveCells = set(np.where(bitLifeCounter > 0)[0])
+    newActiveCells = list(steps[t] - preActiveCells)
+    stopActiveCells = sorted(preActiveCells - steps[t])
+    continuousActiveCells = list(preActiveCells & steps[t])
+    bitLifeList += list(bitLifeCounter[stopActiveCells])
+
+    bitLifeCounter[stopActiveCells] = 0
+    bitLifeCounter[newActiveCells] = 1
+    bitLifeCounter[continuousActiveCells] += 1
+
+  return bitLifeList
+
+
+
+def setTransitions(predictedCells, activeColumns, labels, cellsPerColumn):
+  """
+  The transition traces and the predicted => active cells of each sequence,
+  computed from sets like the apical TM pair mixin used to.
+  """
+  transitions = dict((name, []) for name in (
+    "predictedActiveCells", "predictedInactiveCells", "predictedActiveColumns",
+    "predictedInactiveColumns", "unpredictedActiveColumns"))
+  cellsForSequence = {}
+
+  for predicted, active, label in zip(predictedCells, activeColumns, labels):
+    predictedActiveCells = set()
+    predictedInactiveCells = set()
+    predictedActiveColumns = set()
+    predictedInactiveColumns = set()
+
+    for predictedCell in predicted:
+      predictedColumn = predictedCell // cellsPerColumn
+
+      if predictedColumn in active:
+        predictedActiveCells.add(predictedCell)
+        predictedActiveColumns.add(predictedColumn)
+        if label is not None:
+          cellsForSequence.setdefault(label, set()).add(predictedCell)
+      else:
+        predictedInactiveCells.add(predictedCell)
+        predictedInactiveColumns.add(predictedColumn)
+
+    transitions["predictedActiveCells"].append(predictedActiveCells)
+    transitions["predictedInactiveCells"].append(predictedInactiveCells)
+    transitions["predictedActiveColumns"].append(predictedActiveColumns)
+    transitions["predictedInactiveColumns"].append(predictedInactiveColumns)
+    transitions["unpredictedActiveColumns"].append(
+      set(active) - predictedActiveColumns)
+
+  return transitions, cellsForSequence
+
+
+
+class MetricTestCase(unittest.TestCase):
+
+  def assertMetric(self, metric, data):
+    """
+    Checks the stats that a nupic Metric keeps of its data.
+    """
+    if not len(data):
+      self.assertIsNone(metric.sum)
+      return
+
+    self.assertEqual(metric.min, min(data))
+    self.assertEqual(metric.max, max(data))
+    self.assertEqual(metric.sum, sum(data))
+    self.assertAlmostEqual(metric.mean, np.mean(data))
+    self.assertAlmostEqual(metric.standardDeviation, np.std(data))
+
+
+
+class MonitorMixinTracesTest(MetricTestCase):
+
+  numSteps = 200
+
+
+  def runMonitor(self, monitor, compute, seed=0):
+    rng = np.random.RandomState(seed)
+    for _ in xrange(self.numSteps):
+      if rng.rand() < 0.1:
+        monitor.reset()
+      compute(rng, LABELS[rng.randint(len(LABELS))])
+
+
+  def runPooler(self, pooler):
+    self.runMonitor(pooler, lambda rng, label: pooler.compute(sequenceLabel=label))
+    return (list(pooler.mmGetTraceSequenceLabels().data),
+            list(pooler.mmGetTraceResets().data))
+
+
+  def testTemporalPoolerConfusion(self):
+    for kwargs in ({}, {"mmTraceLength": 50}):
+      pooler = MonitoredTemporalPooler(1, **kwargs)
+      labels, resets = self.runPooler(pooler)
+      steps = list(pooler.mmGetTraceActiveCells().data)
+
+      overlap, stability, distinctness = setConfusion(
+        steps, labels, resets,
+        lambda activeCells, numOverlap: len(activeCells) - numOverlap)
+      self.assertEqual(pooler.mmGetDataOverlap().tolist(), overlap.tolist())
+      self.assertEqual(pooler._mmData["stabilityConfusion"], stability)
+      self.assertEqual(pooler._mmData["distinctnessConfusion"], distinctness)
+      self.assertMetric(pooler.mmGetMetricStabilityConfusion(), stability)
+      self.assertMetric(pooler.mmGetMetricDistinctnessConfusion(),
+                        distinctness)
+
+
+  def testUnionTemporalPoolerConfusion(self):
+    for kwargs in ({}, {"mmTraceLength": 50}):
+      pooler = MonitoredUnionTemporalPooler(2, **kwargs)
+      labels, resets = self.runPooler(pooler)
+      steps = list(pooler.mmGetTraceUnionSDR().data)
+
+      overlap, stability, distinctness = setConfusion(
+        steps, labels, resets, lambda activeCells, numOverlap: numOverlap)
+      self.assertEqual(pooler.mmGetDataOverlap().tolist(), overlap.tolist())
+      self.assertEqual(pooler._mmData["stabilityConfusion"], stability)
+      self.assertEqual(pooler._mmData["distinctnessConfusion"], distinctness)
+      self.assertMetric(pooler.mmGetMetricStabilityConfusion(), stability)
+      self.assertMetric(pooler.mmGetMetricDistinctnessConfusion(),
+                        distinctness)
+
+
+  def testUnionTemporalPoolerBitlife(self):
+    for kwargs in ({}, {"mmTraceLength": 50}):
+      pooler = MonitoredUnionTemporalPooler(3, **kwargs)
+      self.runPooler(pooler)
+      steps = list(pooler.mmGetTraceUnionSDR().data)
+
+      expected = setBitlife(steps, pooler.getNumColumns())
+      self.assertGreater(len(expected), 0)
+      self.assertEqual(pooler.mmGetDataBitlife(), expected)
+
+
+  def testTransitionTraces(self):
+    tm = MonitoredTemporalMemory(4)
+    self.runMonitor(tm, lambda rng, label: tm.compute(
+      np.unique(rng.randint(tm.numColumns, size=5)), sequenceLabel=label))
+
+    transitions, cellsForSequence = setTransitions(
+      list(tm.mmGetTracePredictedCells().data),
+      list(tm.mmGetTraceActiveColumns().data),
+      list(tm.mmGetTraceSequenceLabels().data),
+      tm.getCellsPerColumn())
+    for name, expected in transitions.iteritems():
+      self.assertEqual(list(tm._mmTraces[name].data), expected, name)
+    self.assertEqual(dict(tm._mmData["predictedActiveCellsForSequence"]),
+                     cellsForSequence)
+
+
+
+
+class ApicalTMPairMonitorMixinTest(MetricTestCase):
+  """
+  Learn sequences with a monitored ApicalTiebreakPairMemory, and check the
+  transition traces and the cells of each sequence against the history that
+  the traces still hold, while the history grows.
+  """
+
+  columnCount = 64
+  cellsPerColumn = 4
+
+
+  def setUp(self):
+    rng = np.random.RandomState(42)
+    self.sequences = [
+      [np.sort(rng.permutation(self.columnCount)[:6]) for _ in xrange(6)]
+      for _ in xrange(3)]
+
+
+  def createTM(self, **kwargs):
+    return MonitoredApicalTiebreakPairMemory(
+      columnCount=self.columnCount,
+      basalInputSize=self.columnCount * self.cellsPerColumn,
+      cellsPerColumn=self.cellsPerColumn,
+      activationThreshold=4,
+      reducedBasalThreshold=4,
+      minThreshold=4,
+      sampleSize=6,
+      initialPermanence=0.6,
+      **kwargs)
+
+
+  def assertSameAsHistory(self, tm):
+    cellsPerColumn = tm.getCellsPerColumn()
+    labels = list(tm.mmGetTraceSequenceLabels().data)
+    transitions, cellsForSequence = setTransitions(
+      list(tm.mmGetTracePredictedCells().data),
+      list(tm.mmGetTraceActiveColumns().data),
+      labels, cellsPerColumn)
+
+    for name, expected in transitions.iteritems():
+      self.assertEqual(list(tm._mmTraces[name].data), expected, name)
+    self.assertEqual(dict(tm._mmData["predictedActiveCellsForSequence"]),
+                     cellsForSequence)
+
+    cellsPerSequenceColumn = {}
+    sequencesPerCell = {}
+    for label, cells in cellsForSequence.iteritems():
+      for cell in cells:
+        key = (label, cell // cellsPerColumn)
+        cellsPerSequenceColumn[key] = cellsPerSequenceColumn.get(key, 0) + 1
+        sequencesPerCell[cell] = sequencesPerCell.get(cell, 0) + 1
+    self.assertMetric(tm.mmGetMetricSequencesPredictedActiveCellsPerColumn(),
+                      cellsPerSequenceColumn.values())
+    self.assertMetric(tm.mmGetMetricSequencesPredictedActiveCellsShared(),
+                      sequencesPerCell.values())
+
+
+  def assertMonitorsSequences(self, **kwargs):
+    tm = self.createTM(**kwargs)
+    rng = np.random.RandomState(7)
+    numPredictedActive = 0
+    for _ in xrange(8):
+      for i in rng.permutation(len(self.sequences)):
+        # Some unlabeled noise between the sequences.
+        sequences = [(self.sequences[i], "S{}".format(i)),
+                     ([np.sort(rng.permutation(self.columnCount)[:6])], None)]
+        for sequence, label in sequences:
+          for activeColumns in sequence:
+            tm.compute(activeColumns, basalInput=tm.getActiveCells(),
+                       sequenceLabel=label)
+            numPredictedActive += len(
+              tm.mmGetTracePredictedActiveCells().data[-1])
+          tm.reset()
+        self.assertSameAsHistory(tm)
+
+    maxLength = kwargs.get("mmTraceLength")
+    if maxLength is not None:
+      self.assertEqual(len(tm.mmGetTraceResets().data), maxLength)
+    self.assertGreater(numPredictedActive, 0)
+
+
+  def testWholeHistory(self):
+    self.assertMonitorsSequences()
+
+
+  def testLastSteps(self):
+    self.assertMonitorsSequences(mmTraceLength=1)
+    self.assertMonitorsSequences(mmTraceLength=10)
+    self.assertMonitorsSequences(mmTraceLength=25)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,326 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the SegmentPool of the legacy TM to lists of synapses, check that the
+TM still pickles its segments in the list format, and that its global decay
+matches decaying those lists.
+"""
+
+import copy_reg
+import cPickle as pickle
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.TM import TM, Segment, SegmentPool
+
+
+class SegmentPoolTest(unittest.TestCase):
+
+  numCells = 50
+
+
+  def setUp(self):
+    self.rng = np.random.RandomState(42)
+    self.pool = SegmentPool(self.numCells)
+    # segment -> list of (presynaptic cell, permanence)
+    self.synapses = {}
+
+
+  def createSegment(self):
+    segment = self.pool.createSegment()
+    self.pool.segmentCells[segment] = self.rng.randint(self.numCells)
+    self.synapses[segment] = []
+    return segment
+
+
+  def assertSameSynapses(self):
+    for segment, synapses in self.synapses.iteritems():
+      self.assertEqual(
+        zip(self.pool.presynapticCells(segment).tolist(),
+            self.pool.permanences(segment).tolist()),
+        synapses)
+
+    self.assertEqual(sorted(self.pool.liveSegments().tolist()),
+                     sorted(self.synapses.keys()))
+
+
+  def assertSameActivity(self):
+    cellMask = np.append(self.rng.rand(self.numCells) < 0.5, False)
+
+    activity = self.pool.computeActivity(cellMask, 0.5)
+    for segment, synapses in self.synapses.iteritems():
+      self.assertEqual(activity[segment],
+                       sum(1 for cell, permanence in synapses
+                           if cellMask[cell] and permanence >= 0.5))
+
+    segments = self.synapses.keys()
+    np.testing.assert_equal(
+      self.pool.computeActivity(cellMask, None, segments),
+      [sum(1 for cell, _ in self.synapses[segment] if cellMask[cell])
+       for segment in segments])
+
+
+  def testRandomOperations(self):
+    for _ in xrange(1000):
+      operation = self.rng.randint(4)
+
+      if operation == 0 or len(self.synapses) == 0:
+        self.createSegment()
+
+      elif operation == 1:
+        segment = self.rng.choice(self.synapses.keys())
+        self.pool.destroySegment(segment)
+        del self.synapses[segment]
+
+      elif operation == 2:
+        segment = self.rng.choice(self.synapses.keys())
+        numSynapses = self.rng.randint(12)
+        cells = self.rng.randint(self.numCells, size=numSynapses)
+        permanences = self.rng.rand(numSynapses).astype("float32")
+        self.pool.appendSynapses(segment, cells, permanences)
+        self.synapses[segment] += zip(cells.tolist(), permanences.tolist())
+
+      else:
+        segments = self.rng.choice(self.synapses.keys(),
+                                   size=min(3, len(self.synapses)),
+                                   replace=False)
+        keep = self.rng.rand(self.pool.rowLengths(segments).sum()) < 0.7
+        numRemaining = self.pool.compactRows(segments, keep)
+
+        start = 0
+        for segment, remaining in zip(segments, numRemaining):
+          synapses = self.synapses[segment]
+          self.synapses[segment] = [
+            synapse
+            for synapse, k in zip(synapses,
+                                  keep[start:start + len(synapses)])
+            if k]
+          start += len(synapses)
+          self.assertEqual(remaining, len(self.synapses[segment]))
+
+      self.assertSameSynapses()
+      self.assertSameActivity()
+
+
+  def testCompaction(self):
+    kept = self.createSegment()
+    for _ in xrange(20):
+      segment = self.createSegment()
+      for cell in xrange(10):
+        self.pool.appendSynapses(segment, [cell], [0.5])
+        self.pool.appendSynapses(kept, [cell], [0.7])
+        self.synapses[kept].append((cell, np.float32(0.7)))
+      self.pool.destroySegment(segment)
+      del self.synapses[segment]
+
+    self.assertLessEqual(self.pool._numGarbageSlots * 2, self.pool._numSlots)
+    self.assertSameSynapses()
+    self.assertSameActivity()
+
+
+
+class OldSegment(object):
+  """
+  Pickles like a Segment from before the SegmentPool, which had no
+  __getstate__: the plain __dict__ with the synapses in 'syns', restored
+  without calling __init__.
+  """
+
+  def __init__(self, state):
+    self.__dict__.update(state)
+
+
+  def __reduce__(self):
+    return copy_reg._reconstructor, (Segment, object, None), self.__dict__
+
+
+
+class TMPickleTest(unittest.TestCase):
+
+  def testSegmentsPickleTheirSynapses(self):
+    tm = TM(numberOfCols=32, cellsPerColumn=4, newSynapseCount=4,
+            activationThreshold=3, minThreshold=2, globalDecay=0.0)
+    rng = np.random.RandomState(42)
+    patterns = [rng.permutation(32)[:4] for _ in xrange(4)]
+    for _ in xrange(5):
+      for pattern in patterns:
+        bottomUpInput = np.zeros(32, dtype="uint32")
+        bottomUpInput[pattern] = 1
+        tm.compute(bottomUpInput, enableLearn=True)
+      tm.reset()
+
+    segments = [segment for column in tm.cells for cell in column
+                for segment in cell]
+    self.assertGreater(len(segments), 0)
+
+    state = segments[0].__getstate__()
+    self.assertEqual(state["syns"], segments[0].syns)
+    self.assertNotIn("_index", state)
+
+    restored = pickle.loads(pickle.dumps(tm))
+    restoredSegments = [segment for column in restored.cells
+                        for cell in column for segment in cell]
+    self.assertEqual([segment.syns for segment in restoredSegments],
+                     [segment.syns for segment in segments])
+    self.assertEqual(restored.getSegmentInfo()[:2], tm.getSegmentInfo()[:2])
+
+
+  def testOldSegmentsLoadIntoThePool(self):
+    tm = TM(numberOfCols=8, cellsPerColumn=4, globalDecay=0.0)
+    oldSegments = {
+      (2, 1): [([[3, 0, 0.5], [5, 2, 0.25], [7, 3, 0.75]], 12)],
+      (6, 3): [([[0, 1, 0.125]], 4), ([[1, 1, 0.5], [2, 2, 0.625]], 9)],
+    }
+    for (column, cellIdx), segments in oldSegments.iteritems():
+      for syns, lastActiveIteration in segments:
+        tm.cells[column][cellIdx].append(OldSegment({
+          "tp": tm,
+          "segID": tm.segID,
+          "isSequenceSeg": False,
+          "lastActiveIteration": lastActiveIteration,
+          "positiveActivations": 1,
+          "totalActivations": 1,
+          "_lastPosDutyCycle": 1.0,
+          "_lastPosDutyCycleIteration": 1,
+          "syns": syns}))
+        tm.segID += 1
+
+    restored = pickle.loads(pickle.dumps(tm))
+
+    pool = restored._segmentPool
+    for (column, cellIdx), segments in oldSegments.iteritems():
+      restoredSegments = restored.cells[column][cellIdx]
+      self.assertEqual(len(restoredSegments), len(segments))
+      for segment, (syns, lastActiveIteration) in zip(restoredSegments,
+                                                      segments):
+        self.assertIsInstance(segment, Segment)
+        self.assertIs(segment.tp, restored)
+        self.assertEqual(segment.syns, syns)
+        self.assertEqual(segment.lastActiveIteration, lastActiveIteration)
+        self.assertEqual(pool.lastActiveIterations[segment._index],
+                         lastActiveIteration)
+        self.assertEqual(pool.segmentCells[segment._index],
+                         column * restored.cellsPerColumn + cellIdx)
+        self.assertEqual(
+          pool.presynapticCells(segment._index).tolist(),
+          [col * restored.cellsPerColumn + idx for col, idx, _ in syns])
+        self.assertNotIn("syns", segment.__dict__)
+
+    self.assertEqual(restored.getSegmentInfo()[:2], (3, 6))
+
+
+
+class TMLearningTest(unittest.TestCase):
+
+  numberOfCols = 64
+
+
+  def setUp(self):
+    self.rng = np.random.RandomState(42)
+
+
+  def compute(self, tm, activeColumns):
+    bottomUpInput = np.zeros(self.numberOfCols, dtype="uint32")
+    bottomUpInput[activeColumns] = 1
+    tm.compute(bottomUpInput, enableLearn=True)
+
+
+  @staticmethod
+  def segmentSynapses(tm):
+    """
+    @return (dict) (column, cell, segID) -> (lastActiveIteration, syns)
+    """
+    return dict(((c, i, segment.segID),
+                 (segment.lastActiveIteration, segment.syns))
+                for c, column in enumerate(tm.cells)
+                for i, cell in enumerate(column)
+                for segment in cell)
+
+
+  @staticmethod
+  def decayedSynapses(tm, segments):
+    """
+    Apply the global decay of the next learning iteration to segmentSynapses.
+    """
+    iterationIdx = tm.iterationIdx + 1
+    decayed = {}
+    for key, (lastActiveIteration, syns) in segments.iteritems():
+      if iterationIdx - lastActiveIteration > tm.maxAge:
+        syns = [[c, i, float(np.float32(permanence) - tm.globalDecay)]
+                for c, i, permanence in syns]
+        syns = [syn for syn in syns if syn[2] > 0]
+        if len(syns) == 0:
+          continue
+      decayed[key] = (lastActiveIteration, syns)
+    return decayed
+
+
+  def testSegmentWithEveryLearningCell(self):
+    # With 9 active columns, a segment that already has the 9 learning cells
+    # of the previous step asks for a single new synapse and has no candidate.
+    tm = TM(numberOfCols=self.numberOfCols, cellsPerColumn=4, seed=7)
+    patterns = [self.rng.permutation(self.numberOfCols)[:9]
+                for _ in xrange(5)]
+    for _ in xrange(20):
+      for pattern in patterns:
+        self.compute(tm, pattern)
+    self.assertGreater(tm.getSegmentInfo()[0], 0)
+
+
+  def testGlobalDecay(self):
+    tm = TM(numberOfCols=self.numberOfCols, cellsPerColumn=4, newSynapseCount=6,
+            activationThreshold=4, minThreshold=3, initialPerm=0.3,
+            globalDecay=0.05, maxAge=3)
+
+    numRemovedSynapses = 0
+    numRemovedSegments = 0
+    for epoch in xrange(20):
+      # A new sequence every other epoch, so older segments stop being active.
+      if epoch % 2 == 0:
+        patterns = [self.rng.permutation(self.numberOfCols)[:6]
+                    for _ in xrange(4)]
+      for pattern in patterns:
+        self.compute(tm, pattern)
+      tm.reset()
+
+      # Learning from an empty input only applies the global decay.
+      while (tm.iterationIdx + 1) % tm.maxAge != 0:
+        self.compute(tm, [])
+      segments = self.segmentSynapses(tm)
+      expected = self.decayedSynapses(tm, segments)
+      self.compute(tm, [])
+
+      self.assertEqual(self.segmentSynapses(tm), expected)
+      numSynapses = sum(len(syns) for _, syns in expected.itervalues())
+      self.assertEqual(tm.getSegmentInfo()[:2], (len(expected), numSynapses))
+      numRemovedSegments += len(segments) - len(expected)
+      numRemovedSynapses += (
+        sum(len(syns) for _, syns in segments.itervalues()) - numSynapses)
+
+    self.assertGreater(numRemovedSegments, 0)
+    self.assertGreater(numRemovedSynapses, numRemovedSegments)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,134 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare inferSPOnBatch to running sp.compute without learning on every input.
+"""
+
+import unittest
+
+import numpy as np
+
+from nupic.algorithms.spatial_pooler import SpatialPooler as PYSpatialPooler
+from nupic.bindings.algorithms import SpatialPooler as CPPSpatialPooler
+
+from htmresearch.algorithms.faulty_spatial_pooler import FaultySpatialPooler
+from htmresearch.frameworks.sp_paper.sp_metrics import (
+  getConnectedMatrix, inferSPOnBatch)
+from htmresearch.support.spatial_pooler_monitor_mixin import (
+  SpatialPoolerMonitorMixin)
+
+
+uintType = "uint32"
+
+
+
+class MonitoredSpatialPooler(SpatialPoolerMonitorMixin, PYSpatialPooler):
+  pass
+
+
+
+class InferSPOnBatchTest(unittest.TestCase):
+
+  inputSize = 400
+  numColumns = 256
+
+
+  def setUp(self):
+    np.random.seed(42)
+    self.inputs = (np.random.rand(50, self.inputSize) < 0.1).astype(uintType)
+
+
+  def createTrainedSP(self, spClass):
+    sp = spClass(inputDimensions=(self.inputSize,),
+                 columnDimensions=(self.numColumns,),
+                 potentialRadius=self.inputSize,
+                 potentialPct=0.5,
+                 globalInhibition=True,
+                 numActiveColumnsPerInhArea=10,
+                 stimulusThreshold=1,
+                 synPermInactiveDec=0.01,
+                 synPermActiveInc=0.05,
+                 synPermConnected=0.1,
+                 dutyCyclePeriod=20,
+                 boostStrength=1.0,
+                 seed=42)
+
+    output = np.zeros(self.numColumns, dtype=uintType)
+    for inputVector in self.inputs[:30]:
+      sp.compute(inputVector, True, output)
+
+    return sp
+
+
+  def assertSameInference(self, sp, exactTies=True):
+    iterationNum = sp.getIterationNum()
+    expected = np.zeros((len(self.inputs), self.numColumns), dtype=uintType)
+    for inputVector, output in zip(self.inputs, expected):
+      sp.compute(inputVector, False, output)
+    expectedIterationNum = sp.getIterationNum()
+
+    sp.setIterationNum(iterationNum)
+    actual = inferSPOnBatch(sp, self.inputs, blockSize=16)
+
+    self.assertEqual(sp.getIterationNum(), expectedIterationNum)
+    if exactTies:
+      np.testing.assert_array_equal(actual, expected)
+    else:
+      # The cpp sp may break ties between equal overlaps differently.
+      overlaps = getConnectedMatrix(sp).dot(self.inputs.T).T
+      for columnOverlaps, actualOutput, expectedOutput in zip(overlaps,
+                                                              actual,
+                                                              expected):
+        np.testing.assert_array_equal(
+          np.sort(columnOverlaps[actualOutput > 0]),
+          np.sort(columnOverlaps[expectedOutput > 0]))
+
+
+  def testPYSpatialPooler(self):
+    self.assertSameInference(self.createTrainedSP(PYSpatialPooler))
+
+
+  def testCPPSpatialPooler(self):
+    self.assertSameInference(self.createTrainedSP(CPPSpatialPooler),
+                             exactTies=False)
+
+
+  def testFaultySpatialPooler(self):
+    sp = self.createTrainedSP(FaultySpatialPooler)
+    sp.killCells(0.2)
+    self.assertSameInference(sp)
+
+
+  def testMonitoredSpatialPoolerRecordsEveryInput(self):
+    sp = self.createTrainedSP(MonitoredSpatialPooler)
+    numTraced = len(sp.mmGetTraceActiveColumns().data)
+
+    self.assertSameInference(sp)
+
+    # Once for the compute loop, once for inferSPOnBatch.
+    self.assertEqual(len(sp.mmGetTraceActiveColumns().data),
+                     numTraced + 2 * len(self.inputs))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
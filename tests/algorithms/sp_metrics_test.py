@@ -0,0 +1,214 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the blocked witnessError and meanMutualInformation to loops over the
+inputs and the pairs of columns.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.frameworks.sp_paper.sp_metrics import (
+  calculateOverlapCurve, getConnectedSyns, meanMutualInformation,
+  witnessError)
+
+
+
+class FakeSpatialPooler(object):
+  """
+  Just enough of a spatial pooler for the metrics: a fixed connected matrix.
+  """
+
+  def __init__(self, connected):
+    self.connected = connected
+
+
+  def getNumInputs(self):
+    return self.connected.shape[1]
+
+
+  def getColumnDimensions(self):
+    return np.array([self.connected.shape[0]])
+
+
+  def getConnectedSynapses(self, column, connectedSynapses):
+    connectedSynapses[:] = self.connected[column]
+
+
+
+class CountingSpatialPooler(FakeSpatialPooler):
+  """
+  Counts its computes in the iteration number, and activates the columns
+  connected to the first active input.
+  """
+
+  def __init__(self, connected):
+    super(CountingSpatialPooler, self).__init__(connected)
+    self.iterationNum = 0
+
+
+  def compute(self, inputVector, learn, activeArray):
+    self.iterationNum += 1
+    activeArray[:] = self.connected[:, np.flatnonzero(inputVector)[0]]
+
+
+  def getIterationNum(self):
+    return self.iterationNum
+
+
+  def setIterationNum(self, iterationNum):
+    self.iterationNum = iterationNum
+
+
+
+def loopWitnessError(sp, inputVectors, activeColumnsCurrentEpoch):
+  connectionMatrix = getConnectedSyns(sp)
+  batchSize = inputVectors.shape[0]
+
+  Err = 0.
+  for i in range(batchSize):
+    activeColumns = np.where(activeColumnsCurrentEpoch[i] > 0.)[0]
+    numActiveColumns = activeColumns.shape[0]
+    err = 0.
+    for j in activeColumns:
+      err += np.sum(np.absolute(connectionMatrix[j] - inputVectors[i]))
+    Err += err/numActiveColumns
+  return Err/batchSize
+
+
+
+def loopMutualInformation(activeColumnsCurrentEpoch, i, j):
+  batchSize = activeColumnsCurrentEpoch.shape[0]
+
+  ci, cj, cij = 0., 0., dict([((0, 0), 0.), ((1, 0), 0.), ((0, 1), 0.),
+                              ((1, 1), 0.)])
+  for t in range(batchSize):
+    ai = activeColumnsCurrentEpoch[t, i]
+    aj = activeColumnsCurrentEpoch[t, j]
+    cij[(ai, aj)] += 1.
+    ci += ai
+    cj += aj
+
+  Iij = 0
+  for a, b in [(0, 0), (1, 0), (0, 1), (1, 1)]:
+    pij = cij[(a, b)]/batchSize
+    pi = ci/batchSize if a == 1 else 1. - ci/batchSize
+    pj = cj/batchSize if b == 1 else 1. - cj/batchSize
+    Iij += pij * np.log2(pij/(pi*pj)) if pij > 0 else 0
+  return Iij
+
+
+
+def loopMeanMutualInformation(activeColumnsCurrentEpoch, columns):
+  numCols = len(columns)
+  sumMutualInfo = 0
+  for i in range(numCols):
+    for j in range(i + 1, numCols):
+      sumMutualInfo += loopMutualInformation(activeColumnsCurrentEpoch,
+                                             columns[i], columns[j])
+  return sumMutualInfo/(numCols*(numCols - 1)/2)
+
+
+
+class SPMetricsTest(unittest.TestCase):
+
+  numInputs = 30
+  numColumns = 11
+  batchSize = 13
+
+
+  def setUp(self):
+    self.rng = np.random.RandomState(42)
+    self.sp = FakeSpatialPooler(
+      (self.rng.rand(self.numColumns, self.numInputs) < 0.3).astype("uint32"))
+    self.activeColumns = (
+      self.rng.rand(self.batchSize, self.numColumns) < 0.3).astype("uint32")
+    # Every input needs an active column.
+    self.activeColumns[np.arange(self.batchSize),
+                       self.rng.randint(self.numColumns,
+                                        size=self.batchSize)] = 1
+
+
+  def testWitnessErrorBinaryInputs(self):
+    inputVectors = (
+      self.rng.rand(self.batchSize, self.numInputs) < 0.2).astype("uint32")
+    expected = loopWitnessError(self.sp, inputVectors, self.activeColumns)
+    for blockSize in (1, 4, 1024):
+      self.assertEqual(witnessError(self.sp, inputVectors, self.activeColumns,
+                                    blockSize=blockSize),
+                       expected)
+
+
+  def testWitnessErrorNonBinaryInputs(self):
+    inputVectors = self.rng.rand(self.batchSize, self.numInputs)
+    expected = loopWitnessError(self.sp, inputVectors, self.activeColumns)
+    for blockSize in (1, 4, 1024):
+      self.assertEqual(witnessError(self.sp, inputVectors, self.activeColumns,
+                                    blockSize=blockSize),
+                       expected)
+
+
+  def testWitnessErrorWithoutActiveColumns(self):
+    inputVectors = (
+      self.rng.rand(self.batchSize, self.numInputs) < 0.2).astype("uint32")
+    self.activeColumns[3] = 0
+    with self.assertRaises(ZeroDivisionError):
+      loopWitnessError(self.sp, inputVectors, self.activeColumns)
+    with self.assertRaises(ZeroDivisionError):
+      witnessError(self.sp, inputVectors, self.activeColumns, blockSize=4)
+
+
+  def testMeanMutualInformation(self):
+    expected = loopMeanMutualInformation(self.activeColumns,
+                                         range(self.numColumns))
+    for blockSize in (1, 3, 4, 1024):
+      self.assertEqual(meanMutualInformation(self.sp, self.activeColumns,
+                                             blockSize=blockSize),
+                       expected)
+
+
+  def testMeanMutualInformationOfSomeColumns(self):
+    columns = [9, 2, 5, 0, 7]
+    expected = loopMeanMutualInformation(self.activeColumns, columns)
+    for blockSize in (2, 3, 1024):
+      self.assertEqual(meanMutualInformation(self.sp, self.activeColumns,
+                                             columns, blockSize=blockSize),
+                       expected)
+
+
+  def testOverlapCurveIterations(self):
+    sp = CountingSpatialPooler(self.sp.connected)
+    inputVectors = (
+      self.rng.rand(self.batchSize, self.numInputs) < 0.2).astype("uint32")
+    inputVectors[:, 0] = 1
+
+    noiseLevels, _, outputOverlap = calculateOverlapCurve(sp, inputVectors)
+    # The clean and the corrupted input, at every noise level
+    self.assertEqual(sp.getIterationNum(),
+                     2 * self.batchSize * len(noiseLevels))
+    self.assertEqual(outputOverlap.shape, (self.batchSize, len(noiseLevels)))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,163 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the compact weight formats of the CAN networks to dense weights.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from htmresearch.frameworks.grid_cell_learning.DynamicCAN import Dynamic2DCAN
+from htmresearch.frameworks.grid_cell_learning.weight_formats import (
+  ConvolutionWeights, kernelToSparse)
+
+
+
+class WeightFormatsTest(unittest.TestCase):
+
+  dimensions = (9, 12)
+
+
+  def assertSameDot(self, periodic, presynapticScale=None):
+    rng = np.random.RandomState(42)
+    kernel = rng.randn(5, 7)
+    kernel[0, 0] = 0
+    weights = ConvolutionWeights(kernel, self.dimensions, periodic,
+                                 presynapticScale)
+    dense = weights.toarray()
+
+    for _ in xrange(3):
+      activations = rng.random_sample(dense.shape[1])
+      np.testing.assert_allclose(weights.dot(activations),
+                                 dense.dot(activations),
+                                 rtol=1e-5, atol=1e-5)
+
+
+  def testConvolutionDotPeriodic(self):
+    self.assertSameDot(periodic=True)
+
+
+  def testConvolutionDotNonPeriodic(self):
+    self.assertSameDot(periodic=False)
+
+
+  def testConvolutionDotScaled(self):
+    scale = np.random.RandomState(0).random_sample(
+      self.dimensions[0] * self.dimensions[1])
+    self.assertSameDot(periodic=True, presynapticScale=scale)
+    self.assertSameDot(periodic=False, presynapticScale=scale)
+
+
+  def testConvolutionMatchesSparse(self):
+    kernel = np.random.RandomState(42).randn(5, 7)
+    for periodic in (False, True):
+      np.testing.assert_allclose(
+        ConvolutionWeights(kernel, self.dimensions, periodic).toarray(),
+        kernelToSparse(kernel.astype("float32"), self.dimensions,
+                       periodic).toarray())
+
+
+  def createNetwork(self, weightFormat, periodic, hardwireEnvelope=False):
+    np.random.seed(42)
+    return Dynamic2DCAN(numPlaces=20,
+                        learningRate=0.005,
+                        dt=0.002,
+                        dimensions=(12, 14),
+                        hardwireI=True,
+                        plotting=False,
+                        movie=False,
+                        periodic=periodic,
+                        hardwireEnvelope=hardwireEnvelope,
+                        weightFormat=weightFormat)
+
+
+  def assertSameUpdates(self, periodic, hardwireEnvelope=False):
+    sparseNet = self.createNetwork("sparse", periodic, hardwireEnvelope)
+    convolutionNet = self.createNetwork("convolution", periodic,
+                                        hardwireEnvelope)
+
+    rng = np.random.RandomState(42)
+    activationsI = rng.random_sample(sparseNet.numInhibitory)
+    activationsP = rng.random_sample(sparseNet.numPlaces)
+    for net in (sparseNet, convolutionNet):
+      net.activationsI[:] = activationsI
+      net.activationsP[:] = activationsP
+
+    for _ in xrange(5):
+      # Strong enough to keep part of the inhibitory cells active despite
+      # the recurrent inhibition.
+      feedforwardInputI = 1000 * rng.random_sample(sparseNet.numInhibitory)
+      feedforwardInputE = rng.random_sample(sparseNet.numExcitatory)
+      for net in (sparseNet, convolutionNet):
+        net.update(feedforwardInputI, feedforwardInputE, np.zeros(2),
+                   envelope=True)
+
+      self.assertTrue(np.any(sparseNet.instantaneousI > 0))
+      np.testing.assert_allclose(convolutionNet.instantaneousI,
+                                 sparseNet.instantaneousI,
+                                 rtol=1e-5, atol=1e-3)
+
+    np.testing.assert_allclose(convolutionNet.activationsI,
+                               sparseNet.activationsI, rtol=1e-5, atol=1e-6)
+    for k in sparseNet.activations:
+      np.testing.assert_allclose(convolutionNet.activations[k],
+                                 sparseNet.activations[k],
+                                 rtol=1e-5, atol=1e-6)
+
+
+  def testSparseAndConvolutionUpdates(self):
+    self.assertSameUpdates(periodic=False)
+    self.assertSameUpdates(periodic=True)
+
+
+  def testSparseAndConvolutionUpdatesWithEnvelope(self):
+    self.assertSameUpdates(periodic=False, hardwireEnvelope=True)
+    self.assertSameUpdates(periodic=True, hardwireEnvelope=True)
+
+
+  def testNonPeriodicKernelMatchesDenseWeights(self):
+    # The dense network caches its hardwired weights in the working directory.
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp()
+    try:
+      os.chdir(directory)
+      dense = self.createNetwork("dense", periodic=False)
+    finally:
+      os.chdir(cwd)
+      shutil.rmtree(directory)
+
+    kernel = dense.hardwiredKernel(periodic=False)
+    np.testing.assert_allclose(
+      kernelToSparse(kernel, dense.dimensions, False).toarray(),
+      dense.weightsII, rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(
+      ConvolutionWeights(kernel, dense.dimensions, False).toarray(),
+      dense.weightsII, rtol=1e-6, atol=1e-6)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -116,6 +116,48 @@ class L4L2ExperimentTest(unittest.TestCase):
     self.assertEqual(len(exp.getL4Representations()[1]),20)
 
 
+  def testSparseLinks(self):
+    """Sparse links between the regions shouldn't change the results."""
+    objects = createObjectMachine(
+      machineType="simple",
+      numInputBits=20,
+      sensorInputSize=1024,
+      externalInputSize=1024,
+      numCorticalColumns=3,
+    )
+    objects.addObject([(1, 1), (2, 2), (3, 3)])
+    objects.addObject([(1, 1), (3, 2), (2, 3)])
+    objects.addObject([(2, 2), (3, 3), (1, 2)])
+
+    inferConfig = {
+      "numSteps": 4,
+      "pairs": {
+        0: [(1, 1), (2, 2), (3, 3), (1, 1)],
+        1: [(2, 2), (3, 3), (1, 1), (2, 2)],
+        2: [(3, 3), (1, 1), (2, 2), (3, 3)],
+      }
+    }
+    sensations = objects.provideObjectToInfer(inferConfig)
+
+    results = []
+    for sparseLinks in (False, True):
+      exp = l2_l4_inference.L4L2Experiment(
+        name="sample",
+        numCorticalColumns=3,
+        sparseLinks=sparseLinks,
+      )
+      exp.learnObjects(objects.provideObjectsToLearn())
+      exp.infer(sensations, objectName=0, reset=False)
+      results.append((exp.getInferenceStats(),
+                      exp.getL2Representations(),
+                      exp.getL4Representations(),
+                      exp.getL4PredictedCells()))
+
+    denseResults, sparseResults = results
+    self.assertEqual(denseResults, sparseResults)
+    self.assertEqual(len(sparseResults[1][0]), 40)
+
+
   def testDelayedLateralandApicalInputs(self):
     """Test whether lateral and apical inputs are synchronized across columns"""
     # Set up experiment
@@ -450,6 +492,12 @@ class L4L2ExperimentTest(unittest.TestCase):
       mock_getL2Representations.return_value = objectL2SDR["Can"]
       results = exp.getCurrentClassification()
       self.assertDictEqual(results, {"Box": 0, "Mug": 0, "Can": 1})
+      results = exp.getCurrentClassification(topK=1)
+      self.assertDictEqual(results, {"Can": 1})
+      results = exp.getCurrentClassification(includeZeros=False)
+      self.assertDictEqual(results, {"Can": 1})
+      self.assertTrue(exp.isObjectClassified("Can"))
+      self.assertFalse(exp.isObjectClassified("Mug"))
 
       # test no match
       mock_getL2Representations.return_value = [
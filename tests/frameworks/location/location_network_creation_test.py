@@ -19,10 +19,12 @@
 # http://numenta.org/licenses/
 # ----------------------------------------------------------------------
 """
-  Test L4-L6a location network factory
+  Test L4-L6a location network factory and the L246aNetwork snapshots
 """
 import math
 import random
+import shutil
+import tempfile
 import unittest
 from collections import defaultdict
 
@@ -30,7 +32,7 @@ import numpy as np
 from nupic.engine import Network
 
 from htmresearch.frameworks.location.location_network_creation import (
-  createL4L6aLocationColumn)
+  L246aNetwork, createL4L6aLocationColumn)
 from htmresearch.support.register_regions import registerAllResearchRegions
 
 NUM_OF_COLUMNS = 150
@@ -217,3 +219,119 @@ class LocationNetworkFactoryTest(unittest.TestCase):
           break
 
       self.assertTrue(inferred)
+
+
+
+class L246aNetworkSnapshotTest(unittest.TestCase):
+  numColumns = 2
+  numModules = 10
+
+  @classmethod
+  def setUpClass(cls):
+    registerAllResearchRegions()
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+    # Sense every feature at its center, in every column
+    self.objects = {}
+    for objectDescription in OBJECTS:
+      sensations = [([feature["top"] + feature["height"] / 2.,
+                      feature["left"] + feature["width"] / 2., 0.],
+                     FEATURE_ACTIVE_COLUMNS[feature["name"]])
+                    for feature in objectDescription["features"]]
+      self.objects[objectDescription["name"]] = [sensations] * self.numColumns
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def _createNetwork(self):
+    return L246aNetwork(
+      numColumns=self.numColumns,
+      L2Params={
+        "cellCount": 4096,
+        "sdrSize": 40,
+        "activationThresholdDistal": 20,
+        "sampleSizeDistal": 30,
+        "initialDistalPermanence": 0.51,
+        "connectedPermanenceDistal": 0.5,
+        "synPermDistalInc": 0.1,
+        "synPermDistalDec": 0.001,
+        "minThresholdProximal": 5,
+        "sampleSizeProximal": 10,
+        "initialProximalPermanence": 0.6,
+        "connectedPermanenceProximal": 0.5,
+        "synPermProximalInc": 0.1,
+        "synPermProximalDec": 0.001,
+      },
+      L4Params={
+        "columnCount": NUM_OF_COLUMNS,
+        "cellsPerColumn": CELLS_PER_COLUMN,
+        "initialPermanence": 1.0,
+        "connectedPermanence": 0.6,
+        "permanenceIncrement": 0.1,
+        "permanenceDecrement": 0.02,
+        "activationThreshold": 8,
+        "minThreshold": 8,
+        "reducedBasalThreshold": 8,
+        "sampleSize": 10,
+        "apicalPredictedSegmentDecrement": 0.0,
+        "basalPredictedSegmentDecrement": 0.0,
+        "implementation": "ApicalTiebreak",
+      },
+      L6aParams={
+        "moduleCount": self.numModules,
+        "scale": [40.0] * self.numModules,
+        "orientation": np.radians(
+          range(3, 60, 60 / self.numModules)).tolist(),
+        "cellsPerAxis": 10,
+        "dimensions": 3,
+        "activationThreshold": 8,
+        "initialPermanence": 1.0,
+        "connectedPermanence": 0.5,
+        "learningThreshold": 8,
+        "sampleSize": 10,
+        "permanenceIncrement": 0.1,
+        "permanenceDecrement": 0.0,
+        "bumpOverlapMethod": "probabilistic",
+      },
+      repeat=3)
+
+  def _infer(self, network):
+    """
+    Infer every object and return the inference statistics and the
+    representations of every layer after each object
+    """
+    random.seed(7)
+    np.random.seed(7)
+    stats = defaultdict(list)
+    representations = []
+    for objectName in sorted(self.objects.keys()):
+      network.sendReset()
+      network.infer(self.objects[objectName], stats=stats, objname=objectName)
+      representations.append((network.getL2Representations(),
+                              network.getL4Representations(),
+                              network.getL6aRepresentations()))
+    return stats, representations
+
+  def testSnapshotRoundTrip(self):
+    random.seed(42)
+    np.random.seed(42)
+    trained = self._createNetwork()
+    trained.learn(self.objects)
+    trained.saveSnapshot(self.directory)
+    expectedStats, expectedRepresentations = self._infer(trained)
+    self.assertGreater(max(expectedStats["L2 Representation C0"]), 0)
+    self.assertGreater(max(expectedStats["L4 Representation C1"]), 0)
+    self.assertGreater(max(expectedStats["L6a Representation C1"]), 0)
+
+    # The fresh networks draw other L6a projections, which the snapshot
+    # replaces.
+    for mmap in (True, False):
+      restored = self._createNetwork()
+      restored.loadSnapshot(self.directory, mmap=mmap)
+      self.assertEqual(restored.learnedObjects, trained.learnedObjects)
+
+      stats, representations = self._infer(restored)
+      self.assertEqual(stats, expectedStats)
+      self.assertEqual(representations, expectedRepresentations)
@@ -0,0 +1,114 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2018, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+"""
+  Test saving and restoring the learned state of a PIUNExperiment
+"""
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from htmresearch.algorithms.csr_connections import CSRConnections
+from htmresearch.frameworks.location.path_integration_union_narrowing import (
+  PIUNCorticalColumn, PIUNExperiment)
+
+OBJECTS = [
+  {"name": "Object 1",
+   "features": [{"top": 0, "left": 0, "width": 10, "height": 10, "name": "A"},
+                {"top": 0, "left": 10, "width": 10, "height": 10, "name": "B"},
+                {"top": 10, "left": 0, "width": 10, "height": 10, "name": "A"}
+                ]},
+  {"name": "Object 2",
+   "features": [{"top": 0, "left": 10, "width": 10, "height": 10, "name": "A"},
+                {"top": 10, "left": 0, "width": 10, "height": 10, "name": "B"},
+                {"top": 10, "left": 10, "width": 10, "height": 10, "name": "B"}
+                ]}]
+
+
+
+def createExperiment():
+  locationConfigs = [{"cellsPerAxis": 10,
+                      "scale": 40. + 10*i,
+                      "orientation": 0.3*i,
+                      "connectionsClass": CSRConnections}
+                     for i in xrange(4)]
+  column = PIUNCorticalColumn(locationConfigs,
+                              L4Overrides={"connectionsClass": CSRConnections})
+  return PIUNExperiment(column, featureNames=("A", "B"))
+
+
+
+class PIUNSnapshotTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def testSnapshotRoundTrip(self):
+    random.seed(42)
+    np.random.seed(42)
+    trained = createExperiment()
+    for objectDescription in OBJECTS:
+      trained.learnObject(objectDescription)
+    trained.saveSnapshot(self.directory)
+
+    restored = createExperiment()
+    restored.loadSnapshot(self.directory)
+
+    self.assertEqual(restored.learnedObjects, trained.learnedObjects)
+    self.assertEqual(restored.representationSet, trained.representationSet)
+    self.assertEqual(sorted(restored.features), sorted(trained.features))
+    for k, sdr in trained.features.iteritems():
+      np.testing.assert_equal(restored.features[k], sdr)
+    for k, representations in trained.locationRepresentations.iteritems():
+      for expected, actual in zip(representations,
+                                  restored.locationRepresentations[k]):
+        np.testing.assert_equal(actual, expected)
+
+    for expected, actual in zip(
+        [trained.column.L4.basalConnections] +
+        [module.connections for module in trained.column.L6aModules],
+        [restored.column.L4.basalConnections] +
+        [module.connections for module in restored.column.L6aModules]):
+      self.assertEqual(actual.numSegments(), expected.numSegments())
+      self.assertGreater(expected.numSegments(), 0)
+      for segment in xrange(expected.numSegments()):
+        np.testing.assert_equal(actual.matrix.getRow(segment),
+                                expected.matrix.getRow(segment))
+
+    # Both experiments infer the same way.
+    for exp in (trained, restored):
+      random.seed(7)
+      np.random.seed(7)
+      exp.inferredSteps = [exp.inferObjectWithRandomMovements(objectDescription)
+                           for objectDescription in OBJECTS]
+    self.assertEqual(restored.inferredSteps, trained.inferredSteps)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,107 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+from __future__ import print_function
+import unittest
+
+import torch
+import htmresearch.frameworks.pytorch.functions as F
+
+
+class TestContext(object):
+  def __init__(self):
+    self.saved_tensors = None
+
+  def save_for_backward(self,x):
+    self.saved_tensors = (x,)
+
+
+class KWinnersTest(unittest.TestCase):
+  """
+  Test the batched k_winners function
+  """
+
+  def setUp(self):
+    # Batch size 2, 6 units
+    x = torch.ones((2, 6))
+    x[0, 1] = 1.2
+    x[0, 2] = 1.1
+    x[0, 5] = 1.3
+    x[1, 0] = 1.5
+    x[1, 3] = 1.7
+    x[1, 4] = 1.6
+    self.x = x
+    self.gradient = torch.rand(x.shape)
+
+    # All equal
+    self.dutyCycle = torch.zeros(6)
+    self.dutyCycle[:] = 1.0 / 2.0
+
+
+  def testNoBoost(self):
+    """
+    Equal duty cycle, boost factor 0, k=3, batch size 2
+    """
+    ctx = TestContext()
+    result = F.k_winners.forward(ctx, self.x, self.dutyCycle, k=3,
+                                 boostStrength=0.0)
+
+    expected = torch.zeros_like(self.x)
+    expected[0, 1] = 1.2
+    expected[0, 2] = 1.1
+    expected[0, 5] = 1.3
+    expected[1, 0] = 1.5
+    expected[1, 3] = 1.7
+    expected[1, 4] = 1.6
+    self.assertTrue(torch.equal(result, expected))
+
+    grad_x, _, _, _ = F.k_winners.backward(ctx, self.gradient)
+    expectedGrad = torch.where(expected != 0, self.gradient,
+                               torch.zeros_like(self.gradient))
+    self.assertTrue(torch.equal(grad_x, expectedGrad))
+
+
+  def testBoost(self):
+    """
+    Boosting chooses units with low duty cycles, but the output keeps the
+    unboosted values.
+    """
+    dutyCycle = self.dutyCycle.clone()
+    dutyCycle[0] = 0.0
+    dutyCycle[5] = 1.0
+
+    ctx = TestContext()
+    result = F.k_winners.forward(ctx, self.x, dutyCycle, k=3,
+                                 boostStrength=10.0)
+
+    expected = torch.zeros_like(self.x)
+    expected[0, 0] = 1.0
+    expected[0, 1] = 1.2
+    expected[0, 2] = 1.1
+    expected[1, 0] = 1.5
+    expected[1, 3] = 1.7
+    expected[1, 4] = 1.6
+    self.assertTrue(torch.equal(result, expected))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
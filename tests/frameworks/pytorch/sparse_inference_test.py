@@ -0,0 +1,136 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+
+import torch
+
+from htmresearch.frameworks.pytorch.modules.not_so_densenet import (
+  NotSoDenseNet
+)
+from htmresearch.frameworks.pytorch.sparse_net import SparseNet
+from htmresearch.frameworks.pytorch.sparse_inference import (
+  SparseInputLinear, freezeNotSoDenseNet, freezeSparseNet, saveFrozenModel,
+  loadFrozenModel
+)
+
+
+
+class SparseInferenceTest(unittest.TestCase):
+  """
+  Compare frozen sparse networks to the networks they were created from
+  """
+
+
+  def warmUp(self, model, inputShape):
+    """
+    Update the duty cycles and batch norm statistics, then switch to eval mode
+    """
+    model.train()
+    for _ in range(3):
+      model(torch.randn((16,) + inputShape))
+    model.eval()
+    return model
+
+
+  def trainedModel(self, inputShape, **kwargs):
+    torch.manual_seed(42)
+    return self.warmUp(SparseNet(**kwargs), inputShape)
+
+
+  def testLinearSparseNet(self):
+    model = self.trainedModel((100,), inputSize=100, n=[200, 100],
+                              k=[20, 10], kInferenceFactor=1.5,
+                              weightSparsity=0.4, boostStrength=1.5,
+                              dropout=0.5)
+    frozen = freezeSparseNet(model)
+    self.assertEqual(sum(isinstance(m, SparseInputLinear)
+                         for m in frozen.modules()), 2)
+
+    x = torch.randn(8, 100)
+    with torch.no_grad():
+      self.assertTrue(torch.allclose(model(x), frozen(x), atol=1e-5))
+
+
+  def testCNNSparseNet(self):
+    model = self.trainedModel((1, 12, 12), inputSize=(1, 12, 12),
+                              outChannels=4, c_k=20, kernelSize=3, n=50, k=10,
+                              boostStrength=1.0)
+    frozen = freezeSparseNet(model)
+
+    x = torch.randn(8, 1, 12, 12)
+    with torch.no_grad():
+      self.assertTrue(torch.allclose(model(x), frozen(x), atol=1e-5))
+
+
+  def notSoDenseNet(self, **kwargs):
+    torch.manual_seed(42)
+    model = NotSoDenseNet(nblocks=[1, 1, 1, 1], growth_rate=4,
+                          dense_c1_out_planes=8,
+                          dense_sparsities=[0.2, 0.2, 0.3, 0.5],
+                          transition_sparsities=[0.2, 0.2, 0.2], **kwargs)
+    return self.warmUp(model, (3, 32, 32))
+
+
+  def assertSameNotSoDenseNet(self, model, numSparseInputLinear):
+    frozen = freezeNotSoDenseNet(model)
+    self.assertEqual(sum(isinstance(m, SparseInputLinear)
+                         for m in frozen.modules()), numSparseInputLinear)
+
+    x = torch.randn(8, 3, 32, 32)
+    with torch.no_grad():
+      self.assertTrue(torch.allclose(model(x), frozen(x), atol=1e-5))
+
+
+  def testNotSoDenseNet(self):
+    model = self.notSoDenseNet(linear_n=50, linear_sparsity=0.2)
+    self.assertSameNotSoDenseNet(model, numSparseInputLinear=1)
+
+
+  def testNotSoDenseNetWithoutSparseLinear(self):
+    model = self.notSoDenseNet(linear_sparsity=0.0)
+    self.assertSameNotSoDenseNet(model, numSparseInputLinear=0)
+
+
+  def testSaveAndLoad(self):
+    model = self.trainedModel((100,), inputSize=100, n=200, k=20)
+    frozen = freezeSparseNet(model)
+    x = torch.randn(8, 100)
+
+    tmpDir = tempfile.mkdtemp()
+    try:
+      path = os.path.join(tmpDir, "frozen.pt")
+      saveFrozenModel(frozen, x, path)
+      loaded = loadFrozenModel(path)
+      with torch.no_grad():
+        self.assertTrue(torch.allclose(frozen(x), loaded(x), atol=1e-5))
+    finally:
+      shutil.rmtree(tmpDir)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
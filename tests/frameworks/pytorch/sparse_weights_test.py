@@ -0,0 +1,160 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+
+from __future__ import print_function
+import copy
+import pickle
+import unittest
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from htmresearch.frameworks.pytorch.modules import (SparseWeights,
+                                                    SparseWeights2d,
+                                                    SparseWeightsBase)
+from htmresearch.frameworks.pytorch.modules.not_so_densenet import (
+  NotSoDenseNet
+)
+from htmresearch.frameworks.pytorch.sparse_net import SparseNet
+
+
+
+class SparseWeightsTest(unittest.TestCase):
+  """
+  Compare the sparse execution of SparseWeights modules to the dense one
+  """
+
+
+  def checkSameOutputAndGradients(self, dense, x):
+    sparse = copy.deepcopy(dense)
+    sparse.toSparse()
+    self.assertTrue(sparse.sparseExecution)
+    self.assertIsNone(sparse.module.weight)
+
+    xDense = x.clone().requires_grad_()
+    xSparse = x.clone().requires_grad_()
+    outDense = dense(xDense)
+    outSparse = sparse(xSparse)
+    self.assertTrue(torch.allclose(outDense, outSparse, atol=1e-5))
+
+    gradient = torch.rand(outDense.shape)
+    outDense.backward(gradient)
+    outSparse.backward(gradient)
+    self.assertTrue(torch.allclose(xDense.grad, xSparse.grad, atol=1e-5))
+
+    denseGrad = dense.module.weight.grad.view(dense.denseWeightShape[0], -1)
+    indices = sparse.sparseIndices
+    self.assertTrue(torch.allclose(denseGrad[indices[0], indices[1]],
+                                   sparse.sparseWeights.grad, atol=1e-5))
+
+    # Converting back restores the original weights
+    sparse.toDense()
+    self.assertFalse(sparse.sparseExecution)
+    self.assertTrue(torch.equal(dense.module.weight.data,
+                                sparse.module.weight.data))
+
+
+  def testLinear(self):
+    torch.manual_seed(42)
+    dense = SparseWeights(nn.Linear(50, 20), weightSparsity=0.2)
+    self.checkSameOutputAndGradients(dense, torch.randn(8, 50))
+
+
+  def testConv2d(self):
+    torch.manual_seed(42)
+    dense = SparseWeights2d(nn.Conv2d(3, 6, kernel_size=3, padding=1, stride=2),
+                            weightSparsity=0.3)
+    self.checkSameOutputAndGradients(dense, torch.randn(4, 3, 9, 9))
+
+
+  def testAutoExecution(self):
+    sparse = SparseWeights(nn.Linear(100, 10), weightSparsity=0.05,
+                           execution="auto")
+    self.assertTrue(sparse.sparseExecution)
+    self.assertAlmostEqual(sparse.weightDensity(), 0.05)
+
+    dense = SparseWeights(nn.Linear(100, 10), weightSparsity=0.5,
+                          execution="auto")
+    self.assertFalse(dense.sparseExecution)
+
+
+  def testLoadModuleSavedBeforeSparseExecution(self):
+    torch.manual_seed(42)
+    module = SparseWeights(nn.Linear(50, 20), weightSparsity=0.2)
+    x = torch.randn(8, 50)
+    expected = module(x)
+
+    # Modules saved before sparse execution have neither attribute
+    del module.sparseExecution
+    del module.denseWeightShape
+    loaded = pickle.loads(pickle.dumps(module))
+    self.assertFalse(loaded.sparseExecution)
+    self.assertEqual(loaded.denseWeightShape, (20, 50))
+    self.assertTrue(torch.equal(loaded(x), expected))
+
+    loaded.toSparse()
+    self.assertTrue(torch.allclose(loaded(x), expected, atol=1e-5))
+
+
+  def checkSameModels(self, createModel, x):
+    """
+    Build the model with dense and sparse weight execution, from the same
+    seeds, and compare their inference output
+    """
+    models = []
+    for execution in ("dense", "sparse"):
+      torch.manual_seed(42)
+      np.random.seed(42)
+      models.append(createModel(execution).eval())
+    dense, sparse = models
+
+    sparseWeights = [m for m in sparse.modules()
+                     if isinstance(m, SparseWeightsBase)]
+    self.assertGreater(len(sparseWeights), 0)
+    self.assertTrue(all(m.sparseExecution for m in sparseWeights))
+
+    with torch.no_grad():
+      self.assertTrue(torch.allclose(dense(x), sparse(x), atol=1e-5))
+
+
+  def testSparseNetExecution(self):
+    self.checkSameModels(
+      lambda execution: SparseNet(inputSize=(1, 12, 12), outChannels=4,
+                                  c_k=20, kernelSize=3, n=50, k=10,
+                                  weightSparsity=0.3, weightSparsityCNN=0.4,
+                                  weightExecution=execution),
+      torch.randn(8, 1, 12, 12))
+
+
+  def testNotSoDenseNetExecution(self):
+    self.checkSameModels(
+      lambda execution: NotSoDenseNet(nblocks=[1, 1, 1, 1], growth_rate=4,
+                                      dense_c1_out_planes=8, linear_n=50,
+                                      linear_sparsity=0.2,
+                                      weight_execution=execution),
+      torch.randn(4, 3, 32, 32))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------
+# Numenta Platform for Intelligent Computing (NuPIC)
+# Copyright (C) 2019, Numenta, Inc.  Unless you have an agreement
+# with Numenta, Inc., for a separate license for this software code, the
+# following terms and conditions apply:
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+# See the GNU Affero Public License for more details.
+#
+# You should have received a copy of the GNU Affero Public License
+# along with this program.  If not, see http://www.gnu.org/licenses.
+#
+# http://numenta.org/licenses/
+# ----------------------------------------------------------------------
+
+"""
+Compare the vectorized thalamus topology and feed forward computation to
+per-cell loops.
+"""
+
+import unittest
+
+import numpy as np
+
+from htmresearch.frameworks.thalamus.thalamus import Thalamus
+
+
+class ThalamusTest(unittest.TestCase):
+
+  def loopFeedForwardActivity(self, t, feedForwardInput):
+    ff = feedForwardInput.copy()
+    for x in range(t.relayWidth):
+      for y in range(t.relayHeight):
+        for idx in t._preSynapticFFCells(x, y):
+          if feedForwardInput[idx] != 0:
+            ff[x, y] = 1.0
+    return ff * 0.4 + t.burstReadyCells * ff
+
+
+  def testTRNToRelayConnections(self):
+    t = Thalamus(trnCellShape=(7, 5), relayCellShape=(6, 5),
+                 inputShape=(6, 5), l6CellCount=100)
+
+    segment = 0
+    for x in range(t.relayWidth):
+      for y in range(t.relayHeight):
+        for trnCell in t._preSynapticTRNCells(x, y):
+          self.assertEqual(
+            t.relayConnections.mapSegmentsToCells([segment])[0],
+            t.relayCellIndex((x, y)))
+          inputs, permanences = t.relayConnections.matrix.rowNonZeros(segment)
+          np.testing.assert_equal(inputs, [t.trnCellIndex(trnCell)])
+          np.testing.assert_equal(permanences, [1.0])
+          segment += 1
+
+    self.assertEqual(t.relayConnections.numSegments(), segment)
+
+
+  def testFeedForwardActivity(self):
+    t = Thalamus(trnCellShape=(12, 12), relayCellShape=(12, 12),
+                 inputShape=(12, 12), l6CellCount=100)
+    rng = np.random.RandomState(42)
+    t.burstReadyCells[rng.random_sample(t.burstReadyCells.shape) < 0.3] = 1
+
+    frames = (rng.random_sample((5, 12, 12)) < 0.05).astype("float")
+    for frame in frames:
+      np.testing.assert_equal(t.computeFeedForwardActivity(frame),
+                              self.loopFeedForwardActivity(t, frame))
+
+    np.testing.assert_equal(
+      t.computeFeedForwardActivity(frames),
+      [self.loopFeedForwardActivity(t, frame) for frame in frames])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -20,6 +20,7 @@
 # ----------------------------------------------------------------------
 
 import json
+import numpy
 import os
 import shutil
 import tempfile
@@ -105,6 +106,38 @@ class RawSensorTest(unittest.TestCase):
                       "Value of sequenceIdOut incorrect")
 
 
+  def testBatch(self):
+    """Batches are dequeued in order with the other queued items."""
+    net = Network()
+    rawSensor = net.addRegion("raw", "py.RawSensor",
+                              json.dumps({"outputWidth": 1029}))
+    rawSensorPy = rawSensor.getSelf()
+
+    rawSensorPy.addDataToQueue([1, 2], 0, 41)
+    rawSensorPy.addBatchToQueue(numpy.array([2, 4, 6, 42, 1023, 5]),
+                                numpy.array([0, 3, 5, 6]),
+                                resets=numpy.array([1, 0, 0]),
+                                sequenceIds=numpy.array([42, 42, 43]))
+    rawSensorPy.addBatchToQueue(numpy.array([7, 8]), numpy.array([0, 2]))
+    rawSensorPy.addResetToQueue(44)
+
+    expected = [([1, 2], 0, 41),
+                ([2, 4, 6], 1, 42),
+                ([42, 1023], 0, 42),
+                ([5], 0, 43),
+                ([7, 8], 0, 0),
+                ([], 1, 44)]
+    for nonZeros, reset, sequenceId in expected:
+      net.run(1)
+      self.assertEqual(
+        rawSensor.getOutputData("dataOut").nonzero()[0].tolist(), nonZeros)
+      self.assertEqual(rawSensor.getOutputData("resetOut")[0], reset)
+      self.assertEqual(rawSensor.getOutputData("sequenceIdOut")[0],
+                       sequenceId)
+
+    self.assertEqual(len(rawSensorPy.queue), 0)
+
+
 if __name__ == "__main__":
   unittest.main()
 